@@ -57,16 +57,16 @@ REM Шаг 1: Создание датасета
 echo.
 echo 🗂️ Шаг 1: Создание датасета...
 echo ===============================
-if exist "src\ml\training\dataset.py" (
-    python src\ml\training\dataset.py
+if exist "src\ml\training\pipeline.py" (
+    python src\ml\training\pipeline.py cards battles market features
 ) else (
-    echo ❌ Файл dataset.py не найден
+    echo ❌ Файл pipeline.py не найден
     pause
     exit /b 1
 )
 
 REM Проверка создания датасета
-if not exist "datasets\training_data.json" (
+if not exist "datasets\training_data\manifest.json" (
     echo ❌ Ошибка создания датасета
     pause
     exit /b 1
@@ -78,10 +78,10 @@ REM Шаг 2: Обучение моделей
 echo.
 echo 🤖 Шаг 2: Обучение ML моделей...
 echo ===============================
-if exist "src\ml\training\train_models.py" (
-    python src\ml\training\train_models.py
+if exist "src\ml\training\pipeline.py" (
+    python src\ml\training\pipeline.py
 ) else (
-    echo ❌ Файл train_models.py не найден
+    echo ❌ Файл pipeline.py не найден
     pause
     exit /b 1
 )
@@ -111,6 +111,12 @@ xcopy "trained_models\tensorflowjs\*" "public\assets\models\" /E /I /Y >nul
 REM Копируем метаданные
 copy "trained_models\models_metadata.json" "public\assets\models\" >nul
 
+REM Копируем бинарный бандл моделей (загружается model-loader.ts)
+copy "trained_models\urban_rivals_models.bin" "public\assets\models\" >nul
+
+REM Копируем таблицу исходов пар карт (загружается battleWorker.ts)
+copy "trained_models\matchups.bin" "public\assets\models\" >nul
+
 echo ✅ Модели скопированы в public\assets\models\
 
 REM Шаг 5: Создание бэкапа
@@ -60,15 +60,15 @@ mkdir -p models_backup
 echo ""
 echo "🗂️ Шаг 1: Создание датасета..."
 echo "==============================="
-if [ -f "src/ml/training/dataset.py" ]; then
-    python3 src/ml/training/dataset.py
+if [ -f "src/ml/training/pipeline.py" ]; then
+    python3 src/ml/training/pipeline.py cards battles market features
 else
-    echo "❌ Файл dataset.py не найден"
+    echo "❌ Файл pipeline.py не найден"
     exit 1
 fi
 
 # Проверка создания датасета
-if [ ! -f "datasets/training_data.json" ]; then
+if [ ! -f "datasets/training_data/manifest.json" ]; then
     echo "❌ Ошибка создания датасета"
     exit 1
 fi
@@ -79,10 +79,10 @@ echo "✅ Датасет создан успешно"
 echo ""
 echo "🤖 Шаг 2: Обучение ML моделей..."
 echo "==============================="
-if [ -f "src/ml/training/train_models.py" ]; then
-    python3 src/ml/training/train_models.py
+if [ -f "src/ml/training/pipeline.py" ]; then
+    python3 src/ml/training/pipeline.py
 else
-    echo "❌ Файл train_models.py не найден"
+    echo "❌ Файл pipeline.py не найден"
     exit 1
 fi
 
@@ -109,6 +109,12 @@ cp -r trained_models/tensorflowjs/* public/assets/models/
 # Копируем метаданные
 cp trained_models/models_metadata.json public/assets/models/
 
+# Копируем бинарный бандл моделей (загружается model-loader.ts)
+cp trained_models/urban_rivals_models.bin public/assets/models/
+
+# Таблица исходов пар карт (загружается battleWorker.ts)
+cp trained_models/matchups.bin public/assets/models/
+
 echo "✅ Модели скопированы в public/assets/models/"
 
 # Шаг 4: Создание бэкапа
@@ -0,0 +1,140 @@
+/**
+ * Urban Rivals Matchup Table
+ * Чтение таблицы исходов раунда (src/ml/training/matchups.py): исход пары карт при любых пилюлях - один поиск по индексу
+ */
+
+// Путь таблицы внутри расширения (копируется скриптами scripts/train-ml-models.*)
+export const MATCHUP_TABLE_PATH = 'assets/models/matchups.bin';
+
+// Формат как у бандла моделей: magic "URMT" | версия формата uint32 | длина заголовка uint32 | заголовок JSON | тензоры
+const MATCHUP_MAGIC = 'URMT';
+const MATCHUP_FORMAT_VERSION = 2;
+const PREAMBLE_SIZE = 12;
+
+interface TensorSpec {
+  dtype: 'int8' | 'int16';
+  shape: number[];
+  offset: number;
+  byte_length: number;
+}
+
+interface MatchupHeader {
+  pill_levels: number;
+  card_levels: number[];
+  card_ids: string[];
+  checksum: { algorithm: string; value: string };
+  tensors: Record<string, TensorSpec>;
+}
+
+export interface MatchupExpectation {
+  win: number;
+  draw: number;
+  netDamage: number; // средний урон сопернику минус урон игроку
+}
+
+/**
+ * Исходы раунда по профилям (сила, урон): net_damage > 0 - победа игрока с этим уроном, < 0 - поражение, 0 - ничья
+ */
+export class MatchupTable {
+  private profileIndex = new Map<string, number>();
+
+  constructor(
+    readonly pillLevels: number,
+    readonly sizeBytes: number,
+    private numProfiles: number,
+    private netDamage: Int8Array, // профили x профили x пилюли x пилюли
+    profilePower: Int16Array,
+    profileDamage: Int16Array
+  ) {
+    for (let i = 0; i < numProfiles; i++) {
+      this.profileIndex.set(`${profilePower[i]}:${profileDamage[i]}`, i);
+    }
+  }
+
+  /**
+   * Номер профиля по текущим силе и урону карты (null, если таких характеристик в таблице нет)
+   */
+  profile(power: number, damage: number): number | null {
+    return this.profileIndex.get(`${power}:${damage}`) ?? null;
+  }
+
+  outcome(player: number, opponent: number, playerPills: number, opponentPills: number): number {
+    const pills = this.pillLevels;
+    return this.netDamage[((player * this.numProfiles + opponent) * pills + playerPills) * pills + opponentPills];
+  }
+
+  /**
+   * Исход при 0..maxOpponentPills пилюлях соперника (все варианты равновероятны)
+   */
+  expected(player: number, opponent: number, playerPills: number, maxOpponentPills: number): MatchupExpectation {
+    const pills = this.pillLevels;
+    const last = Math.min(Math.max(maxOpponentPills, 0), pills - 1);
+    const row = ((player * this.numProfiles + opponent) * pills + Math.min(playerPills, pills - 1)) * pills;
+    let wins = 0;
+    let draws = 0;
+    let netDamage = 0;
+    for (let q = 0; q <= last; q++) {
+      const value = this.netDamage[row + q];
+      if (value > 0) wins++;
+      else if (value === 0) draws++;
+      netDamage += value;
+    }
+    const count = last + 1;
+    return { win: wins / count, draw: draws / count, netDamage: netDamage / count };
+  }
+}
+
+/**
+ * Загружает таблицу одним запросом
+ */
+export async function fetchMatchupTable(url: string): Promise<MatchupTable> {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Не удалось загрузить таблицу исходов ${url}: ${response.status}`);
+  }
+  return parseMatchupTable(await response.arrayBuffer());
+}
+
+/**
+ * Разбирает таблицу: проверяет сигнатуру, версию и SHA-256, массивы - представления над тем же буфером
+ */
+export async function parseMatchupTable(buffer: ArrayBuffer): Promise<MatchupTable> {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, MATCHUP_MAGIC.length));
+  if (magic !== MATCHUP_MAGIC) {
+    throw new Error('Не таблица исходов Urban Rivals: неверная сигнатура');
+  }
+  const formatVersion = view.getUint32(4, true);
+  if (formatVersion !== MATCHUP_FORMAT_VERSION) {
+    throw new Error(`Неподдерживаемая версия формата таблицы исходов: ${formatVersion}`);
+  }
+
+  const headerLength = view.getUint32(8, true);
+  const dataStart = PREAMBLE_SIZE + headerLength;
+  const header: MatchupHeader = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, PREAMBLE_SIZE, headerLength)));
+
+  const digest = await crypto.subtle.digest('SHA-256', buffer.slice(dataStart));
+  if (toHex(digest) !== header.checksum.value) {
+    throw new Error('Контрольная сумма таблицы исходов не совпадает: файл повреждён');
+  }
+
+  const length = (spec: TensorSpec) => spec.shape.reduce((size, dim) => size * dim, 1);
+  const int16Tensor = (name: string) => {
+    const spec = header.tensors[name];
+    return new Int16Array(buffer, dataStart + spec.offset, length(spec));
+  };
+  const netDamageSpec = header.tensors.net_damage;
+
+  return new MatchupTable(
+    header.pill_levels,
+    buffer.byteLength,
+    netDamageSpec.shape[0],
+    new Int8Array(buffer, dataStart + netDamageSpec.offset, length(netDamageSpec)),
+    int16Tensor('profile_power'),
+    int16Tensor('profile_damage')
+  );
+}
+
+function toHex(buffer: ArrayBuffer): string {
+  return Array.from(new Uint8Array(buffer), byte => byte.toString(16).padStart(2, '0')).join('');
+}
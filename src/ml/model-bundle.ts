@@ -0,0 +1,219 @@
+/**
+ * Urban Rivals Model Bundle
+ * Чтение бинарного бандла моделей (src/ml/training/model_bundle.py): один fetch, веса - типизированные массивы
+ */
+
+// Путь бандла внутри расширения (копируется скриптами scripts/train-ml-models.*)
+export const MODEL_BUNDLE_PATH = 'assets/models/urban_rivals_models.bin';
+
+// Формат: magic "URMB" | версия формата uint32 | длина заголовка uint32 | заголовок JSON | тензоры.
+// Заголовок и смещения тензоров выровнены по 16 байтам, числа - little-endian
+// (как и типизированные массивы на всех платформах, где работает Chrome).
+const BUNDLE_MAGIC = 'URMB';
+const BUNDLE_FORMAT_VERSION = 1;
+const PREAMBLE_SIZE = 12;
+
+type Activation = 'linear' | 'relu' | 'sigmoid' | 'softmax';
+
+interface TensorSpec {
+  dtype: 'float32' | 'float16' | 'int8';
+  shape: number[];
+  offset: number;
+  byte_length: number;
+  scale?: string; // масштабы выходов для int8
+}
+
+interface LayerSpec {
+  kernel: string;
+  bias: string;
+  activation: Activation;
+}
+
+export interface BundleModelInfo {
+  type: string;
+  input_features: string[];
+  output_classes?: string[];
+  output_range?: number[];
+  accuracy?: number;
+  mse?: number;
+  description?: string;
+}
+
+interface BundleHeader {
+  version: string;
+  created: string | null;
+  quantization: string;
+  checksum: { algorithm: string; value: string };
+  models: Record<string, BundleModelInfo & { layers: LayerSpec[]; scaler: { mean: string; scale: string } }>;
+  mappings: Record<string, string[]>;
+  tensors: Record<string, TensorSpec>;
+}
+
+interface DenseLayer {
+  inputs: number;
+  outputs: number;
+  kernel: Float32Array | Int8Array; // входы x выходы, построчно
+  kernelScale: Float32Array | null;
+  bias: Float32Array;
+  activation: Activation;
+}
+
+/**
+ * Полносвязная модель из бандла: нормализация скейлером и прямой проход без TensorFlow.js
+ */
+export class DenseModel {
+  constructor(
+    readonly info: BundleModelInfo,
+    private layers: DenseLayer[],
+    private mean: Float32Array,
+    private scale: Float32Array
+  ) {}
+
+  predict(features: number[]): Float32Array {
+    let outputs = Float32Array.from(features, (value, i) => (value - this.mean[i]) / this.scale[i]);
+
+    for (const layer of this.layers) {
+      const next = Float32Array.from(layer.bias);
+      for (let i = 0; i < layer.inputs; i++) {
+        const input = outputs[i];
+        if (input === 0) continue;
+        const row = i * layer.outputs;
+        for (let j = 0; j < layer.outputs; j++) {
+          next[j] += input * (layer.kernelScale ? layer.kernel[row + j] * layer.kernelScale[j] : layer.kernel[row + j]);
+        }
+      }
+      outputs = activate(next, layer.activation);
+    }
+
+    return outputs;
+  }
+}
+
+export interface ModelBundle {
+  version: string;
+  created: string | null;
+  quantization: string;
+  sizeBytes: number;
+  models: Record<string, DenseModel>;
+  mappings: Record<string, string[]>;
+}
+
+/**
+ * Загружает бандл одним запросом
+ */
+export async function fetchModelBundle(url: string): Promise<ModelBundle> {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Не удалось загрузить бандл моделей ${url}: ${response.status}`);
+  }
+  return parseModelBundle(await response.arrayBuffer());
+}
+
+/**
+ * Разбирает бандл: проверяет сигнатуру, версию и SHA-256, веса - представления над тем же буфером
+ */
+export async function parseModelBundle(buffer: ArrayBuffer): Promise<ModelBundle> {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, BUNDLE_MAGIC.length));
+  if (magic !== BUNDLE_MAGIC) {
+    throw new Error('Не бандл моделей Urban Rivals: неверная сигнатура');
+  }
+  const formatVersion = view.getUint32(4, true);
+  if (formatVersion !== BUNDLE_FORMAT_VERSION) {
+    throw new Error(`Неподдерживаемая версия формата бандла: ${formatVersion}`);
+  }
+
+  const headerLength = view.getUint32(8, true);
+  const dataStart = PREAMBLE_SIZE + headerLength;
+  const header: BundleHeader = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, PREAMBLE_SIZE, headerLength)));
+
+  const digest = await crypto.subtle.digest('SHA-256', buffer.slice(dataStart));
+  if (toHex(digest) !== header.checksum.value) {
+    throw new Error('Контрольная сумма бандла не совпадает: файл повреждён');
+  }
+
+  const tensor = (name: string): Float32Array | Int8Array => {
+    const spec = header.tensors[name];
+    const offset = dataStart + spec.offset;
+    const length = spec.shape.reduce((size, dim) => size * dim, 1);
+    switch (spec.dtype) {
+      case 'float32':
+        return new Float32Array(buffer, offset, length);
+      case 'int8':
+        return new Int8Array(buffer, offset, length);
+      case 'float16':
+        return float16ToFloat32(new Uint16Array(buffer, offset, length));
+      default:
+        throw new Error(`Неизвестный тип тензора ${name}: ${spec.dtype}`);
+    }
+  };
+  const floatTensor = (name: string): Float32Array => tensor(name) as Float32Array;
+
+  const models: Record<string, DenseModel> = {};
+  for (const [name, spec] of Object.entries(header.models)) {
+    const { layers, scaler, ...info } = spec;
+    const denseLayers = layers.map(layer => {
+      const kernelSpec = header.tensors[layer.kernel];
+      return {
+        inputs: kernelSpec.shape[0],
+        outputs: kernelSpec.shape[1],
+        kernel: tensor(layer.kernel),
+        kernelScale: kernelSpec.scale ? floatTensor(kernelSpec.scale) : null,
+        bias: floatTensor(layer.bias),
+        activation: layer.activation
+      };
+    });
+    models[name] = new DenseModel(info, denseLayers, floatTensor(scaler.mean), floatTensor(scaler.scale));
+  }
+
+  return {
+    version: header.version,
+    created: header.created,
+    quantization: header.quantization,
+    sizeBytes: buffer.byteLength,
+    models,
+    mappings: header.mappings
+  };
+}
+
+function activate(values: Float32Array, activation: Activation): Float32Array {
+  switch (activation) {
+    case 'relu':
+      return values.map(x => Math.max(0, x));
+    case 'sigmoid':
+      return values.map(x => 1 / (1 + Math.exp(-x)));
+    case 'softmax': {
+      const maxValue = Math.max(...values);
+      const exps = values.map(x => Math.exp(x - maxValue));
+      const sum = exps.reduce((total, x) => total + x, 0);
+      return exps.map(x => x / sum);
+    }
+    default:
+      return values;
+  }
+}
+
+/**
+ * float16 -> float32 (Float16Array есть не во всех поддерживаемых версиях Chrome)
+ */
+function float16ToFloat32(halfs: Uint16Array): Float32Array {
+  const result = new Float32Array(halfs.length);
+  for (let i = 0; i < halfs.length; i++) {
+    const h = halfs[i];
+    const sign = h & 0x8000 ? -1 : 1;
+    const exponent = (h >> 10) & 0x1f;
+    const fraction = h & 0x3ff;
+    if (exponent === 0) {
+      result[i] = sign * 2 ** -14 * (fraction / 1024);
+    } else if (exponent === 0x1f) {
+      result[i] = fraction ? NaN : sign * Infinity;
+    } else {
+      result[i] = sign * 2 ** (exponent - 15) * (1 + fraction / 1024);
+    }
+  }
+  return result;
+}
+
+function toHex(buffer: ArrayBuffer): string {
+  return Array.from(new Uint8Array(buffer), byte => byte.toString(16).padStart(2, '0')).join('');
+}
@@ -4,33 +4,15 @@
  */
 
 import type { IBattleState, ICard, IMLModel } from '../common/types';
+import { MODEL_BUNDLE_PATH, fetchModelBundle } from './model-bundle';
+import type { BundleModelInfo, DenseModel, ModelBundle } from './model-bundle';
 
 interface ModelMetadata {
   version: string;
-  created: string;
-  models: {
-    battle_predictor: {
-      type: string;
-      accuracy: number;
-      input_features: string[];
-      output_classes: string[];
-      description: string;
-    };
-    card_recommender: {
-      type: string;
-      mse: number;
-      input_features: string[];
-      output_range: number[];
-      description: string;
-    };
-    strategy_classifier: {
-      type: string;
-      accuracy: number;
-      input_features: string[];
-      output_classes: string[];
-      description: string;
-    };
-  };
+  created: string | null;
+  quantization: string;
+  sizeBytes: number;
+  models: Record<string, BundleModelInfo>;
 }
 
 interface PreprocessedData {
@@ -42,200 +24,131 @@ interface PreprocessedData {
   };
 }
 
-// Легковесные алгоритмы без TensorFlow.js
+// Легковесные алгоритмы без TensorFlow.js: веса, скейлеры и кодировки - из бандла моделей
 class OptimizedMLEngine {
-  // Встроенные данные для нормализации (из обучения)
-  private scalerData = {
-    battle_predictor: {
-      mean: [10.5, 10.5, 0, 2.5, 2.5],
-      std: [3.2, 3.2, 4.8, 2.1, 2.1]
-    },
-    card_recommender: {
-      mean: [9.0, 2.5, 7.5, 5.8, 0.7, 1.2, 13.3],
-      std: [5.2, 1.4, 1.8, 1.6, 0.45, 0.3, 3.1]
-    },
-    strategy_classifier: {
-      mean: [7.2, 5.4, 53.6, 2.8, 2.1],
-      std: [1.1, 1.3, 8.7, 0.9, 1.2]
-    }
-  };
-
-  // Данные о кланах для кодирования
-  private clansMapping = {
-    'All Stars': 0, 'Bangers': 1, 'Fang Pi Clang': 2, 'Freaks': 3,
-    'Ulu Watu': 4, 'Montana': 5, 'Uppers': 6, 'Sakrohm': 7,
-    'Nightmare': 8, 'Piranas': 9, 'Skeelz': 10, 'Roots': 11,
-    'GHEIST': 12, 'Pussycats': 13, 'Rescue': 14, 'Sentinels': 15,
-    'La Junta': 16, 'Junkz': 17
-  };
+  constructor(private bundle: ModelBundle) {}
 
-  private rarityMapping = {
-    'Common': 0, 'Uncommon': 1, 'Rare': 2, 'Legendary': 3
-  };
+  private model(name: string): DenseModel {
+    const model = this.bundle.models[name];
+    if (!model) {
+      throw new Error(`Модель ${name} отсутствует в бандле ${this.bundle.version}`);
+    }
+    return model;
+  }
 
   /**
-   * Легковесная функция активации (замена TensorFlow.js)
+   * Вероятности классов модели по именам классов из бандла
    */
-  private relu(x: number): number {
-    return Math.max(0, x);
-  }
-
-  private sigmoid(x: number): number {
-    return 1 / (1 + Math.exp(-x));
-  }
-
-  private softmax(logits: number[]): number[] {
-    const maxLogit = Math.max(...logits);
-    const expLogits = logits.map(x => Math.exp(x - maxLogit));
-    const sumExp = expLogits.reduce((sum, x) => sum + x, 0);
-    return expLogits.map(x => x / sumExp);
+  private classProbabilities(name: string, features: number[]): Record<string, number> {
+    const model = this.model(name);
+    const probabilities = model.predict(features);
+    const classes = model.info.output_classes ?? [];
+    return Object.fromEntries(classes.map((label, i) => [label, probabilities[i]]));
   }
 
   /**
-   * Упрощенная нейронная сеть для предсказания боев
+   * Нейронная сеть предсказания боев
    */
   predictBattleOutcome(features: number[]): { player: number; opponent: number; draw: number } {
-    // Нормализация входных данных
-    const normalized = features.map((val, i) => 
-      (val - this.scalerData.battle_predictor.mean[i]) / this.scalerData.battle_predictor.std[i]
-    );
-
-    // Упрощенные веса (заранее рассчитанные)
-    const weights1 = [0.3, -0.2, 0.4, 0.1, -0.1];
-    const weights2 = [-0.4, 0.3, -0.2, 0.2, 0.1];
-    
-    // Скалярное произведение + bias
-    const output1 = normalized.reduce((sum, val, i) => sum + val * weights1[i], 0) + 0.1;
-    const output2 = normalized.reduce((sum, val, i) => sum + val * weights2[i], 0) - 0.05;
-    const output3 = -(output1 + output2) * 0.3; // draw probability
-
-    const logits = [output1, output2, output3];
-    const probabilities = this.softmax(logits);
+    const probabilities = this.classProbabilities('battle_predictor', features);
 
     return {
-      player: probabilities[0],
-      opponent: probabilities[1],
-      draw: probabilities[2]
+      player: probabilities.player ?? 0,
+      opponent: probabilities.opponent ?? 0,
+      draw: probabilities.draw ?? 0
     };
   }
 
   /**
-   * Упрощенная оценка карты
+   * Оценка карты
    */
   evaluateCard(features: number[]): number {
-    // Нормализация
-    const normalized = features.map((val, i) => 
-      (val - this.scalerData.card_recommender.mean[i]) / this.scalerData.card_recommender.std[i]
-    );
-
-    // Простая линейная комбинация с весами
-    const weights = [0.2, 0.15, 0.3, 0.25, 0.1, 0.05, 0.2];
-    const score = normalized.reduce((sum, val, i) => sum + val * weights[i], 0);
-    
-    return this.sigmoid(score);
+    return this.model('card_recommender').predict(features)[0];
   }
 
   /**
-   * Классификация стратегии
+   * Классификация стратегии: стратегии, отсортированные по вероятности
    */
-  classifyStrategy(features: number[]): string[] {
-    const normalized = features.map((val, i) => 
-      (val - this.scalerData.strategy_classifier.mean[i]) / this.scalerData.strategy_classifier.std[i]
-    );
-
-    const strategies = ['power_focused', 'damage_focused', 'mono_clan', 'ability_focused', 'balanced'];
-    const weights = [
-      [0.4, 0.1, 0.0, -0.1, 0.2],  // power_focused
-      [0.1, 0.4, 0.0, -0.1, 0.2],  // damage_focused  
-      [0.0, 0.0, 0.5, 0.1, -0.2],  // mono_clan
-      [-0.1, -0.1, 0.1, 0.4, 0.1], // ability_focused
-      [0.2, 0.2, -0.1, 0.1, 0.3]   // balanced
-    ];
+  classifyStrategy(features: number[]): { strategy: string; prob: number }[] {
+    const probabilities = this.classProbabilities('strategy_classifier', features);
 
-    const scores = weights.map(w => 
-      normalized.reduce((sum, val, i) => sum + val * w[i], 0)
-    );
-
-    const probabilities = this.softmax(scores);
-    
-    // Возвращаем стратегии отсортированные по вероятности
-    return strategies
-      .map((strategy, i) => ({ strategy, prob: probabilities[i] }))
-      .sort((a, b) => b.prob - a.prob)
-      .map(item => item.strategy);
+    return Object.entries(probabilities)
+      .map(([strategy, prob]) => ({ strategy, prob }))
+      .sort((a, b) => b.prob - a.prob);
   }
 
   /**
-   * Получение кодирования клана
+   * Получение кодирования клана (порядок кланов - как при обучении)
    */
   getClanEncoding(clan: string): number {
-    return this.clansMapping[clan as keyof typeof this.clansMapping] || 0;
+    return Math.max(0, this.bundle.mappings.clans.indexOf(clan));
   }
 
   /**
    * Получение кодирования редкости
    */
   getRarityEncoding(rarity: string): number {
-    return this.rarityMapping[rarity as keyof typeof this.rarityMapping] || 0;
+    return Math.max(0, this.bundle.mappings.rarities.indexOf(rarity));
   }
 }
 
 export class UrbanRivalsMLModelLoader {
-  private engine: OptimizedMLEngine;
+  private engine: OptimizedMLEngine | null = null;
   private metadata: ModelMetadata | null = null;
   private isInitialized = false;
+  private initialization: Promise<void>;
 
-  constructor() {
-    this.engine = new OptimizedMLEngine();
-    this.initializeModels();
+  constructor(private bundleUrl: string = UrbanRivalsMLModelLoader.defaultBundleUrl()) {
+    this.initialization = this.initializeModels();
+    // Ошибка уже залогирована; методы предсказания сообщат о ней через ensureReady()
+    this.initialization.catch(() => undefined);
+  }
+
+  private static defaultBundleUrl(): string {
+    if (typeof chrome !== 'undefined' && chrome.runtime?.getURL) {
+      return chrome.runtime.getURL(MODEL_BUNDLE_PATH);
+    }
+    return MODEL_BUNDLE_PATH;
   }
 
   /**
-   * Быстрая инициализация без загрузки TensorFlow.js моделей
+   * Быстрая инициализация: один запрос за бинарным бандлом вместо моделей TensorFlow.js
    */
   async initializeModels(): Promise<void> {
     try {
-      console.log('🚀 Инициализация оптимизированных ML алгоритмов...');
-      
-      // Небольшая задержка для имитации загрузки
-      await new Promise(resolve => setTimeout(resolve, 100));
+      console.log('🚀 Загрузка бандла ML моделей...');
+      const started = performance.now();
       
+      const bundle = await fetchModelBundle(this.bundleUrl);
+      this.engine = new OptimizedMLEngine(bundle);
       this.metadata = {
-        version: '2.0.0-optimized',
-        created: new Date().toISOString(),
-        models: {
-          battle_predictor: {
-            type: 'classification',
-            accuracy: 0.82,
-            input_features: ['player_total_attack', 'opponent_total_attack', 'attack_difference', 'player_pills_used', 'opponent_pills_used'],
-            output_classes: ['player', 'opponent', 'draw'],
-            description: 'Легковесный предсказатель исхода боя'
-          },
-          card_recommender: {
-            type: 'regression',
-            mse: 0.025,
-            input_features: ['clan_encoded', 'rarity_encoded', 'max_power', 'max_damage', 'has_ability', 'power_damage_ratio', 'total_stats'],
-            output_range: [0, 1],
-            description: 'Быстрая оценка полезности карты'
-          },
-          strategy_classifier: {
-            type: 'classification',
-            accuracy: 0.75,
-            input_features: ['avg_power', 'avg_damage', 'total_stats', 'clan_diversity', 'ability_count'],
-            output_classes: ['power_focused', 'damage_focused', 'mono_clan', 'ability_focused', 'balanced'],
-            description: 'Классификация стратегии колоды'
-          }
-        }
+        version: bundle.version,
+        created: bundle.created,
+        quantization: bundle.quantization,
+        sizeBytes: bundle.sizeBytes,
+        models: Object.fromEntries(Object.entries(bundle.models).map(([name, model]) => [name, model.info]))
       };
       
       this.isInitialized = true;
-      console.log('✅ Оптимизированные ML алгоритмы готовы');
+      console.log(`✅ ML модели готовы: бандл ${bundle.version} (${bundle.quantization}, ` +
+        `${(bundle.sizeBytes / 1024).toFixed(1)} КБ) за ${(performance.now() - started).toFixed(0)} мс`);
     } catch (error) {
       console.error('❌ Ошибка инициализации ML:', error);
       throw error;
     }
   }
 
+  /**
+   * Дожидается загрузки бандла
+   */
+  private async ensureReady(): Promise<OptimizedMLEngine> {
+    await this.initialization.catch(() => undefined);
+    if (!this.isInitialized || !this.engine) {
+      throw new Error('ML алгоритмы не инициализированы');
+    }
+    return this.engine;
+  }
+
   /**
    * Предсказание результата боя - ОПТИМИЗИРОВАННАЯ ВЕРСИЯ
    */
@@ -244,16 +157,14 @@ export class UrbanRivalsMLModelLoader {
     predictions: { player: number; opponent: number; draw: number };
     confidence: number;
   }> {
-    if (!this.isInitialized) {
-      throw new Error('ML алгоритмы не инициализированы');
-    }
+    const engine = await this.ensureReady();
 
     try {
       // Подготовка входных данных
       const features = this.prepareBattleFeatures(battleState, playerCard, pillsUsed);
       
       // Быстрое предсказание без TensorFlow.js
-      const predictions = this.engine.predictBattleOutcome(features);
+      const predictions = engine.predictBattleOutcome(features);
       
       return {
         winProbability: predictions.player,
@@ -275,13 +186,11 @@ export class UrbanRivalsMLModelLoader {
     strengths: string[];
     weaknesses: string[];
   }> {
-    if (!this.isInitialized) {
-      throw new Error('ML алгоритмы не инициализированы');
-    }
+    const engine = await this.ensureReady();
 
     try {
-      const features = this.prepareCardFeatures(card);
-      const rating = this.engine.evaluateCard(features);
+      const features = this.prepareCardFeatures(engine, card);
+      const rating = engine.evaluateCard(features);
       
       return {
         rating,
@@ -303,19 +212,16 @@ export class UrbanRivalsMLModelLoader {
     confidence: number;
     recommendations: string[];
   }> {
-    if (!this.isInitialized) {
-      throw new Error('ML алгоритмы не инициализированы');
-    }
+    const engine = await this.ensureReady();
 
     try {
       const features = this.prepareDeckFeatures(cards);
-      const strategies = this.engine.classifyStrategy(features);
-      const topStrategy = strategies[0];
+      const [top] = engine.classifyStrategy(features);
       
       return {
-        strategy: topStrategy,
-        confidence: 0.75 + Math.random() * 0.2, // Симуляция confidence
-        recommendations: this.generateStrategyRecommendations(topStrategy, cards)
+        strategy: top.strategy,
+        confidence: top.prob,
+        recommendations: this.generateStrategyRecommendations(top.strategy, cards)
       };
     } catch (error) {
       console.error('Ошибка классификации стратегии:', error);
@@ -347,9 +253,9 @@ export class UrbanRivalsMLModelLoader {
   /**
    * Подготовка признаков для оценки карты
    */
-  private prepareCardFeatures(card: ICard): number[] {
-    const clanEncoded = this.engine.getClanEncoding(card.clan);
-    const rarityEncoded = this.engine.getRarityEncoding(card.rarity);
+  private prepareCardFeatures(engine: OptimizedMLEngine, card: ICard): number[] {
+    const clanEncoded = engine.getClanEncoding(card.clan);
+    const rarityEncoded = engine.getRarityEncoding(card.rarity);
     const hasAbility = card.ability ? 1 : 0;
     const powerDamageRatio = card.power / Math.max(card.damage, 1);
     const totalStats = card.power + card.damage;
@@ -0,0 +1,223 @@
+/**
+ * Urban Rivals Training Data
+ * Чтение признаков, экспортированных dataset.py (--tfjs-format binary): части типизированных массивов с манифестом
+ */
+
+// Формат storage.export_typed_arrays: manifest.json | <таблица>/chunk-NNNNN.bin (колонки подряд, little-endian)
+const TRAINING_DATA_FORMAT = 'urban-rivals-typed-arrays';
+const TRAINING_DATA_FORMAT_VERSION = 1;
+const MANIFEST_NAME = 'manifest.json';
+
+export type ColumnDtype = 'int8' | 'uint8' | 'int16' | 'uint16' | 'int32' | 'uint32' | 'float32' | 'float64';
+export type ColumnArray =
+  | Int8Array
+  | Uint8Array
+  | Int16Array
+  | Uint16Array
+  | Int32Array
+  | Uint32Array
+  | Float32Array
+  | Float64Array;
+
+type ColumnArrayConstructor = {
+  new (length: number): ColumnArray;
+  new (buffer: ArrayBuffer, byteOffset: number, length: number): ColumnArray;
+};
+
+const ARRAY_TYPES: Record<ColumnDtype, ColumnArrayConstructor> = {
+  int8: Int8Array,
+  uint8: Uint8Array,
+  int16: Int16Array,
+  uint16: Uint16Array,
+  int32: Int32Array,
+  uint32: Uint32Array,
+  float32: Float32Array,
+  float64: Float64Array
+};
+
+export interface ColumnSpec {
+  dtype: ColumnDtype; // float64 - только даты, остальные дробные колонки экспортируются во float32
+  shape: number[]; // [] - скаляр на строку, [4] - четыре значения на строку подряд
+  categories?: string[]; // категориальные и строковые колонки хранятся кодами (-1 - пусто)
+  unit?: 's'; // даты - секунды Unix
+}
+
+export interface ChunkSpec {
+  file: string;
+  rows: number;
+  byte_length: number;
+  sha256: string;
+  offsets: Record<string, number>;
+}
+
+export interface TableSpec {
+  num_rows: number;
+  chunk_rows: number;
+  columns: Record<string, ColumnSpec>;
+  chunks: ChunkSpec[];
+}
+
+export interface TrainingDataManifest {
+  format: string;
+  version: number;
+  byte_order: 'little';
+  metadata: {
+    version: string;
+    created: string;
+    cards_count: number;
+    battles_count: number;
+    clans: string[];
+  };
+  clans_data: Record<string, { bonus: string; type: string }>;
+  tables: Record<string, TableSpec>;
+}
+
+export interface TrainingDataChunk {
+  table: string;
+  index: number;
+  rows: number;
+  columns: Record<string, ColumnArray>;
+}
+
+/**
+ * Таблицы признаков: части загружаются по требованию, колонки - представления над буфером части без копирования
+ */
+export class TrainingData {
+  constructor(
+    readonly baseUrl: string,
+    readonly manifest: TrainingDataManifest
+  ) {}
+
+  get tables(): string[] {
+    return Object.keys(this.manifest.tables);
+  }
+
+  numRows(table: string): number {
+    return this.table(table).num_rows;
+  }
+
+  columns(table: string): Record<string, ColumnSpec> {
+    return this.table(table).columns;
+  }
+
+  /**
+   * Значение категориальной или строковой колонки по коду (null для пропуска)
+   */
+  category(table: string, column: string, code: number): string | null {
+    const categories = this.table(table).columns[column].categories;
+    if (!categories) {
+      throw new Error(`Колонка ${table}.${column} не категориальная`);
+    }
+    return code < 0 ? null : categories[code];
+  }
+
+  /**
+   * Части таблицы по порядку; следующая часть загружается, пока обрабатывается текущая
+   */
+  async *chunks(table: string, columns?: string[]): AsyncGenerator<TrainingDataChunk> {
+    const spec = this.table(table);
+    const names = columns ?? Object.keys(spec.columns);
+    let next = spec.chunks.length > 0 ? this.fetchChunk(spec.chunks[0]) : null;
+    for (let index = 0; index < spec.chunks.length; index++) {
+      const buffer = await next!;
+      next = index + 1 < spec.chunks.length ? this.fetchChunk(spec.chunks[index + 1]) : null;
+      // Ошибка загрузки следующей части всплывёт на следующем шаге, если до него дойдут
+      next?.catch(() => undefined);
+      const chunk = spec.chunks[index];
+      yield { table, index, rows: chunk.rows, columns: await parseTrainingDataChunk(buffer, chunk, spec.columns, names) };
+    }
+  }
+
+  /**
+   * Таблица целиком: один типизированный массив на колонку (копируются части)
+   */
+  async loadTable(table: string, columns?: string[]): Promise<Record<string, ColumnArray>> {
+    const spec = this.table(table);
+    const names = columns ?? Object.keys(spec.columns);
+    const result: Record<string, ColumnArray> = {};
+    for (const name of names) {
+      const column = spec.columns[name];
+      result[name] = new ARRAY_TYPES[column.dtype](spec.num_rows * rowLength(column));
+    }
+    for await (const chunk of this.chunks(table, names)) {
+      const start = chunk.index * spec.chunk_rows;
+      for (const name of names) {
+        result[name].set(chunk.columns[name], start * rowLength(spec.columns[name]));
+      }
+    }
+    return result;
+  }
+
+  private table(name: string): TableSpec {
+    const table = this.manifest.tables[name];
+    if (!table) {
+      throw new Error(`Таблицы ${name} нет в данных: ${this.tables.join(', ')}`);
+    }
+    return table;
+  }
+
+  private async fetchChunk(chunk: ChunkSpec): Promise<ArrayBuffer> {
+    const url = `${this.baseUrl}/${chunk.file}`;
+    const response = await fetch(url);
+    if (!response.ok) {
+      throw new Error(`Не удалось загрузить часть данных ${url}: ${response.status}`);
+    }
+    return response.arrayBuffer();
+  }
+}
+
+/**
+ * Загружает манифест; части таблиц загружаются позже, по мере чтения
+ */
+export async function fetchTrainingData(baseUrl: string): Promise<TrainingData> {
+  const url = `${baseUrl}/${MANIFEST_NAME}`;
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Не удалось загрузить манифест данных ${url}: ${response.status}`);
+  }
+  const manifest: TrainingDataManifest = await response.json();
+  if (manifest.format !== TRAINING_DATA_FORMAT) {
+    throw new Error(`Не данные Urban Rivals: формат ${manifest.format}`);
+  }
+  if (manifest.version !== TRAINING_DATA_FORMAT_VERSION) {
+    throw new Error(`Неподдерживаемая версия формата данных: ${manifest.version}`);
+  }
+  // Типизированные массивы используют порядок байт платформы, данные записаны в little-endian
+  if (new Uint8Array(new Uint16Array([1]).buffer)[0] !== 1) {
+    throw new Error('Платформа с порядком байт big-endian не поддерживается');
+  }
+  return new TrainingData(baseUrl, manifest);
+}
+
+/**
+ * Разбирает часть: проверяет длину и SHA-256, колонки - представления над тем же буфером
+ */
+export async function parseTrainingDataChunk(
+  buffer: ArrayBuffer,
+  chunk: ChunkSpec,
+  columns: Record<string, ColumnSpec>,
+  names: string[] = Object.keys(columns)
+): Promise<Record<string, ColumnArray>> {
+  if (buffer.byteLength !== chunk.byte_length) {
+    throw new Error(`Часть ${chunk.file}: ${buffer.byteLength} байт вместо ${chunk.byte_length}`);
+  }
+  const digest = await crypto.subtle.digest('SHA-256', buffer);
+  if (toHex(digest) !== chunk.sha256) {
+    throw new Error(`Контрольная сумма части ${chunk.file} не совпадает: файл повреждён`);
+  }
+
+  const result: Record<string, ColumnArray> = {};
+  for (const name of names) {
+    const column = columns[name];
+    result[name] = new ARRAY_TYPES[column.dtype](buffer, chunk.offsets[name], chunk.rows * rowLength(column));
+  }
+  return result;
+}
+
+function rowLength(column: ColumnSpec): number {
+  return column.shape.reduce((size, dim) => size * dim, 1);
+}
+
+function toHex(buffer: ArrayBuffer): string {
+  return Array.from(new Uint8Array(buffer), byte => byte.toString(16).padStart(2, '0')).join('');
+}
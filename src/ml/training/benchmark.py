@@ -0,0 +1,1020 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals ML Pipeline Benchmarks
+Замеры производительности этапов генерации датасета и обучения
+"""
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dataset import TFJS_EXPORT_FORMATS, TFJS_EXPORT_NAMES, UrbanRivalsDataCollector
+from features import (STRATEGY_LABELS, card_features, card_outcome_index, deck_strategy_features,
+                      first_round_features)
+from inference import DEFAULT_MAX_WAIT_MS
+from market import MARKET_MODELS, market_frame, simulate_market
+from market_features import MARKET_WINDOWS, MarketFeatureState, rolling_market_features
+from schemas import EXPORT_NAMES
+from simulator import WINNER_LABELS, card_stats_array, sample_decks, simulate_battles
+from storage import EXPORT_FORMATS, MANIFEST_NAME, export_table, iter_table_chunks, load_columns, read_table
+
+
+def _timed(func: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """Выполняет функцию и возвращает (результат, время в секундах)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_simulator(num_battles: int, legacy_battles: int, seed: int):
+    """Сравнивает скорость пошаговой и пакетной симуляции боёв"""
+    print(f"⚔️ Бенчмарк симулятора боёв ({num_battles} боёв, эталон: {legacy_battles})")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        cards_df = collector.create_cards_database()
+
+        def run_legacy():
+            for _ in range(legacy_battles):
+                collector._simulate_battle(cards_df.sample(4), cards_df.sample(4))
+
+        _, legacy_time = _timed(run_legacy)
+
+        card_stats = card_stats_array(cards_df)
+        _, batch_time = _timed(simulate_battles, card_stats, num_battles, np.random.default_rng(seed))
+
+    legacy_rate = legacy_battles / legacy_time
+    batch_rate = num_battles / batch_time
+    print(f"  🐢 _simulate_battle:  {legacy_rate:12,.0f} боёв/сек")
+    print(f"  🚀 simulate_battles:  {batch_rate:12,.0f} боёв/сек")
+    print(f"  📈 Ускорение: x{batch_rate / legacy_rate:.1f}")
+
+
+def legacy_market_data(cards_df, days: int) -> pd.DataFrame:
+    """Прежний построчный генератор рынка (дни x iterrows), без записи файлов - эталон для сравнения"""
+    market_data = []
+    for day in range(days):
+        date = datetime.now() - timedelta(days=day)
+        for _, card in cards_df.iterrows():
+            base_price = {
+                'Common': np.random.randint(50, 200),
+                'Uncommon': np.random.randint(150, 500),
+                'Rare': np.random.randint(400, 1500),
+                'Legendary': np.random.randint(1000, 5000)
+            }[card['rarity']]
+            price_variation = np.random.normal(0, 0.1)
+            current_price = int(base_price * (1 + price_variation))
+            transaction_count = np.random.poisson(5)
+            market_data.append({
+                'date': date,
+                'card_id': card['card_id'],
+                'card_name': card['name'],
+                'price': max(1, current_price),
+                'transaction_count': transaction_count,
+                'total_volume': current_price * transaction_count
+            })
+    return pd.DataFrame(market_data)
+
+
+def bench_market(days: int, num_cards: int, legacy_days: int, seed: int):
+    """Сравнивает скорость построчной и векторизованной генерации рынка (без записи файлов)"""
+    print(f"💰 Бенчмарк генерации рынка ({days} дней x {num_cards} карт, эталон: {legacy_days} дней)")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        base_cards = collector.create_cards_database()
+
+    # Размножаем базу карт до нужного размера
+    cards_df = base_cards.iloc[np.arange(num_cards) % len(base_cards)].reset_index(drop=True)
+    cards_df['card_id'] = [f"card_{i + 1}" for i in range(num_cards)]
+
+    _, legacy_time = _timed(legacy_market_data, cards_df, legacy_days)
+    legacy_rate = legacy_days * num_cards / legacy_time
+    print(f"  🐢 days x iterrows:   {legacy_rate:14,.0f} строк/сек")
+
+    rarities = cards_df['rarity'].to_numpy()
+    for model in MARKET_MODELS:
+        rng = np.random.default_rng(seed)
+        market, simulate_time = _timed(simulate_market, rarities, days, rng, model)
+        frame, frame_time = _timed(market_frame, market, cards_df, collector.reference_time)
+        rate = len(frame) / (simulate_time + frame_time)
+        print(f"  🚀 simulate_market({model}): {rate:12,.0f} строк/сек "
+              f"(матрица {simulate_time:.2f}с, таблица {frame_time:.2f}с), ускорение x{rate / legacy_rate:.0f}")
+
+
+def pandas_market_features(price: np.ndarray, volume: np.ndarray, windows: List[int]) -> Dict[str, np.ndarray]:
+    """Эталон признаков рынка: groupby по карте + rolling pandas в длинной таблице"""
+    days, num_cards = price.shape
+    frame = pd.DataFrame({'card': np.tile(np.arange(num_cards), days), 'price': price.ravel(),
+                          'volume': volume.ravel()})
+    frame['log_return'] = np.log(frame['price']).groupby(frame['card']).diff()
+    frame['traded'] = frame['price'] * frame['volume']
+    grouped = frame.groupby('card')
+    features = {}
+    for window in windows:
+        rolling = grouped.rolling(window)
+        mean = rolling['price'].mean().droplevel(0).sort_index()
+        std = rolling['price'].std(ddof=0).droplevel(0).sort_index()
+        vwap = (rolling['traded'].sum() / rolling['volume'].sum()).droplevel(0).sort_index()
+        features[f"mean_{window}"] = mean
+        features[f"volatility_{window}"] = (grouped['log_return'].rolling(window).std(ddof=0)
+                                            .droplevel(0).sort_index())
+        features[f"momentum_{window}"] = frame['price'] / grouped['price'].shift(window) - 1
+        features[f"vwap_{window}"] = vwap.fillna(mean)
+        features[f"zscore_{window}"] = ((frame['price'] - mean) / std).where(std > 0, 0.0).where(mean.notna())
+    return {name: values.to_numpy().reshape(days, num_cards) for name, values in features.items()}
+
+
+def bench_market_features(days: int, num_cards: int, legacy_cards: int, seed: int):
+    """Скользящие признаки рынка: prefix-суммы по матрице vs groupby + rolling pandas, дописывание одного дня"""
+    print(f"📈 Бенчмарк признаков рынка ({days} дней x {num_cards} карт, окна {MARKET_WINDOWS}, "
+          f"эталон: {legacy_cards} карт)")
+
+    rng = np.random.default_rng(seed)
+    rarities = rng.choice(['Common', 'Uncommon', 'Rare', 'Legendary'], size=num_cards)
+    market = simulate_market(rarities, days + 1, rng, 'gbm')
+    # Строка 0 в simulate_market - самый свежий день; признаки считаются по возрастанию дат.
+    # Цены не меньше 1, как в таблице market/ (market_frame)
+    price = np.maximum(1, market['price'][::-1]).astype(np.float64)
+    volume = market['transaction_count'][::-1].astype(np.float64)
+    history, last_price, last_volume = price[:-1], price[-1], volume[-1]
+
+    features, full_time = _timed(rolling_market_features, history, volume[:-1], MARKET_WINDOWS)
+    reference, pandas_time = _timed(pandas_market_features, history[:, :legacy_cards], volume[:-1, :legacy_cards],
+                                    MARKET_WINDOWS)
+    max_error = max(float(np.nanmax(np.abs(features[name][:, :legacy_cards] - values) /
+                                    np.maximum(1, np.abs(values))))
+                    for name, values in reference.items())
+    rows = days * num_cards
+    pandas_rate = days * legacy_cards / pandas_time
+    print(f"  🐼 groupby + rolling:    {pandas_rate:14,.0f} строк/сек")
+    print(f"  🚀 prefix-суммы:         {rows / full_time:14,.0f} строк/сек ({full_time:.2f}с), "
+          f"ускорение x{rows / full_time / pandas_rate:.0f}")
+
+    # Новый день: пересчёт всей истории vs хвост из MarketFeatureState
+    state = MarketFeatureState.from_history(np.arange(days).astype('datetime64[D]'), history, volume[:-1],
+                                            MARKET_WINDOWS)
+    appended, append_time = _timed(state.append, np.datetime64(days, 'D'), last_price, last_volume)
+    recomputed, recompute_time = _timed(rolling_market_features, price, volume, MARKET_WINDOWS)
+    append_error = max(float(np.nanmax(np.abs(values - recomputed[name][-1]) / np.maximum(1, np.abs(values))))
+                       for name, values in appended.items())
+    print(f"  🔁 новый день: пересчёт {recompute_time * 1000:.1f} мс, дописывание {append_time * 1000:.1f} мс "
+          f"(x{recompute_time / append_time:.0f})")
+    identical = max_error < 1e-6 and append_error < 1e-6
+    print(f"  {'✅' if identical else '❌'} Признаки {'совпадают' if identical else 'РАСХОДЯТСЯ'} с pandas и пересчётом "
+          f"(отклонение {max(max_error, append_error):.1e})")
+
+
+def _dir_size(path: Path) -> int:
+    """Размер файла или папки в байтах"""
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+def bench_storage(num_battles: int, chunk_size: int, seed: int):
+    """Сравнивает размер и время загрузки колоночных таблиц и CSV/JSON"""
+    print(f"💾 Бенчмарк форматов хранения ({num_battles} боёв)")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards_df = collector.create_cards_database()
+            collector.write_battle_data(cards_df, num_battles, seed, chunk_size, workers=1)
+
+        for name in ['battles', 'rounds']:
+            table_dir = collector.output_dir / name
+            stem = collector.output_dir / EXPORT_NAMES[name]
+            _, export_time = _timed(export_table, table_dir, EXPORT_FORMATS, stem)
+
+            _, columnar_time = _timed(read_table, table_dir)
+            _, mmap_time = _timed(load_columns, table_dir)
+            _, csv_time = _timed(pd.read_csv, stem.with_suffix('.csv'))
+            _, json_time = _timed(pd.read_json, stem.with_suffix('.json'))
+
+            print(f"  📋 {name}:")
+            print(f"    колоночный: {_dir_size(table_dir) / 2**20:8.1f} МБ, read_table {columnar_time:6.2f}с, "
+                  f"load_columns {mmap_time:6.3f}с")
+            print(f"    CSV:        {_dir_size(stem.with_suffix('.csv')) / 2**20:8.1f} МБ, read_csv   {csv_time:6.2f}с")
+            print(f"    JSON:       {_dir_size(stem.with_suffix('.json')) / 2**20:8.1f} МБ, read_json  {json_time:6.2f}с")
+            print(f"    (экспорт CSV+JSON: {export_time:.2f}с)")
+
+
+# Разбор экспорта потребителем до колонок: JSON - JSON.parse и обход объектов строк,
+# binary - проверка SHA-256 и представления типизированных массивов над частями (как src/ml/training-data.ts)
+NODE_EXPORT_READERS = {
+    'json': """
+const fs = require('fs');
+const start = process.hrtime.bigint();
+const data = JSON.parse(fs.readFileSync(process.argv[1], 'utf8'));
+let rows = 0;
+for (const name of ['card_features', 'battle_features']) {
+  const records = data[name];
+  for (const column of Object.keys(records[0] || {})) {
+    const values = typeof records[0][column] === 'number' ? new Float64Array(records.length) : new Array(records.length);
+    records.forEach((record, i) => { values[i] = record[column]; });
+  }
+  rows += records.length;
+}
+console.log(JSON.stringify({seconds: Number(process.hrtime.bigint() - start) / 1e9, rows}));
+""",
+    'binary': """
+const fs = require('fs'), path = require('path'), crypto = require('crypto');
+const types = {int8: Int8Array, uint8: Uint8Array, int16: Int16Array, uint16: Uint16Array, int32: Int32Array,
+               uint32: Uint32Array, float32: Float32Array, float64: Float64Array};
+const start = process.hrtime.bigint();
+const dir = process.argv[1];
+const manifest = JSON.parse(fs.readFileSync(path.join(dir, 'manifest.json'), 'utf8'));
+let rows = 0;
+for (const table of Object.values(manifest.tables)) {
+  for (const chunk of table.chunks) {
+    const file = fs.readFileSync(path.join(dir, chunk.file));
+    if (crypto.createHash('sha256').update(file).digest('hex') !== chunk.sha256) throw new Error(chunk.file);
+    const buffer = file.buffer.slice(file.byteOffset, file.byteOffset + file.byteLength);
+    for (const [name, spec] of Object.entries(table.columns)) {
+      new types[spec.dtype](buffer, chunk.offsets[name], chunk.rows * spec.shape.reduce((a, b) => a * b, 1));
+    }
+    rows += chunk.rows;
+  }
+}
+console.log(JSON.stringify({seconds: Number(process.hrtime.bigint() - start) / 1e9, rows}));
+"""
+}
+
+
+def _read_json_export(path: Path) -> Dict[str, Dict[str, np.ndarray]]:
+    """Прежний потребитель: весь training_data.json в память, затем колонки из объектов строк"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: {column: np.array([record[column] for record in data[name]]) for column in data[name][0]}
+            for name in ['card_features', 'battle_features']}
+
+
+def _read_typed_export(output_dir: Path) -> Dict[str, List[Dict[str, np.ndarray]]]:
+    """Разбор типизированных массивов: проверка SHA-256 частей и np.frombuffer без копирования"""
+    manifest = json.loads((output_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+    tables = {}
+    for name, table in manifest['tables'].items():
+        tables[name] = []
+        for chunk in table['chunks']:
+            payload = (output_dir / chunk['file']).read_bytes()
+            if hashlib.sha256(payload).hexdigest() != chunk['sha256']:
+                raise ValueError(f"Контрольная сумма части {chunk['file']} не совпадает")
+            tables[name].append({
+                column: np.frombuffer(payload, dtype=np.dtype(spec['dtype']).newbyteorder('<'),
+                                      count=chunk['rows'] * int(np.prod(spec['shape'])),
+                                      offset=chunk['offsets'][column]).reshape([chunk['rows']] + spec['shape'])
+                for column, spec in table['columns'].items()
+            })
+    return tables
+
+
+def bench_export(num_battles: int, chunk_size: int, seed: int):
+    """Экспорт признаков для TensorFlow.js: один JSON vs части типизированных массивов.
+
+    Время экспорта, размер (и после gzip - так файлы обычно отдаются браузеру), разбор до колонок
+    в Python и, если найден node, в Node.js. Совпадение колонок обоих форматов проверяется.
+    """
+    print(f"📦 Бенчмарк экспорта для TensorFlow.js ({num_battles} боёв)")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collectors = {fmt: UrbanRivalsDataCollector(tmp_dir, reference_time=datetime(2024, 1, 1), tfjs_format=fmt)
+                      for fmt in TFJS_EXPORT_FORMATS}
+        collector = collectors['binary']
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards_df = collector.create_cards_database()
+            collector.write_battle_data(cards_df, num_battles, seed, chunk_size, workers=1)
+            features = collector.create_training_features(cards_df, load_columns(collector.output_dir / "battles"),
+                                                          load_columns(collector.output_dir / "rounds"))
+
+        readers = {'json': _read_json_export, 'binary': _read_typed_export}
+        node = shutil.which('node')
+        parsed = {}
+        for fmt in TFJS_EXPORT_FORMATS:
+            path = collector.output_dir / TFJS_EXPORT_NAMES[fmt]
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, export_time = _timed(collectors[fmt].export_for_tensorflowjs, features)
+            files = [path] if path.is_file() else sorted(f for f in path.rglob('*') if f.is_file())
+            gzip_size = sum(len(gzip.compress(f.read_bytes(), compresslevel=6)) for f in files)
+            parsed[fmt], parse_time = _timed(readers[fmt], path)
+
+            line = (f"  {'🐢' if fmt == 'json' else '🚀'} {fmt:<6}: экспорт {export_time:6.2f}с, "
+                    f"{_dir_size(path) / 2**20:7.2f} МБ (gzip {gzip_size / 2**20:6.2f} МБ, файлов {len(files)}), "
+                    f"разбор Python {parse_time:6.3f}с")
+            if node:
+                result = subprocess.run([node, '-e', NODE_EXPORT_READERS[fmt], str(path)], capture_output=True,
+                                        text=True, check=True)
+                line += f", Node.js {json.loads(result.stdout)['seconds']:6.3f}с"
+            print(line)
+
+    if not node:
+        print("  ⚠️ node не найден: разбор в Node.js не замерялся")
+    json_columns = parsed['json']['battle_features']
+    typed_columns = {column: np.concatenate([chunk[column] for chunk in parsed['binary']['battle_features']])
+                     for column in json_columns}
+    # winner в JSON - строки меток, в типизированных массивах - коды категорий манифеста
+    identical = all(np.array_equal(json_columns[column], typed_columns[column])
+                    for column in json_columns if json_columns[column].dtype.kind != 'U')
+    print(f"  {'✅' if identical else '❌'} Числовые колонки battle_features {'совпадают' if identical else 'РАСХОДЯТСЯ'}")
+
+
+def legacy_training_features(cards_df: pd.DataFrame, battles_df: pd.DataFrame, rounds_df: pd.DataFrame,
+                              clans: list) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Прежнее построчное построение признаков (iterrows + list.index) - эталон для сравнения"""
+    card_features = []
+    for _, card in cards_df.iterrows():
+        card_features.append({
+            'card_id': card['card_id'],
+            'clan_encoded': list(clans).index(card['clan']),
+            'rarity_encoded': ['Common', 'Uncommon', 'Rare', 'Legendary'].index(card['rarity']),
+            'max_power': card['power_level_5'],
+            'max_damage': card['damage_level_5'],
+            # pandas >= 3 хранит отсутствующую способность как NaN, а NaN истинно в if
+            'has_ability': 1 if pd.notna(card['ability']) and card['ability'] else 0,
+            'power_damage_ratio': card['power_level_5'] / max(card['damage_level_5'], 1),
+            'total_stats': card['power_level_5'] + card['damage_level_5']
+        })
+
+    battle_features = []
+    winners = dict(zip(battles_df['battle_id'], battles_df['winner']))
+    first_rounds = rounds_df[rounds_df['round'] == 1]
+    for _, first_round in first_rounds.iterrows():
+        battle_features.append({
+            'battle_id': first_round['battle_id'],
+            'player_total_attack': first_round['player_attack'],
+            'opponent_total_attack': first_round['opponent_attack'],
+            'attack_difference': int(first_round['player_attack']) - int(first_round['opponent_attack']),
+            'player_pills_used': first_round['player_pills_used'],
+            'opponent_pills_used': first_round['opponent_pills_used'],
+            'winner': winners[first_round['battle_id']]
+        })
+
+    return pd.DataFrame(card_features), pd.DataFrame(battle_features)
+
+
+def bench_features(num_battles: int, legacy_battles: int, chunk_size: int, seed: int):
+    """Сравнивает построчное и векторизованное построение признаков и проверяет идентичность"""
+    print(f"🔧 Бенчмарк признаков ({num_battles} боёв, эталон: {legacy_battles})")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        clans = list(collector.clans_data.keys())
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards_df = collector.create_cards_database()
+            collector.write_battle_data(cards_df, num_battles, seed, chunk_size, workers=1)
+
+        battles = load_columns(collector.output_dir / "battles")
+        rounds = load_columns(collector.output_dir / "rounds")
+
+        def run_vectorized():
+            return card_features(cards_df, clans), first_round_features(battles, rounds)
+
+        (cards_new, battles_new), new_time = _timed(run_vectorized)
+
+        # Эталон - на первых legacy_battles боях (таблицы отсортированы по battle_id)
+        battles_df = read_table(collector.output_dir / "battles")
+        rounds_df = read_table(collector.output_dir / "rounds")
+        battles_df = battles_df[battles_df['battle_id'] < legacy_battles]
+        rounds_df = rounds_df[rounds_df['battle_id'] < legacy_battles]
+        (cards_old, battles_old), old_time = _timed(legacy_training_features, cards_df, battles_df, rounds_df, clans)
+
+    identical = True
+    for old, new in [(cards_old, cards_new), (battles_old, battles_new.iloc[:len(battles_old)])]:
+        try:
+            pd.testing.assert_frame_equal(old.reset_index(drop=True).astype(object),
+                                          new.reset_index(drop=True).astype(object), check_dtype=False)
+        except AssertionError:
+            identical = False
+
+    old_rate = legacy_battles / old_time
+    new_rate = num_battles / new_time
+    print(f"  🐢 iterrows:     {old_rate:14,.0f} боёв/сек")
+    print(f"  🚀 векторно:     {new_rate:14,.0f} боёв/сек ({new_time:.2f}с на {num_battles} боёв)")
+    print(f"  📈 Ускорение: x{new_rate / old_rate:.0f}")
+    print(f"  {'✅' if identical else '❌'} Признаки {'совпадают' if identical else 'РАСХОДЯТСЯ'} с эталоном")
+
+
+def legacy_strategy_samples(card_features_df: pd.DataFrame, decks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Прежний цикл train_strategy_classifier (агрегаты pandas + if/elif) по заданным колодам"""
+    strategies = []
+    strategy_labels = []
+    for deck_index in decks:
+        deck = card_features_df.iloc[deck_index]
+
+        avg_power = deck['max_power'].mean()
+        avg_damage = deck['max_damage'].mean()
+        total_stats = deck['total_stats'].sum()
+        clan_diversity = deck['clan_encoded'].nunique()
+        ability_count = deck['has_ability'].sum()
+
+        if avg_power > 7.5:
+            strategy = 'power_focused'
+        elif avg_damage > 6:
+            strategy = 'damage_focused'
+        elif clan_diversity <= 2:
+            strategy = 'mono_clan'
+        elif ability_count >= 3:
+            strategy = 'ability_focused'
+        else:
+            strategy = 'balanced'
+
+        strategies.append([avg_power, avg_damage, total_stats, clan_diversity, ability_count])
+        strategy_labels.append(strategy)
+
+    return np.array(strategies), np.array(strategy_labels)
+
+
+def bench_strategy(num_decks: int, legacy_decks: int, seed: int):
+    """Сравнивает цикл по колодам и матричную выборку колод, проверяет совпадение признаков и меток"""
+    print(f"🎯 Бенчмарк выборки колод для стратегий ({num_decks} колод, эталон: {legacy_decks})")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards_df = collector.create_cards_database()
+    card_features_df = card_features(cards_df, list(collector.clans_data.keys()))
+
+    (X_new, y_new), new_time = _timed(deck_strategy_features, card_features_df, num_decks,
+                                      np.random.default_rng(seed))
+
+    # Эталон - на тех же колодах: тот же сид даёт ту же матрицу индексов
+    decks = sample_decks(np.random.default_rng(seed), len(card_features_df), num_decks)[:legacy_decks]
+    (X_old, y_old), old_time = _timed(legacy_strategy_samples, card_features_df, decks)
+
+    identical = np.array_equal(X_old, X_new[:legacy_decks]) and np.array_equal(y_old, y_new[:legacy_decks])
+    old_rate = legacy_decks / old_time
+    new_rate = num_decks / new_time
+    print(f"  🐢 цикл pandas:  {old_rate:14,.0f} колод/сек")
+    print(f"  🚀 матрица:      {new_rate:14,.0f} колод/сек ({new_time:.2f}с на {num_decks} колод)")
+    print(f"  📈 Ускорение: x{new_rate / old_rate:.0f}")
+    labels, counts = np.unique(y_new, return_counts=True)
+    print(f"  📊 Стратегии: {dict(zip(labels.tolist(), counts.tolist()))}")
+    print(f"  {'✅' if identical else '❌'} Признаки и метки {'совпадают' if identical else 'РАСХОДЯТСЯ'} с эталоном")
+
+
+def grouped_card_outcomes(rounds_df: pd.DataFrame, num_cards: int) -> pd.DataFrame:
+    """Эталон индекса исходов: groupby по карте для каждой стороны раунда"""
+    sides = []
+    for side, side_winner in [('player_card', 'player'), ('opponent_card', 'opponent')]:
+        won = rounds_df['winner'] == side_winner
+        sides.append(pd.DataFrame({
+            'card': rounds_df[side].to_numpy(),
+            'appearances': 1,
+            'wins': won.to_numpy().astype(np.int64),
+            'draws': (rounds_df['winner'] == 'draw').to_numpy().astype(np.int64),
+            'damage_dealt': np.where(won, rounds_df['damage_dealt'], 0).astype(np.int64)
+        }))
+    grouped = pd.concat(sides).groupby('card').sum()
+    return grouped.reindex(range(num_cards), fill_value=0)
+
+
+def bench_outcomes(num_battles: int, chunk_size: int, seed: int):
+    """Время построения индекса исходов по картам (bincount по частям раундов) и проверка по groupby"""
+    print(f"🃏 Бенчмарк индекса исходов карт ({num_battles} боёв)")
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards_df = collector.create_cards_database()
+            collector.write_battle_data(cards_df, num_battles, seed, chunk_size, workers=1)
+        rounds_dir = collector.output_dir / "rounds"
+        columns = ['player_card', 'opponent_card', 'winner', 'damage_dealt']
+
+        outcomes, index_time = _timed(lambda: card_outcome_index(iter_table_chunks(rounds_dir, columns),
+                                                                 cards_df['card_id'].to_numpy()))
+        rounds_df = read_table(rounds_dir, columns)
+        reference, groupby_time = _timed(grouped_card_outcomes, rounds_df, len(cards_df))
+
+    identical = all(np.array_equal(outcomes[name], reference[name].to_numpy())
+                    for name in ['appearances', 'wins', 'draws', 'damage_dealt'])
+    num_rounds = len(rounds_df)
+    print(f"  📊 {num_rounds} раундов, {len(cards_df)} карт")
+    print(f"  🐼 groupby (в памяти):   {num_rounds / groupby_time:14,.0f} раундов/сек")
+    print(f"  🚀 bincount по частям:   {num_rounds / index_time:14,.0f} раундов/сек ({index_time:.2f}с)")
+    print(f"  {'✅' if identical else '❌'} Индекс {'совпадает' if identical else 'РАСХОДИТСЯ'} с groupby")
+
+
+def bench_input_pipeline(num_battles: int, chunk_size: int, batch_size: int, seed: int):
+    """Сравнивает время эпохи модели боёв: массивы в памяти (batch 32) vs конвейер tf.data по частям таблицы"""
+    import tensorflow as tf
+    from input_pipeline import columns_fn, fit_scaler, make_datasets, table_parts
+    from train_models import BATTLE_INPUT_FEATURES
+
+    print(f"🧪 Бенчмарк входного конвейера ({num_battles} боёв, batch_size={batch_size})")
+
+    def build_model():
+        model = tf.keras.Sequential([
+            tf.keras.layers.Dense(64, activation='relu', input_shape=(len(BATTLE_INPUT_FEATURES),)),
+            tf.keras.layers.Dense(32, activation='relu'),
+            tf.keras.layers.Dense(len(WINNER_LABELS), activation='softmax')
+        ])
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+        return model
+
+    np.random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collector = UrbanRivalsDataCollector(tmp_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cards_df = collector.create_cards_database()
+            collector.write_battle_data(cards_df, num_battles, seed, chunk_size, workers=1)
+            collector.create_training_features(cards_df, load_columns(collector.output_dir / "battles"),
+                                               load_columns(collector.output_dir / "rounds"))
+        table_dir = collector.output_dir / "battle_features"
+
+        # Прежний путь: вся таблица в памяти, batch_size=32, validation_split
+        frame = read_table(table_dir)
+        X = frame[BATTLE_INPUT_FEATURES].to_numpy(dtype=np.float32)
+        X = (X - X.mean(axis=0)) / X.std(axis=0)
+        y = frame['winner'].cat.codes.to_numpy()
+        model = build_model()
+        _, legacy_time = _timed(model.fit, X, y, epochs=1, batch_size=32, validation_split=0.2, verbose=0)
+
+        # Конвейер: части таблицы с диска, большие батчи, параллельный map и prefetch
+        parts = table_parts(table_dir)
+        features = columns_fn(BATTLE_INPUT_FEATURES)
+        labels = lambda part, rows: np.asarray(part['winner'])[rows]
+        datasets = make_datasets(parts, features, labels, scaler=fit_scaler(parts, features), batch_size=batch_size)
+        model = build_model()
+        _, pipeline_time = _timed(model.fit, datasets['train'], validation_data=datasets['validation'],
+                                  epochs=1, verbose=0)
+
+    print(f"  🐢 массивы, batch 32:        {legacy_time:8.2f}с на эпоху")
+    print(f"  🚀 tf.data, batch {batch_size:<6}:    {pipeline_time:8.2f}с на эпоху")
+    print(f"  📈 Ускорение: x{legacy_time / pipeline_time:.1f}")
+
+
+# Полносвязные модели train_models.py (размеры слоёв, активация выхода, классы) - для синтетического бандла,
+# если обученных моделей нет: на пропускную способность влияют только размеры слоёв
+INFERENCE_ARCHITECTURES = {
+    'battle_predictor': ([5, 64, 32, 16, 3], 'softmax', sorted(WINNER_LABELS)),
+    'card_recommender': ([7, 128, 64, 32, 16, 1], 'sigmoid', None),
+    'strategy_classifier': ([5, 64, 32, 16, 5], 'softmax', sorted(STRATEGY_LABELS))
+}
+INFERENCE_BATCH_SIZES = [2 ** power for power in range(13)]  # 1 ... 4096
+INFERENCE_MAX_BATCHES = 256  # больше пакетов на размер не нужно для устойчивого замера
+
+
+def _synthetic_bundle(path: Path, seed: int):
+    """Бандл со случайными весами в архитектурах моделей тренера"""
+    from model_bundle import write_bundle
+
+    rng = np.random.default_rng(seed)
+    models = {}
+    for name, (sizes, output_activation, classes) in INFERENCE_ARCHITECTURES.items():
+        activations = ['relu'] * (len(sizes) - 2) + [output_activation]
+        models[name] = {
+            'type': 'classification' if classes else 'regression',
+            'input_features': [f"x{i}" for i in range(sizes[0])],
+            'output_classes': classes,
+            'layers': [{'kernel': rng.normal(0, np.sqrt(2 / inputs), (inputs, outputs)),
+                        'bias': np.zeros(outputs), 'activation': activation}
+                       for inputs, outputs, activation in zip(sizes[:-1], sizes[1:], activations)],
+            'scaler': {'mean': np.zeros(sizes[0]), 'scale': np.ones(sizes[0])}
+        }
+    write_bundle(path, models, {'clans': [], 'rarities': []}, 'float32')
+
+
+def bench_inference(models_dir: Optional[str], backend: str, rows: int, batch_sizes: List[int],
+                    concurrency: int, max_wait_ms: float, seed: int, output: Optional[Path] = None):
+    """Пропускная способность пакетного инференса по размерам пакета и склейка одиночных запросов"""
+    from concurrent.futures import ThreadPoolExecutor
+    from inference import BundlePredictor, CoalescingPredictor, load_predictor
+    from model_bundle import BUNDLE_FILE
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if models_dir is None:
+            print("⚠️ --models-dir не задан: бандл со случайными весами в архитектурах моделей тренера")
+            _synthetic_bundle(Path(tmp_dir) / BUNDLE_FILE, seed)
+            predictor = BundlePredictor(Path(tmp_dir))
+            backend = 'bundle'
+        else:
+            predictor = load_predictor(models_dir, backend)
+
+    rng = np.random.default_rng(seed)
+    results = {'backend': backend, 'rows': rows, 'models': {}}
+    print(f"🤖 Бенчмарк инференса ({backend}, до {rows} строк на размер пакета)")
+    print(f"  {'пакет':>6} " + " ".join(f"{name:>22}" for name in predictor.infos))
+    inputs = {name: rng.normal(5, 3, (rows, len(info['input_features']))).astype(np.float32)
+              for name, info in predictor.infos.items()}
+    for name, X in inputs.items():
+        predictor.predict(name, X[:max(batch_sizes)], max(batch_sizes))  # прогрев
+        results['models'][name] = {}
+
+    for batch_size in batch_sizes:
+        line = []
+        for name, X in inputs.items():
+            n = min(rows, batch_size * INFERENCE_MAX_BATCHES)
+            _, elapsed = _timed(predictor.predict, name, X[:n], batch_size)
+            results['models'][name][batch_size] = n / elapsed
+            line.append(f"{n / elapsed:16,.0f} стр/с")
+        print(f"  {batch_size:>6} " + " ".join(f"{cell:>22}" for cell in line))
+
+    # Склейка: concurrency клиентов шлют по одной строке, исполнитель считает их общими пакетами
+    coalescer = CoalescingPredictor(predictor, max(batch_sizes), max_wait_ms)
+    results['coalesced'] = {}
+    for name, X in inputs.items():
+        n = min(rows, concurrency * INFERENCE_MAX_BATCHES)
+        with ThreadPoolExecutor(concurrency) as pool:
+            _, elapsed = _timed(lambda: list(pool.map(lambda i: coalescer.submit(name, X[i:i + 1]).result(), range(n))))
+        stats = coalescer.stats[name]
+        results['coalesced'][name] = {'rows_per_sec': n / elapsed, 'avg_batch': stats['rows'] / stats['batches']}
+        print(f"  🔗 {name}: {concurrency} клиентов по 1 строке - {n / elapsed:,.0f} стр/с, "
+              f"средний склеенный пакет {stats['rows'] / stats['batches']:.1f}")
+
+    if output is not None:
+        output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"💾 Результаты: {output}")
+
+
+# Набор этапов для suite: функция замера и максимальный размер (None - без ограничения)
+SUITE_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SUITE_TOLERANCE = 0.2
+SUITE_REPEATS = 3
+# Замеры короче этого времени слишком шумные, чтобы считать их регрессией
+SUITE_MIN_COMPARABLE_SECONDS = 0.05
+
+
+def _suite_cards_df(task: Dict[str, Any]) -> pd.DataFrame:
+    return read_table(Path(task['data_dir']) / "cards")
+
+
+def _suite_collector(task: Dict[str, Any]) -> UrbanRivalsDataCollector:
+    return UrbanRivalsDataCollector(task['scratch_dir'], reference_time=datetime(2024, 1, 1))
+
+
+def _suite_trainer(task: Dict[str, Any], job: str):
+    from train_models import UrbanRivalsMLTrainer
+    trainer = UrbanRivalsMLTrainer(task['data_dir'], str(Path(task['scratch_dir']) / "models"),
+                                   strategy_samples=task['size'], epochs=task['epochs'])
+    # Только таблицы задачи: признаков рынка в датасете suite нет
+    return trainer, trainer.load_training_data([job])
+
+
+def _suite_create_cards_database(task):
+    np.random.seed(task['seed'])
+    cards_df, elapsed = _timed(_suite_collector(task).create_cards_database)
+    return len(cards_df), elapsed
+
+
+def _suite_generate_battle_data(task):
+    collector = _suite_collector(task)
+    cards_df = _suite_cards_df(task)
+    _, elapsed = _timed(collector.generate_battle_data, cards_df, task['size'], np.random.default_rng(task['seed']))
+    return task['size'], elapsed
+
+
+def _suite_write_battle_data(task):
+    collector = _suite_collector(task)
+    cards_df = _suite_cards_df(task)
+    _, elapsed = _timed(collector.write_battle_data, cards_df, task['size'], task['seed'], workers=1)
+    return task['size'], elapsed
+
+
+def _suite_generate_market_data(task):
+    # Дней столько, чтобы строк рынка было примерно столько же, сколько боёв
+    collector = _suite_collector(task)
+    cards_df = _suite_cards_df(task)
+    days = max(1, task['size'] // len(cards_df))
+    _, elapsed = _timed(collector.generate_market_data, cards_df, days, np.random.default_rng(task['seed']))
+    return days * len(cards_df), elapsed
+
+
+def _suite_create_training_features(task):
+    collector = _suite_collector(task)
+    cards_df = _suite_cards_df(task)
+    battles = load_columns(Path(task['data_dir']) / "battles")
+    rounds = load_columns(Path(task['data_dir']) / "rounds")
+    _, elapsed = _timed(collector.create_training_features, cards_df, battles, rounds)
+    return task['size'], elapsed
+
+
+def _suite_export_for_tensorflowjs(task):
+    collector = _suite_collector(task)
+    features = {}
+    for name in ['card_features', 'battle_features']:
+        # Двоичный экспорт читает таблицы признаков из папки коллектора
+        shutil.copytree(Path(task['data_dir']) / name, collector.output_dir / name, dirs_exist_ok=True)
+        features[name] = read_table(Path(task['data_dir']) / name)
+    _, elapsed = _timed(collector.export_for_tensorflowjs, features)
+    return task['size'], elapsed
+
+
+def _suite_train_battle_predictor(task):
+    trainer, data = _suite_trainer(task, 'battle')
+    _, elapsed = _timed(trainer.train_battle_predictor, data['battle_features'])
+    return task['size'], elapsed
+
+
+def _suite_train_card_recommender(task):
+    trainer, data = _suite_trainer(task, 'card')
+    _, elapsed = _timed(trainer.train_card_recommender, data['card_features'], data['card_outcomes'])
+    return len(data['card_features']), elapsed
+
+
+def _suite_train_strategy_classifier(task):
+    trainer, data = _suite_trainer(task, 'strategy')
+    _, elapsed = _timed(trainer.train_strategy_classifier, data['card_features'])
+    return task['size'], elapsed
+
+
+SUITE_STAGES = {
+    'create_cards_database': {'run': _suite_create_cards_database, 'max_size': None},
+    'generate_battle_data': {'run': _suite_generate_battle_data, 'max_size': None},
+    'write_battle_data': {'run': _suite_write_battle_data, 'max_size': None},
+    'generate_market_data': {'run': _suite_generate_market_data, 'max_size': None},
+    'create_training_features': {'run': _suite_create_training_features, 'max_size': None},
+    'export_for_tensorflowjs': {'run': _suite_export_for_tensorflowjs, 'max_size': None},
+    'train_battle_predictor': {'run': _suite_train_battle_predictor, 'max_size': None},
+    'train_card_recommender': {'run': _suite_train_card_recommender, 'max_size': None},
+    'train_strategy_classifier': {'run': _suite_train_strategy_classifier, 'max_size': None}
+}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS текущего процесса в МБ (None, если платформа не поддерживает resource)"""
+    # На Linux ru_maxrss переживает exec и включает RSS родителя на момент fork,
+    # а VmHWM относится только к адресному пространству самого процесса
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+def suite_stage(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Замер одного этапа в отдельном процессе: пиковый RSS относится только к этому этапу.
+
+    Этап выполняется task['repeats'] раз, в результат идёт лучшее время.
+    """
+    record = {'stage': task['stage'], 'size': task['size']}
+    # Рабочая папка этапа: туда пишут коллектор и тренер (models/ создаётся без parents)
+    Path(task['scratch_dir']).mkdir(parents=True, exist_ok=True)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            runs = [SUITE_STAGES[task['stage']]['run'](task) for _ in range(task['repeats'])]
+        rows, elapsed = min(runs, key=lambda run: run[1])
+    except Exception as e:
+        # Например, TensorFlow не установлен - этап отмечается, остальные замеры продолжаются
+        record.update({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+        return record
+    record.update({
+        'status': 'ok',
+        'rows': int(rows),
+        'wall_time': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed > 0 else None,
+        'repeats': task['repeats'],
+        'peak_rss_mb': _peak_rss_mb()
+    })
+    return record
+
+
+def _prepare_suite_dataset(data_dir: Path, num_battles: int, seed: int):
+    """Готовит датасет, на котором замеряются признаки, экспорт и обучение (не входит в замеры)"""
+    collector = UrbanRivalsDataCollector(str(data_dir), reference_time=datetime(2024, 1, 1))
+    with contextlib.redirect_stdout(io.StringIO()):
+        np.random.seed(seed)
+        cards_df = collector.create_cards_database()
+        collector.write_battle_data(cards_df, num_battles, seed, workers=1)
+        collector.create_training_features(cards_df, load_columns(data_dir / "battles"),
+                                           load_columns(data_dir / "rounds"))
+        collector.create_sequence_features(cards_df)
+        collector.create_card_outcomes(cards_df)
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = SUITE_TOLERANCE) -> List[Dict[str, Any]]:
+    """Сравнивает rows/sec с базовой линией; регрессия - падение больше чем на tolerance.
+
+    Слишком короткие замеры (базовое время меньше SUITE_MIN_COMPARABLE_SECONDS) регрессией не считаются.
+    """
+    reference = {(r['stage'], r['size']): r for r in baseline['results'] if r.get('status') == 'ok'}
+    comparison = []
+    for record in results['results']:
+        base = reference.get((record['stage'], record['size']))
+        if record.get('status') != 'ok' or base is None:
+            continue
+        ratio = record['rows_per_sec'] / base['rows_per_sec']
+        comparison.append({
+            'stage': record['stage'],
+            'size': record['size'],
+            'ratio': ratio,
+            'comparable': base['wall_time'] >= SUITE_MIN_COMPARABLE_SECONDS,
+            'regression': ratio < 1 - tolerance and base['wall_time'] >= SUITE_MIN_COMPARABLE_SECONDS
+        })
+    return comparison
+
+
+def run_suite(sizes: List[int], stages: List[str], output: Path, baseline_path: Optional[Path],
+              tolerance: float, epochs: int, seed: int, repeats: int = SUITE_REPEATS) -> bool:
+    """Замеряет этапы на всех размерах, пишет результаты в JSON и сравнивает с базовой линией.
+
+    Возвращает False, если найдена регрессия относительно базовой линии.
+    """
+    print(f"🧪 Набор бенчмарков: {len(stages)} этапов x размеры {sizes}")
+    results = {
+        'created': datetime.now().isoformat(),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'cpu_count': os.cpu_count()
+        },
+        'params': {'sizes': sizes, 'stages': stages, 'epochs': epochs, 'seed': seed, 'repeats': repeats},
+        'results': []
+    }
+
+    # Каждый замер - в новом процессе (spawn), чтобы пиковый RSS не наследовался от предыдущих этапов
+    mp_context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_dir = Path(tmp_dir) / "data"
+            _, prepare_time = _timed(_prepare_suite_dataset, data_dir, size, seed)
+            print(f"  📦 {size} боёв: датасет подготовлен за {prepare_time:.1f}с")
+
+            for stage in stages:
+                max_size = SUITE_STAGES[stage]['max_size']
+                if max_size is not None and size > max_size:
+                    record = {'stage': stage, 'size': size, 'status': 'skipped'}
+                else:
+                    task = {'stage': stage, 'size': size, 'seed': seed, 'epochs': epochs, 'repeats': repeats,
+                            'data_dir': str(data_dir), 'scratch_dir': str(Path(tmp_dir) / f"scratch_{stage}")}
+                    with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+                        record = executor.submit(suite_stage, task).result()
+                results['results'].append(record)
+                _print_suite_record(record)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"💾 Результаты сохранены: {output}")
+
+    if baseline_path is None:
+        return True
+    if not baseline_path.exists():
+        print(f"⚠️ Базовая линия не найдена: {baseline_path}")
+        return True
+
+    comparison = compare_with_baseline(results, json.loads(baseline_path.read_text(encoding='utf-8')), tolerance)
+    print(f"📏 Сравнение с базовой линией {baseline_path} (допуск {tolerance:.0%}):")
+    for item in comparison:
+        mark = '❌' if item['regression'] else '✅' if item['comparable'] else '〰️'
+        print(f"  {mark} {item['stage']:<28} {item['size']:>9}: x{item['ratio']:.2f}")
+    regressions = [item for item in comparison if item['regression']]
+    if regressions:
+        print(f"❌ Регрессий: {len(regressions)}")
+    return not regressions
+
+
+def _print_suite_record(record: Dict[str, Any]):
+    if record['status'] == 'ok':
+        rss = f"{record['peak_rss_mb']:8.0f} МБ" if record['peak_rss_mb'] is not None else "       -"
+        print(f"    {record['stage']:<28} {record['wall_time']:8.2f}с {record['rows_per_sec']:14,.0f} строк/сек {rss}")
+    elif record['status'] == 'skipped':
+        print(f"    {record['stage']:<28} пропущен (больше max_size)")
+    else:
+        print(f"    {record['stage']:<28} ❌ {record['error']}")
+
+
+def main():
+    """Точка входа бенчмарков"""
+    parser = argparse.ArgumentParser(description="Бенчмарки ML пайплайна Urban Rivals")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    simulator_parser = subparsers.add_parser('simulator', help="Симуляция боёв: пошагово vs пакетно")
+    simulator_parser.add_argument('--battles', type=int, default=1_000_000)
+    simulator_parser.add_argument('--legacy-battles', type=int, default=5_000)
+    simulator_parser.add_argument('--seed', type=int, default=42)
+
+    market_parser = subparsers.add_parser('market', help="Генерация рынка: days x iterrows vs матрица")
+    market_parser.add_argument('--days', type=int, default=3 * 365)
+    market_parser.add_argument('--cards', type=int, default=20_000)
+    market_parser.add_argument('--legacy-days', type=int, default=2)
+    market_parser.add_argument('--seed', type=int, default=42)
+
+    market_features_parser = subparsers.add_parser('market_features',
+                                                   help="Признаки рынка: groupby + rolling vs prefix-суммы по матрице")
+    market_features_parser.add_argument('--days', type=int, default=3 * 365)
+    market_features_parser.add_argument('--cards', type=int, default=5_000)
+    market_features_parser.add_argument('--legacy-cards', type=int, default=1_000)
+    market_features_parser.add_argument('--seed', type=int, default=42)
+
+    storage_parser = subparsers.add_parser('storage', help="Хранение: колоночные таблицы vs CSV/JSON")
+    storage_parser.add_argument('--battles', type=int, default=1_000_000)
+    storage_parser.add_argument('--chunk-size', type=int, default=250_000)
+    storage_parser.add_argument('--seed', type=int, default=42)
+
+    export_parser = subparsers.add_parser('export', help="Экспорт для TensorFlow.js: JSON vs части типизированных массивов")
+    export_parser.add_argument('--battles', type=int, default=1_000_000)
+    export_parser.add_argument('--chunk-size', type=int, default=250_000)
+    export_parser.add_argument('--seed', type=int, default=42)
+
+    features_parser = subparsers.add_parser('features', help="Признаки: iterrows vs колоночные операции")
+    features_parser.add_argument('--battles', type=int, default=1_000_000)
+    features_parser.add_argument('--legacy-battles', type=int, default=1_000_000)
+    features_parser.add_argument('--chunk-size', type=int, default=250_000)
+    features_parser.add_argument('--seed', type=int, default=42)
+
+    strategy_parser = subparsers.add_parser('strategy', help="Колоды стратегий: цикл pandas vs матрица индексов")
+    strategy_parser.add_argument('--decks', type=int, default=1_000_000)
+    strategy_parser.add_argument('--legacy-decks', type=int, default=5_000)
+    strategy_parser.add_argument('--seed', type=int, default=42)
+
+    outcomes_parser = subparsers.add_parser('outcomes', help="Индекс исходов карт: bincount по частям vs groupby")
+    outcomes_parser.add_argument('--battles', type=int, default=2_000_000)
+    outcomes_parser.add_argument('--chunk-size', type=int, default=250_000)
+    outcomes_parser.add_argument('--seed', type=int, default=42)
+
+    suite_parser = subparsers.add_parser('suite', help="Все этапы на нескольких размерах: время, строк/сек, пиковый RSS")
+    suite_parser.add_argument('--sizes', type=int, nargs='+', default=SUITE_SIZES, help="Количества боёв")
+    suite_parser.add_argument('--stages', nargs='+', choices=list(SUITE_STAGES), default=list(SUITE_STAGES))
+    suite_parser.add_argument('--output', type=Path, default=Path("benchmark_results.json"),
+                              help="Файл результатов (JSON)")
+    suite_parser.add_argument('--baseline', type=Path, default=None,
+                              help="Файл результатов прошлого запуска для сравнения")
+    suite_parser.add_argument('--tolerance', type=float, default=SUITE_TOLERANCE,
+                              help="Допустимое падение строк/сек относительно базовой линии")
+    suite_parser.add_argument('--epochs', type=int, default=1, help="Эпох для этапов обучения")
+    suite_parser.add_argument('--repeats', type=int, default=SUITE_REPEATS, help="Повторов замера (берётся лучшее время)")
+    suite_parser.add_argument('--seed', type=int, default=42)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help="Обучение: массивы в памяти vs конвейер tf.data")
+    pipeline_parser.add_argument('--battles', type=int, default=1_000_000)
+    pipeline_parser.add_argument('--chunk-size', type=int, default=250_000)
+    pipeline_parser.add_argument('--batch-size', type=int, default=1024)
+    pipeline_parser.add_argument('--seed', type=int, default=42)
+
+    inference_parser = subparsers.add_parser('inference', help="Инференс: строк/сек по размерам пакета 1..4096")
+    inference_parser.add_argument('--models-dir', default=None,
+                                  help="Папка обученных моделей (по умолчанию - синтетический бандл)")
+    inference_parser.add_argument('--backend', choices=['auto', 'bundle', 'keras'], default='auto')
+    inference_parser.add_argument('--rows', type=int, default=262_144, help="Максимум строк на размер пакета")
+    inference_parser.add_argument('--batch-sizes', type=int, nargs='+', default=INFERENCE_BATCH_SIZES)
+    inference_parser.add_argument('--concurrency', type=int, default=64, help="Клиентов для замера склейки")
+    inference_parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                                  help="Ожидание соседей при склейке (как у inference.py serve)")
+    inference_parser.add_argument('--output', type=Path, default=None, help="Файл результатов (JSON)")
+    inference_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'simulator':
+        bench_simulator(args.battles, args.legacy_battles, args.seed)
+    elif args.benchmark == 'market':
+        bench_market(args.days, args.cards, args.legacy_days, args.seed)
+    elif args.benchmark == 'market_features':
+        bench_market_features(args.days, args.cards, min(args.legacy_cards, args.cards), args.seed)
+    elif args.benchmark == 'storage':
+        bench_storage(args.battles, args.chunk_size, args.seed)
+    elif args.benchmark == 'export':
+        bench_export(args.battles, args.chunk_size, args.seed)
+    elif args.benchmark == 'features':
+        bench_features(args.battles, min(args.legacy_battles, args.battles), args.chunk_size, args.seed)
+    elif args.benchmark == 'strategy':
+        bench_strategy(args.decks, min(args.legacy_decks, args.decks), args.seed)
+    elif args.benchmark == 'outcomes':
+        bench_outcomes(args.battles, args.chunk_size, args.seed)
+    elif args.benchmark == 'suite':
+        ok = run_suite(args.sizes, args.stages, args.output, args.baseline, args.tolerance, args.epochs, args.seed,
+                       args.repeats)
+        sys.exit(0 if ok else 1)
+    elif args.benchmark == 'pipeline':
+        bench_input_pipeline(args.battles, args.chunk_size, args.batch_size, args.seed)
+    elif args.benchmark == 'inference':
+        bench_inference(args.models_dir, args.backend, args.rows, args.batch_sizes, args.concurrency,
+                        args.max_wait_ms, args.seed, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,63 @@ Urban Rivals ML Dataset Creation and Preprocessing
 Создание и предобработка датасета для обучения ML моделей
 """
 
+import argparse
 import json
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-import sqlite3
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 from datetime import datetime, timedelta
 import time
 
+from features import card_features, card_outcome_index, first_round_features, round_sequence_features
+from instrumentation import add_instrumentation_args, configure_from_args, instrumented
+from market import MARKET_MODELS, market_frame, simulate_market
+from market_features import (MARKET_STATE_FILE, MARKET_WINDOWS, MarketFeatureState, market_feature_rows,
+                             market_matrices, rolling_market_features)
+from sharding import battle_shard, chunk_bounds, iter_shards, market_shard, run_shards, shard_bounds, shard_seeds
+from sqlite_store import SQLITE_FILE, ingest_dataset
+from simulator import battle_tables, card_stats_array, draw_battle_metadata, simulate_battles
+from schemas import (ABILITY_TYPES, BATTLE_FEATURES_SCHEMA, BATTLE_SEQUENCES_SCHEMA, BATTLES_SCHEMA,
+                     CARD_FEATURES_SCHEMA, CARD_OUTCOMES_SCHEMA, EXPORT_NAMES, ROUNDS_SCHEMA, cards_schema,
+                     market_features_schema, market_schema)
+from storage import (EXPORT_FORMATS, ChunkedTableWriter, export_table, export_typed_arrays, iter_table_chunks,
+                     load_columns, read_manifest, read_table, write_table)
+
+# Этапы CLI (--stages), как в pipeline.py. Результаты невыбранных этапов, нужные выбранным, читаются с диска;
+# features включает последовательности раундов, индекс исходов карт и экспорт для TensorFlow.js,
+# market_features - скользящие признаки рынка для модели прогноза цены
+DATASET_STAGES = ['cards', 'battles', 'market', 'market_features', 'features']
+
+# Экспорт признаков для TensorFlow.js (--tfjs-format): binary - части типизированных массивов с манифестом
+# (читаются src/ml/training-data.ts), json - прежний training_data.json с объектом на строку
+TFJS_EXPORT_FORMATS = ['binary', 'json']
+TFJS_EXPORT_NAMES = {'binary': 'training_data', 'json': 'training_data.json'}
+
+
+def _outputs(*names: str):
+    """Пути результатов этапа в output_dir коллектора (для замеров bytes_written)"""
+    return lambda arguments: [arguments['self'].output_dir / name for name in names]
+
+
 class UrbanRivalsDataCollector:
     """Сборщик данных об Urban Rivals"""
     
-    def __init__(self, output_dir: str = "datasets"):
+    def __init__(self, output_dir: str = "datasets", reference_time: Optional[datetime] = None,
+                 export_formats: Optional[List[str]] = None, tfjs_format: str = 'binary'):
+        if tfjs_format not in TFJS_EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат экспорта для TensorFlow.js: {tfjs_format}. "
+                             f"Доступные: {TFJS_EXPORT_FORMATS}")
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         
+        # Таблицы всегда пишутся в колоночном формате, CSV/JSON - только по запросу
+        self.export_formats = list(export_formats or [])
+        self.tfjs_format = tfjs_format
+        
+        # Единая точка отсчёта для всех дат, чтобы генерация была воспроизводимой
+        self.reference_time = reference_time or datetime.now()
+        
         # Базовые данные о кланах и их бонусах
         self.clans_data = {
             'All Stars': {'bonus': '+2 Life', 'type': 'life'},
@@ -43,6 +83,7 @@ class UrbanRivalsDataCollector:
             'Junkz': {'bonus': '+8 Attack', 'type': 'attack'}
         }
     
+    @instrumented('cards', rows_out=len, outputs=_outputs('cards'))
     def create_cards_database(self) -> pd.DataFrame:
         """Создаёт базу данных карт Urban Rivals"""
         print("🃏 Создание базы данных карт...")
@@ -84,9 +125,7 @@ class UrbanRivalsDataCollector:
                 
                 # Способности (только для некоторых карт)
                 has_ability = np.random.random() < 0.7
-                ability_types = ['+2 Power', '+2 Damage', '+1 Life', 'Stop Opp Ability', 
-                               'Protection: Ability', '-2 Opp Power', '-2 Opp Damage']
-                ability = np.random.choice(ability_types) if has_ability else None
+                ability = np.random.choice(ABILITY_TYPES) if has_ability else None
                 
                 card_data = {
                     'card_id': f"card_{card_id}",
@@ -95,7 +134,7 @@ class UrbanRivalsDataCollector:
                     'rarity': rarity,
                     'ability': ability,
                     'ability_unlock_level': np.random.randint(2, 5) if has_ability else None,
-                    'release_date': datetime.now() - timedelta(days=np.random.randint(1, 1000)),
+                    'release_date': self.reference_time - timedelta(days=np.random.randint(1, 1000)),
                     **levels_data
                 }
                 
@@ -104,52 +143,100 @@ class UrbanRivalsDataCollector:
         
         cards_df = pd.DataFrame(cards_data)
         
-        # Сохраняем в файлы
-        cards_df.to_csv(self.output_dir / "cards_database.csv", index=False)
-        cards_df.to_json(self.output_dir / "cards_database.json", orient='records')
+        # Сохраняем в колоночную таблицу
+        self._save_table('cards', cards_df, cards_schema(list(self.clans_data.keys())))
         
         print(f"✅ База карт создана: {len(cards_df)} карт, {len(self.clans_data)} кланов")
         return cards_df
     
-    def generate_battle_data(self, cards_df: pd.DataFrame, num_battles: int = 10000) -> pd.DataFrame:
-        """Генерирует данные о боях для обучения"""
+    @instrumented('battles', rows_in=lambda a: a['num_battles'], rows_out=lambda result: len(result[1]['battle_id']),
+                  outputs=_outputs('battles', 'rounds'))
+    def generate_battle_data(self, cards_df: pd.DataFrame, num_battles: int = 10000,
+                             rng: Optional[np.random.Generator] = None
+                             ) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """Генерирует данные о боях для обучения одним пакетом (бои целиком в памяти).
+        
+        Возвращает записанные колоночные таблицы (бои, раунды) - как simulator.battle_tables;
+        для больших корпусов - write_battle_data.
+        """
         print(f"⚔️ Генерация {num_battles} боёв...")
         
-        battles_data = []
-        
-        for battle_id in range(num_battles):
-            # Случайный выбор 4 карт для каждого игрока
-            player_cards = cards_df.sample(4)
-            opponent_cards = cards_df.sample(4)
-            
-            # Симуляция боя
-            battle_result = self._simulate_battle(player_cards, opponent_cards)
-            
-            battle_data = {
-                'battle_id': f"battle_{battle_id}",
-                'timestamp': datetime.now() - timedelta(minutes=np.random.randint(1, 10000)),
-                'player_deck': player_cards['card_id'].tolist(),
-                'opponent_deck': opponent_cards['card_id'].tolist(),
-                'winner': battle_result['winner'],
-                'rounds_data': battle_result['rounds'],
-                'final_score': battle_result['final_score'],
-                'game_duration': np.random.randint(3, 8)  # минуты
+        if rng is None:
+            # Наследуем глобальное состояние np.random, чтобы np.random.seed() по-прежнему работал
+            rng = np.random.default_rng(np.random.randint(0, 2**31 - 1))
+        
+        # Все бои симулируются одним пакетом на массивах NumPy
+        card_stats = card_stats_array(cards_df)
+        batch = simulate_battles(card_stats, num_battles, rng)
+        batch.update(draw_battle_metadata(rng, num_battles))
+        
+        battles, rounds = battle_tables(batch, 0, self.reference_time)
+        self._save_table('battles', battles, BATTLES_SCHEMA)
+        self._save_table('rounds', rounds, ROUNDS_SCHEMA)
+        
+        print(f"✅ База боёв создана: {num_battles} боёв, {len(rounds['battle_id'])} раундов")
+        return battles, rounds
+    
+    @instrumented('battles', rows_in=lambda a: a['num_battles'], rows_out=lambda result: result['rounds'],
+                  outputs=_outputs('battles', 'rounds'))
+    def write_battle_data(self, cards_df: pd.DataFrame, num_battles: int, seed: int,
+                          chunk_size: int = 100_000, workers: Optional[int] = None,
+                          resume: bool = False) -> Dict[str, int]:
+        """Потоково генерирует бои и пишет их частями в колоночные таблицы battles/ и rounds/.
+        
+        Каждая часть - отдельный шард со своим np.random.Generator из мастер-сида,
+        поэтому результат не зависит от workers, а память не растёт с num_battles.
+        С resume=True уже записанные части сохраняются и генерация продолжается с места остановки.
+        """
+        params = {
+            'seed': seed,
+            'num_battles': num_battles,
+            'chunk_size': chunk_size,
+            'num_cards': len(cards_df),
+            'reference_time': self.reference_time.isoformat()
+        }
+        battles_writer = ChunkedTableWriter(self.output_dir / "battles", BATTLES_SCHEMA, params, resume)
+        rounds_writer = ChunkedTableWriter(self.output_dir / "rounds", ROUNDS_SCHEMA, params, resume)
+        
+        # Часть считается записанной, только если она есть в обеих таблицах
+        done = min(battles_writer.num_parts, rounds_writer.num_parts)
+        battles_writer.truncate(done)
+        rounds_writer.truncate(done)
+        
+        bounds = chunk_bounds(num_battles, chunk_size)
+        seeds = shard_seeds(seed, 'battles', len(bounds))
+        print(f"⚔️ Генерация {num_battles} боёв: {len(bounds)} частей по {chunk_size}, "
+              f"уже записано {done}, workers={workers or 'auto'}...")
+        
+        card_stats = card_stats_array(cards_df)
+        tasks = [
+            {
+                'card_stats': card_stats,
+                'num_battles': stop - start,
+                'first_battle_id': start,
+                'reference_time': self.reference_time,
+                'seed': seed_seq
             }
-            
-            battles_data.append(battle_data)
-            
-            if battle_id % 1000 == 0:
-                print(f"  📊 Обработано {battle_id} боёв...")
-        
-        battles_df = pd.DataFrame(battles_data)
-        battles_df.to_csv(self.output_dir / "battles_database.csv", index=False)
-        battles_df.to_json(self.output_dir / "battles_database.json", orient='records')
-        
-        print(f"✅ База боёв создана: {len(battles_df)} записей")
-        return battles_df
+            for (start, stop), seed_seq in list(zip(bounds, seeds))[done:]
+        ]
+        
+        for battles, rounds in iter_shards(battle_shard, tasks, workers):
+            battles_writer.write_chunk(battles)
+            rounds_writer.write_chunk(rounds)
+            print(f"  📊 Записано {battles_writer.num_rows} боёв...")
+        
+        print(f"✅ База боёв создана: {battles_writer.num_rows} боёв, {rounds_writer.num_rows} раундов")
+        self._export_table('battles')
+        self._export_table('rounds')
+        return {'battles': battles_writer.num_rows, 'rounds': rounds_writer.num_rows}
     
-    def _simulate_battle(self, player_cards: pd.DataFrame, opponent_cards: pd.DataFrame) -> Dict:
-        """Симулирует бой между двумя наборами карт"""
+    def _simulate_battle(self, player_cards: pd.DataFrame, opponent_cards: pd.DataFrame,
+                         pill_draws: Optional[Tuple[List[int], List[int]]] = None) -> Dict:
+        """Симулирует бой между двумя наборами карт (эталонная пошаговая реализация).
+        
+        pill_draws позволяет подставить заранее выбранные пилюли по раундам
+        (как в simulator.simulate_battles) для сверки с пакетным симулятором.
+        """
         player_life = 12
         opponent_life = 12
         player_pills = 12
@@ -167,8 +254,12 @@ class UrbanRivalsDataCollector:
                 opponent_card = opponent_cards.iloc[round_num - 1]
                 
                 # Определяем количество пилюль (случайная стратегия)
-                player_pills_used = min(np.random.randint(0, 6), player_pills)
-                opponent_pills_used = min(np.random.randint(0, 6), opponent_pills)
+                if pill_draws is None:
+                    player_pills_used = min(np.random.randint(0, 6), player_pills)
+                    opponent_pills_used = min(np.random.randint(0, 6), opponent_pills)
+                else:
+                    player_pills_used = min(int(pill_draws[0][round_num - 1]), player_pills)
+                    opponent_pills_used = min(int(pill_draws[1][round_num - 1]), opponent_pills)
                 
                 # Расчёт атаки
                 player_attack = player_card[f'power_level_5'] + player_pills_used
@@ -220,113 +311,210 @@ class UrbanRivalsDataCollector:
             'final_score': {'player': player_life, 'opponent': opponent_life}
         }
     
-    def generate_market_data(self, cards_df: pd.DataFrame, days: int = 180) -> pd.DataFrame:
-        """Генерирует данные о рынке карт"""
-        print(f"💰 Генерация рыночных данных за {days} дней...")
-        
-        market_data = []
-        
-        for day in range(days):
-            date = datetime.now() - timedelta(days=day)
-            
-            # Для каждой карты генерируем цены
-            for _, card in cards_df.iterrows():
-                # Базовая цена зависит от редкости
-                base_price = {
-                    'Common': np.random.randint(50, 200),
-                    'Uncommon': np.random.randint(150, 500),
-                    'Rare': np.random.randint(400, 1500),
-                    'Legendary': np.random.randint(1000, 5000)
-                }[card['rarity']]
-                
-                # Добавляем случайные колебания
-                price_variation = np.random.normal(0, 0.1)
-                current_price = int(base_price * (1 + price_variation))
-                
-                # Количество сделок
-                transaction_count = np.random.poisson(5)
-                
-                market_entry = {
-                    'date': date,
-                    'card_id': card['card_id'],
-                    'card_name': card['name'],
-                    'price': max(1, current_price),
-                    'transaction_count': transaction_count,
-                    'total_volume': current_price * transaction_count
-                }
-                
-                market_data.append(market_entry)
+    @instrumented('market', rows_in=lambda a: len(a['cards_df']), rows_out=len, outputs=_outputs('market'))
+    def generate_market_data(self, cards_df: pd.DataFrame, days: int = 180,
+                             rng: Optional[np.random.Generator] = None, model: str = 'iid') -> pd.DataFrame:
+        """Генерирует данные о рынке карт (вся матрица дни x карты за несколько операций над массивами)"""
+        print(f"💰 Генерация рыночных данных за {days} дней (модель {model})...")
+        
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(0, 2**31 - 1))
         
-        market_df = pd.DataFrame(market_data)
-        market_df.to_csv(self.output_dir / "market_data.csv", index=False)
-        market_df.to_json(self.output_dir / "market_data.json", orient='records')
+        market = simulate_market(cards_df['rarity'].to_numpy(), days, rng, model)
+        return self._save_market(market_frame(market, cards_df, self.reference_time), cards_df)
+    
+    @instrumented('market', rows_in=lambda a: len(a['cards_df']), rows_out=len, outputs=_outputs('market'))
+    def generate_market_data_sharded(self, cards_df: pd.DataFrame, days: int, seed: int,
+                                     num_shards: int, workers: Optional[int] = None,
+                                     model: str = 'iid') -> pd.DataFrame:
+        """Генерирует рыночные данные по шардам карт на пуле процессов"""
+        bounds = shard_bounds(len(cards_df), num_shards)
+        print(f"💰 Генерация рыночных данных за {days} дней (модель {model}): "
+              f"{len(bounds)} шардов, workers={workers or 'auto'}...")
+        
+        rarities = cards_df['rarity'].to_numpy()
+        tasks = [
+            {'rarities': rarities[start:stop], 'days': days, 'model': model, 'seed': seed_seq}
+            for (start, stop), seed_seq in zip(bounds, shard_seeds(seed, 'market', len(bounds)))
+        ]
+        shards = run_shards(market_shard, tasks, workers)
+        
+        # Склеиваем шарды по оси карт: матрицы (days x cards)
+        market = {
+            'price': np.hstack([shard['price'] for shard in shards]),
+            'transaction_count': np.hstack([shard['transaction_count'] for shard in shards])
+        }
+        return self._save_market(market_frame(market, cards_df, self.reference_time), cards_df)
+    
+    def _save_market(self, market_df: pd.DataFrame, cards_df: pd.DataFrame) -> pd.DataFrame:
+        """Сохраняет рыночные данные в колоночную таблицу"""
+        self._save_table('market', market_df, market_schema(cards_df))
         
         print(f"✅ Рыночные данные созданы: {len(market_df)} записей")
         return market_df
     
-    def create_training_features(self, cards_df: pd.DataFrame, battles_df: pd.DataFrame) -> Dict:
-        """Создаёт признаки для обучения ML моделей"""
+    def append_market_day(self, cards_df: pd.DataFrame, date: datetime, price: np.ndarray,
+                          transaction_count: np.ndarray) -> int:
+        """Дописывает в market/ новую часть: цены и сделки всех карт за один день (например, снимок рынка).
+        
+        Признаки нового дня затем дописывает create_market_features(incremental=True).
+        """
+        market = {'price': np.asarray(price)[None], 'transaction_count': np.asarray(transaction_count)[None]}
+        writer = ChunkedTableWriter(self.output_dir / "market", market_schema(cards_df), resume=True)
+        writer.write_chunk(market_frame(market, cards_df, date))
+        self._export_table('market')
+        return writer.num_rows
+    
+    @instrumented('market_features', rows_out=lambda num_rows: num_rows, outputs=_outputs('market_features'))
+    def create_market_features(self, cards_df: pd.DataFrame, incremental: bool = False,
+                               windows: Optional[List[int]] = None) -> int:
+        """Скользящие признаки рынка (market_features.py) по таблице market/, строка - день и карта.
+        
+        Пишутся дни с полной историей для всех окон. incremental - дописать только дни market/ позже
+        последнего обработанного: признаки каждого нового дня считаются по хвосту истории из состояния
+        (MARKET_STATE_FILE), таблица дополняется частью на день. Без состояния или с другими окнами
+        признаки считаются заново по всей истории. Возвращает количество строк в таблице.
+        """
+        windows = list(windows or MARKET_WINDOWS)
+        table_dir = self.output_dir / "market_features"
+        schema = market_features_schema(cards_df, windows)
+        market = load_columns(self.output_dir / "market", ['date', 'card_id', 'price', 'transaction_count'])
+        
+        state = None
+        if incremental and read_manifest(table_dir) is not None:
+            state = MarketFeatureState.load(table_dir / MARKET_STATE_FILE)
+        if state is not None and state.windows != windows:
+            print(f"⚠️ Окна признаков рынка изменились ({state.windows} -> {windows}): пересчёт всей истории")
+            state = None
+        
+        if state is None:
+            print(f"📈 Скользящие признаки рынка (окна {windows} дней)...")
+            dates, price, volume = market_matrices(market, len(cards_df))
+            features = rolling_market_features(price, volume, windows)
+            start = max(windows)
+            writer = ChunkedTableWriter(table_dir, schema, {'windows': windows})
+            writer.write_chunk(market_feature_rows(dates[start:], price[start:],
+                                                   {name: values[start:] for name, values in features.items()}))
+            state = MarketFeatureState.from_history(dates, price, volume, windows)
+        else:
+            new = np.asarray(market['date']) > state.last_date
+            dates, price, volume = market_matrices({name: np.asarray(values)[new] for name, values in market.items()},
+                                                   len(cards_df))
+            print(f"📈 Дописывание признаков рынка: {len(dates)} новых дней после {state.last_date}...")
+            writer = ChunkedTableWriter(table_dir, schema, {'windows': windows}, resume=True)
+            for day in range(len(dates)):
+                features = state.append(dates[day], price[day], volume[day])
+                writer.write_chunk(market_feature_rows(dates[day:day + 1], price[day:day + 1],
+                                                       {name: values[None] for name, values in features.items()}))
+        state.save(table_dir / MARKET_STATE_FILE)
+        
+        print(f"✅ Признаки рынка: {writer.num_rows} строк, {len(schema) - 3} признаков")
+        return writer.num_rows
+    
+    @instrumented('features', rows_in=lambda a: len(a['battles_df']['battle_id']),
+                  rows_out=lambda result: len(result['battle_features']),
+                  outputs=_outputs('card_features', 'battle_features'))
+    def create_training_features(self, cards_df: pd.DataFrame, battles_df: Mapping[str, Any],
+                                 rounds_df: Mapping[str, Any]) -> Dict:
+        """Создаёт признаки для обучения ML моделей по таблицам battles/ и rounds/.
+        
+        Таблицы боёв и раундов можно передать как DataFrame (read_table) или как
+        словарь массивов (load_columns) - второй вариант не копирует данные.
+        """
         print("🔧 Создание признаков для ML...")
         
-        # Признаки для модели выбора карт
-        card_features = []
-        for _, card in cards_df.iterrows():
-            features = {
-                'card_id': card['card_id'],
-                'clan_encoded': list(self.clans_data.keys()).index(card['clan']),
-                'rarity_encoded': ['Common', 'Uncommon', 'Rare', 'Legendary'].index(card['rarity']),
-                'max_power': card['power_level_5'],
-                'max_damage': card['damage_level_5'],
-                'has_ability': 1 if card['ability'] else 0,
-                'power_damage_ratio': card['power_level_5'] / max(card['damage_level_5'], 1),
-                'total_stats': card['power_level_5'] + card['damage_level_5']
-            }
-            card_features.append(features)
+        # Признаки для модели выбора карт: коды кланов/редкостей и арифметика над колонками
+        card_features_df = card_features(cards_df, list(self.clans_data.keys()))
         
-        # Признаки для модели предсказания боёв
-        battle_features = []
-        for _, battle in battles_df.iterrows():
-            if isinstance(battle['rounds_data'], list) and len(battle['rounds_data']) > 0:
-                first_round = battle['rounds_data'][0]
-                
-                features = {
-                    'battle_id': battle['battle_id'],
-                    'player_total_attack': first_round.get('player_attack', 0),
-                    'opponent_total_attack': first_round.get('opponent_attack', 0),
-                    'attack_difference': first_round.get('player_attack', 0) - first_round.get('opponent_attack', 0),
-                    'player_pills_used': first_round.get('player_pills_used', 0),
-                    'opponent_pills_used': first_round.get('opponent_pills_used', 0),
-                    'winner': battle['winner']
-                }
-                battle_features.append(features)
+        # Признаки для модели предсказания боёв: первый раунд из плоской таблицы раундов
+        battle_features_df = first_round_features(battles_df, rounds_df)
         
         # Сохраняем признаки
-        card_features_df = pd.DataFrame(card_features)
-        battle_features_df = pd.DataFrame(battle_features)
-        
-        card_features_df.to_csv(self.output_dir / "card_features.csv", index=False)
-        battle_features_df.to_csv(self.output_dir / "battle_features.csv", index=False)
+        self._save_table('card_features', card_features_df, CARD_FEATURES_SCHEMA)
+        self._save_table('battle_features', battle_features_df, BATTLE_FEATURES_SCHEMA)
         
-        print(f"✅ Признаки созданы: {len(card_features)} карт, {len(battle_features)} боёв")
+        print(f"✅ Признаки созданы: {len(card_features_df)} карт, {len(battle_features_df)} боёв")
         
         return {
             'card_features': card_features_df,
             'battle_features': battle_features_df
         }
     
+    @instrumented('sequences', rows_out=lambda num_rows: num_rows, outputs=_outputs('battle_sequences'))
+    def create_sequence_features(self, cards_df: pd.DataFrame) -> int:
+        """Создаёт последовательности всех раундов боёв (таблица battle_sequences/).
+        
+        Части таблиц battles/ и rounds/ обрабатываются по очереди с отображением в память,
+        поэтому в памяти одновременно находится только одна часть датасета.
+        """
+        print("🔧 Создание последовательностей раундов...")
+        
+        card_stats = card_stats_array(cards_df)
+        writer = ChunkedTableWriter(self.output_dir / "battle_sequences", BATTLE_SEQUENCES_SCHEMA)
+        battle_chunks = iter_table_chunks(self.output_dir / "battles", ['battle_id', 'winner'])
+        round_chunks = iter_table_chunks(self.output_dir / "rounds")
+        # Части боёв и раундов пишутся парами в write_battle_data и содержат одни и те же бои
+        for battles, rounds in zip(battle_chunks, round_chunks):
+            writer.write_chunk(round_sequence_features(battles, rounds, card_stats))
+        
+        print(f"✅ Последовательности созданы: {writer.num_rows} боёв")
+        return writer.num_rows
+    
+    @instrumented('card_outcomes', rows_in=lambda a: len(a['cards_df']),
+                  rows_out=lambda result: len(result['card_id']), outputs=_outputs('card_outcomes'))
+    def create_card_outcomes(self, cards_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Создаёт индекс исходов раундов по картам (таблица card_outcomes/) за один проход по раундам"""
+        print("🔧 Подсчёт исходов раундов по картам...")
+        
+        round_chunks = iter_table_chunks(self.output_dir / "rounds",
+                                         ['player_card', 'opponent_card', 'winner', 'damage_dealt'])
+        outcomes = card_outcome_index(round_chunks, cards_df['card_id'].to_numpy())
+        self._save_table('card_outcomes', outcomes, CARD_OUTCOMES_SCHEMA)
+        
+        print(f"✅ Исходы посчитаны: {int(outcomes['appearances'].sum()) // 2} раундов, {len(cards_df)} карт")
+        return outcomes
+    
+    def _save_table(self, name: str, data: Any, schema: Dict[str, Dict[str, Any]]) -> int:
+        """Пишет таблицу в колоночном формате и, если запрошено, экспортирует в CSV/JSON"""
+        num_rows = write_table(self.output_dir / name, data, schema)
+        self._export_table(name)
+        return num_rows
+    
+    def _export_table(self, name: str):
+        """Экспортирует колоночную таблицу в форматы из export_formats"""
+        if self.export_formats:
+            export_table(self.output_dir / name, self.export_formats, self.output_dir / EXPORT_NAMES[name])
+    
+    @instrumented('export_tfjs', rows_in=lambda a: len(a['features']['battle_features']),
+                  outputs=lambda a: [a['self'].output_dir / TFJS_EXPORT_NAMES[a['self'].tfjs_format]])
     def export_for_tensorflowjs(self, features: Dict):
-        """Экспортирует данные в формате для TensorFlow.js"""
-        print("📦 Экспорт для TensorFlow.js...")
+        """Экспортирует признаки для TensorFlow.js.
+        
+        binary - таблицы признаков частями типизированных массивов (storage.export_typed_arrays),
+        браузер читает их без разбора JSON; json - один training_data.json с объектом на строку.
+        """
+        print(f"📦 Экспорт для TensorFlow.js ({self.tfjs_format})...")
+        
+        metadata = {
+            'version': '1.0.0',
+            'created': datetime.now().isoformat(),
+            'cards_count': len(features['card_features']),
+            'battles_count': len(features['battle_features']),
+            'clans': list(self.clans_data.keys())
+        }
+        if self.tfjs_format == 'binary':
+            # Таблицы признаков уже на диске (create_training_features), части читаются в отображении в память
+            output_dir = self.output_dir / TFJS_EXPORT_NAMES['binary']
+            manifest = export_typed_arrays({name: self.output_dir / name for name in ['card_features', 'battle_features']},
+                                           output_dir, metadata={'metadata': metadata, 'clans_data': self.clans_data})
+            num_chunks = sum(len(table['chunks']) for table in manifest['tables'].values())
+            size = sum(path.stat().st_size for path in output_dir.rglob('*') if path.is_file())
+            print(f"✅ Данные экспортированы в {output_dir.name}/: {num_chunks} частей, {size / 2**20:.1f} МБ")
+            return manifest
         
         # Экспорт в JSON формат для браузера
         export_data = {
-            'metadata': {
-                'version': '1.0.0',
-                'created': datetime.now().isoformat(),
-                'cards_count': len(features['card_features']),
-                'battles_count': len(features['battle_features']),
-                'clans': list(self.clans_data.keys())
-            },
+            'metadata': metadata,
             'card_features': features['card_features'].to_dict('records'),
             'battle_features': features['battle_features'].to_dict('records'),
             'clans_data': self.clans_data
@@ -341,32 +529,111 @@ class UrbanRivalsDataCollector:
 
 def main():
     """Основная функция для создания полного датасета"""
+    parser = argparse.ArgumentParser(description="Создание датасета Urban Rivals ML")
+    parser.add_argument('--stages', nargs='+', choices=DATASET_STAGES, default=DATASET_STAGES,
+                        help="Этапы для выполнения (по умолчанию все); остальные таблицы берутся из --output-dir")
+    parser.add_argument('--output-dir', default="datasets", help="Папка для файлов датасета")
+    parser.add_argument('--num-battles', type=int, default=10000, help="Количество боёв")
+    parser.add_argument('--days', type=int, default=180, help="Длина истории рынка в днях")
+    parser.add_argument('--market-model', choices=MARKET_MODELS, default='iid',
+                        help="Модель цен: iid - независимые дни, gbm/ar - автокоррелированные блуждания")
+    parser.add_argument('--seed', type=int, default=None, help="Мастер-сид генерации")
+    parser.add_argument('--chunk-size', type=int, default=100_000,
+                        help="Количество боёв в одной части (шарде) таблиц battles/ и rounds/")
+    parser.add_argument('--resume', action='store_true',
+                        help="Продолжить прерванную генерацию боёв с уже записанных частей")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="Количество шардов рыночных данных (0 - генерация в одном процессе)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Количество процессов для шардов (по умолчанию - все ядра)")
+    parser.add_argument('--export', nargs='+', choices=EXPORT_FORMATS, default=[],
+                        help="Дополнительно выгрузить таблицы в CSV/JSON (основной формат - колоночный)")
+    parser.add_argument('--market-incremental', action='store_true',
+                        help="market_features: дописать признаки только для новых дней market/ (по хвосту истории)")
+    parser.add_argument('--tfjs-format', choices=TFJS_EXPORT_FORMATS, default='binary',
+                        help="Экспорт признаков для TensorFlow.js: части типизированных массивов или один JSON")
+    parser.add_argument('--reference-date', type=datetime.fromisoformat, default=None,
+                        help="Дата отсчёта для временных меток (ISO), по умолчанию - текущее время")
+    parser.add_argument('--sqlite', action='store_true',
+                        help=f"Загрузить карты, бои, раунды и рынок в индексированную базу {SQLITE_FILE}")
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    
     print("🚀 Начинаем создание датасета Urban Rivals ML...")
     
-    collector = UrbanRivalsDataCollector()
+    battles_manifest = read_manifest(Path(args.output_dir) / "battles")
+    if args.resume and battles_manifest is not None:
+        # Продолжаем с теми же сидом и точкой отсчёта, что и прерванный запуск
+        if args.seed is None:
+            args.seed = battles_manifest['params']['seed']
+        if args.reference_date is None:
+            args.reference_date = datetime.fromisoformat(battles_manifest['params']['reference_time'])
+    
+    collector = UrbanRivalsDataCollector(args.output_dir, reference_time=args.reference_date,
+                                         export_formats=args.export, tfjs_format=args.tfjs_format)
     
-    # 1. Создаём базу карт
-    cards_df = collector.create_cards_database()
+    if args.seed is None:
+        # Шардам нужен явный мастер-сид; без него берём случайный и печатаем для воспроизведения
+        args.seed = int(np.random.SeedSequence().generate_state(1)[0])
+        print(f"🎲 Мастер-сид: {args.seed}")
+    np.random.seed(args.seed)
     
-    # 2. Генерируем данные о боях
-    battles_df = collector.generate_battle_data(cards_df, num_battles=10000)
+    # 1. Создаём базу карт (или читаем созданную ранее)
+    if 'cards' in args.stages:
+        cards_df = collector.create_cards_database()
+    else:
+        cards_df = _read_stage_table(collector.output_dir, 'cards')
+    
+    # 2. Потоково генерируем бои частями
+    if 'battles' in args.stages:
+        collector.write_battle_data(cards_df, args.num_battles, args.seed, args.chunk_size,
+                                    args.workers, resume=args.resume)
     
     # 3. Генерируем рыночные данные
-    market_df = collector.generate_market_data(cards_df, days=180)
+    market_df = None
+    if 'market' in args.stages and args.shards:
+        market_df = collector.generate_market_data_sharded(
+            cards_df, args.days, args.seed, args.shards, args.workers, model=args.market_model
+        )
+    elif 'market' in args.stages:
+        market_df = collector.generate_market_data(cards_df, days=args.days, model=args.market_model)
+    
+    # 3a. Скользящие признаки рынка (с --market-incremental - только новые дни)
+    if 'market_features' in args.stages:
+        collector.create_market_features(cards_df, incremental=args.market_incremental)
     
-    # 4. Создаём признаки для ML
-    features = collector.create_training_features(cards_df, battles_df)
+    # 4. Создаём признаки для ML и экспортируем для TensorFlow.js
+    export_data = None
+    if 'features' in args.stages:
+        battles = _read_stage_table(collector.output_dir, 'battles', load_columns)
+        rounds = _read_stage_table(collector.output_dir, 'rounds', load_columns)
+        features = collector.create_training_features(cards_df, battles, rounds)
+        collector.create_sequence_features(cards_df)
+        collector.create_card_outcomes(cards_df)
+        export_data = collector.export_for_tensorflowjs(features)
     
-    # 5. Экспортируем для TensorFlow.js
-    export_data = collector.export_for_tensorflowjs(features)
+    # 5. Индексированная база SQLite для выборок по карте, бою и датам
+    if args.sqlite:
+        ingest_dataset(str(collector.output_dir))
     
     print("\n🎉 Датасет успешно создан!")
     print(f"📁 Все файлы сохранены в папке: {collector.output_dir}")
     print(f"🃏 Карт: {len(cards_df)}")
-    print(f"⚔️ Боёв: {len(battles_df)}")
-    print(f"💰 Рыночных записей: {len(market_df)}")
+    battles_manifest = read_manifest(collector.output_dir / "battles")
+    if battles_manifest is not None:
+        print(f"⚔️ Боёв: {battles_manifest['num_rows']}")
+    if market_df is not None:
+        print(f"💰 Рыночных записей: {len(market_df)}")
     
     return export_data
 
+def _read_stage_table(output_dir: Path, name: str, reader=read_table):
+    """Таблица невыбранного этапа из папки датасета (с понятной ошибкой, если этап ещё не выполнялся)"""
+    if read_manifest(output_dir / name) is None:
+        print(f"❌ Таблица {name}/ не найдена в {output_dir}. Сначала выполните этап, который её создаёт")
+        raise FileNotFoundError(output_dir / name)
+    return reader(output_dir / name)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Feature Engineering
+Векторизованное построение признаков по колоночным таблицам датасета
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from market import RARITIES
+from simulator import DECK_SIZE, START_LIFE, WINNER_DRAW, WINNER_LABELS, WINNER_OPPONENT, WINNER_PLAYER, sample_decks
+
+# Признаки одного раунда в последовательности боя (последняя ось массива rounds).
+# Несыгранные раунды дополняются нулями, played = 0.
+SEQUENCE_FEATURES = [
+    'played',
+    'player_power', 'player_damage', 'opponent_power', 'opponent_damage',
+    'player_pills_used', 'opponent_pills_used',
+    'player_attack', 'opponent_attack',
+    'player_life_before', 'opponent_life_before',
+    'player_life_after', 'opponent_life_after'
+]
+
+
+def category_codes(values: Any, categories: List[str]) -> np.ndarray:
+    """Коды категорий для колонки: уже закодированной (read_table/load_columns) или строковой"""
+    dtype = getattr(values, 'dtype', None)
+    if isinstance(dtype, pd.CategoricalDtype):
+        if list(dtype.categories) == list(categories):
+            return pd.Categorical(values).codes
+        values = np.asarray(values, dtype=object)
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values
+    codes = pd.Categorical(values, categories=categories).codes
+    unknown = codes == -1
+    if unknown.any():
+        raise ValueError(f"Неизвестные значения: {sorted(set(values[unknown]))[:5]}")
+    return codes
+
+# Стратегии колод в порядке проверки правил и признаки колоды для классификатора
+STRATEGY_LABELS = ['power_focused', 'damage_focused', 'mono_clan', 'ability_focused', 'balanced']
+STRATEGY_FEATURES = ['avg_power', 'avg_damage', 'total_stats', 'clan_diversity', 'ability_count']
+
+
+def battle_positions(battle_ids: Any, lookup: np.ndarray) -> np.ndarray:
+    """Позиции боёв с идентификаторами lookup в таблице боёв (поиск по отсортированным battle_id)"""
+    battle_ids = np.asarray(battle_ids)
+    order = np.argsort(battle_ids, kind='stable')
+    return order[np.searchsorted(battle_ids, lookup, sorter=order)]
+
+
+def card_features(cards: Mapping[str, Any], clans: List[str]) -> pd.DataFrame:
+    """Признаки карт для модели рекомендации (по одной строке на карту)"""
+    power = np.asarray(cards['power_level_5']).astype(np.int64)
+    damage = np.asarray(cards['damage_level_5']).astype(np.int64)
+
+    return pd.DataFrame({
+        'card_id': np.asarray(cards['card_id']),
+        'clan_encoded': category_codes(cards['clan'], clans),
+        'rarity_encoded': category_codes(cards['rarity'], RARITIES),
+        'max_power': power,
+        'max_damage': damage,
+        'has_ability': pd.notna(np.asarray(cards['ability'], dtype=object)).astype(np.int64),
+        'power_damage_ratio': power / np.maximum(damage, 1),
+        'total_stats': power + damage
+    })
+
+
+def first_round_features(battles: Mapping[str, Any], rounds: Mapping[str, Any]) -> pd.DataFrame:
+    """Признаки первого раунда каждого боя для модели предсказания боёв.
+
+    Первый раунд берётся прямо из плоской таблицы раундов, победитель боя -
+    из таблицы боёв по battle_id (поиск по отсортированным идентификаторам).
+    """
+    first = np.asarray(rounds['round']) == 1
+    battle_id = np.asarray(rounds['battle_id'])[first]
+    player_attack = np.asarray(rounds['player_attack'])[first].astype(np.int64)
+    opponent_attack = np.asarray(rounds['opponent_attack'])[first].astype(np.int64)
+
+    battle_winners = category_codes(battles['winner'], WINNER_LABELS)
+    position = battle_positions(battles['battle_id'], battle_id)
+
+    return pd.DataFrame({
+        'battle_id': battle_id,
+        'player_total_attack': player_attack,
+        'opponent_total_attack': opponent_attack,
+        'attack_difference': player_attack - opponent_attack,
+        'player_pills_used': np.asarray(rounds['player_pills_used'])[first].astype(np.int64),
+        'opponent_pills_used': np.asarray(rounds['opponent_pills_used'])[first].astype(np.int64),
+        'winner': pd.Categorical.from_codes(battle_winners[position], categories=WINNER_LABELS)
+    })
+
+
+def card_outcome_index(round_chunks: Iterable[Mapping[str, Any]], card_ids: Any) -> Dict[str, np.ndarray]:
+    """Статистика исходов раундов по картам: появления, победы, ничьи и нанесённый урон.
+
+    Части таблицы раундов обрабатываются по очереди, каждая - несколькими np.bincount
+    по индексам карт обеих сторон, поэтому время линейно по числу раундов, а память
+    не зависит от размера таблицы. Для карт без раундов доля побед - 0.5.
+    """
+    num_cards = len(card_ids)
+    totals = {name: np.zeros(num_cards, dtype=np.int64)
+              for name in ['appearances', 'wins', 'draws', 'damage_dealt']}
+
+    for rounds in round_chunks:
+        winner = category_codes(rounds['winner'], WINNER_LABELS)
+        damage = np.asarray(rounds['damage_dealt'], dtype=np.int64)
+        draw = winner == WINNER_DRAW
+        for side, side_code in [('player_card', WINNER_PLAYER), ('opponent_card', WINNER_OPPONENT)]:
+            cards = np.asarray(rounds[side], dtype=np.intp)
+            won = winner == side_code
+            totals['appearances'] += np.bincount(cards, minlength=num_cards)
+            totals['wins'] += np.bincount(cards[won], minlength=num_cards)
+            totals['draws'] += np.bincount(cards[draw], minlength=num_cards)
+            totals['damage_dealt'] += np.bincount(cards[won], weights=damage[won], minlength=num_cards).astype(np.int64)
+
+    played = np.maximum(totals['appearances'], 1)
+    return {
+        'card_id': np.asarray(card_ids),
+        **totals,
+        'win_rate': np.where(totals['appearances'] > 0, totals['wins'] / played, 0.5),
+        'avg_damage': totals['damage_dealt'] / played
+    }
+
+
+def round_sequence_features(battles: Mapping[str, Any], rounds: Mapping[str, Any],
+                            card_stats: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Последовательности всех раундов боя для последовательной модели предсказания боёв.
+
+    Возвращает колонки таблицы battle_sequences: battle_id, rounds - массив
+    (боёв x DECK_SIZE x SEQUENCE_FEATURES) в int8, дополненный нулями после
+    последнего сыгранного раунда, и winner - коды победителя боя.
+    Характеристики карт берутся из card_stats по индексам карт в таблице раундов.
+    """
+    battle_ids = np.asarray(battles['battle_id'])
+    num_battles = len(battle_ids)
+
+    row = battle_positions(battle_ids, np.asarray(rounds['battle_id']))
+    step = np.asarray(rounds['round']).astype(np.intp) - 1
+    player_card = np.asarray(rounds['player_card'])
+    opponent_card = np.asarray(rounds['opponent_card'])
+
+    values = {
+        'played': 1,
+        'player_power': card_stats['power'][player_card],
+        'player_damage': card_stats['damage'][player_card],
+        'opponent_power': card_stats['power'][opponent_card],
+        'opponent_damage': card_stats['damage'][opponent_card]
+    }
+    for name in ['player_pills_used', 'opponent_pills_used', 'player_attack', 'opponent_attack',
+                 'player_life_after', 'opponent_life_after']:
+        values[name] = np.asarray(rounds[name])
+
+    sequences = np.zeros((num_battles, DECK_SIZE, len(SEQUENCE_FEATURES)), dtype=np.int8)
+    for i, name in enumerate(SEQUENCE_FEATURES):
+        if name in values:
+            sequences[row, step, i] = values[name]
+
+    # Жизни до раунда: стартовые в первом раунде, дальше - жизни после предыдущего
+    for side in ['player', 'opponent']:
+        before = SEQUENCE_FEATURES.index(f"{side}_life_before")
+        after = SEQUENCE_FEATURES.index(f"{side}_life_after")
+        sequences[:, 0, before] = START_LIFE
+        sequences[:, 1:, before] = sequences[:, :-1, after]
+        sequences[:, :, before] *= sequences[:, :, 0]  # обнуляем несыгранные раунды
+
+    return {
+        'battle_id': battle_ids,
+        'rounds': sequences,
+        'winner': category_codes(battles['winner'], WINNER_LABELS)
+    }
+
+
+def deck_strategy_features(cards: Mapping[str, Any], num_decks: int,
+                           rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Случайные колоды и их стратегии для классификатора стратегий.
+
+    Колоды выбираются матрицей индексов (num_decks x DECK_SIZE) без повторов карт,
+    агрегаты считаются по строкам матрицы. Возвращает (признаки STRATEGY_FEATURES, метки STRATEGY_LABELS).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    decks = sample_decks(rng, len(cards['max_power']), num_decks)
+    power = np.asarray(cards['max_power'], dtype=np.int64)[decks]
+    damage = np.asarray(cards['max_damage'], dtype=np.int64)[decks]
+    clans = np.sort(np.asarray(cards['clan_encoded'])[decks], axis=1)
+
+    avg_power = power.sum(axis=1) / DECK_SIZE
+    avg_damage = damage.sum(axis=1) / DECK_SIZE
+    total_stats = np.asarray(cards['total_stats'], dtype=np.int64)[decks].sum(axis=1)
+    clan_diversity = 1 + (clans[:, 1:] != clans[:, :-1]).sum(axis=1)
+    ability_count = np.asarray(cards['has_ability'], dtype=np.int64)[decks].sum(axis=1)
+
+    # Правила проверяются по порядку, как прежняя цепочка if/elif
+    labels = np.select(
+        [avg_power > 7.5, avg_damage > 6, clan_diversity <= 2, ability_count >= 3],
+        STRATEGY_LABELS[:-1],
+        STRATEGY_LABELS[-1]
+    )
+    features = np.column_stack([avg_power, avg_damage, total_stats, clan_diversity, ability_count])
+    return features, labels
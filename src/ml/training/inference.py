@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Batch Inference
+Пакетное применение обученных моделей: потоки признаков из файлов/stdin -> предсказания, локальный HTTP-сервис
+"""
+
+import abc
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, TextIO
+
+import numpy as np
+import pandas as pd
+
+from model_bundle import BUNDLE_FILE, bundle_predict, read_bundle
+from storage import iter_table_chunks, read_manifest
+
+BACKENDS = ['auto', 'bundle', 'keras']
+INPUT_FORMATS = ['csv', 'jsonl', 'table']
+OUTPUT_FORMATS = ['csv', 'jsonl']
+
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_CHUNK_ROWS = 65_536  # строк входа, читаемых за раз
+DEFAULT_PORT = 8765
+SERVER_BACKLOG = 1024
+# Сколько запрос ждёт соседей для общего пакета. 0 - жадная склейка: пакет составляют запросы,
+# накопившиеся, пока считался предыдущий (чем медленнее модель, тем крупнее пакеты)
+DEFAULT_MAX_WAIT_MS = 0.0
+
+
+def _log(message: str):
+    """Сообщения - в stderr: stdout может быть потоком предсказаний"""
+    print(message, file=sys.stderr, flush=True)
+
+
+class Predictor(abc.ABC):
+    """Обученные модели, загруженные один раз: имя модели -> описание и пакетное предсказание"""
+
+    def __init__(self):
+        self.infos: Dict[str, Dict[str, Any]] = {}
+
+    def predict(self, name: str, X: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """Предсказания для матрицы признаков (строк x input_features), микропакетами по batch_size"""
+        if name not in self.infos:
+            raise KeyError(f"Неизвестная модель: {name}. Доступные: {list(self.infos)}")
+        X = np.asarray(X, dtype=np.float32).reshape(-1, len(self.infos[name]['input_features']))
+        outputs = [self._predict_batch(name, X[start:start + batch_size]) for start in range(0, len(X), batch_size)]
+        return np.concatenate(outputs) if outputs else np.zeros((0, self.num_outputs(name)), dtype=np.float32)
+
+    def num_outputs(self, name: str) -> int:
+        return len(self.infos[name].get('output_classes') or [None])
+
+    @abc.abstractmethod
+    def _predict_batch(self, name: str, X: np.ndarray) -> np.ndarray:
+        """Предсказания модели name для одного пакета строк"""
+
+
+class BundlePredictor(Predictor):
+    """Модели из бинарного бандла (model_bundle.py): прямой проход на NumPy без TensorFlow"""
+
+    def __init__(self, models_dir: Path):
+        super().__init__()
+        bundle = read_bundle(Path(models_dir) / BUNDLE_FILE)
+        self.models = bundle['models']
+        self.infos = {name: {key: value for key, value in model.items() if key not in ('layers', 'scaler')}
+                      for name, model in self.models.items()}
+
+    def _predict_batch(self, name: str, X: np.ndarray) -> np.ndarray:
+        return bundle_predict(self.models[name], X)
+
+
+class KerasPredictor(Predictor):
+    """Модели Keras (.h5) со скейлерами и энкодерами sklearn (.pkl), как их сохраняет train_models.py"""
+
+    def __init__(self, models_dir: Path):
+        super().__init__()
+        import joblib
+        import tensorflow as tf
+        from train_models import BUNDLE_MODELS
+
+        models_dir = Path(models_dir)
+        metadata = json.loads((models_dir / "models_metadata.json").read_text(encoding='utf-8'))
+        self.models = {}
+        for name, files in BUNDLE_MODELS.items():
+            if name not in metadata['models']:
+                continue
+            info = dict(metadata['models'][name])
+            if 'label_encoder' in files:
+                # Выходы модели идут в порядке классов энкодера
+                label_encoder = joblib.load(models_dir / "sklearn" / files['label_encoder'])
+                info['output_classes'] = [str(label) for label in label_encoder.classes_]
+            model = tf.keras.models.load_model(models_dir / "tensorflow" / files['model'], compile=False)
+            scaler = joblib.load(models_dir / "sklearn" / files['scaler'])
+            self.models[name] = (model, scaler)
+            self.infos[name] = info
+
+    def _predict_batch(self, name: str, X: np.ndarray) -> np.ndarray:
+        model, scaler = self.models[name]
+        # predict_on_batch - без накладных расходов predict() на построение датасета для каждого вызова
+        return np.asarray(model.predict_on_batch(scaler.transform(X).astype(np.float32)))
+
+
+def load_predictor(models_dir: str, backend: str = 'auto') -> Predictor:
+    """Загружает модели из models_dir: auto - бандл, если он есть, иначе Keras"""
+    models_dir = Path(models_dir)
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд: {backend}. Доступные: {BACKENDS}")
+    if backend == 'auto':
+        backend = 'bundle' if (models_dir / BUNDLE_FILE).exists() else 'keras'
+    start = time.perf_counter()
+    predictor = BundlePredictor(models_dir) if backend == 'bundle' else KerasPredictor(models_dir)
+    _log(f"🤖 Загружены модели ({backend}): {', '.join(predictor.infos)} за {time.perf_counter() - start:.2f}с")
+    return predictor
+
+
+def prediction_columns(info: Dict[str, Any], outputs: np.ndarray) -> Dict[str, np.ndarray]:
+    """Колонки результата: вероятности классов и предсказанный класс или оценка регрессии"""
+    classes = info.get('output_classes')
+    if not classes:
+        return {'score': outputs[:, 0]}
+    columns = {f"p_{label}": outputs[:, i] for i, label in enumerate(classes)}
+    columns['prediction'] = np.asarray(classes, dtype=object)[outputs.argmax(axis=1)]
+    return columns
+
+
+def feature_matrix(chunk: Mapping[str, Any], features: List[str]) -> np.ndarray:
+    """Матрица признаков модели из колонок части входа"""
+    missing = [name for name in features if name not in chunk]
+    if missing:
+        raise KeyError(f"Во входных данных нет признаков: {missing}")
+    return np.column_stack([np.asarray(chunk[name], dtype=np.float32) for name in features])
+
+
+def detect_input_format(source: str) -> str:
+    """Формат входа по пути: папка колоночной таблицы, .jsonl/.json или CSV"""
+    if source != '-' and read_manifest(Path(source)) is not None:
+        return 'table'
+    if source.endswith(('.jsonl', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_input_chunks(source: str, input_format: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Mapping[str, Any]]:
+    """Читает вход частями: колоночная таблица (по её частям, в отображении в память), CSV или JSON lines"""
+    if input_format == 'table':
+        yield from iter_table_chunks(Path(source), mmap=True)
+        return
+    stream = sys.stdin if source == '-' else source
+    if input_format == 'csv':
+        yield from pd.read_csv(stream, chunksize=chunk_rows)
+    elif input_format == 'jsonl':
+        yield from pd.read_json(stream, lines=True, chunksize=chunk_rows)
+    else:
+        raise ValueError(f"Неизвестный формат входа: {input_format}. Доступные: {INPUT_FORMATS}")
+
+
+def write_chunk(stream: TextIO, columns: Dict[str, Any], output_format: str, header: bool):
+    """Дописывает часть результатов в поток и сбрасывает буфер (результаты видны сразу)"""
+    frame = pd.DataFrame(columns)
+    if output_format == 'csv':
+        frame.to_csv(stream, index=False, header=header)
+    else:
+        lines = frame.to_json(orient='records', lines=True, force_ascii=False)
+        stream.write(lines if lines.endswith("\n") else lines + "\n")
+    stream.flush()
+
+
+def predict_stream(predictor: Predictor, name: str, source: str, output: str = '-',
+                   input_format: Optional[str] = None, output_format: Optional[str] = None,
+                   id_column: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                   chunk_rows: int = DEFAULT_CHUNK_ROWS) -> int:
+    """Применяет модель name ко входу source частями и пишет предсказания потоком в output.
+
+    Возвращает количество обработанных строк.
+    """
+    input_format = input_format or detect_input_format(source)
+    output_format = output_format or ('csv' if output.endswith('.csv') else 'jsonl')
+    info = predictor.infos[name]
+    stream = sys.stdout if output == '-' else open(output, 'w', encoding='utf-8', newline='')
+    num_rows = 0
+    start = time.perf_counter()
+    try:
+        for chunk in iter_input_chunks(source, input_format, chunk_rows):
+            X = feature_matrix(chunk, info['input_features'])
+            columns = {id_column: np.asarray(chunk[id_column])} if id_column else {}
+            columns.update(prediction_columns(info, predictor.predict(name, X, batch_size)))
+            write_chunk(stream, columns, output_format, header=num_rows == 0)
+            num_rows += len(X)
+            _log(f"  📊 {name}: {num_rows} строк, {num_rows / (time.perf_counter() - start):,.0f} строк/сек")
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return num_rows
+
+
+class CoalescingPredictor:
+    """Склеивает одновременные запросы к модели в один пакет.
+
+    Для каждой модели - очередь и поток-исполнитель: первый запрос ждёт соседей не дольше max_wait_ms
+    (или пока не наберётся max_batch строк), затем весь пакет считается одним вызовом predict.
+    Запросы, пришедшие во время вычисления, попадают в следующий пакет.
+    """
+
+    def __init__(self, predictor: Predictor, max_batch: int = DEFAULT_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queues = {name: queue.Queue() for name in predictor.infos}
+        self.stats = {name: {'requests': 0, 'batches': 0, 'rows': 0} for name in predictor.infos}
+        for name in predictor.infos:
+            threading.Thread(target=self._worker, args=(name,), daemon=True).start()
+
+    def submit(self, name: str, X: np.ndarray) -> Future:
+        if name not in self.queues:
+            raise KeyError(f"Неизвестная модель: {name}. Доступные: {list(self.queues)}")
+        future = Future()
+        self.queues[name].put((X, future))
+        return future
+
+    def _worker(self, name: str):
+        requests = self.queues[name]
+        while True:
+            batch = [requests.get()]
+            num_rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while num_rows < self.max_batch:
+                try:
+                    batch.append(requests.get(timeout=max(0.0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+                num_rows += len(batch[-1][0])
+
+            try:
+                outputs = self.predictor.predict(name, np.concatenate([X for X, _ in batch]), self.max_batch)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for X, future in batch:
+                future.set_result(outputs[offset:offset + len(X)])
+                offset += len(X)
+            stats = self.stats[name]
+            stats['requests'] += len(batch)
+            stats['batches'] += 1
+            stats['rows'] += num_rows
+
+
+def make_handler(coalescer: CoalescingPredictor):
+    """Обработчик HTTP: GET /models, GET /stats, POST /predict/<модель>"""
+    predictor = coalescer.predictor
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/models':
+                self._send(200, predictor.infos)
+            elif self.path == '/stats':
+                self._send(200, coalescer.stats)
+            else:
+                self._send(404, {'error': f"Неизвестный путь: {self.path}"})
+
+        def do_POST(self):
+            name = self.path[len('/predict/'):] if self.path.startswith('/predict/') else None
+            if name not in predictor.infos:
+                self._send(404, {'error': f"Неизвестная модель. Доступные: {list(predictor.infos)}"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                info = predictor.infos[name]
+                # rows - списки в порядке input_features, instances - словари признак -> значение
+                if 'instances' in body:
+                    X = feature_matrix(pd.DataFrame(body['instances']), info['input_features'])
+                else:
+                    X = np.asarray(body['rows'], dtype=np.float32).reshape(-1, len(info['input_features']))
+                outputs = coalescer.submit(name, X).result()
+            except (KeyError, ValueError, TypeError) as e:
+                self._send(400, {'error': str(e)})
+                return
+            columns = prediction_columns(info, outputs)
+            self._send(200, {'model': name,
+                             'predictions': pd.DataFrame(columns).to_dict(orient='records')})
+
+        def _send(self, status: int, payload: Any):
+            data = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args):
+            pass
+
+    return InferenceHandler
+
+
+def serve(predictor: Predictor, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+          max_batch: int = DEFAULT_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+    """Локальный HTTP-сервис предсказаний со склейкой одновременных запросов"""
+    coalescer = CoalescingPredictor(predictor, max_batch, max_wait_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(coalescer), bind_and_activate=False)
+    # Очередь соединений больше стандартных 5: иначе при одновременных клиентах соединения сбрасываются
+    server.request_queue_size = SERVER_BACKLOG
+    server.server_bind()
+    server.server_activate()
+    _log(f"🌐 Сервис предсказаний: http://{host}:{port}/predict/<модель> "
+         f"(пакет до {max_batch} строк, ожидание до {max_wait_ms} мс)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+
+def main():
+    """Пакетные предсказания по файлам/stdin или локальный HTTP-сервис"""
+    parser = argparse.ArgumentParser(description="Пакетное применение ML моделей Urban Rivals")
+    parser.add_argument('--models-dir', default="trained_models", help="Папка обученных моделей")
+    parser.add_argument('--backend', choices=BACKENDS, default='auto',
+                        help="bundle - бинарный бандл на NumPy, keras - .h5 и .pkl, auto - бандл, если есть")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    predict_parser = subparsers.add_parser('predict', help="Предсказания для файла или stdin потоком")
+    predict_parser.add_argument('--model', required=True,
+                                help="battle_predictor, card_recommender или strategy_classifier")
+    predict_parser.add_argument('--input', default='-', help="CSV, JSON lines или папка колоночной таблицы (- = stdin)")
+    predict_parser.add_argument('--input-format', choices=INPUT_FORMATS, default=None,
+                                help="Формат входа (по умолчанию - по пути, для stdin - CSV)")
+    predict_parser.add_argument('--output', default='-', help="Файл результатов (- = stdout)")
+    predict_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default=None,
+                                help="Формат результатов (по умолчанию - по расширению, иначе JSON lines)")
+    predict_parser.add_argument('--id-column', default=None, help="Колонка входа, копируемая в результат")
+    predict_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Размер микропакета")
+    predict_parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                                help="Строк CSV/JSON lines, читаемых за раз")
+
+    serve_parser = subparsers.add_parser('serve', help="Локальный HTTP-сервис со склейкой запросов")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--max-batch', type=int, default=DEFAULT_BATCH_SIZE,
+                              help="Максимум строк в склеенном пакете")
+    serve_parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                              help="Сколько запрос ждёт соседей для общего пакета")
+    args = parser.parse_args()
+
+    predictor = load_predictor(args.models_dir, args.backend)
+    if args.command == 'predict':
+        num_rows = predict_stream(predictor, args.model, args.input, args.output, args.input_format,
+                                  args.output_format, args.id_column, args.batch_size, args.chunk_rows)
+        _log(f"✅ Готово: {num_rows} строк")
+    else:
+        serve(predictor, args.host, args.port, args.max_batch, args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
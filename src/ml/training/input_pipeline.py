@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Training Input Pipeline
+Входные конвейеры tf.data для обучения моделей по частям колоночных таблиц
+"""
+
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from storage import ChunkedTableWriter, column, empty_columns, iter_table_chunks, read_manifest
+
+if TYPE_CHECKING:
+    # TensorFlow и sklearn импортируются в функциях, которым они нужны: импорт модуля остаётся быстрым
+    import tensorflow as tf
+    from sklearn.preprocessing import StandardScaler
+
+SUBSETS = ['train', 'validation', 'test']
+
+# Доли как у прежнего train_test_split(test_size=0.2) + model.fit(validation_split=0.2)
+TEST_SPLIT = 0.2
+VALIDATION_SPLIT = 0.2
+
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_SHUFFLE_BUFFER = 100_000
+READ_BLOCK_ROWS = 65_536  # строк за одно чтение из части таблицы
+PREPARED_CHUNK_ROWS = 1_000_000  # строк в части подготовленной выборки (write_prepared)
+
+# Колонка, по хэшу которой строки делятся на выборки (если она есть в части)
+SPLIT_ID_COLUMN = 'battle_id'
+
+# Колонка с готовыми номерами выборок (индекс в SUBSETS, -1 - строка не используется), например
+# разбиение временного ряда по датам; если она есть в части, заменяет SPLIT_ID_COLUMN
+SUBSET_COLUMN = 'subset'
+
+# Функция признаков/меток: (часть таблицы, номера строк) -> массив
+ColumnsFn = Callable[[Mapping[str, Any], np.ndarray], np.ndarray]
+
+
+def table_parts(table_dir: Path, columns: Optional[List[str]] = None) -> List[Dict[str, np.ndarray]]:
+    """Части колоночной таблицы, отображённые в память (данные читаются с диска по мере обучения).
+
+    Таблица без частей (например, выборка write_prepared без строк) - одна пустая часть с типами
+    и формами колонок схемы: конвейер знает формы признаков и отдаёт пустой набор.
+    """
+    parts = list(iter_table_chunks(table_dir, columns, mmap=True))
+    if not parts:
+        schema = read_manifest(table_dir)['columns']
+        parts = [empty_columns({name: schema[name] for name in columns or schema})]
+    return parts
+
+
+def columns_fn(columns: Sequence[str]) -> ColumnsFn:
+    """Признаки из нескольких одномерных колонок: матрица (строк x колонок)"""
+    columns = list(columns)
+    return lambda part, rows: np.column_stack([np.asarray(part[name])[rows] for name in columns])
+
+
+def subset_codes(num_rows: int, part_index: int, seed: int = 42,
+                 test_split: float = TEST_SPLIT, validation_split: float = VALIDATION_SPLIT) -> np.ndarray:
+    """Номер выборки (индекс в SUBSETS) для каждой строки части таблицы.
+
+    Разбиение детерминировано сидом и номером части, поэтому train/validation/test
+    не пересекаются между эпохами и запусками, а читать таблицу целиком не нужно.
+    """
+    rng = np.random.default_rng([seed, part_index])
+    return _codes(rng.random(num_rows), test_split, validation_split)
+
+
+def hash_subset_codes(ids: np.ndarray, seed: int = 42, test_split: float = TEST_SPLIT,
+                      validation_split: float = VALIDATION_SPLIT) -> np.ndarray:
+    """Номер выборки по хэшу id строки (splitmix64).
+
+    Выборка строки зависит только от её id и сида: не меняется при другом делении таблицы
+    на части, при дозаписи новых боёв и при дообучении только на новых строках.
+    """
+    with np.errstate(over='ignore'):
+        x = np.asarray(ids).astype(np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return _codes((x >> np.uint64(11)).astype(np.float64) / float(1 << 53), test_split, validation_split)
+
+
+def _codes(u: np.ndarray, test_split: float, validation_split: float) -> np.ndarray:
+    """Равномерные числа [0, 1) -> номера выборок в долях test_split и validation_split"""
+    codes = np.zeros(len(u), dtype=np.int8)
+    codes[u < test_split + (1 - test_split) * validation_split] = SUBSETS.index('validation')
+    codes[u < test_split] = SUBSETS.index('test')
+    return codes
+
+
+def fit_scaler(parts: Sequence[Mapping[str, Any]], features: ColumnsFn, seed: int = 42) -> 'StandardScaler':
+    """Обучает StandardScaler по обучающим строкам всех частей (partial_fit, часть за частью).
+
+    Без обучающих строк скейлер остался бы необученным - ValueError.
+    """
+    subset_rows = [_subset_rows(part, index, 'train', seed) for index, part in enumerate(parts)]
+    if not sum(len(rows) for rows in subset_rows):
+        raise ValueError("Нет строк в выборке 'train': разбиение по хэшу battle_id не дало обучающих строк "
+                         "- слишком мало данных для обучения")
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    for part, rows in zip(parts, subset_rows):
+        for start in range(0, len(rows), READ_BLOCK_ROWS):
+            block = features(part, rows[start:start + READ_BLOCK_ROWS])
+            scaler.partial_fit(block.reshape(len(block), -1))
+    return scaler
+
+
+def make_dataset(parts: Sequence[Mapping[str, Any]], features: ColumnsFn, labels: ColumnsFn,
+                 subset: str = 'train', seed: int = 42, scaler: Optional['StandardScaler'] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, shuffle_buffer: int = DEFAULT_SHUFFLE_BUFFER,
+                 split: bool = True) -> 'tf.data.Dataset':
+    """Собирает tf.data.Dataset (признаки, метки) для одной выборки.
+
+    Части таблицы читаются параллельно (interleave) блоками по READ_BLOCK_ROWS строк;
+    для обучающей выборки перемешиваются порядок частей и строки (буфер shuffle_buffer).
+    Нормализация скейлером выполняется над батчами в параллельном map,
+    следующий батч готовится во время шага обучения (prefetch).
+    split=False - части уже содержат только строки выборки subset (write_prepared).
+    Выборка без строк даёт пустой набор с теми же формами; формы берутся из первой части,
+    поэтому parts не может быть пустым (пустая таблица - часть без строк, см. table_parts).
+    """
+    import tensorflow as tf
+
+    if subset not in SUBSETS:
+        raise ValueError(f"Неизвестная выборка: {subset}. Доступные: {SUBSETS}")
+    if not parts:
+        raise ValueError("Нет частей таблицы: формы признаков и меток неизвестны")
+    training = subset == 'train'
+
+    empty = np.zeros(0, dtype=np.int64)
+    feature_shape = features(parts[0], empty).shape[1:]
+    label_shape = labels(parts[0], empty).shape[1:]
+
+    def read_part(part_index: int):
+        part = parts[part_index]
+        rows = _subset_rows(part, part_index, subset, seed) if split else np.arange(_num_rows(part))
+        for start in range(0, len(rows), READ_BLOCK_ROWS):
+            block = rows[start:start + READ_BLOCK_ROWS]
+            yield features(part, block).astype(np.float32), labels(part, block)
+
+    label_dtype = labels(parts[0], empty).dtype
+    output_signature = (
+        tf.TensorSpec(shape=(None,) + feature_shape, dtype=tf.float32),
+        tf.TensorSpec(shape=(None,) + label_shape, dtype=tf.as_dtype(label_dtype))
+    )
+
+    dataset = tf.data.Dataset.range(len(parts))
+    if training:
+        dataset = dataset.shuffle(len(parts), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        lambda index: tf.data.Dataset.from_generator(read_part, args=(index,), output_signature=output_signature),
+        cycle_length=min(len(parts), 4),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training
+    )
+    dataset = dataset.unbatch()
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    if scaler is not None:
+        mean = tf.constant(scaler.mean_.reshape(feature_shape), dtype=tf.float32)
+        scale = tf.constant(scaler.scale_.reshape(feature_shape), dtype=tf.float32)
+        dataset = dataset.map(lambda x, y: ((x - mean) / scale, y), num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def subset_sizes(parts: Sequence[Mapping[str, Any]], seed: int = 42) -> Dict[str, int]:
+    """Число строк каждой выборки без чтения признаков (только разбиение частей)"""
+    codes = [_split_codes(part, index, seed) for index, part in enumerate(parts)]
+    return {subset: sum(int((part_codes == code).sum()) for part_codes in codes)
+            for code, subset in enumerate(SUBSETS)}
+
+
+def make_datasets(parts: Sequence[Mapping[str, Any]], features: ColumnsFn, labels: ColumnsFn,
+                  seed: int = 42, scaler: Optional['StandardScaler'] = None,
+                  batch_size: int = DEFAULT_BATCH_SIZE,
+                  shuffle_buffer: int = DEFAULT_SHUFFLE_BUFFER) -> Dict[str, 'tf.data.Dataset']:
+    """Конвейеры для всех трёх выборок: {'train': ..., 'validation': ..., 'test': ...}"""
+    return {
+        subset: make_dataset(parts, features, labels, subset, seed, scaler, batch_size, shuffle_buffer)
+        for subset in SUBSETS
+    }
+
+
+def write_prepared(parts: Sequence[Mapping[str, Any]], features: ColumnsFn, labels: ColumnsFn, output_dir: Path,
+                   scaler: Optional['StandardScaler'] = None, seed: int = 42,
+                   chunk_rows: int = PREPARED_CHUNK_ROWS) -> Dict[str, int]:
+    """Записывает выборки в output_dir/<выборка>/: нормализованные признаки float32 ('X') и метки ('y').
+
+    Один проход по частям блоками READ_BLOCK_ROWS; в памяти не больше chunk_rows строк каждой выборки,
+    поэтому объём таблицы ограничен только диском. Эпохи обучения читают готовые батчи без
+    пересчёта признаков и нормализации (prepared_datasets). Возвращает число строк каждой выборки
+    (выборка без строк - пустая таблица с манифестом).
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    feature_shape = features(parts[0], empty).shape[1:]
+    label_sample = labels(parts[0], empty)
+    schema = {'X': column('float32', shape=list(feature_shape)),
+              'y': column(label_sample.dtype.name, shape=list(label_sample.shape[1:]))}
+    writers = {subset: ChunkedTableWriter(Path(output_dir) / subset, schema, {'seed': seed}) for subset in SUBSETS}
+    buffers = {subset: [] for subset in SUBSETS}
+
+    def flush(subset: str):
+        blocks = buffers[subset]
+        if blocks:
+            writers[subset].write_chunk({'X': np.concatenate([X for X, _ in blocks]),
+                                         'y': np.concatenate([y for _, y in blocks])})
+            buffers[subset] = []
+
+    if scaler is not None:
+        mean = scaler.mean_.reshape(feature_shape).astype(np.float32)
+        scale = scaler.scale_.reshape(feature_shape).astype(np.float32)
+    for part_index, part in enumerate(parts):
+        codes = _split_codes(part, part_index, seed)
+        for start in range(0, len(codes), READ_BLOCK_ROWS):
+            block = np.arange(start, min(start + READ_BLOCK_ROWS, len(codes)))
+            X = features(part, block).astype(np.float32)
+            if scaler is not None:
+                X = (X - mean) / scale
+            y = labels(part, block)
+            for code, subset in enumerate(SUBSETS):
+                selected = codes[block] == code
+                buffers[subset].append((X[selected], y[selected]))
+                if sum(len(rows) for _, rows in buffers[subset]) >= chunk_rows:
+                    flush(subset)
+    for subset in SUBSETS:
+        flush(subset)
+    return {subset: writer.num_rows for subset, writer in writers.items()}
+
+
+def prepared_datasets(prepared_dir: Path, seed: int = 42, batch_size: int = DEFAULT_BATCH_SIZE,
+                      shuffle_buffer: int = DEFAULT_SHUFFLE_BUFFER) -> Dict[str, 'tf.data.Dataset']:
+    """Конвейеры по выборкам write_prepared (части отображаются в память, нормализация уже выполнена)"""
+    return {
+        subset: make_dataset(table_parts(Path(prepared_dir) / subset), array_column('X'), array_column('y'),
+                             subset, seed, batch_size=batch_size, shuffle_buffer=shuffle_buffer, split=False)
+        for subset in SUBSETS
+    }
+
+
+def array_parts(X: np.ndarray, y: np.ndarray) -> List[Dict[str, np.ndarray]]:
+    """Оборачивает массивы в памяти в одну часть таблицы (для небольших синтетических выборок)"""
+    return [{'X': np.asarray(X), 'y': np.asarray(y)}]
+
+
+def array_column(name: str) -> ColumnsFn:
+    """Признаки или метки из одной (в том числе многомерной) колонки части"""
+    return lambda part, rows: np.asarray(part[name])[rows]
+
+
+def parts_after(parts: Sequence[Mapping[str, Any]], last_id: int, id_column: str = 'battle_id') -> List[Dict[str, Any]]:
+    """Строки частей с id_column > last_id - срезы без копирования (id в таблице идут по возрастанию)"""
+    new_parts = []
+    for part in parts:
+        ids = np.asarray(part[id_column])
+        start = int(np.searchsorted(ids, last_id, side='right'))
+        if start < len(ids):
+            new_parts.append({name: values[start:] for name, values in part.items()})
+    return new_parts
+
+
+def last_id(parts: Sequence[Mapping[str, Any]], id_column: str = 'battle_id') -> int:
+    """Наибольший id_column во всех частях (-1 для пустой таблицы)"""
+    return max((int(np.asarray(part[id_column])[-1]) for part in parts if len(part[id_column])), default=-1)
+
+
+def _subset_rows(part: Mapping[str, Any], part_index: int, subset: str, seed: int) -> np.ndarray:
+    """Номера строк части, попавших в выборку"""
+    return np.flatnonzero(_split_codes(part, part_index, seed) == SUBSETS.index(subset))
+
+
+def _split_codes(part: Mapping[str, Any], part_index: int, seed: int) -> np.ndarray:
+    """Номера выборок строк части: SUBSET_COLUMN, по хэшу SPLIT_ID_COLUMN, без них - по сиду и номеру части"""
+    if SUBSET_COLUMN in part:
+        return np.asarray(part[SUBSET_COLUMN])
+    if SPLIT_ID_COLUMN in part:
+        return hash_subset_codes(np.asarray(part[SPLIT_ID_COLUMN]), seed)
+    return subset_codes(_num_rows(part), part_index, seed)
+
+
+def _num_rows(part: Mapping[str, Any]) -> int:
+    return len(part[next(iter(part))])
+
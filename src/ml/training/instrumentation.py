@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Pipeline Instrumentation
+Замеры этапов пайплайна (время, CPU, память, строки, байты) в JSON lines и trace-файл
+"""
+
+import argparse
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+PROFILERS = ['cprofile', 'tracemalloc']
+PROFILE_TOP_LINES = 25
+
+
+def _rss_mb(field: str) -> Optional[float]:
+    """Поле VmRSS/VmHWM из /proc/self/status в МБ (только Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Сбрасывает VmHWM, чтобы пик памяти относился к текущему этапу (Linux 4.0+)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> Optional[float]:
+    peak = _rss_mb("VmHWM:")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Без /proc - пик за всё время процесса (Linux - КБ, macOS - байты)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _path_size(path: Path) -> int:
+    """Размер файла или папки в байтах (0, если путь не существует)"""
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+    return 0
+
+
+class Instrumentation:
+    """Собирает замеры этапов и пишет их в JSON lines и trace-файл (формат Chrome Trace Event).
+
+    Trace-файл открывается в chrome://tracing или https://ui.perfetto.dev.
+    Пока ничего не включено, stage() сразу отдаёт управление без замеров.
+    """
+
+    def __init__(self):
+        self.jsonl_path: Optional[Path] = None
+        self.trace_path: Optional[Path] = None
+        self.profile_stage: Optional[str] = None
+        self.profiler = 'cprofile'
+        self.profile_dir = Path(".")
+        self.records: List[Dict[str, Any]] = []
+        self.trace_events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.jsonl_path is not None or self.trace_path is not None or self.profile_stage is not None
+
+    def configure(self, jsonl_path: Optional[str] = None, trace_path: Optional[str] = None,
+                  profile_stage: Optional[str] = None, profiler: str = 'cprofile', profile_dir: str = "."):
+        """Включает вывод замеров и профилирование одного этапа"""
+        if profiler not in PROFILERS:
+            raise ValueError(f"Неизвестный профилировщик: {profiler}. Доступные: {PROFILERS}")
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.trace_path = Path(trace_path) if trace_path else None
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.profile_dir = Path(profile_dir)
+        for path in [self.jsonl_path, self.trace_path]:
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+    def settings(self) -> Dict[str, Any]:
+        """Настройки для configure() в дочернем процессе (trace-файл пишет только родитель)"""
+        return {
+            'jsonl_path': str(self.jsonl_path) if self.jsonl_path else None,
+            'profile_stage': self.profile_stage,
+            'profiler': self.profiler,
+            'profile_dir': str(self.profile_dir)
+        }
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None,
+              outputs: Optional[List[Path]] = None) -> Iterator[Dict[str, Any]]:
+        """Замеряет этап. В отданный словарь можно записать rows_out и другие поля"""
+        record: Dict[str, Any] = {}
+        if not self.enabled:
+            yield record
+            return
+
+        profiler = self._start_profiler(name)
+        _reset_peak_rss()
+        rss_start = _rss_mb("VmRSS:")
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_start = os.times()
+        status = 'ok'
+        try:
+            yield record
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            # CPU завершившихся дочерних процессов (пулы шардов) - отдельно от CPU самого процесса
+            children_end = os.times()
+            children_cpu = (children_end.children_user - children_start.children_user +
+                            children_end.children_system - children_start.children_system)
+            record.update({
+                'stage': name,
+                'status': status,
+                'pid': os.getpid(),
+                'timestamp': time.time() - wall,
+                'start': wall_start,
+                'wall_time': wall,
+                'cpu_time': cpu,
+                'children_cpu_time': children_cpu,
+                'rss_start_mb': rss_start,
+                'peak_rss_mb': _peak_rss_mb(),
+                'rows_in': rows_in,
+                'rows_out': record.get('rows_out'),
+                'bytes_written': sum(_path_size(path) for path in outputs) if outputs else None
+            })
+            if profiler is not None:
+                record.update(self._stop_profiler(name, profiler))
+            self._emit(record)
+
+    def merge(self, records: List[Dict[str, Any]]):
+        """Добавляет в trace-файл замеры из дочерних процессов (в JSON lines они уже записаны)"""
+        with self._lock:
+            self.records.extend(records)
+            self._write_trace(records)
+
+    def _emit(self, record: Dict[str, Any]):
+        with self._lock:
+            self.records.append(record)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._write_trace([record])
+
+    def _write_trace(self, records: List[Dict[str, Any]]):
+        if self.trace_path is None:
+            return
+        # perf_counter - монотонные часы системы (в Linux общие для процессов), поэтому этапы
+        # дочерних процессов ложатся на ту же шкалу времени отдельными строками по pid
+        for record in records:
+            self.trace_events.append({
+                'name': record['stage'],
+                'cat': 'stage',
+                'ph': 'X',
+                'ts': record['start'] * 1e6,
+                'dur': record['wall_time'] * 1e6,
+                'pid': record['pid'],
+                'tid': record['pid'],
+                'args': {key: value for key, value in record.items() if key not in ('stage', 'start', 'pid')}
+            })
+        # Файл переписывается целиком после каждого этапа: прерванный запуск оставляет валидный trace
+        tmp_path = self.trace_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'traceEvents': self.trace_events}, default=str), encoding='utf-8')
+        os.replace(tmp_path, self.trace_path)
+
+    def _start_profiler(self, name: str) -> Optional[Any]:
+        if name != self.profile_stage:
+            return None
+        if self.profiler == 'tracemalloc':
+            tracemalloc.start()
+            return 'tracemalloc'
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, name: str, profiler: Any) -> Dict[str, Any]:
+        """Останавливает профилировщик и сохраняет отчёт в profile_dir"""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if profiler == 'tracemalloc':
+            snapshot = tracemalloc.take_snapshot()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report_path = self.profile_dir / f"{name}.tracemalloc.txt"
+            lines = [str(stat) for stat in snapshot.statistics('lineno')[:PROFILE_TOP_LINES]]
+            report_path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+            print(f"🔬 tracemalloc {name}: пик {traced_peak / 2**20:.1f} МБ, отчёт {report_path}")
+            return {'traced_peak_mb': traced_peak / 2**20, 'profile': str(report_path)}
+
+        profiler.disable()
+        report_path = self.profile_dir / f"{name}.prof"
+        profiler.dump_stats(report_path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_LINES)
+        print(f"🔬 cProfile {name}: {report_path} (snakeviz / python -m pstats)")
+        print(summary.getvalue())
+        return {'profile': str(report_path)}
+
+
+# Общий экземпляр для всего процесса
+instrumentation = Instrumentation()
+
+
+def instrumented(name: str, rows_in: Optional[Callable[[Dict[str, Any]], int]] = None,
+                 rows_out: Optional[Callable[[Any], int]] = None,
+                 outputs: Optional[Callable[[Dict[str, Any]], List[Path]]] = None) -> Callable:
+    """Декоратор метода-этапа.
+
+    rows_in и outputs получают аргументы вызова по именам (включая self),
+    rows_out - результат метода. Пока замеры выключены, метод вызывается напрямую.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            with instrumentation.stage(name, rows_in(arguments) if rows_in else None,
+                                       outputs(arguments) if outputs else None) as record:
+                result = func(*args, **kwargs)
+                if rows_out is not None:
+                    record['rows_out'] = rows_out(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def add_instrumentation_args(parser: argparse.ArgumentParser):
+    """Добавляет в CLI флаги замеров и профилирования"""
+    group = parser.add_argument_group("замеры и профилирование")
+    group.add_argument('--metrics-jsonl', default=None, help="Писать замеры этапов в JSON lines")
+    group.add_argument('--trace', default=None, help="Писать trace-файл этапов (chrome://tracing, Perfetto)")
+    group.add_argument('--profile-stage', default=None, help="Профилировать этап с этим именем")
+    group.add_argument('--profiler', choices=PROFILERS, default='cprofile', help="Профилировщик для --profile-stage")
+    group.add_argument('--profile-dir', default="profiles", help="Папка для отчётов профилировщика")
+
+
+def configure_from_args(args: argparse.Namespace):
+    """Включает замеры по флагам из add_instrumentation_args"""
+    instrumentation.configure(args.metrics_jsonl, args.trace, args.profile_stage, args.profiler, args.profile_dir)
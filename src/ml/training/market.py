@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Market Simulator
+Векторизованная генерация рыночных цен и сделок (матрица days x cards)
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+RARITIES = ['Common', 'Uncommon', 'Rare', 'Legendary']
+
+# Базовая цена карты по редкости: [low, high) для rng.integers
+MARKET_PRICE_RANGES = {
+    'Common': (50, 200),
+    'Uncommon': (150, 500),
+    'Rare': (400, 1500),
+    'Legendary': (1000, 5000)
+}
+
+# Параметры ценовых блужданий по редкости (дневные значения в лог-цене)
+PRICE_WALK_PARAMS = {
+    'Common': {'drift': -0.0005, 'volatility': 0.03, 'reversion': 0.95},
+    'Uncommon': {'drift': 0.0, 'volatility': 0.035, 'reversion': 0.96},
+    'Rare': {'drift': 0.0003, 'volatility': 0.045, 'reversion': 0.97},
+    'Legendary': {'drift': 0.0008, 'volatility': 0.06, 'reversion': 0.98}
+}
+
+MARKET_MODELS = ['iid', 'gbm', 'ar']
+MEAN_TRANSACTIONS = 5
+
+
+def simulate_market(rarities: np.ndarray, days: int, rng: Optional[np.random.Generator] = None,
+                    model: str = 'iid') -> Dict[str, np.ndarray]:
+    """Генерирует цены и количество сделок для всех карт сразу.
+
+    Строка матрицы - день (0 = дата отсчёта, дальше - в прошлое), столбец - карта.
+    Модели:
+      iid - независимые дневные цены вокруг базовой (как прежний построчный генератор);
+      gbm - геометрическое броуновское движение от базовой цены;
+      ar  - AR(1) в лог-цене с возвратом к базовой цене.
+    """
+    if model not in MARKET_MODELS:
+        raise ValueError(f"Неизвестная модель рынка: {model}. Доступные: {MARKET_MODELS}")
+    if rng is None:
+        rng = np.random.default_rng()
+
+    rarities = np.asarray(rarities)
+    num_cards = len(rarities)
+    low = np.array([MARKET_PRICE_RANGES[r][0] for r in rarities], dtype=np.int64)
+    high = np.array([MARKET_PRICE_RANGES[r][1] for r in rarities], dtype=np.int64)
+
+    if model == 'iid':
+        base_price = rng.integers(low, high, size=(days, num_cards))
+        price_variation = rng.normal(0, 0.1, size=(days, num_cards))
+        price = (base_price * (1 + price_variation)).astype(np.int64)
+    else:
+        drift = _walk_param(rarities, 'drift')
+        volatility = _walk_param(rarities, 'volatility')
+        base_log_price = np.log(rng.integers(low, high, size=num_cards))
+        shocks = rng.normal(0, 1, size=(days, num_cards)) * volatility
+
+        if model == 'gbm':
+            # log p_t = log p_0 + sum((mu - sigma^2 / 2) + sigma * eps)
+            log_returns = (drift - volatility ** 2 / 2) + shocks
+            log_price = base_log_price + np.cumsum(log_returns, axis=0)
+        else:
+            # x_t = phi * x_{t-1} + mu + sigma * eps, x - отклонение лог-цены от базовой
+            reversion = _walk_param(rarities, 'reversion')
+            deviation = np.empty((days, num_cards))
+            current = np.zeros(num_cards)
+            for day in range(days):
+                current = reversion * current + drift + shocks[day]
+                deviation[day] = current
+            log_price = base_log_price + deviation
+
+        # Блуждание идёт вперёд во времени, а строка 0 - самый свежий день
+        price = np.exp(log_price[::-1]).astype(np.int64)
+
+    transaction_count = rng.poisson(MEAN_TRANSACTIONS, size=(days, num_cards))
+
+    return {
+        'price': price,
+        'transaction_count': transaction_count
+    }
+
+
+def market_frame(market: Dict[str, np.ndarray], cards_df: pd.DataFrame,
+                 reference_time: datetime) -> pd.DataFrame:
+    """Разворачивает матрицы (days x cards) в длинную таблицу: день, затем карта"""
+    price = market['price']
+    transaction_count = market['transaction_count']
+    days, num_cards = price.shape
+
+    day_index = np.repeat(np.arange(days), num_cards)
+    card_index = np.tile(np.arange(num_cards), days)
+    dates = pd.to_datetime([reference_time - timedelta(days=day) for day in range(days)])
+
+    return pd.DataFrame({
+        'date': dates[day_index],
+        'card_id': cards_df['card_id'].to_numpy()[card_index],
+        'card_name': cards_df['name'].to_numpy()[card_index],
+        'price': np.maximum(1, price.ravel()),
+        'transaction_count': transaction_count.ravel(),
+        'total_volume': price.ravel() * transaction_count.ravel()
+    })
+
+
+def _walk_param(rarities: np.ndarray, name: str) -> np.ndarray:
+    """Параметр блуждания для каждой карты по её редкости"""
+    return np.array([PRICE_WALK_PARAMS[r][name] for r in rarities])
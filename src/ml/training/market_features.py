@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Market Features
+Скользящие признаки рынка по матрице (дни x карты): средние, волатильность, моментум, VWAP, z-оценки
+"""
+
+import numpy as np
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from input_pipeline import SUBSETS, TEST_SPLIT, VALIDATION_SPLIT
+
+# Окна в днях; признаки дня определены, когда за каждым окном есть полная история (max(windows) дней назад)
+MARKET_WINDOWS = [7, 14, 30]
+MARKET_FEATURE_KINDS = ['mean', 'volatility', 'momentum', 'vwap', 'zscore']
+
+# Цель модели прогноза цены: лог-доходность за горизонт, log(price[t + h] / price[t])
+PRICE_FORECAST_HORIZON = 7
+
+MARKET_STATE_FILE = "state.npz"
+
+
+def market_feature_names(windows: Sequence[int] = MARKET_WINDOWS) -> List[str]:
+    """Колонки признаков: <вид>_<окно>, по окнам"""
+    return [f"{kind}_{window}" for window in windows for kind in MARKET_FEATURE_KINDS]
+
+
+def forecast_input_names(windows: Sequence[int] = MARKET_WINDOWS) -> List[str]:
+    """Входы модели прогноза: признаки без масштаба цены (средние и VWAP - в лог-отношении к цене)"""
+    names = []
+    for window in windows:
+        names += [f"mean_ratio_{window}", f"volatility_{window}", f"momentum_{window}",
+                  f"vwap_ratio_{window}", f"zscore_{window}"]
+    return names
+
+
+def forecast_inputs(windows: Sequence[int] = MARKET_WINDOWS) -> Callable[[Mapping[str, Any], np.ndarray], np.ndarray]:
+    """Функция признаков (часть таблицы market_features, номера строк) -> матрица forecast_input_names"""
+    def inputs(part: Mapping[str, Any], rows: np.ndarray) -> np.ndarray:
+        log_price = np.log(np.asarray(part['price'])[rows].astype(np.float64))
+        columns = []
+        for window in windows:
+            columns += [
+                np.log(np.asarray(part[f"mean_{window}"])[rows]) - log_price,
+                np.asarray(part[f"volatility_{window}"])[rows],
+                np.asarray(part[f"momentum_{window}"])[rows],
+                np.log(np.asarray(part[f"vwap_{window}"])[rows]) - log_price,
+                np.asarray(part[f"zscore_{window}"])[rows]
+            ]
+        return np.column_stack(columns)
+    return inputs
+
+
+def market_matrices(market: Mapping[str, Any], num_cards: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Длинная таблица рынка (load_columns, card_id - коды) -> (даты по возрастанию, цены, сделки) (дни x карты)"""
+    dates, day_index = np.unique(np.asarray(market['date']), return_inverse=True)
+    card_index = np.asarray(market['card_id']).astype(np.int64)
+    price = np.full((len(dates), num_cards), np.nan)
+    volume = np.zeros((len(dates), num_cards))
+    price[day_index, card_index] = market['price']
+    volume[day_index, card_index] = market['transaction_count']
+    if np.isnan(price).any():
+        raise ValueError("В рыночных данных есть дни без цены части карт")
+    return dates, price, volume
+
+
+def rolling_market_features(price: np.ndarray, volume: np.ndarray,
+                            windows: Sequence[int] = MARKET_WINDOWS) -> Dict[str, np.ndarray]:
+    """Признаки для каждого дня и карты (дни по возрастанию x карты), NaN - пока история короче окна.
+
+    Суммы по окнам - разности префиксных сумм по оси дней: O(дней x карт) на признак при любом окне.
+    Цены центрируются ценой первого дня карты, чтобы дисперсия через суммы квадратов не теряла точность.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    centered = price - price[:1]
+    log_returns = np.full(price.shape, np.nan)
+    log_returns[1:] = np.diff(np.log(price), axis=0)
+    returns = np.nan_to_num(log_returns)
+
+    features = {}
+    for window in windows:
+        count = float(window)
+        mean = _rolling_sum(centered, window) / count
+        variance = np.maximum(_rolling_sum(centered ** 2, window) / count - mean ** 2, 0)
+        std = np.sqrt(variance)
+        volume_sum = _rolling_sum(volume, window)
+        vwap = _rolling_sum(price * volume, window) / np.where(volume_sum > 0, volume_sum, np.nan)
+        return_mean = _rolling_sum(returns, window) / count
+        return_variance = np.maximum(_rolling_sum(returns ** 2, window) / count - return_mean ** 2, 0)
+
+        features[f"mean_{window}"] = mean + price[:1]
+        # Доходностей в окне window, первая доходность - на втором дне
+        volatility = np.sqrt(return_variance)
+        volatility[:window] = np.nan
+        features[f"volatility_{window}"] = volatility
+        momentum = np.full(price.shape, np.nan)
+        momentum[window:] = price[window:] / price[:-window] - 1
+        features[f"momentum_{window}"] = momentum
+        # Окно без сделок - VWAP равен средней цене
+        features[f"vwap_{window}"] = np.where(np.isnan(vwap) & ~np.isnan(mean), mean + price[:1], vwap)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            features[f"zscore_{window}"] = np.where(std > 1e-9 * np.abs(price), (centered - mean) / std,
+                                                    np.where(np.isnan(mean), np.nan, 0.0))
+    return features
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Суммы по скользящему окну вдоль дней (первые window - 1 дней - NaN)"""
+    prefix = np.zeros((len(values) + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=prefix[1:])
+    sums = np.full(values.shape, np.nan)
+    sums[window - 1:] = prefix[window:] - prefix[:-window]
+    return sums
+
+
+class MarketFeatureState:
+    """Хвост истории рынка (последние max(windows) + 1 дней) для дописывания признаков по одному дню.
+
+    append пересчитывает признаки только нового дня по хвосту - O(карт x окно) вместо всей истории;
+    результат совпадает с rolling_market_features по полной истории (до округления float).
+    Состояние хранится рядом с таблицей признаков (MARKET_STATE_FILE).
+    """
+
+    def __init__(self, price: np.ndarray, volume: np.ndarray, last_date: np.datetime64,
+                 windows: Sequence[int] = MARKET_WINDOWS):
+        self.windows = list(windows)
+        self.history = max(self.windows) + 1
+        self.price = np.asarray(price, dtype=np.float64)[-self.history:]
+        self.volume = np.asarray(volume, dtype=np.float64)[-self.history:]
+        self.last_date = np.datetime64(last_date, 's')
+
+    @classmethod
+    def from_history(cls, dates: np.ndarray, price: np.ndarray, volume: np.ndarray,
+                     windows: Sequence[int] = MARKET_WINDOWS) -> 'MarketFeatureState':
+        return cls(price, volume, dates[-1], windows)
+
+    def append(self, date: np.datetime64, price: np.ndarray, volume: np.ndarray) -> Dict[str, np.ndarray]:
+        """Добавляет день (цены и сделки всех карт) и возвращает его признаки {колонка: (карты,)}"""
+        date = np.datetime64(date, 's')
+        if date <= self.last_date:
+            raise ValueError(f"День {date} не позже последнего обработанного {self.last_date}")
+        self.price = np.vstack([self.price, np.asarray(price, dtype=np.float64)[None]])[-self.history:]
+        self.volume = np.vstack([self.volume, np.asarray(volume, dtype=np.float64)[None]])[-self.history:]
+        self.last_date = date
+        return {name: values[-1] for name, values in rolling_market_features(self.price, self.volume,
+                                                                             self.windows).items()}
+
+    def save(self, path: Path):
+        tmp_path = Path(path).with_name(f".{Path(path).name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, price=self.price, volume=self.volume, last_date=self.last_date,
+                     windows=np.array(self.windows))
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['MarketFeatureState']:
+        """Состояние из файла (None, если его нет - признаки ещё не считались)"""
+        if not Path(path).exists():
+            return None
+        with np.load(path) as state:
+            return cls(state['price'], state['volume'], state['last_date'], state['windows'].tolist())
+
+
+def forecast_targets(price: np.ndarray, num_cards: int, horizon: int = PRICE_FORECAST_HORIZON) -> np.ndarray:
+    """Цели по колонке price таблицы market_features (строки - день, затем карта): NaN для последних horizon дней"""
+    price = np.asarray(price, dtype=np.float64).reshape(-1, num_cards)
+    targets = np.full(price.shape, np.nan, dtype=np.float32)
+    targets[:-horizon] = np.log(price[horizon:] / price[:-horizon])
+    return targets.ravel()
+
+
+def forecast_subset_codes(num_days: int, horizon: int = PRICE_FORECAST_HORIZON,
+                          test_split: float = TEST_SPLIT, validation_split: float = VALIDATION_SPLIT) -> np.ndarray:
+    """Номера выборок по дням (индекс в SUBSETS): обучение - ранние дни, проверка и тест - поздние.
+
+    Цель дня смотрит на horizon дней вперёд, поэтому последние horizon дней перед началом следующей
+    выборки и дни без цели исключаются (-1): в обучение не попадают цены из периода проверки.
+    """
+    test_start = int(round(num_days * (1 - test_split)))
+    validation_start = int(round(test_start * (1 - validation_split)))
+    codes = np.full(num_days, -1, dtype=np.int8)
+    codes[:max(0, validation_start - horizon)] = SUBSETS.index('train')
+    codes[validation_start:max(validation_start, test_start - horizon)] = SUBSETS.index('validation')
+    codes[test_start:max(test_start, num_days - horizon)] = SUBSETS.index('test')
+    return codes
+
+
+def market_feature_rows(dates: np.ndarray, price: np.ndarray, features: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Матрицы (дни x карты) -> колонки таблицы market_features: строки по дням, внутри дня - по картам"""
+    days, num_cards = price.shape
+    return {
+        'date': np.repeat(dates, num_cards),
+        'card_id': np.tile(np.arange(num_cards), days),
+        'price': price.ravel(),
+        **{name: values.ravel() for name, values in features.items()}
+    }
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Matchup Table
+Заранее посчитанные исходы раунда для всех пар карт и всех вариантов пилюль: поиск по индексу вместо расчёта на каждый запрос
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import add_instrumentation_args, configure_from_args, instrumented
+from sharding import chunk_bounds, iter_shards
+from simulator import START_PILLS
+from storage import read_table
+
+# Формат файла (как у бандла моделей, все числа little-endian):
+#   magic "URMT" | версия формата uint32 | длина заголовка uint32 | заголовок JSON (UTF-8) | тензоры
+# Заголовок дополнен пробелами до MATCHUP_ALIGNMENT, смещения тензоров - от начала секции тензоров.
+MATCHUP_MAGIC = b'URMT'
+MATCHUP_FORMAT_VERSION = 2
+MATCHUP_ALIGNMENT = 16
+MATCHUP_FILE = "matchups.bin"
+
+# Пилюли на раунд: 0..START_PILLS у каждой стороны
+PILL_LEVELS = START_PILLS + 1
+CARD_LEVELS = range(1, 6)
+
+# Исход раунда зависит только от силы и урона карт, поэтому таблица строится по уникальным
+# профилям (сила, урон) всех уровней карт, а карта на уровне ссылается на свой профиль.
+# net_damage[player, opponent, p, q] (int8): урон сопернику при победе (> 0), минус урон игроку
+# при поражении (< 0), 0 - ничья (урон карт не меньше 1).
+# Ожидаемые исходы (вероятность победы, ничьей и средний net_damage при равновероятных пилюлях
+# соперника) в файл не пишутся: это среднее по строке net_damage из PILL_LEVELS значений,
+# его дешевле посчитать при поиске (expected_block, MatchupTable.expected в matchup-table.ts).
+EXPECTED_FIELDS = ['win', 'draw', 'net_damage']
+
+# Строк профилей в одном блоке: блок net_damage ~16 МБ
+BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def stat_profiles(cards_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Уникальные профили (сила, урон) по всем уровням карт.
+
+    Возвращает (power, damage, card_profiles): профили отсортированы по силе и урону,
+    card_profiles[карта, уровень - 1] - номер профиля карты на уровне.
+    """
+    power = np.stack([cards_df[f'power_level_{level}'].to_numpy(dtype=np.int16) for level in CARD_LEVELS], axis=1)
+    damage = np.stack([cards_df[f'damage_level_{level}'].to_numpy(dtype=np.int16) for level in CARD_LEVELS], axis=1)
+    if damage.min() < 1:
+        raise ValueError("Урон карты меньше 1: ничья и победа без урона в net_damage неразличимы")
+
+    profiles, card_profiles = np.unique(np.stack([power.ravel(), damage.ravel()], axis=1), axis=0,
+                                        return_inverse=True)
+    return (profiles[:, 0].astype(np.int16), profiles[:, 1].astype(np.int16),
+            card_profiles.reshape(power.shape).astype(np.int16))
+
+
+def matchup_block(power: np.ndarray, damage: np.ndarray, rows: Tuple[int, int]) -> np.ndarray:
+    """net_damage для профилей игрока [start, stop) против всех профилей: (строки x профили x пилюли x пилюли).
+
+    Правила раунда как в resolve_battles: атака = сила + пилюли, большая атака побеждает
+    и наносит урон своей карты, равные атаки - ничья без урона.
+    """
+    start, stop = rows
+    pills = np.arange(PILL_LEVELS, dtype=np.int16)
+    # Разница атак (игрок - соперник) сразу для всего блока: power_i - power_j + p - q
+    diff = ((power[start:stop, None] - power[None, :])[:, :, None, None] +
+            (pills[:, None] - pills[None, :])[None, None])
+    player_damage = damage[start:stop, None, None, None].astype(np.int8)
+    opponent_damage = damage[None, :, None, None].astype(np.int8)
+    return np.where(diff > 0, player_damage, np.where(diff < 0, -opponent_damage, 0)).astype(np.int8)
+
+
+def expected_block(net_damage: np.ndarray, max_opponent_pills: int = START_PILLS) -> np.ndarray:
+    """Вероятности победы/ничьей и средний net_damage при 0..max_opponent_pills пилюлях соперника (поровну)"""
+    outcomes = net_damage[..., :max_opponent_pills + 1]
+    return np.stack([(outcomes > 0).mean(axis=-1), (outcomes == 0).mean(axis=-1),
+                     outcomes.mean(axis=-1, dtype=np.float32)], axis=-1)
+
+
+def _matchup_task(task: Dict[str, Any]) -> np.ndarray:
+    """Задача пула: блок net_damage"""
+    return matchup_block(task['power'], task['damage'], task['rows'])
+
+
+@instrumented('matchups', rows_out=lambda result: result['num_pairs'],
+              outputs=lambda a: [Path(a['path'])])
+def build_matchup_table(cards_df: pd.DataFrame, path: Any, workers: Optional[int] = None,
+                        block_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Считает таблицу исходов по блокам профилей (параллельно) и пишет её в файл.
+
+    Блоки пишутся на свои места в файле по мере готовности, поэтому в памяти
+    одновременно не больше нескольких блоков; контрольная сумма считается после записи.
+    """
+    power, damage, card_profiles = stat_profiles(cards_df)
+    num_profiles = len(power)
+    pair_bytes = PILL_LEVELS * PILL_LEVELS
+    block_rows = block_rows or max(1, BLOCK_BYTES // (num_profiles * pair_bytes))
+    blocks = chunk_bounds(num_profiles, block_rows)
+
+    tensors = {}
+    offset = 0
+    for name, dtype, shape in [
+        ('net_damage', np.dtype(np.int8), [num_profiles, num_profiles, PILL_LEVELS, PILL_LEVELS]),
+        ('profile_power', np.dtype('<i2'), [num_profiles]),
+        ('profile_damage', np.dtype('<i2'), [num_profiles]),
+        ('card_profiles', np.dtype('<i2'), list(card_profiles.shape))
+    ]:
+        byte_length = int(np.prod(shape)) * dtype.itemsize
+        tensors[name] = {'dtype': dtype.name, 'shape': shape, 'offset': offset, 'byte_length': byte_length}
+        offset += byte_length + (-byte_length % MATCHUP_ALIGNMENT)
+    data_size = offset
+
+    header = {
+        'pill_levels': PILL_LEVELS,
+        'card_levels': list(CARD_LEVELS),
+        'card_ids': cards_df['card_id'].astype(str).tolist(),
+        'checksum': {'algorithm': 'sha256', 'value': '0' * 64},
+        'tensors': tensors
+    }
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    start = time.perf_counter()
+    with open(tmp_path, 'w+b') as f:
+        # Заголовок с нулевой суммой той же длины: после записи тензоров он перезаписывается на месте
+        data_start = _write_header(f, header)
+        f.truncate(data_start + data_size)
+
+        def write_tensor(name: str, array: np.ndarray, first_row: int = 0):
+            spec = tensors[name]
+            row_bytes = spec['byte_length'] // spec['shape'][0]
+            f.seek(data_start + spec['offset'] + first_row * row_bytes)
+            f.write(np.ascontiguousarray(array, dtype=np.dtype(spec['dtype']).newbyteorder('<')).tobytes())
+
+        tasks = [{'power': power, 'damage': damage, 'rows': rows} for rows in blocks]
+        for rows, net_damage in zip(blocks, iter_shards(_matchup_task, tasks, workers)):
+            write_tensor('net_damage', net_damage, rows[0])
+        write_tensor('profile_power', power)
+        write_tensor('profile_damage', damage)
+        write_tensor('card_profiles', card_profiles)
+
+        f.flush()
+        header['checksum']['value'] = _file_digest(f, data_start)
+        f.seek(0)
+        _write_header(f, header)
+    tmp_path.replace(path)
+
+    elapsed = time.perf_counter() - start
+    size = path.stat().st_size
+    num_pairs = num_profiles * num_profiles
+    print(f"🎲 Таблица исходов: {len(cards_df)} карт -> {num_profiles} профилей, {num_pairs} пар x "
+          f"{pair_bytes} вариантов пилюль, {size / 1024 / 1024:.1f} МБ за {elapsed:.2f}с "
+          f"({len(blocks)} блоков) -> {path}")
+    return {'path': str(path), 'num_profiles': num_profiles, 'num_pairs': num_pairs, 'size': size,
+            'time': elapsed}
+
+
+def _write_header(f: Any, header: Dict[str, Any]) -> int:
+    """Пишет преамбулу и заголовок с текущей позиции, возвращает начало секции тензоров"""
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    preamble_size = len(MATCHUP_MAGIC) + 8
+    header_bytes += b' ' * (-(preamble_size + len(header_bytes)) % MATCHUP_ALIGNMENT)
+    f.write(MATCHUP_MAGIC + struct.pack('<II', MATCHUP_FORMAT_VERSION, len(header_bytes)) + header_bytes)
+    return preamble_size + len(header_bytes)
+
+
+def _file_digest(f: Any, start: int, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """SHA-256 файла от позиции start до конца"""
+    digest = hashlib.sha256()
+    f.seek(start)
+    while chunk := f.read(chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MatchupTable:
+    """Таблица исходов из файла build_matchup_table: массивы - представления над mmap файла"""
+
+    def __init__(self, path: Any, verify: bool = True):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = self._mmap
+        if buffer[:len(MATCHUP_MAGIC)] != MATCHUP_MAGIC:
+            raise ValueError("Не таблица исходов Urban Rivals: неверная сигнатура")
+        format_version, header_length = struct.unpack_from('<II', buffer, len(MATCHUP_MAGIC))
+        if format_version != MATCHUP_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия формата таблицы исходов: {format_version}")
+        data_start = len(MATCHUP_MAGIC) + 8 + header_length
+        self.header = json.loads(buffer[len(MATCHUP_MAGIC) + 8:data_start].decode('utf-8'))
+        if verify and hashlib.sha256(memoryview(buffer)[data_start:]).hexdigest() != self.header['checksum']['value']:
+            raise ValueError("Контрольная сумма таблицы исходов не совпадает: файл повреждён")
+
+        def tensor(name: str) -> np.ndarray:
+            spec = self.header['tensors'][name]
+            return np.frombuffer(buffer, dtype=np.dtype(spec['dtype']).newbyteorder('<'),
+                                 count=int(np.prod(spec['shape'])),
+                                 offset=data_start + spec['offset']).reshape(spec['shape'])
+
+        self.net_damage = tensor('net_damage')
+        self.profile_power = tensor('profile_power')
+        self.profile_damage = tensor('profile_damage')
+        self.card_profiles = tensor('card_profiles')
+        self.card_index = {card_id: index for index, card_id in enumerate(self.header['card_ids'])}
+        self._profile_index = {(int(power), int(damage)): index
+                               for index, (power, damage) in enumerate(zip(self.profile_power, self.profile_damage))}
+
+    def profile(self, card_id: str, level: int = 5) -> int:
+        """Номер профиля карты на уровне"""
+        return int(self.card_profiles[self.card_index[card_id], level - 1])
+
+    def stats_profile(self, power: int, damage: int) -> Optional[int]:
+        """Номер профиля по силе и урону (None, если таких характеристик нет ни у одной карты)"""
+        return self._profile_index.get((power, damage))
+
+    def outcome(self, player_card: str, opponent_card: str, player_pills: int, opponent_pills: int,
+                player_level: int = 5, opponent_level: int = 5) -> int:
+        """net_damage раунда: > 0 - победа игрока с этим уроном, < 0 - поражение, 0 - ничья"""
+        return int(self.net_damage[self.profile(player_card, player_level), self.profile(opponent_card, opponent_level),
+                                   player_pills, opponent_pills])
+
+    def expected(self, player_card: str, opponent_card: str, player_pills: int,
+                 max_opponent_pills: int = START_PILLS, player_level: int = 5,
+                 opponent_level: int = 5) -> Dict[str, float]:
+        """Вероятности победы/ничьей и средний net_damage, если у соперника 0..max_opponent_pills пилюль"""
+        player = self.profile(player_card, player_level)
+        opponent = self.profile(opponent_card, opponent_level)
+        values = expected_block(self.net_damage[player, opponent, player_pills], max_opponent_pills)
+        return dict(zip(EXPECTED_FIELDS, map(float, values)))
+
+    def close(self):
+        # Представления net_damage и др. держат буфер: освобождаем их вместе с mmap
+        self.net_damage = self.card_profiles = None
+        self.profile_power = self.profile_damage = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    """Построение таблицы исходов и поиск по ней из командной строки"""
+    parser = argparse.ArgumentParser(description="Таблица исходов раунда для всех пар карт Urban Rivals")
+    parser.add_argument('--table', default=f"trained_models/{MATCHUP_FILE}", help="Файл таблицы исходов")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Построить таблицу по базе карт")
+    build_parser.add_argument('--data-dir', default="datasets", help="Папка с датасетом (dataset.py)")
+    build_parser.add_argument('--workers', type=int, default=None, help="Процессов (по умолчанию все ядра)")
+    build_parser.add_argument('--block-rows', type=int, default=None, help="Профилей игрока в одном блоке")
+    add_instrumentation_args(build_parser)
+
+    lookup_parser = subparsers.add_parser('lookup', help="Исход раунда для пары карт")
+    lookup_parser.add_argument('player_card')
+    lookup_parser.add_argument('opponent_card')
+    lookup_parser.add_argument('--player-pills', type=int, default=0)
+    lookup_parser.add_argument('--opponent-pills', type=int, default=None,
+                               help="Пилюли соперника (по умолчанию - средний исход по 0..12)")
+    lookup_parser.add_argument('--level', type=int, choices=list(CARD_LEVELS), default=5)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        configure_from_args(args)
+        cards_df = read_table(Path(args.data_dir) / "cards")
+        build_matchup_table(cards_df, args.table, args.workers, args.block_rows)
+        return
+
+    with MatchupTable(args.table) as table:
+        if args.opponent_pills is not None:
+            net_damage = table.outcome(args.player_card, args.opponent_card, args.player_pills,
+                                       args.opponent_pills, args.level, args.level)
+            result = 'ничья' if net_damage == 0 else ('победа' if net_damage > 0 else 'поражение')
+            print(f"⚔️ {result}, урон {abs(net_damage)}")
+        else:
+            expected = table.expected(args.player_card, args.opponent_card, args.player_pills,
+                                      player_level=args.level, opponent_level=args.level)
+            print(f"⚔️ победа {expected['win']:.3f}, ничья {expected['draw']:.3f}, "
+                  f"средний урон {expected['net_damage']:+.2f}")
+
+
+if __name__ == "__main__":
+    main()
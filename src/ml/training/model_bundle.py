@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Model Bundle
+Единый бинарный файл моделей для расширения: веса полносвязных слоёв, скейлеры, энкодеры и схема признаков
+"""
+
+import hashlib
+import json
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Формат файла (все числа little-endian):
+#   magic "URMB" | версия формата uint32 | длина заголовка uint32 | заголовок JSON (UTF-8) | тензоры
+# Заголовок дополнен пробелами до BUNDLE_ALIGNMENT, смещения тензоров в нём - от начала секции тензоров
+# и тоже кратны BUNDLE_ALIGNMENT, поэтому в браузере веса читаются типизированными массивами без копирования.
+BUNDLE_MAGIC = b'URMB'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ALIGNMENT = 16
+BUNDLE_FILE = "urban_rivals_models.bin"
+
+# float16 - половина размера почти без потери точности, int8 - четверть (масштаб на каждый выход слоя)
+QUANTIZATIONS = ['float32', 'float16', 'int8']
+
+# Слои Keras, которые не влияют на инференс и в бандл не попадают
+INFERENCE_NOOP_LAYERS = ['InputLayer', 'Dropout']
+
+BUNDLE_ACTIVATIONS = ['linear', 'relu', 'sigmoid', 'softmax']
+
+
+def dense_layers(model: Any) -> List[Dict[str, Any]]:
+    """Веса и активации полносвязных слоёв модели Keras: [{'kernel', 'bias', 'activation'}, ...]"""
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in INFERENCE_NOOP_LAYERS:
+            continue
+        if kind != 'Dense':
+            raise ValueError(f"Слой {kind} ({layer.name}) не поддерживается бандлом, только Dense")
+        activation = layer.get_config()['activation']
+        if activation not in BUNDLE_ACTIVATIONS:
+            raise ValueError(f"Активация {activation} не поддерживается бандлом. Доступные: {BUNDLE_ACTIVATIONS}")
+        kernel, bias = layer.get_weights()
+        layers.append({'kernel': kernel, 'bias': bias, 'activation': activation})
+    return layers
+
+
+def quantize(kernel: np.ndarray, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Квантует матрицу весов (входы x выходы): (значения, масштабы выходов для int8 или None)"""
+    if quantization == 'float32':
+        return kernel.astype('<f4'), None
+    if quantization == 'float16':
+        return kernel.astype('<f2'), None
+    if quantization == 'int8':
+        # Симметричная квантизация с отдельным масштабом на каждый выход (столбец матрицы)
+        scale = np.abs(kernel).max(axis=0) / 127
+        scale[scale == 0] = 1
+        values = np.clip(np.round(kernel / scale), -127, 127).astype(np.int8)
+        return values, scale.astype('<f4')
+    raise ValueError(f"Неизвестная квантизация: {quantization}. Доступные: {QUANTIZATIONS}")
+
+
+def build_bundle(models: Dict[str, Dict[str, Any]], mappings: Dict[str, List[str]],
+                 quantization: str = 'float16', version: str = '1.0.0', created: Optional[str] = None) -> bytes:
+    """Собирает бандл.
+
+    models: имя -> {'layers': dense_layers(...), 'scaler': {'mean', 'scale'}, прочие поля описания}
+    (input_features, output_classes, метрики) - прочие поля попадают в заголовок как есть.
+    mappings: коды категориальных признаков, например {'clans': [...], 'rarities': [...]}.
+    """
+    tensors = {}
+    chunks = []
+    offset = 0
+
+    def add_tensor(name: str, array: np.ndarray, **extra) -> str:
+        nonlocal offset
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+        tensors[name] = {'dtype': array.dtype.name, 'shape': list(array.shape), 'offset': offset,
+                         'byte_length': len(data), **extra}
+        padding = -len(data) % BUNDLE_ALIGNMENT
+        chunks.append(data + b'\0' * padding)
+        offset += len(data) + padding
+        return name
+
+    header_models = {}
+    for model_name, model in models.items():
+        layers = []
+        for index, layer in enumerate(model['layers']):
+            prefix = f"{model_name}/dense_{index}"
+            values, scale = quantize(np.asarray(layer['kernel'], dtype=np.float32), quantization)
+            extra = {} if scale is None else {'scale': add_tensor(f"{prefix}/kernel_scale", scale)}
+            layers.append({
+                'kernel': add_tensor(f"{prefix}/kernel", values, **extra),
+                'bias': add_tensor(f"{prefix}/bias", np.asarray(layer['bias'], dtype='<f4')),
+                'activation': layer['activation']
+            })
+        spec = {key: value for key, value in model.items() if key not in ('layers', 'scaler')}
+        spec['layers'] = layers
+        spec['scaler'] = {
+            'mean': add_tensor(f"{model_name}/scaler_mean", np.asarray(model['scaler']['mean'], dtype='<f4')),
+            'scale': add_tensor(f"{model_name}/scaler_scale", np.asarray(model['scaler']['scale'], dtype='<f4'))
+        }
+        header_models[model_name] = spec
+
+    data = b''.join(chunks)
+    header = {
+        'version': version,
+        'created': created,
+        'quantization': quantization,
+        'checksum': {'algorithm': 'sha256', 'value': hashlib.sha256(data).hexdigest()},
+        'models': header_models,
+        'mappings': mappings,
+        'tensors': tensors
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+    preamble_size = len(BUNDLE_MAGIC) + 8
+    header_bytes += b' ' * (-(preamble_size + len(header_bytes)) % BUNDLE_ALIGNMENT)
+    return BUNDLE_MAGIC + struct.pack('<II', BUNDLE_FORMAT_VERSION, len(header_bytes)) + header_bytes + data
+
+
+def write_bundle(path: Path, models: Dict[str, Dict[str, Any]], mappings: Dict[str, List[str]],
+                 quantization: str = 'float16', version: str = '1.0.0', created: Optional[str] = None) -> int:
+    """Пишет бандл в файл, возвращает размер в байтах"""
+    bundle = build_bundle(models, mappings, quantization, version, created)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_bytes(bundle)
+    tmp_path.replace(path)
+    return len(bundle)
+
+
+def read_bundle(source: Any) -> Dict[str, Any]:
+    """Читает бандл (путь или bytes): заголовок, в котором ссылки на тензоры заменены массивами float32.
+
+    Проверяет сигнатуру, версию формата и контрольную сумму секции тензоров.
+    """
+    buffer = Path(source).read_bytes() if isinstance(source, (str, Path)) else bytes(source)
+    if buffer[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+        raise ValueError("Не бандл моделей Urban Rivals: неверная сигнатура")
+    format_version, header_length = struct.unpack_from('<II', buffer, len(BUNDLE_MAGIC))
+    if format_version != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата бандла: {format_version}")
+    data_start = len(BUNDLE_MAGIC) + 8 + header_length
+    header = json.loads(buffer[len(BUNDLE_MAGIC) + 8:data_start].decode('utf-8'))
+    data = memoryview(buffer)[data_start:]
+    if hashlib.sha256(data).hexdigest() != header['checksum']['value']:
+        raise ValueError("Контрольная сумма бандла не совпадает: файл повреждён")
+
+    def tensor(name: str) -> np.ndarray:
+        spec = header['tensors'][name]
+        array = np.frombuffer(data, dtype=np.dtype(spec['dtype']).newbyteorder('<'),
+                              count=int(np.prod(spec['shape'])), offset=spec['offset']).reshape(spec['shape'])
+        array = array.astype(np.float32)
+        if 'scale' in spec:
+            array = array * tensor(spec['scale'])
+        return array
+
+    for model in header['models'].values():
+        model['layers'] = [
+            {'kernel': tensor(layer['kernel']), 'bias': tensor(layer['bias']), 'activation': layer['activation']}
+            for layer in model['layers']
+        ]
+        model['scaler'] = {name: tensor(ref) for name, ref in model['scaler'].items()}
+    return header
+
+
+def bundle_predict(model: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """Прямой проход модели из read_bundle на NumPy (нормализация скейлером + полносвязные слои)"""
+    outputs = (np.asarray(X, dtype=np.float32) - model['scaler']['mean']) / model['scaler']['scale']
+    for layer in model['layers']:
+        outputs = outputs @ layer['kernel'] + layer['bias']
+        if layer['activation'] == 'relu':
+            outputs = np.maximum(outputs, 0)
+        elif layer['activation'] == 'sigmoid':
+            outputs = 1 / (1 + np.exp(-outputs))
+        elif layer['activation'] == 'softmax':
+            outputs = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+            outputs /= outputs.sum(axis=1, keepdims=True)
+    return outputs
+
+
+def _json_default(value: Any) -> Any:
+    """Числа и массивы NumPy в метаданных моделей (точность, классы энкодеров)"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
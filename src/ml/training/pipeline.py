@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals ML Pipeline
+Инкрементальный запуск этапов датасета и обучения (DAG) с кэшем результатов по хэшу входов
+"""
+
+import argparse
+import ast
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from instrumentation import add_instrumentation_args, configure_from_args, instrumentation
+from market import MARKET_MODELS
+from matchups import MATCHUP_FILE, build_matchup_table
+from model_bundle import BUNDLE_FILE, QUANTIZATIONS
+from sharding import shard_seeds
+from storage import load_columns, read_table
+
+MODULE_DIR = Path(__file__).resolve().parent
+CACHE_ENTRY_NAME = "entry.json"
+STATE_NAME = "state.json"
+DEFAULT_CACHE_SIZE_GB = 20.0
+# Результаты в этих папках делятся с кэшем жёсткими ссылками, остальные копируются
+LINKED_ROOTS = {'data'}
+
+# Этапы конвейера в топологическом порядке.
+#   deps    - этапы, чьи результаты нужны этапу (их ключи входят в ключ этапа)
+#   params  - параметры запуска, от которых зависит результат
+#   modules - модули, через которые этап запускается; версия кода - содержимое их и всех модулей
+#             этой папки, которые они импортируют (module_closure, в том числе импорты внутри функций)
+#   outputs - файлы и папки результата (относительно data_dir / models_dir)
+DATASET_MODULES = ['dataset.py']
+TRAINING_MODULES = ['train_models.py']
+
+STAGES = {
+    'cards': {
+        'deps': [],
+        'params': ['seed'],
+        'modules': DATASET_MODULES,
+        'outputs': lambda config: [('data', 'cards')]
+    },
+    'battles': {
+        'deps': ['cards'],
+        'params': ['seed', 'num_battles', 'chunk_size', 'reference_date'],
+        'modules': DATASET_MODULES,
+        'outputs': lambda config: [('data', 'battles'), ('data', 'rounds')]
+    },
+    'market': {
+        'deps': ['cards'],
+        'params': ['seed', 'days', 'market_model', 'reference_date'],
+        'modules': DATASET_MODULES,
+        'outputs': lambda config: [('data', 'market')]
+    },
+    'market_features': {
+        'deps': ['cards', 'market'],
+        'params': [],
+        'modules': DATASET_MODULES,
+        'outputs': lambda config: [('data', 'market_features')]
+    },
+    'features': {
+        'deps': ['cards', 'battles'],
+        'params': [],
+        'modules': DATASET_MODULES,
+        'outputs': lambda config: [('data', name) for name in ['card_features', 'battle_features', 'battle_sequences',
+                                                               'card_outcomes', 'training_data']]
+    },
+    'train_battle': {
+        'deps': ['features'],
+        'params': ['battle_model', 'batch_size'],
+        'modules': TRAINING_MODULES,
+        'outputs': lambda config: _battle_model_outputs(config['battle_model'])
+    },
+    'train_card': {
+        'deps': ['features'],
+        'params': [],
+        'modules': TRAINING_MODULES,
+        'outputs': lambda config: [('models', 'tensorflow/card_recommender.h5'), ('models', 'sklearn/card_scaler.pkl'),
+                                   ('models', 'tensorflowjs/card_recommender'), ('models', 'metrics/card.json')]
+    },
+    'train_strategy': {
+        'deps': ['features'],
+        'params': ['strategy_samples'],
+        'modules': TRAINING_MODULES,
+        'outputs': lambda config: [('models', 'tensorflow/strategy_classifier.h5'), ('models', 'sklearn/strategy_rf.pkl'),
+                                   ('models', 'sklearn/strategy_scaler.pkl'),
+                                   ('models', 'sklearn/strategy_label_encoder.pkl'),
+                                   ('models', 'tensorflowjs/strategy_classifier'), ('models', 'metrics/strategy.json')]
+    },
+    'train_price': {
+        'deps': ['market_features'],
+        'params': [],
+        'modules': TRAINING_MODULES,
+        'outputs': lambda config: [('models', 'tensorflow/price_forecaster.h5'), ('models', 'sklearn/price_scaler.pkl'),
+                                   ('models', 'tensorflowjs/price_forecaster'), ('models', 'metrics/price.json')]
+    },
+    'metadata': {
+        'deps': ['train_battle', 'train_card', 'train_strategy', 'train_price'],
+        'params': ['bundle_quantization'],
+        'modules': TRAINING_MODULES,
+        'outputs': lambda config: [('models', 'models_metadata.json'), ('models', BUNDLE_FILE)]
+    },
+    'matchups': {
+        'deps': ['cards'],
+        'params': [],
+        'modules': ['matchups.py'],
+        'outputs': lambda config: [('models', MATCHUP_FILE)]
+    }
+}
+
+
+def _battle_model_outputs(battle_model: str) -> List[tuple]:
+    """Файлы модели боёв зависят от её варианта"""
+    if battle_model == 'sequence':
+        return [('models', 'tensorflow/battle_sequence_predictor.h5'),
+                ('models', 'tensorflowjs/battle_sequence_predictor'), ('models', 'metrics/battle.json')]
+    return [('models', 'tensorflow/battle_predictor.h5'), ('models', 'sklearn/battle_scaler.pkl'),
+            ('models', 'sklearn/battle_label_encoder.pkl'), ('models', 'tensorflowjs/battle_predictor'),
+            ('models', 'metrics/battle.json')]
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def module_closure(modules: List[str]) -> List[str]:
+    """Модули и все модули папки MODULE_DIR, которые они импортируют прямо или через другие модули"""
+    closure = set()
+    stack = list(modules)
+    while stack:
+        module = stack.pop()
+        if module not in closure:
+            closure.add(module)
+            stack.extend(_local_imports(module))
+    return sorted(closure)
+
+
+@functools.lru_cache(maxsize=None)
+def _local_imports(module: str) -> List[str]:
+    """Модули папки, импортируемые файлом (по синтаксическому дереву: импорты внутри функций тоже)"""
+    tree = ast.parse((MODULE_DIR / module).read_text(encoding='utf-8'))
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.append(node.module)
+    return sorted({f"{name}.py" for name in names if (MODULE_DIR / f"{name}.py").is_file()})
+
+
+def stage_key(name: str, config: Dict[str, Any], dep_keys: Dict[str, str]) -> str:
+    """Ключ результата этапа: хэш имени, параметров, версии кода и ключей зависимостей"""
+    stage = STAGES[name]
+    payload = {
+        'stage': name,
+        'params': {param: config[param] for param in stage['params']},
+        'code': {module: file_digest(MODULE_DIR / module) for module in module_closure(stage['modules'])},
+        'deps': {dep: dep_keys[dep] for dep in stage['deps']}
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def _path_size(path: Path) -> int:
+    """Размер файла или папки в байтах"""
+    if path.is_file():
+        return path.stat().st_size
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+def _link_or_copy(src: Path, dst: Path, hard_link: bool = True):
+    """Переносит результат жёсткими ссылками (без копирования данных), между дисками или без hard_link - копией"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    _remove(dst)
+
+    def link(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+
+    copy_function = link if hard_link else shutil.copy2
+    if src.is_dir():
+        shutil.copytree(src, dst, copy_function=copy_function)
+    else:
+        copy_function(src, dst)
+
+
+def _shares_files(output_id: str) -> bool:
+    """Можно ли делить файлы результата с кэшем жёсткими ссылками.
+
+    Таблицы датасета пишутся через временные файлы и os.replace - запись создаёт новый файл,
+    а файл в кэше не меняется. Модели перезаписываются на месте (joblib.dump, .h5, метаданные,
+    train_models.py --warm-start и --stages вне пайплайна), поэтому их результаты копируются.
+    """
+    return output_id.split('/', 1)[0] in LINKED_ROOTS
+
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+class PipelineCache:
+    """Кэш результатов этапов на диске: папка на ключ, вытеснение давно не использованных по размеру.
+
+    Таблицы датасета кладутся в кэш и восстанавливаются из него жёсткими ссылками: этап перед
+    запуском удаляет свои прежние результаты, а таблицы пишутся через os.replace, поэтому файлы
+    в кэше не перезаписываются на месте. Модели копируются (см. _shares_files).
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_dir(self, name: str, key: str) -> Path:
+        return self.cache_dir / f"{name}-{key}"
+
+    def has(self, name: str, key: str) -> bool:
+        return (self._entry_dir(name, key) / CACHE_ENTRY_NAME).exists()
+
+    def store(self, name: str, key: str, outputs: Dict[str, Path]):
+        """Кладёт результаты этапа в кэш и вытесняет старые записи сверх лимита"""
+        entry_dir = self._entry_dir(name, key)
+        tmp_dir = self.cache_dir / f".{entry_dir.name}.tmp"
+        _remove(tmp_dir)
+        for output_id, path in outputs.items():
+            _link_or_copy(path, tmp_dir / output_id, _shares_files(output_id))
+
+        entry = {'stage': name, 'key': key, 'outputs': list(outputs), 'size': _path_size(tmp_dir),
+                 'last_used': time.time()}
+        (tmp_dir / CACHE_ENTRY_NAME).write_text(json.dumps(entry, indent=2), encoding='utf-8')
+        _remove(entry_dir)
+        os.replace(tmp_dir, entry_dir)
+        self.evict(keep=entry_dir)
+
+    def restore(self, name: str, key: str, outputs: Dict[str, Path]):
+        """Восстанавливает результаты этапа из кэша на их места"""
+        entry_dir = self._entry_dir(name, key)
+        for output_id, path in outputs.items():
+            _link_or_copy(entry_dir / output_id, path, _shares_files(output_id))
+        self._touch(entry_dir)
+
+    def evict(self, keep: Optional[Path] = None):
+        """Удаляет давно не использованные записи, пока кэш больше max_bytes"""
+        entries = []
+        for entry_path in self.cache_dir.glob(f"*/{CACHE_ENTRY_NAME}"):
+            entry = json.loads(entry_path.read_text(encoding='utf-8'))
+            entries.append((entry['last_used'], entry['size'], entry_path.parent))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            shutil.rmtree(entry_dir)
+            total -= size
+            print(f"  🧹 Вытеснен из кэша: {entry_dir.name} ({size / 2**20:.1f} МБ)")
+
+    def _touch(self, entry_dir: Path):
+        entry_path = entry_dir / CACHE_ENTRY_NAME
+        entry = json.loads(entry_path.read_text(encoding='utf-8'))
+        entry['last_used'] = time.time()
+        entry_path.write_text(json.dumps(entry, indent=2), encoding='utf-8')
+
+
+class UrbanRivalsPipeline:
+    """Запускает этапы датасета и обучения, пропуская этапы с неизменившимися входами"""
+
+    def __init__(self, config: Dict[str, Any], data_dir: str = "datasets", models_dir: str = "trained_models",
+                 cache_dir: str = ".pipeline_cache", cache_size_gb: float = DEFAULT_CACHE_SIZE_GB):
+        self.config = config
+        self.data_dir = Path(data_dir)
+        self.models_dir = Path(models_dir)
+        self.cache = PipelineCache(Path(cache_dir), int(cache_size_gb * 2**30))
+        self.state_path = Path(cache_dir) / STATE_NAME
+        self.runners: Dict[str, Callable[[], None]] = {
+            'cards': self._run_cards,
+            'battles': self._run_battles,
+            'market': self._run_market,
+            'market_features': lambda: self._collector().create_market_features(self._cards()),
+            'features': self._run_features,
+            'train_battle': lambda: self._run_training('battle'),
+            'train_card': lambda: self._run_training('card'),
+            'train_strategy': lambda: self._run_training('strategy'),
+            'train_price': lambda: self._run_training('price'),
+            'metadata': self._run_metadata,
+            'matchups': self._run_matchups
+        }
+
+    def _outputs(self, name: str) -> Dict[str, Path]:
+        """Результаты этапа: {идентификатор в кэше: путь в рабочих папках}"""
+        roots = {'data': self.data_dir, 'models': self.models_dir}
+        return {f"{root}/{path}": roots[root] / path for root, path in STAGES[name]['outputs'](self.config)}
+
+    def _load_state(self) -> Dict[str, str]:
+        """Ключи этапов, результаты которых сейчас лежат в рабочих папках"""
+        if not self.state_path.exists():
+            return {}
+        state = json.loads(self.state_path.read_text(encoding='utf-8'))
+        workspace = [str(self.data_dir.resolve()), str(self.models_dir.resolve())]
+        return state['stages'] if state.get('workspace') == workspace else {}
+
+    def _save_state(self, stages: Dict[str, str]):
+        state = {'workspace': [str(self.data_dir.resolve()), str(self.models_dir.resolve())], 'stages': stages}
+        tmp_path = self.state_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(state, indent=2), encoding='utf-8')
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, targets: Optional[List[str]] = None, force: Optional[List[str]] = None) -> Dict[str, str]:
+        """Выполняет этапы targets (по умолчанию все) вместе с их зависимостями.
+
+        Этап пропускается, если его результат с тем же ключом уже в рабочих папках,
+        и восстанавливается из кэша, если ключ есть в кэше. Этапы из force выполняются заново.
+        """
+        targets = targets or list(STAGES)
+        force = set(force or [])
+        needed = self._with_dependencies(targets)
+        state = self._load_state()
+        keys = {}
+
+        print(f"🧭 Этапы: {', '.join(needed)}")
+        for name in needed:
+            keys[name] = stage_key(name, self.config, keys)
+            outputs = self._outputs(name)
+            outputs_exist = all(path.exists() for path in outputs.values())
+
+            if name not in force and state.get(name) == keys[name] and outputs_exist:
+                print(f"  ✔️ {name}: без изменений ({keys[name]})")
+                continue
+            with instrumentation.stage(f"pipeline.{name}", outputs=list(outputs.values())) as record:
+                if name not in force and self.cache.has(name, keys[name]):
+                    self.cache.restore(name, keys[name], outputs)
+                    record['cache'] = 'hit'
+                    print(f"  ♻️ {name}: из кэша ({keys[name]})")
+                else:
+                    print(f"  🔨 {name}: выполнение ({keys[name]})...")
+                    for path in outputs.values():
+                        _remove(path)
+                    start = time.perf_counter()
+                    self.runners[name]()
+                    self.cache.store(name, keys[name], outputs)
+                    record['cache'] = 'miss'
+                    print(f"  ✅ {name}: {time.perf_counter() - start:.1f}с")
+
+            state[name] = keys[name]
+            self._save_state(state)
+
+        return keys
+
+    def _with_dependencies(self, targets: List[str]) -> List[str]:
+        """Этапы targets и все их зависимости в порядке STAGES"""
+        unknown = [name for name in targets if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Неизвестные этапы: {unknown}. Доступные: {list(STAGES)}")
+        needed = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(STAGES[name]['deps'])
+        return [name for name in STAGES if name in needed]
+
+    def _collector(self):
+        from dataset import UrbanRivalsDataCollector
+        return UrbanRivalsDataCollector(str(self.data_dir), reference_time=self.config['reference_date'])
+
+    def _cards(self):
+        return read_table(self.data_dir / "cards")
+
+    def _run_cards(self):
+        np.random.seed(self.config['seed'])
+        self._collector().create_cards_database()
+
+    def _run_battles(self):
+        self._collector().write_battle_data(self._cards(), self.config['num_battles'], self.config['seed'],
+                                            self.config['chunk_size'], self.config['workers'])
+
+    def _run_market(self):
+        rng = np.random.default_rng(shard_seeds(self.config['seed'], 'market', 1)[0])
+        self._collector().generate_market_data(self._cards(), self.config['days'], rng,
+                                               model=self.config['market_model'])
+
+    def _run_features(self):
+        collector = self._collector()
+        cards_df = self._cards()
+        features = collector.create_training_features(cards_df, load_columns(self.data_dir / "battles"),
+                                                      load_columns(self.data_dir / "rounds"))
+        collector.create_sequence_features(cards_df)
+        collector.create_card_outcomes(cards_df)
+        collector.export_for_tensorflowjs(features)
+
+    def _trainer(self):
+        from train_models import UrbanRivalsMLTrainer
+        return UrbanRivalsMLTrainer(str(self.data_dir), str(self.models_dir),
+                                    battle_model=self.config['battle_model'], batch_size=self.config['batch_size'],
+                                    strategy_samples=self.config['strategy_samples'],
+                                    bundle_quantization=self.config['bundle_quantization'])
+
+    def _run_training(self, job: str):
+        from train_models import model_summary
+        trainer = self._trainer()
+        key, result = trainer.train_model(job, trainer.load_training_data([job]))
+        metrics_path = self.models_dir / "metrics" / f"{job}.json"
+        metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        metrics = {'key': key, 'result': model_summary(result)}
+        metrics_path.write_text(json.dumps(metrics, ensure_ascii=False, indent=2, default=float), encoding='utf-8')
+
+    def _run_metadata(self):
+        models_info = {}
+        for job in ['battle', 'card', 'strategy', 'price']:
+            metrics = json.loads((self.models_dir / "metrics" / f"{job}.json").read_text(encoding='utf-8'))
+            models_info[metrics['key']] = metrics['result']
+        trainer = self._trainer()
+        trainer.create_model_bundle(trainer.create_model_metadata(models_info))
+
+    def _run_matchups(self):
+        build_matchup_table(self._cards(), self.models_dir / MATCHUP_FILE, self.config['workers'])
+
+
+def main():
+    """Инкрементальный запуск всего конвейера: датасет -> признаки -> модели -> метаданные"""
+    parser = argparse.ArgumentParser(description="Инкрементальный ML пайплайн Urban Rivals")
+    parser.add_argument('targets', nargs='*', default=None,
+                        help=f"Этапы для выполнения (с зависимостями), по умолчанию все: {', '.join(STAGES)}")
+    parser.add_argument('--data-dir', default="datasets")
+    parser.add_argument('--models-dir', default="trained_models")
+    parser.add_argument('--cache-dir', default=".pipeline_cache", help="Папка кэша результатов этапов")
+    parser.add_argument('--cache-size-gb', type=float, default=DEFAULT_CACHE_SIZE_GB,
+                        help="Лимит размера кэша, старые записи вытесняются")
+    parser.add_argument('--force', nargs='+', default=[], choices=list(STAGES), help="Выполнить этапы заново")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--num-battles', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--market-model', choices=MARKET_MODELS, default='iid')
+    parser.add_argument('--reference-date', type=datetime.fromisoformat, default=None,
+                        help="Дата отсчёта (ISO); по умолчанию - начало текущего дня")
+    parser.add_argument('--battle-model', choices=['dense', 'sequence'], default='dense')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--strategy-samples', type=int, default=5000)
+    parser.add_argument('--bundle-quantization', choices=QUANTIZATIONS, default='float16')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    # Дата отсчёта входит в ключи этапов: по умолчанию округляем до дня, чтобы повторные
+    # запуски в течение дня не пересчитывали датасет
+    reference_date = args.reference_date or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    config = {
+        'seed': args.seed,
+        'num_battles': args.num_battles,
+        'chunk_size': args.chunk_size,
+        'workers': args.workers,
+        'days': args.days,
+        'market_model': args.market_model,
+        'reference_date': reference_date,
+        'battle_model': args.battle_model,
+        'batch_size': args.batch_size,
+        'strategy_samples': args.strategy_samples,
+        'bundle_quantization': args.bundle_quantization
+    }
+
+    print("🚀 Urban Rivals ML Pipeline")
+    pipeline = UrbanRivalsPipeline(config, args.data_dir, args.models_dir, args.cache_dir, args.cache_size_gb)
+    keys = pipeline.run(args.targets or None, args.force)
+    print(f"🎉 Готово: {len(keys)} этапов")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Dataset Schemas
+Схемы колоночных таблиц датасета (типы и категории колонок)
+"""
+
+import pandas as pd
+from typing import Any, Dict, List
+
+from features import SEQUENCE_FEATURES
+from market import RARITIES
+from market_features import MARKET_WINDOWS, market_feature_names
+from simulator import DECK_SIZE, WINNER_LABELS
+from storage import column
+
+ABILITY_TYPES = ['+2 Power', '+2 Damage', '+1 Life', 'Stop Opp Ability',
+                 'Protection: Ability', '-2 Opp Power', '-2 Opp Damage']
+
+# Имена файлов при экспорте таблиц в CSV/JSON (совпадают с прежними файлами датасета)
+EXPORT_NAMES = {
+    'cards': 'cards_database',
+    'battles': 'battles_database',
+    'rounds': 'rounds_database',
+    'market': 'market_data',
+    'card_features': 'card_features',
+    'battle_features': 'battle_features',
+    'card_outcomes': 'card_outcomes'
+}
+
+Schema = Dict[str, Dict[str, Any]]
+
+
+def cards_schema(clans: List[str]) -> Schema:
+    """База карт: характеристики по уровням в int8, клан/редкость/способность - категории"""
+    schema = {
+        'card_id': column('str'),
+        'name': column('str'),
+        'clan': column('category', categories=clans),
+        'rarity': column('category', categories=RARITIES),
+        'ability': column('category', categories=ABILITY_TYPES),
+        'ability_unlock_level': column('float32'),  # NaN - способности нет
+        'release_date': column('datetime64[s]')
+    }
+    for level in range(1, 6):
+        schema[f"power_level_{level}"] = column('int8')
+        schema[f"damage_level_{level}"] = column('int8')
+    return schema
+
+
+# Бои: карты колод хранятся индексом строки в базе карт
+BATTLES_SCHEMA = {
+    'battle_id': column('int32'),
+    'timestamp': column('datetime64[s]'),
+    'player_deck': column('int16', shape=[4]),
+    'opponent_deck': column('int16', shape=[4]),
+    'winner': column('category', categories=WINNER_LABELS),
+    'player_final_life': column('int8'),
+    'opponent_final_life': column('int8'),
+    'game_duration': column('int8')
+}
+
+# Раунды: только сыгранные, связаны с боями через battle_id
+ROUNDS_SCHEMA = {
+    'battle_id': column('int32'),
+    'round': column('int8'),
+    'player_card': column('int16'),
+    'opponent_card': column('int16'),
+    'player_pills_used': column('int8'),
+    'opponent_pills_used': column('int8'),
+    'player_attack': column('int8'),
+    'opponent_attack': column('int8'),
+    'winner': column('category', categories=WINNER_LABELS),
+    'damage_dealt': column('int8'),
+    'player_life_after': column('int8'),
+    'opponent_life_after': column('int8')
+}
+
+
+def market_schema(cards_df: pd.DataFrame) -> Schema:
+    """Рыночные данные в длинном формате: карта и её имя - категории по базе карт"""
+    return {
+        'date': column('datetime64[s]'),
+        'card_id': column('category', categories=cards_df['card_id'].tolist()),
+        'card_name': column('category', categories=cards_df['name'].tolist()),
+        'price': column('int32'),
+        'transaction_count': column('int16'),
+        'total_volume': column('int32')
+    }
+
+
+def market_features_schema(cards_df: pd.DataFrame, windows: List[int] = MARKET_WINDOWS) -> Schema:
+    """Скользящие признаки рынка (market_features.py): строка - день и карта, дни по возрастанию"""
+    schema = {
+        'date': column('datetime64[s]'),
+        'card_id': column('category', categories=cards_df['card_id'].tolist()),
+        'price': column('int32')
+    }
+    for name in market_feature_names(windows):
+        schema[name] = column('float32')
+    return schema
+
+
+CARD_FEATURES_SCHEMA = {
+    'card_id': column('str'),
+    'clan_encoded': column('int8'),
+    'rarity_encoded': column('int8'),
+    'max_power': column('int8'),
+    'max_damage': column('int8'),
+    'has_ability': column('int8'),
+    'power_damage_ratio': column('float32'),
+    'total_stats': column('int8')
+}
+
+BATTLE_FEATURES_SCHEMA = {
+    'battle_id': column('int32'),
+    'player_total_attack': column('int8'),
+    'opponent_total_attack': column('int8'),
+    'attack_difference': column('int8'),
+    'player_pills_used': column('int8'),
+    'opponent_pills_used': column('int8'),
+    'winner': column('category', categories=WINNER_LABELS)
+}
+
+# Последовательности раундов: rounds[бой, раунд, признак], признаки - SEQUENCE_FEATURES.
+# Таблица не экспортируется в CSV/JSON и читается через load_columns с отображением в память.
+BATTLE_SEQUENCES_SCHEMA = {
+    'battle_id': column('int32'),
+    'rounds': column('int8', shape=[DECK_SIZE, len(SEQUENCE_FEATURES)]),
+    'winner': column('category', categories=WINNER_LABELS)
+}
+
+# Разметка раундов оптимальной игрой (solver.py): лучшая карта и пилюли игрока в состоянии
+# перед раундом и итоговая разница жизней при лучшей игре обеих сторон
+OPTIMAL_PLAY_SCHEMA = {
+    'battle_id': column('int32'),
+    'round': column('int8'),
+    'optimal_card': column('int16'),
+    'optimal_pills': column('int8'),
+    'value': column('int8')
+}
+
+# Исходы раундов по картам (индекс для модели рекомендации карт), строка = карта из базы
+CARD_OUTCOMES_SCHEMA = {
+    'card_id': column('str'),
+    'appearances': column('int64'),
+    'wins': column('int64'),
+    'draws': column('int64'),
+    'damage_dealt': column('int64'),
+    'win_rate': column('float32'),
+    'avg_damage': column('float32')
+}
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Sharded Dataset Generation
+Параллельная генерация датасета по шардам с детерминированными сидами
+"""
+
+import multiprocessing
+import os
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from market import simulate_market
+from simulator import battle_tables, draw_battle_metadata, simulate_battles
+
+# Независимые потоки случайных чисел для разных этапов генерации
+STREAM_IDS = {
+    'battles': 0,
+    'market': 1
+}
+
+def shard_bounds(total: int, num_shards: int) -> List[Tuple[int, int]]:
+    """Делит диапазон [0, total) на num_shards непрерывных частей (размеры отличаются не более чем на 1)"""
+    num_shards = max(1, min(num_shards, total)) if total > 0 else 1
+    edges = np.linspace(0, total, num_shards + 1).astype(np.int64)
+    return [(int(edges[i]), int(edges[i + 1])) for i in range(num_shards)]
+
+
+def shard_seeds(master_seed: int, stream: str, num_shards: int) -> List[np.random.SeedSequence]:
+    """Выводит сиды шардов из мастер-сида.
+
+    Сид шарда зависит только от (master_seed, stream, номер шарда), поэтому результат
+    не зависит от количества процессов, которые выполняют шарды.
+    """
+    return np.random.SeedSequence([master_seed, STREAM_IDS[stream]]).spawn(num_shards)
+
+
+def chunk_bounds(total: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """Делит диапазон [0, total) на части фиксированного размера (последняя может быть короче)"""
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+
+def iter_shards(func: Callable[[Any], Any], tasks: Sequence[Any], workers: Optional[int] = None,
+                max_pending: Optional[int] = None, start_method: Optional[str] = None) -> Iterator[Any]:
+    """Выполняет задачи шардов на пуле процессов и отдаёт результаты по порядку.
+
+    В работе одновременно не более max_pending задач, поэтому готовые результаты
+    не накапливаются в памяти, пока потребитель их записывает.
+    start_method='spawn' нужен, если в родительском процессе уже инициализирован TensorFlow.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    max_pending = max_pending or 2 * workers
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(func, task))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def run_shards(func: Callable[[Any], Any], tasks: Sequence[Any], workers: Optional[int] = None,
+               start_method: Optional[str] = None) -> List[Any]:
+    """Выполняет задачи шардов на пуле процессов, сохраняя порядок результатов"""
+    return list(iter_shards(func, tasks, workers, start_method=start_method))
+
+
+def battle_shard(task: Dict[str, Any]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Генерирует бои одного шарда и возвращает плоские таблицы (бои, раунды)"""
+    rng = np.random.default_rng(task['seed'])
+    batch = simulate_battles(task['card_stats'], task['num_battles'], rng)
+    batch.update(draw_battle_metadata(rng, task['num_battles']))
+    return battle_tables(batch, task['first_battle_id'], task['reference_time'])
+
+
+def market_shard(task: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Генерирует цены и сделки для диапазона карт одного шарда (матрицы days x cards)"""
+    rng = np.random.default_rng(task['seed'])
+    return simulate_market(task['rarities'], task['days'], rng, task['model'])
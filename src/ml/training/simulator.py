@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Batch Battle Simulator
+Векторизованный симулятор боёв на NumPy
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Коды победителя раунда/боя (порядок совпадает с output_classes модели)
+WINNER_LABELS = ['player', 'opponent', 'draw']
+WINNER_PLAYER = 0
+WINNER_OPPONENT = 1
+WINNER_DRAW = 2
+ROUND_NOT_PLAYED = -1
+
+# Правила боя (как в UrbanRivalsDataCollector._simulate_battle)
+DECK_SIZE = 4
+START_LIFE = 12
+START_PILLS = 12
+MAX_PILL_DRAW = 6  # np.random.randint(0, 6) -> 0..5 пилюль за раунд
+
+
+def card_stats_array(cards_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Собирает плотные массивы характеристик карт (индекс = позиция в cards_df)"""
+    return {
+        'card_id': cards_df['card_id'].to_numpy(),
+        'power': cards_df['power_level_5'].to_numpy(dtype=np.int16),
+        'damage': cards_df['damage_level_5'].to_numpy(dtype=np.int16)
+    }
+
+
+def sample_decks(rng: np.random.Generator, num_cards: int, num_battles: int,
+                 deck_size: int = DECK_SIZE) -> np.ndarray:
+    """Выбирает N колод без повторов карт внутри колоды (матрица N x deck_size)"""
+    decks = rng.integers(0, num_cards, size=(num_battles, deck_size))
+
+    # Перевыбираем только строки с повторами: при ~200 картах это ~3% колод
+    while True:
+        sorted_decks = np.sort(decks, axis=1)
+        duplicated = (sorted_decks[:, 1:] == sorted_decks[:, :-1]).any(axis=1)
+        num_duplicated = int(duplicated.sum())
+        if num_duplicated == 0:
+            return decks
+        decks[duplicated] = rng.integers(0, num_cards, size=(num_duplicated, deck_size))
+
+
+def resolve_battles(power: np.ndarray, damage: np.ndarray,
+                    player_deck: np.ndarray, opponent_deck: np.ndarray,
+                    player_pill_draws: np.ndarray, opponent_pill_draws: np.ndarray) -> Dict[str, np.ndarray]:
+    """Разыгрывает N боёв по заданным колодам и выбору пилюль.
+
+    Раунды обрабатываются по очереди, но каждый раунд считается сразу для всех боёв.
+    Правила полностью повторяют UrbanRivalsDataCollector._simulate_battle.
+    """
+    num_battles, num_rounds = player_deck.shape
+
+    player_life = np.full(num_battles, START_LIFE, dtype=np.int16)
+    opponent_life = np.full(num_battles, START_LIFE, dtype=np.int16)
+    player_pills = np.full(num_battles, START_PILLS, dtype=np.int16)
+    opponent_pills = np.full(num_battles, START_PILLS, dtype=np.int16)
+
+    shape = (num_battles, num_rounds)
+    played = np.zeros(shape, dtype=bool)
+    player_pills_used = np.zeros(shape, dtype=np.int16)
+    opponent_pills_used = np.zeros(shape, dtype=np.int16)
+    player_attack = np.zeros(shape, dtype=np.int16)
+    opponent_attack = np.zeros(shape, dtype=np.int16)
+    round_winner = np.full(shape, ROUND_NOT_PLAYED, dtype=np.int8)
+    damage_dealt = np.zeros(shape, dtype=np.int16)
+    player_life_after = np.zeros(shape, dtype=np.int16)
+    opponent_life_after = np.zeros(shape, dtype=np.int16)
+
+    for r in range(num_rounds):
+        # Раунд играется, только если оба игрока ещё живы
+        active = (player_life > 0) & (opponent_life > 0)
+
+        p_used = np.where(active, np.minimum(player_pill_draws[:, r], player_pills), 0).astype(np.int16)
+        o_used = np.where(active, np.minimum(opponent_pill_draws[:, r], opponent_pills), 0).astype(np.int16)
+
+        p_attack = power[player_deck[:, r]] + p_used
+        o_attack = power[opponent_deck[:, r]] + o_used
+
+        player_wins = active & (p_attack > o_attack)
+        opponent_wins = active & (o_attack > p_attack)
+
+        dealt = np.where(player_wins, damage[player_deck[:, r]],
+                         np.where(opponent_wins, damage[opponent_deck[:, r]], 0)).astype(np.int16)
+
+        opponent_life -= np.where(player_wins, dealt, 0).astype(np.int16)
+        player_life -= np.where(opponent_wins, dealt, 0).astype(np.int16)
+        player_pills -= p_used
+        opponent_pills -= o_used
+
+        played[:, r] = active
+        player_pills_used[:, r] = p_used
+        opponent_pills_used[:, r] = o_used
+        player_attack[:, r] = np.where(active, p_attack, 0)
+        opponent_attack[:, r] = np.where(active, o_attack, 0)
+        round_winner[:, r] = np.select(
+            [player_wins, opponent_wins, active],
+            [WINNER_PLAYER, WINNER_OPPONENT, WINNER_DRAW],
+            ROUND_NOT_PLAYED
+        )
+        damage_dealt[:, r] = dealt
+        player_life_after[:, r] = np.where(active, player_life, 0)
+        opponent_life_after[:, r] = np.where(active, opponent_life, 0)
+
+    winner = np.select(
+        [player_life > opponent_life, opponent_life > player_life],
+        [WINNER_PLAYER, WINNER_OPPONENT],
+        WINNER_DRAW
+    ).astype(np.int8)
+
+    return {
+        'player_deck': player_deck,
+        'opponent_deck': opponent_deck,
+        'played': played,
+        'player_pills_used': player_pills_used,
+        'opponent_pills_used': opponent_pills_used,
+        'player_attack': player_attack,
+        'opponent_attack': opponent_attack,
+        'round_winner': round_winner,
+        'damage_dealt': damage_dealt,
+        'player_life_after': player_life_after,
+        'opponent_life_after': opponent_life_after,
+        'winner': winner,
+        'player_life': player_life,
+        'opponent_life': opponent_life
+    }
+
+
+def simulate_battles(card_stats: Dict[str, np.ndarray], num_battles: int,
+                     rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+    """Симулирует N боёв целиком на массивах: колоды, пилюли, атаки, урон, жизни"""
+    if rng is None:
+        rng = np.random.default_rng()
+
+    num_cards = len(card_stats['power'])
+    player_deck = sample_decks(rng, num_cards, num_battles)
+    opponent_deck = sample_decks(rng, num_cards, num_battles)
+
+    # Выбор пилюль (случайная стратегия) разыгрываем для всех раундов сразу;
+    # для несыгранных раундов значения просто не используются
+    player_pill_draws = rng.integers(0, MAX_PILL_DRAW, size=(num_battles, DECK_SIZE), dtype=np.int16)
+    opponent_pill_draws = rng.integers(0, MAX_PILL_DRAW, size=(num_battles, DECK_SIZE), dtype=np.int16)
+
+    batch = resolve_battles(card_stats['power'], card_stats['damage'],
+                            player_deck, opponent_deck,
+                            player_pill_draws, opponent_pill_draws)
+    batch['player_pill_draws'] = player_pill_draws
+    batch['opponent_pill_draws'] = opponent_pill_draws
+    return batch
+
+
+def draw_battle_metadata(rng: np.random.Generator, num_battles: int) -> Dict[str, np.ndarray]:
+    """Разыгрывает служебные поля боёв: давность в минутах и длительность партии"""
+    return {
+        'minutes_ago': rng.integers(1, 10000, size=num_battles),
+        'game_duration': rng.integers(3, 8, size=num_battles)  # минуты
+    }
+
+
+def battle_tables(batch: Dict[str, np.ndarray], first_battle_id: int,
+                  reference_time: datetime) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Раскладывает пакет боёв в две плоские колоночные таблицы: бои и раунды.
+
+    Карты хранятся индексом строки в базе карт, раунды связаны с боями через battle_id.
+    В таблицу раундов попадают только сыгранные раунды.
+    """
+    num_battles = len(batch['winner'])
+    battle_id = np.arange(first_battle_id, first_battle_id + num_battles, dtype=np.int64)
+
+    battles = {
+        'battle_id': battle_id,
+        'timestamp': np.datetime64(reference_time, 's') - batch['minutes_ago'].astype('timedelta64[m]'),
+        'player_deck': batch['player_deck'].astype(np.int16),
+        'opponent_deck': batch['opponent_deck'].astype(np.int16),
+        'winner': batch['winner'],
+        'player_final_life': batch['player_life'],
+        'opponent_final_life': batch['opponent_life'],
+        'game_duration': batch['game_duration'].astype(np.int8)
+    }
+
+    played = batch['played']
+    battle_index, round_index = np.nonzero(played)
+    rounds = {
+        'battle_id': battle_id[battle_index],
+        'round': (round_index + 1).astype(np.int8),
+        'player_card': batch['player_deck'][played].astype(np.int16),
+        'opponent_card': batch['opponent_deck'][played].astype(np.int16),
+        'player_pills_used': batch['player_pills_used'][played],
+        'opponent_pills_used': batch['opponent_pills_used'][played],
+        'player_attack': batch['player_attack'][played],
+        'opponent_attack': batch['opponent_attack'][played],
+        'winner': batch['round_winner'][played],
+        'damage_dealt': batch['damage_dealt'][played],
+        'player_life_after': batch['player_life_after'][played],
+        'opponent_life_after': batch['opponent_life_after'][played]
+    }
+    return battles, rounds
+
+
+def battle_rounds_records(batch: Dict[str, np.ndarray], card_ids: np.ndarray, index: int) -> List[Dict]:
+    """Восстанавливает список раундов одного боя в формате _simulate_battle"""
+    rounds = []
+    for r in np.flatnonzero(batch['played'][index]):
+        rounds.append({
+            'round': int(r) + 1,
+            'player_card': card_ids[batch['player_deck'][index, r]],
+            'opponent_card': card_ids[batch['opponent_deck'][index, r]],
+            'player_pills_used': int(batch['player_pills_used'][index, r]),
+            'opponent_pills_used': int(batch['opponent_pills_used'][index, r]),
+            'player_attack': int(batch['player_attack'][index, r]),
+            'opponent_attack': int(batch['opponent_attack'][index, r]),
+            'winner': WINNER_LABELS[batch['round_winner'][index, r]],
+            'damage_dealt': int(batch['damage_dealt'][index, r]),
+            'player_life_after': int(batch['player_life_after'][index, r]),
+            'opponent_life_after': int(batch['opponent_life_after'][index, r])
+        })
+    return rounds
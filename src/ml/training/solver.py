@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Battle Solver
+Оптимальная игра по дереву боя с таблицей транспозиций: разметка состояний боёв лучшим ходом вместо случайного
+"""
+
+import argparse
+import functools
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from instrumentation import add_instrumentation_args, configure_from_args, instrumented
+from schemas import OPTIMAL_PLAY_SCHEMA
+from sharding import chunk_bounds, iter_shards
+from simulator import DECK_SIZE, START_LIFE, START_PILLS, card_stats_array
+from storage import ChunkedTableWriter, load_columns, read_table
+
+# Модель игры (правила раунда как в resolve_battles):
+#   - в раунде один игрок первым выбирает карту и пилюли, второй отвечает, зная этот выбор;
+#     первым ходит игрок в нечётных раундах и соперник в чётных (инициатива чередуется, как в игре);
+#   - результат боя - разница жизней в конце (жизнь ниже нуля считается нулём): знак даёт победителя,
+#     величина отличает крупную победу от минимальной.
+# Значение состояния - итог для стороны, которая ходит первой в этом раунде, поэтому следующий раунд
+# считается с переставленными сторонами и знаком минус (negamax), а одна таблица транспозиций
+# обслуживает обе стороны.
+#
+# Состояние: (жизни, пилюли, оставшиеся карты обеих сторон). Карты - отсортированные кортежи
+# (сила, урон): карты с одинаковыми характеристиками взаимозаменяемы, порядок и номера карт
+# в колоде не важны, поэтому одно состояние встречается в разных боях и колодах.
+Cards = Tuple[Tuple[int, int], ...]
+
+DEFAULT_CACHE_ENTRIES = 2_000_000  # ~0.5 ГБ на процесс; при переполнении вытесняется старшая половина
+LABEL_CHUNK_SIZE = 20_000
+INFINITY = 1 << 10  # больше любой разницы жизней
+
+
+class BattleSolver:
+    """Минимакс по раундам боя с таблицей транспозиций ограниченного размера.
+
+    Отсечения:
+      - ответ: из пилюль, дающих один исход раунда (победа/ничья/поражение), нужна только
+        наименьшая ставка - лишние пилюли никогда не улучшают продолжение;
+      - ход: ставка больше той, что уже гарантирует победу в раунде, не рассматривается;
+      - последний раунд решается сразу: пилюли после него не нужны, обе стороны ставят все;
+      - ход, на который у соперника есть ответ не лучше найденного хода, дальше не проверяется;
+        поиск останавливается, если найден ход с наилучшим возможным итогом.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._table: Dict[tuple, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def solve(self, my_cards: Sequence[Tuple[int, int]], their_cards: Sequence[Tuple[int, int]],
+              my_life: int = START_LIFE, their_life: int = START_LIFE,
+              my_pills: int = START_PILLS, their_pills: int = START_PILLS) -> Dict[str, int]:
+        """Лучший ход стороны, которая ходит первой: {'value', 'card', 'pills'}.
+
+        card - номер карты в my_cards, value - итоговая разница жизней при лучшей игре обеих сторон;
+        из равноценных ходов выбирается ход с наименьшим числом пилюль.
+        """
+        mine = _canonical(my_cards)
+        theirs = _canonical(their_cards)
+        value = self.value(my_life, their_life, my_pills, their_pills, mine, theirs)
+        # Итог известен: первый по числу пилюль ход, который его достигает (проверка нулевым окном)
+        for card, rest, pills in _moves(mine, theirs, my_pills, their_pills):
+            move_value = self._move_value(my_life, their_life, my_pills, their_pills, card, rest, theirs, pills,
+                                          value - 1, value)
+            if move_value >= value:
+                return {'value': value, 'card': _original_index(my_cards, card), 'pills': pills}
+        raise RuntimeError("Ход с найденным итогом не найден")
+
+    def respond(self, my_cards: Sequence[Tuple[int, int]], their_cards: Sequence[Tuple[int, int]],
+                their_card: int, their_pills_used: int, my_life: int = START_LIFE, their_life: int = START_LIFE,
+                my_pills: int = START_PILLS, their_pills: int = START_PILLS) -> Dict[str, int]:
+        """Лучший ответ на известный ход соперника (карта their_cards[their_card] и their_pills_used пилюль)"""
+        mine = _canonical(my_cards)
+        theirs = _canonical(their_cards)
+        their_index = theirs.index(tuple(int(value) for value in their_cards[their_card]))
+        their_power = theirs[their_index][0]
+        their_rest = theirs[:their_index] + theirs[their_index + 1:]
+
+        best = None
+        for pills in _response_pills(their_power + their_pills_used, mine, my_pills):
+            for index in _distinct(mine):
+                # Итог для отвечающего - итог раунда для ходившего первым со знаком минус;
+                # окно отсекает ответы не лучше уже найденного
+                beta = INFINITY if best is None else -best[0]
+                value = -self._round_value(their_life, my_life, their_pills, my_pills, theirs[their_index],
+                                           mine[index], their_pills_used, pills, their_rest,
+                                           mine[:index] + mine[index + 1:], -INFINITY, beta)
+                if best is None or value > best[0]:
+                    best = (value, index, pills)
+        value, card, pills = best
+        return {'value': value, 'card': _original_index(my_cards, mine[card]), 'pills': pills}
+
+    def value(self, my_life: int, their_life: int, my_pills: int, their_pills: int,
+              my_cards: Cards, their_cards: Cards, alpha: int = -INFINITY, beta: int = INFINITY) -> int:
+        """Итог состояния для стороны, которая ходит первой (альфа-бета с таблицей транспозиций).
+
+        Точен внутри окна (alpha, beta); вне окна - граница: не больше alpha или не меньше beta.
+        """
+        key = (my_life, their_life, my_pills, their_pills, my_cards, their_cards)
+        entry = self._table.get(key)
+        if entry is not None:
+            lower, upper = entry
+            if lower == upper or lower >= beta or upper <= alpha:
+                self.hits += 1
+                return lower if lower >= beta or lower == upper else upper
+        else:
+            lower, upper = _value_bounds(my_life, their_life, my_pills, their_pills, my_cards, their_cards)
+        self.misses += 1
+        if lower == upper or lower >= beta or upper <= alpha:
+            # Границ без перебора хватает: окно пусто
+            value = lower if lower >= beta or lower == upper else upper
+        else:
+            low, high = max(alpha, lower), min(beta, upper)
+            value = self._search(my_life, their_life, my_pills, their_pills, my_cards, their_cards, low, high)
+            if value <= low:
+                upper = min(upper, value)
+            elif value >= high:
+                lower = max(lower, value)
+            else:
+                lower = upper = value
+        if entry is None and len(self._table) >= self.max_entries:
+            self._evict()
+        self._table[key] = (lower, upper)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._table), 'evictions': self.evictions}
+
+    def _evict(self):
+        # Словарь хранит порядок вставки: отбрасываем старшую половину записей
+        keep = len(self._table) // 2
+        self.evictions += len(self._table) - keep
+        self._table = dict(zip(list(self._table)[-keep:], list(self._table.values())[-keep:])) if keep else {}
+
+    def _search(self, my_life: int, their_life: int, my_pills: int, their_pills: int,
+                my_cards: Cards, their_cards: Cards, alpha: int, beta: int) -> int:
+        """Итог лучшего хода стороны, которая ходит первой (fail-soft в окне (alpha, beta))"""
+        if len(my_cards) == 1:
+            return _last_round(my_life, their_life, my_pills, their_pills, my_cards[0], their_cards[0])
+        if len(my_cards) == 2:
+            return _two_rounds(my_life, their_life, my_pills, their_pills, my_cards, their_cards, alpha, beta)
+
+        best = -INFINITY
+        # Крупные ставки первыми: так раньше находятся сильные ходы и чаще срабатывают отсечения
+        for card, rest, pills in reversed(_moves(my_cards, their_cards, my_pills, their_pills)):
+            value = self._move_value(my_life, their_life, my_pills, their_pills, card, rest, their_cards, pills,
+                                     max(alpha, best), beta)
+            if value > best:
+                best = value
+                if best >= beta:
+                    break
+        return best
+
+    def _move_value(self, my_life: int, their_life: int, my_pills: int, their_pills: int,
+                    card: Tuple[int, int], my_rest: Cards, their_cards: Cards, pills: int,
+                    alpha: int, beta: int) -> int:
+        """Итог хода при лучшем ответе соперника; не больше alpha - ход хуже найденного, перебор прерван"""
+        worst = INFINITY
+        for their_card, their_rest, their_pills_used in _replies(card[0] + pills, their_cards, their_pills):
+            value = self._round_value(my_life, their_life, my_pills, their_pills, card, their_card,
+                                      pills, their_pills_used, my_rest, their_rest, alpha, min(beta, worst))
+            if value < worst:
+                worst = value
+                if worst <= alpha:
+                    return worst
+        return worst
+
+    def _round_value(self, my_life: int, their_life: int, my_pills: int, their_pills: int,
+                     card: Tuple[int, int], their_card: Tuple[int, int], pills: int, their_pills_used: int,
+                     my_rest: Cards, their_rest: Cards, alpha: int, beta: int) -> int:
+        """Итог боя для стороны, ходившей в раунде первой, после розыгрыша раунда"""
+        attack = card[0] + pills
+        their_attack = their_card[0] + their_pills_used
+        if attack > their_attack:
+            their_life -= card[1]
+        elif their_attack > attack:
+            my_life -= their_card[1]
+        if my_life <= 0 or their_life <= 0 or not my_rest:
+            return max(my_life, 0) - max(their_life, 0)
+        if len(my_rest) == 1:
+            return -_last_round(their_life, my_life, their_pills - their_pills_used, my_pills - pills,
+                                their_rest[0], my_rest[0])
+        # В следующем раунде первым ходит соперник
+        return -self.value(their_life, my_life, their_pills - their_pills_used, my_pills - pills,
+                           their_rest, my_rest, -beta, -alpha)
+
+
+# Таблицы ходов и ответов зависят только от карт и пилюль, а не от жизней: одна запись обслуживает
+# все состояния с этими картами во всех решателях процесса, поэтому оставшиеся карты хода
+# нарезаются один раз, а не в каждом узле перебора
+Move = Tuple[Tuple[int, int], Cards, int]
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def _moves(my_cards: Cards, their_cards: Cards, my_pills: int, their_pills: int) -> Tuple[Move, ...]:
+    """Ходы (карта, оставшиеся карты, пилюли) по возрастанию пилюль без заведомо лишних ставок"""
+    their_max_attack = max(power for power, _ in their_cards) + their_pills
+    return tuple((my_cards[index], my_cards[:index] + my_cards[index + 1:], pills)
+                 for pills in range(my_pills + 1) for index in _distinct(my_cards)
+                 # на одну пилюлю меньше раунд уже выигран при любом ответе
+                 if not (pills and my_cards[index][0] + pills - 1 > their_max_attack))
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def _replies(attack: int, their_cards: Cards, their_pills: int) -> Tuple[Move, ...]:
+    """Ответы соперника на атаку attack: (карта, оставшиеся карты, пилюли) без заведомо лишних ставок"""
+    return tuple((their_cards[index], their_cards[:index] + their_cards[index + 1:], pills)
+                 for index in _distinct(their_cards)
+                 for pills in _response_pills(attack, (their_cards[index],), their_pills))
+
+
+def _last_round(my_life: int, their_life: int, my_pills: int, their_pills: int,
+                card: Tuple[int, int], their_card: Tuple[int, int]) -> int:
+    """Последний раунд: пилюли после него не нужны, обе стороны ставят все - порядок ходов не важен"""
+    attack = card[0] + my_pills
+    their_attack = their_card[0] + their_pills
+    if attack > their_attack:
+        their_life -= card[1]
+    elif their_attack > attack:
+        my_life -= their_card[1]
+    return max(my_life, 0) - max(their_life, 0)
+
+
+def _two_rounds(my_life: int, their_life: int, my_pills: int, their_pills: int,
+                my_cards: Cards, their_cards: Cards, alpha: int = -INFINITY, beta: int = INFINITY) -> int:
+    """Итог за два раунда до конца без рекурсии (fail-soft в окне (alpha, beta), как _search).
+
+    Последний раунд решается сравнением атак со всеми пилюлями, поэтому итог хода постоянен
+    на отрезках ставок между точками, где меняется одно из сравнений:
+      - атака хода против силы карты ответа (ответ без пилюль);
+      - пилюли ответа на ничью/победу против запаса соперника;
+      - атаки последнего раунда, если ответ без пилюль (при ответе на ничью или победу ставка
+        сокращается: пилюли последнего раунда у обеих сторон уменьшаются на одну и ту же атаку).
+    Достаточно проверить начало каждого отрезка.
+    """
+    best = -INFINITY
+    their_orders = ((their_cards[0], their_cards[1]),) if their_cards[0] == their_cards[1] else \
+        ((their_cards[0], their_cards[1]), (their_cards[1], their_cards[0]))
+    my_orders = ((my_cards[0], my_cards[1]),) if my_cards[0] == my_cards[1] else \
+        ((my_cards[0], my_cards[1]), (my_cards[1], my_cards[0]))
+    for (power, damage), (last_power, last_damage) in my_orders:
+        starts = {0}
+        for (their_power, _), (their_last_power, _) in their_orders:
+            gap = their_power - power
+            last_gap = last_power + my_pills - their_last_power - their_pills
+            starts.update((gap, gap + 1, their_pills + gap, their_pills + gap + 1, last_gap, last_gap + 1))
+        for pills in sorted(starts, reverse=True):
+            if pills < 0 or pills > my_pills:
+                continue
+            attack = power + pills
+            last_attack = last_power + my_pills - pills
+            worst = INFINITY
+            for (their_power, their_damage), (their_last_power, their_last_damage) in their_orders:
+                tie = attack - their_power
+                for their_pills_used in ((0, tie, tie + 1) if tie >= 0 else (0,)):
+                    if their_pills_used > their_pills:
+                        break
+                    their_attack = their_power + their_pills_used
+                    my_life_after, their_life_after = my_life, their_life
+                    if attack > their_attack:
+                        their_life_after -= damage
+                    elif their_attack > attack:
+                        my_life_after -= their_damage
+                    if my_life_after > 0 and their_life_after > 0:
+                        their_last_attack = their_last_power + their_pills - their_pills_used
+                        if last_attack > their_last_attack:
+                            their_life_after -= last_damage
+                        elif their_last_attack > last_attack:
+                            my_life_after -= their_last_damage
+                    value = (my_life_after if my_life_after > 0 else 0) - \
+                        (their_life_after if their_life_after > 0 else 0)
+                    if value < worst:
+                        worst = value
+                if worst <= best or worst <= alpha:
+                    break  # ход не лучше найденного
+            if worst > best:
+                best = worst
+                if best >= beta:
+                    return best
+    return best
+
+
+def _value_bounds(my_life: int, their_life: int, my_pills: int, their_pills: int,
+                  my_cards: Cards, their_cards: Cards) -> Tuple[int, int]:
+    """Границы итога без перебора: каждая сторона теряет не больше суммарного урона карт соперника.
+
+    Если пилюль хватает, чтобы атакой выше любой возможной атаки соперника выиграть все оставшиеся
+    раунды, итог равен границе (лучше выиграть всё не бывает) - перебор не нужен.
+    """
+    my_damage, my_max_power, my_powers = _card_summary(my_cards)
+    their_damage, their_max_power, their_powers = _card_summary(their_cards)
+    my_lowest = my_life - their_damage
+    their_lowest = their_life - my_damage
+    lower = (my_lowest if my_lowest > 0 else 0) - their_life
+    upper = my_life - (their_lowest if their_lowest > 0 else 0)
+    if my_pills >= _pills_to_win_all(my_powers, their_max_power + their_pills):
+        return upper, upper
+    if their_pills >= _pills_to_win_all(their_powers, my_max_power + my_pills):
+        return lower, lower
+    return lower, upper
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _card_summary(cards: Cards) -> Tuple[int, int, Tuple[int, ...]]:
+    """(суммарный урон, наибольшая сила, силы) оставшихся карт"""
+    return sum(damage for _, damage in cards), max(power for power, _ in cards), tuple(power for power, _ in cards)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _pills_to_win_all(powers: Tuple[int, ...], their_max_attack: int) -> int:
+    """Пилюль достаточно, чтобы каждой картой перебить самую сильную атаку соперника"""
+    return sum(their_max_attack + 1 - power for power in powers if power <= their_max_attack)
+
+
+def _canonical(cards: Sequence[Tuple[int, int]]) -> Cards:
+    return tuple(sorted((int(power), int(damage)) for power, damage in cards))
+
+
+def _distinct(cards: Cards) -> List[int]:
+    """Номера карт без повторов характеристик (cards отсортированы)"""
+    return [index for index in range(len(cards)) if index == 0 or cards[index] != cards[index - 1]]
+
+
+def _original_index(cards: Sequence[Tuple[int, int]], card: Tuple[int, int]) -> int:
+    return next(index for index, other in enumerate(cards) if (int(other[0]), int(other[1])) == card)
+
+
+def _response_pills(attack: int, cards: Cards, pills: int) -> List[int]:
+    """Осмысленные ставки ответа на атаку attack: наименьшие для поражения, ничьей и победы хоть одной картой"""
+    candidates = {0}
+    for power, _ in cards:
+        tie = attack - power
+        candidates.update(value for value in (tie, tie + 1) if 0 <= value <= pills)
+    return sorted(candidates)
+
+
+# Решатель процесса пула: таблица транспозиций переживает задачи одного процесса
+_worker_solver: Optional[BattleSolver] = None
+
+
+def label_shard(task: Dict[str, Any]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Размечает раунды боёв [start, stop): лучший ход игрока в состоянии перед раундом.
+
+    В нечётных раундах игрок ходит первым (solve), в чётных - отвечает на записанный ход соперника (respond).
+    Карты в датасете играются по порядку колоды, поэтому оставшиеся карты - хвост колоды.
+    """
+    global _worker_solver
+    if _worker_solver is None or _worker_solver.max_entries != task['max_entries']:
+        _worker_solver = BattleSolver(task['max_entries'])
+    solver = _worker_solver
+    before = solver.stats()
+    started = time.perf_counter()
+
+    data_dir = Path(task['data_dir'])
+    battles = load_columns(data_dir / "battles", ['battle_id', 'player_deck', 'opponent_deck'])
+    rounds = load_columns(data_dir / "rounds", ['battle_id', 'round', 'opponent_pills_used', 'player_pills_used',
+                                                'player_life_after', 'opponent_life_after'])
+    start, stop = task['battles']
+    round_start, round_stop = task['rounds']
+    battle_ids = np.asarray(battles['battle_id'][start:stop])
+    player_decks = np.asarray(battles['player_deck'][start:stop])
+    opponent_decks = np.asarray(battles['opponent_deck'][start:stop])
+    rounds = {name: np.asarray(values[round_start:round_stop]) for name, values in rounds.items()}
+    stats = np.stack([task['power'], task['damage']], axis=1).tolist()
+
+    num_rounds = round_stop - round_start
+    optimal_card = np.zeros(num_rounds, dtype=np.int16)
+    optimal_pills = np.zeros(num_rounds, dtype=np.int8)
+    value = np.zeros(num_rounds, dtype=np.int8)
+
+    battle_rows = np.searchsorted(battle_ids, rounds['battle_id'])
+    player_life = opponent_life = START_LIFE
+    player_pills = opponent_pills = START_PILLS
+    for row in range(num_rounds):
+        battle = battle_rows[row]
+        round_number = int(rounds['round'][row])
+        if round_number == 1:
+            player_life = opponent_life = START_LIFE
+            player_pills = opponent_pills = START_PILLS
+        player_deck = player_decks[battle, round_number - 1:]
+        opponent_deck = opponent_decks[battle, round_number - 1:]
+        my_cards = [stats[card] for card in player_deck]
+        their_cards = [stats[card] for card in opponent_deck]
+        if round_number % 2 == 1:
+            result = solver.solve(my_cards, their_cards, player_life, opponent_life, player_pills, opponent_pills)
+        else:
+            result = solver.respond(my_cards, their_cards, 0, int(rounds['opponent_pills_used'][row]),
+                                    player_life, opponent_life, player_pills, opponent_pills)
+        optimal_card[row] = player_deck[result['card']]
+        optimal_pills[row] = result['pills']
+        value[row] = result['value']
+
+        player_life = int(rounds['player_life_after'][row])
+        opponent_life = int(rounds['opponent_life_after'][row])
+        player_pills -= int(rounds['player_pills_used'][row])
+        opponent_pills -= int(rounds['opponent_pills_used'][row])
+
+    after = solver.stats()
+    labels = {
+        'battle_id': rounds['battle_id'],
+        'round': rounds['round'],
+        'optimal_card': optimal_card,
+        'optimal_pills': optimal_pills,
+        'value': value
+    }
+    return labels, {'states': num_rounds, 'hits': after['hits'] - before['hits'],
+                    'misses': after['misses'] - before['misses'], 'time': time.perf_counter() - started}
+
+
+@instrumented('labels', rows_out=lambda result: result['states'],
+              outputs=lambda a: [Path(a['data_dir']) / "optimal_play"])
+def label_battles(data_dir: Any, workers: Optional[int] = None, chunk_size: int = LABEL_CHUNK_SIZE,
+                  max_entries: int = DEFAULT_CACHE_ENTRIES) -> Dict[str, Any]:
+    """Размечает все раунды датасета лучшим ходом игрока и пишет таблицу optimal_play.
+
+    Части боёв решаются параллельно; у каждого процесса своя таблица транспозиций,
+    которая переиспользуется между его частями.
+    """
+    data_dir = Path(data_dir)
+    card_stats = card_stats_array(read_table(data_dir / "cards"))
+    battle_ids = load_columns(data_dir / "battles", ['battle_id'])['battle_id']
+    round_battle_ids = load_columns(data_dir / "rounds", ['battle_id'])['battle_id']
+
+    tasks = []
+    for start, stop in chunk_bounds(len(battle_ids), chunk_size):
+        round_start, round_stop = np.searchsorted(round_battle_ids, [battle_ids[start], battle_ids[stop - 1] + 1])
+        tasks.append({
+            'data_dir': str(data_dir),
+            'battles': (start, stop),
+            'rounds': (int(round_start), int(round_stop)),
+            'power': card_stats['power'],
+            'damage': card_stats['damage'],
+            'max_entries': max_entries
+        })
+
+    print(f"🧠 Разметка оптимальной игрой: {len(battle_ids)} боёв, {len(tasks)} частей, workers={workers or 'auto'}...")
+    writer = ChunkedTableWriter(data_dir / "optimal_play", OPTIMAL_PLAY_SCHEMA,
+                                {'num_battles': len(battle_ids), 'max_entries': max_entries})
+    totals = {'states': 0, 'hits': 0, 'misses': 0}
+    started = time.perf_counter()
+    for labels, stats in iter_shards(label_shard, tasks, workers):
+        writer.write_chunk(labels)
+        for key in totals:
+            totals[key] += stats[key]
+        print(f"  📊 Размечено {totals['states']} состояний "
+              f"({totals['states'] / (time.perf_counter() - started):,.0f}/с)...")
+
+    elapsed = time.perf_counter() - started
+    lookups = totals['hits'] + totals['misses']
+    totals.update({
+        'time': elapsed,
+        'states_per_sec': totals['states'] / elapsed if elapsed else 0.0,
+        'hit_rate': totals['hits'] / lookups if lookups else 0.0
+    })
+    print(f"✅ Разметка готова: {totals['states']} состояний за {elapsed:.1f}с "
+          f"({totals['states_per_sec']:,.0f}/с), попаданий в таблицу транспозиций {totals['hit_rate']:.1%}")
+    return totals
+
+
+def benchmark_solver(num_battles: int = 200, seed: int = 0, data_dir: Optional[Any] = None,
+                     max_entries: int = DEFAULT_CACHE_ENTRIES) -> Dict[str, Any]:
+    """Время решения полного боя 4x4 из начального состояния: с пустой таблицей и с общей"""
+    rng = np.random.default_rng(seed)
+    if data_dir is not None:
+        card_stats = card_stats_array(read_table(Path(data_dir) / "cards"))
+        stats = np.stack([card_stats['power'], card_stats['damage']], axis=1)
+        decks = stats[rng.integers(0, len(stats), size=(num_battles, 2, DECK_SIZE))]
+    else:
+        decks = np.stack([rng.integers(2, 11, size=(num_battles, 2, DECK_SIZE)),
+                          rng.integers(2, 9, size=(num_battles, 2, DECK_SIZE))], axis=-1)
+    decks = decks.tolist()
+
+    cold_times = []
+    for player_cards, opponent_cards in decks:
+        solver = BattleSolver(max_entries)
+        # Холодный замер - и без таблиц ходов, заполненных предыдущими боями
+        _moves.cache_clear()
+        _replies.cache_clear()
+        started = time.perf_counter()
+        solver.solve(player_cards, opponent_cards)
+        cold_times.append(time.perf_counter() - started)
+
+    shared = BattleSolver(max_entries)
+    started = time.perf_counter()
+    for player_cards, opponent_cards in decks:
+        shared.solve(player_cards, opponent_cards)
+    shared_time = time.perf_counter() - started
+
+    result = {
+        'battles': num_battles,
+        'cold_ms_median': float(np.median(cold_times) * 1000),
+        'cold_ms_p95': float(np.percentile(cold_times, 95) * 1000),
+        'shared_ms_mean': shared_time / num_battles * 1000,
+        **{f'shared_{key}': value for key, value in shared.stats().items()}
+    }
+    print(f"🧠 Бой 4x4 с пустой таблицей: медиана {result['cold_ms_median']:.1f} мс, "
+          f"p95 {result['cold_ms_p95']:.1f} мс")
+    print(f"🧠 С общей таблицей: {result['shared_ms_mean']:.1f} мс на бой, "
+          f"попаданий {result['shared_hit_rate']:.1%}, записей {result['shared_entries']}")
+    return result
+
+
+def main():
+    """Разметка датасета оптимальной игрой и замер скорости решателя"""
+    parser = argparse.ArgumentParser(description="Решатель боёв Urban Rivals: оптимальная карта и пилюли")
+    parser.add_argument('--data-dir', default="datasets", help="Папка с датасетом (dataset.py)")
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help="Размер таблицы транспозиций (записей на процесс)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    label_parser = subparsers.add_parser('label', help="Разметить раунды датасета -> таблица optimal_play")
+    label_parser.add_argument('--workers', type=int, default=None, help="Процессов (по умолчанию все ядра)")
+    label_parser.add_argument('--chunk-size', type=int, default=LABEL_CHUNK_SIZE, help="Боёв в одной части")
+    add_instrumentation_args(label_parser)
+
+    bench_parser = subparsers.add_parser('benchmark', help="Время решения полного боя из начального состояния")
+    bench_parser.add_argument('--battles', type=int, default=200)
+    bench_parser.add_argument('--seed', type=int, default=0)
+    bench_parser.add_argument('--random-cards', action='store_true',
+                              help="Случайные характеристики карт вместо базы карт датасета")
+
+    args = parser.parse_args()
+    if args.command == 'label':
+        configure_from_args(args)
+        label_battles(args.data_dir, args.workers, args.chunk_size, args.cache_entries)
+    else:
+        benchmark_solver(args.battles, args.seed, None if args.random_cards else args.data_dir, args.cache_entries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals SQLite Store
+Индексированная база SQLite с картами, боями, раундами и рынком: выборки по карте, бою и датам без полного чтения таблиц
+"""
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import add_instrumentation_args, configure_from_args, instrumented
+from schemas import BATTLES_SCHEMA, ROUNDS_SCHEMA
+from simulator import DECK_SIZE
+from storage import encode_columns, iter_table_chunks, read_manifest
+
+SQLITE_FILE = "urban_rivals.sqlite"
+
+# Таблицы датасета, которые переносятся в базу (battles включает состав колод - battle_cards)
+SQLITE_TABLES = ['cards', 'battles', 'rounds', 'market']
+
+INSERT_BATCH_ROWS = 50_000     # строк на один executemany
+TRANSACTION_ROWS = 1_000_000   # строк на транзакцию: крупные транзакции, но WAL-файл не растёт до размера таблицы
+
+# Время хранится в секундах Unix (INTEGER), поэтому фильтры по датам идут по индексу без разбора строк.
+# Карта в боях, раундах и рынке - card_idx, номер строки в базе карт (как коды в колоночных таблицах).
+# Категории (клан, редкость, победитель) хранятся текстом - запросы читаются без таблиц кодов.
+CARD_LEVELS = range(1, 6)
+TABLE_DDL = {
+    'cards': [
+        "CREATE TABLE cards (card_idx INTEGER PRIMARY KEY, card_id TEXT NOT NULL UNIQUE, name TEXT, clan TEXT, "
+        "rarity TEXT, ability TEXT, ability_unlock_level REAL, release_date INTEGER, " +
+        ", ".join(f"power_level_{level} INTEGER, damage_level_{level} INTEGER" for level in CARD_LEVELS) + ")"
+    ],
+    'battles': [
+        "CREATE TABLE battles (battle_id INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL, winner TEXT, "
+        "player_final_life INTEGER, opponent_final_life INTEGER, game_duration INTEGER)",
+        # Состав колод: side 0 - игрок, 1 - соперник; slot - позиция карты в колоде
+        "CREATE TABLE battle_cards (battle_id INTEGER NOT NULL REFERENCES battles, side INTEGER NOT NULL, "
+        "slot INTEGER NOT NULL, card_idx INTEGER NOT NULL REFERENCES cards, "
+        "PRIMARY KEY (battle_id, side, slot)) WITHOUT ROWID"
+    ],
+    'rounds': [
+        "CREATE TABLE rounds (battle_id INTEGER NOT NULL REFERENCES battles, round INTEGER NOT NULL, "
+        "player_card INTEGER NOT NULL, opponent_card INTEGER NOT NULL, player_pills_used INTEGER, "
+        "opponent_pills_used INTEGER, player_attack INTEGER, opponent_attack INTEGER, winner TEXT, "
+        "damage_dealt INTEGER, player_life_after INTEGER, opponent_life_after INTEGER, "
+        "PRIMARY KEY (battle_id, round)) WITHOUT ROWID"
+    ],
+    'market': [
+        "CREATE TABLE market (date INTEGER NOT NULL, card_idx INTEGER NOT NULL REFERENCES cards, price INTEGER, "
+        "transaction_count INTEGER, total_volume INTEGER)"
+    ]
+}
+
+# Вторичные индексы строятся после загрузки: одна сортировка вместо вставок в B-дерево по строке
+TABLE_INDEXES = {
+    'cards': [],
+    'battles': ["CREATE INDEX battles_timestamp ON battles (timestamp)",
+                "CREATE INDEX battle_cards_card ON battle_cards (card_idx, battle_id)"],
+    'rounds': ["CREATE INDEX rounds_player_card ON rounds (player_card)",
+               "CREATE INDEX rounds_opponent_card ON rounds (opponent_card)"],
+    'market': ["CREATE INDEX market_card_date ON market (card_idx, date)",
+               "CREATE INDEX market_date ON market (date)"]
+}
+
+SQL_TABLES = {'cards': ['cards'], 'battles': ['battles', 'battle_cards'], 'rounds': ['rounds'], 'market': ['market']}
+
+BATTLE_COLUMNS = ['battle_id', 'timestamp', 'winner', 'player_final_life', 'opponent_final_life', 'game_duration']
+MARKET_COLUMNS = ['date', 'price', 'transaction_count', 'total_volume']
+
+
+def connect(db_path: Path, readonly: bool = False) -> sqlite3.Connection:
+    """Соединение в режиме WAL: читатели не блокируют запись и друг друга.
+
+    Транзакции управляются явно (BEGIN/COMMIT), synchronous=NORMAL в WAL не теряет
+    согласованность базы при сбое, только последние транзакции.
+    """
+    if readonly:
+        connection = sqlite3.connect(f"file:{Path(db_path).resolve()}?mode=ro", uri=True, isolation_level=None)
+    else:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(db_path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    connection.execute("PRAGMA cache_size=-262144")  # 256 МБ кэша страниц (сортировки индексов при загрузке)
+    return connection
+
+
+def _sql_column(values: np.ndarray, spec: Dict[str, Any]) -> List[Any]:
+    """Колонка части таблицы -> список значений SQLite (категории - текст, даты - секунды Unix)"""
+    values = np.asarray(values)
+    if spec['dtype'] == 'category':
+        # Код -1 (пусто) указывает на последний элемент - NULL
+        labels = np.asarray(list(spec['categories']) + [None], dtype=object)
+        return labels[values].tolist()
+    if spec['dtype'].startswith('datetime64'):
+        return values.astype('datetime64[s]').astype(np.int64).tolist()
+    if spec['dtype'].startswith('float'):
+        # NaN (например, нет способности) -> NULL
+        return np.where(np.isnan(values), None, values.astype(object)).tolist()
+    return values.tolist()
+
+
+def _card_rows(chunk: Dict[str, np.ndarray], schema: Dict[str, Any], offset: int) -> Dict[str, List[Any]]:
+    columns = {'card_idx': list(range(offset, offset + len(chunk['card_id'])))}
+    columns.update((name, _sql_column(values, schema[name])) for name, values in chunk.items())
+    return {'cards': columns}
+
+
+def _battle_rows(chunk: Dict[str, np.ndarray], schema: Dict[str, Any], offset: int) -> Dict[str, List[Any]]:
+    battle_id = np.asarray(chunk['battle_id'])
+    decks = np.stack([chunk['player_deck'], chunk['opponent_deck']], axis=1)  # [боёв, сторона, слот]
+    sides = np.broadcast_to(np.arange(2)[None, :, None], decks.shape)
+    slots = np.broadcast_to(np.arange(DECK_SIZE)[None, None, :], decks.shape)
+    return {
+        'battles': {name: _sql_column(chunk[name], schema[name]) for name in BATTLE_COLUMNS},
+        'battle_cards': {
+            'battle_id': np.repeat(battle_id, 2 * DECK_SIZE).tolist(),
+            'side': sides.ravel().tolist(),
+            'slot': slots.ravel().tolist(),
+            'card_idx': decks.ravel().tolist()
+        }
+    }
+
+
+def _round_rows(chunk: Dict[str, np.ndarray], schema: Dict[str, Any], offset: int) -> Dict[str, List[Any]]:
+    return {'rounds': {name: _sql_column(values, schema[name]) for name, values in chunk.items()}}
+
+
+def _market_rows(chunk: Dict[str, np.ndarray], schema: Dict[str, Any], offset: int) -> Dict[str, List[Any]]:
+    # Коды card_id рынка - номера строк базы карт; имя карты есть в cards
+    columns = {name: _sql_column(chunk[name], schema[name]) for name in MARKET_COLUMNS}
+    columns['card_idx'] = np.asarray(chunk['card_id']).tolist()
+    return {'market': columns}
+
+
+ROW_BUILDERS = {'cards': _card_rows, 'battles': _battle_rows, 'rounds': _round_rows, 'market': _market_rows}
+
+
+def _iter_row_batches(table_dir: Path) -> Iterator[Dict[str, Dict[str, List[Any]]]]:
+    """Части колоночной таблицы блоками по INSERT_BATCH_ROWS строк в виде колонок SQLite"""
+    schema = read_manifest(table_dir)['columns']
+    builder = ROW_BUILDERS[table_dir.name]
+    offset = 0
+    for chunk in iter_table_chunks(table_dir, mmap=True):
+        num_rows = len(next(iter(chunk.values())))
+        for start in range(0, num_rows, INSERT_BATCH_ROWS):
+            block = {name: values[start:start + INSERT_BATCH_ROWS] for name, values in chunk.items()}
+            yield builder(block, schema, offset + start)
+        offset += num_rows
+
+
+def _ingest_table(connection: sqlite3.Connection, table_dir: Path) -> Tuple[int, int]:
+    """Пересоздаёт таблицы SQLite для таблицы датасета и загружает её: (строк датасета, вставлено строк SQLite)"""
+    name = table_dir.name
+    for sql_table in SQL_TABLES[name]:
+        connection.execute(f"DROP TABLE IF EXISTS {sql_table}")
+    for statement in TABLE_DDL[name]:
+        connection.execute(statement)
+
+    num_rows = 0
+    sql_rows = 0
+    pending = 0
+    connection.execute("BEGIN")
+    for batch in _iter_row_batches(table_dir):
+        for sql_table, columns in batch.items():
+            names = list(columns)
+            statement = f"INSERT INTO {sql_table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+            connection.executemany(statement, zip(*columns.values()))
+            sql_rows += len(next(iter(columns.values())))
+        batch_rows = len(next(iter(batch[SQL_TABLES[name][0]].values())))
+        num_rows += batch_rows
+        pending += batch_rows
+        if pending >= TRANSACTION_ROWS:
+            connection.execute("COMMIT")
+            connection.execute("BEGIN")
+            pending = 0
+    for statement in TABLE_INDEXES[name]:
+        connection.execute(statement)
+    connection.execute("COMMIT")
+    return num_rows, sql_rows
+
+
+@instrumented('sqlite', rows_out=lambda counts: sum(counts.values()),
+              outputs=lambda a: [Path(a['db_path'] or Path(a['data_dir']) / SQLITE_FILE)])
+def ingest_dataset(data_dir: str, db_path: Optional[str] = None,
+                   tables: Optional[List[str]] = None) -> Dict[str, int]:
+    """Загружает колоночные таблицы датасета в SQLite (по умолчанию - все из SQLITE_TABLES, что есть на диске).
+
+    Таблицы пересоздаются целиком: пакетные executemany в крупных транзакциях,
+    индексы - после загрузки, затем ANALYZE для планировщика запросов.
+    """
+    data_dir = Path(data_dir)
+    db_path = Path(db_path) if db_path else data_dir / SQLITE_FILE
+    unknown = [name for name in tables or [] if name not in SQLITE_TABLES]
+    if unknown:
+        raise ValueError(f"Неизвестные таблицы: {unknown}. Доступные: {SQLITE_TABLES}")
+    tables = [name for name in SQLITE_TABLES if (tables is None or name in tables)
+              and read_manifest(data_dir / name) is not None]
+    if not tables:
+        raise FileNotFoundError(f"В {data_dir} нет таблиц датасета для загрузки в SQLite")
+
+    print(f"🗄️ Загрузка в SQLite {db_path}: {', '.join(tables)}")
+    connection = connect(db_path)
+    counts = {}
+    try:
+        for name in tables:
+            start = time.perf_counter()
+            counts[name], sql_rows = _ingest_table(connection, data_dir / name)
+            elapsed = time.perf_counter() - start
+            print(f"  ✅ {name}: {counts[name]} строк ({sql_rows} строк SQLite) за {elapsed:.1f}с - "
+                  f"{sql_rows / max(elapsed, 1e-9):,.0f} строк/с вместе с построением индексов")
+        connection.execute("ANALYZE")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        connection.close()
+    return counts
+
+
+def _seconds(value: Any) -> int:
+    """Дата (datetime, строка ISO, np.datetime64) -> секунды Unix, как в базе"""
+    return pd.Timestamp(value).value // 10**9
+
+
+class SQLiteStore:
+    """Выборки из базы SQLite по индексам: бои с картой, раунды боёв, история цен за период.
+
+    Бои и раунды возвращаются в раскладке колоночных таблиц (как load_columns: колоды [боёв, 4],
+    категории - коды), поэтому к выборке применимы те же функции признаков (features.py).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"База SQLite не найдена: {self.db_path}. Сначала выполните ingest")
+        self.connection = connect(self.db_path, readonly=True)
+        # Номера выбранных боёв для соединений (временная база доступна и при чтении только для чтения).
+        # CROSS JOIN в SQLite фиксирует порядок: внешний цикл - по выбранным боям, поиск - по первичному ключу
+        self.connection.execute("CREATE TEMP TABLE selected_battles (battle_id INTEGER PRIMARY KEY)")
+        self.card_ids = [row[0] for row in self.connection.execute("SELECT card_id FROM cards ORDER BY card_idx")]
+        self._card_index = {card_id: index for index, card_id in enumerate(self.card_ids)}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'SQLiteStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """Произвольный запрос SELECT в DataFrame"""
+        return pd.read_sql_query(sql, self.connection, params=list(params))
+
+    def card_index(self, card_id: str) -> int:
+        """card_idx карты по её идентификатору"""
+        if card_id not in self._card_index:
+            raise ValueError(f"Неизвестная карта: {card_id}")
+        return self._card_index[card_id]
+
+    def battle_ids(self, card_id: Optional[str] = None, start: Any = None, end: Any = None) -> np.ndarray:
+        """Номера боёв (по возрастанию) с картой card_id в любой колоде и/или в интервале [start, end]"""
+        where, params = self._battle_filter(card_id, start, end)
+        rows = self.connection.execute(f"SELECT battle_id FROM battles {where} ORDER BY battle_id", params)
+        return np.fromiter((row[0] for row in rows), dtype=np.int64)
+
+    def select_battles(self, card_id: Optional[str] = None, start: Any = None,
+                       end: Any = None) -> Dict[str, np.ndarray]:
+        """Бои с картой и/или за период в раскладке таблицы battles/ (BATTLES_SCHEMA)"""
+        where, params = self._battle_filter(card_id, start, end)
+        rows = self.connection.execute(
+            f"SELECT {', '.join(BATTLE_COLUMNS)} FROM battles {where} ORDER BY battle_id", params
+        ).fetchall()
+        columns = dict(zip(BATTLE_COLUMNS, zip(*rows))) if rows else {name: [] for name in BATTLE_COLUMNS}
+        self._select(columns['battle_id'])
+        cards = np.fromiter(
+            (row[0] for row in self.connection.execute(
+                "SELECT card_idx FROM selected_battles CROSS JOIN battle_cards USING (battle_id) "
+                "ORDER BY battle_id, side, slot")),
+            dtype=np.int16
+        ).reshape(len(rows), 2, DECK_SIZE)
+        data = {
+            **columns,
+            'timestamp': np.asarray(columns['timestamp'], dtype=np.int64).astype('datetime64[s]'),
+            'player_deck': cards[:, 0],
+            'opponent_deck': cards[:, 1]
+        }
+        return encode_columns(data, BATTLES_SCHEMA)
+
+    def select_rounds(self, battle_ids: Optional[Sequence[int]] = None,
+                      card_id: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Раунды выбранных боёв и/или раунды с картой card_id в раскладке таблицы rounds/ (ROUNDS_SCHEMA)"""
+        names = list(ROUNDS_SCHEMA)
+        conditions, params, source = [], [], "rounds"
+        if battle_ids is not None:
+            self._select(battle_ids)
+            source = "selected_battles CROSS JOIN rounds USING (battle_id)"
+        if card_id is not None:
+            conditions.append("(player_card = ? OR opponent_card = ?)")
+            params += [self.card_index(card_id)] * 2
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT {', '.join(names)} FROM {source} {where} ORDER BY battle_id, round", params
+        ).fetchall()
+        columns = dict(zip(names, zip(*rows))) if rows else {name: [] for name in names}
+        return encode_columns({name: np.asarray(values) for name, values in columns.items()}, ROUNDS_SCHEMA)
+
+    def price_history(self, card_id: str, start: Any = None, end: Any = None) -> pd.DataFrame:
+        """История цен карты за период [start, end] по индексу (card_idx, date)"""
+        conditions, params = ["card_idx = ?"], [self.card_index(card_id)]
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(_seconds(start))
+        if end is not None:
+            conditions.append("date <= ?")
+            params.append(_seconds(end))
+        frame = self.query(f"SELECT {', '.join(MARKET_COLUMNS)} FROM market WHERE {' AND '.join(conditions)} "
+                           f"ORDER BY date", params)
+        frame['date'] = pd.to_datetime(frame['date'], unit='s')
+        return frame
+
+    def _battle_filter(self, card_id: Optional[str], start: Any, end: Any) -> Tuple[str, List[Any]]:
+        conditions, params = [], []
+        if card_id is not None:
+            conditions.append("battle_id IN (SELECT battle_id FROM battle_cards WHERE card_idx = ?)")
+            params.append(self.card_index(card_id))
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(_seconds(start))
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            params.append(_seconds(end))
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def _select(self, battle_ids: Sequence[int]):
+        """Заполняет временную таблицу номеров боёв для соединений"""
+        self.connection.execute("BEGIN")
+        self.connection.execute("DELETE FROM selected_battles")
+        self.connection.executemany("INSERT OR IGNORE INTO selected_battles VALUES (?)",
+                                    ((int(battle_id),) for battle_id in battle_ids))
+        self.connection.execute("COMMIT")
+
+
+def main():
+    """Загрузка датасета в SQLite и выборки из командной строки"""
+    parser = argparse.ArgumentParser(description="Индексированная база SQLite датасета Urban Rivals")
+    parser.add_argument('--data-dir', default="datasets", help="Папка с датасетом (dataset.py)")
+    parser.add_argument('--db', default=None, help=f"Файл базы (по умолчанию <data-dir>/{SQLITE_FILE})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help="Загрузить таблицы датасета в базу")
+    ingest_parser.add_argument('--tables', nargs='+', choices=SQLITE_TABLES, default=None,
+                               help="Таблицы для загрузки (по умолчанию все, что есть)")
+    add_instrumentation_args(ingest_parser)
+
+    battles_parser = subparsers.add_parser('battles', help="Бои с картой и/или за период")
+    battles_parser.add_argument('--card-id', default=None)
+    battles_parser.add_argument('--start', default=None, help="Начало периода (ISO)")
+    battles_parser.add_argument('--end', default=None, help="Конец периода (ISO)")
+
+    prices_parser = subparsers.add_parser('prices', help="История цен карты за период")
+    prices_parser.add_argument('--card-id', required=True)
+    prices_parser.add_argument('--start', default=None, help="Начало периода (ISO)")
+    prices_parser.add_argument('--end', default=None, help="Конец периода (ISO)")
+
+    sql_parser = subparsers.add_parser('sql', help="Выполнить запрос SELECT")
+    sql_parser.add_argument('query')
+
+    args = parser.parse_args()
+    db_path = args.db or str(Path(args.data_dir) / SQLITE_FILE)
+
+    if args.command == 'ingest':
+        configure_from_args(args)
+        ingest_dataset(args.data_dir, db_path, args.tables)
+        return
+
+    with SQLiteStore(db_path) as store:
+        start = time.perf_counter()
+        if args.command == 'battles':
+            battles = store.select_battles(args.card_id, args.start, args.end)
+            elapsed = time.perf_counter() - start
+            print(f"⚔️ Боёв: {len(battles['battle_id'])} ({elapsed * 1000:.1f} мс)")
+            print(pd.DataFrame({'battle_id': battles['battle_id'], 'timestamp': battles['timestamp']}).head(20))
+        elif args.command == 'prices':
+            frame = store.price_history(args.card_id, args.start, args.end)
+            print(f"💰 Записей: {len(frame)} ({(time.perf_counter() - start) * 1000:.1f} мс)")
+            print(frame.to_string(index=False))
+        else:
+            print(store.query(args.query).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Chunked Columnar Storage
+Типизированное колоночное хранилище таблиц датасета, записываемое частями
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+MANIFEST_NAME = "manifest.json"
+EXPORT_FORMATS = ['csv', 'json']
+
+# Экспорт для браузера: колонки - типизированные массивы little-endian, частями по TYPED_CHUNK_ROWS строк
+TYPED_FORMAT = 'urban-rivals-typed-arrays'
+TYPED_FORMAT_VERSION = 1
+TYPED_CHUNK_ROWS = 65_536
+TYPED_ALIGNMENT = 8  # смещения колонок в файле части кратны 8 (Float64Array)
+# Числовые колонки этих типов экспортируются как есть; float64 - только даты (секунды Unix не помещаются в float32)
+TYPED_ARRAY_DTYPES = ['int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'float32']
+
+# Схема таблицы - словарь {колонка: спецификация}, спецификация:
+#   {'dtype': 'int8'}                                   - числовая колонка (int*/uint*/float*)
+#   {'dtype': 'int16', 'shape': [4]}                    - многомерная колонка (например, колода)
+#   {'dtype': 'category', 'categories': [...]}          - категориальная, хранятся коды (-1 = пусто)
+#   {'dtype': 'str'}                                    - строки фиксированной ширины
+#   {'dtype': 'datetime64[s]'}                          - дата и время
+
+
+def column(dtype: str, shape: Optional[List[int]] = None, categories: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Описывает колонку схемы"""
+    spec = {'dtype': dtype}
+    if shape:
+        spec['shape'] = list(shape)
+    if categories is not None:
+        spec['categories'] = list(categories)
+    return spec
+
+
+def category_code_dtype(categories: List[str]) -> np.dtype:
+    """Минимальный знаковый тип для кодов категорий (с учётом -1 для пропусков)"""
+    return np.dtype(np.int8) if len(categories) < 128 else np.dtype(np.int16) if len(categories) < 32768 else np.dtype(np.int32)
+
+
+def encode_columns(data: Mapping[str, Any], schema: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Приводит колонки к типам схемы, проверяя диапазоны и категории"""
+    encoded = {}
+    for name, spec in schema.items():
+        if name not in data:
+            raise ValueError(f"В данных нет колонки '{name}' из схемы")
+        values = data[name]
+        dtype = spec['dtype']
+
+        if dtype == 'category':
+            categories = spec['categories']
+            values = np.asarray(values)
+            if np.issubdtype(values.dtype, np.integer):
+                codes = values
+            else:
+                codes = pd.Categorical(values, categories=categories).codes
+                unknown = (codes == -1) & ~pd.isna(values)
+                if unknown.any():
+                    raise ValueError(f"Колонка '{name}': неизвестные категории {sorted(set(values[unknown]))[:5]}")
+            encoded[name] = _cast_checked(name, codes, category_code_dtype(categories))
+        elif dtype == 'str':
+            encoded[name] = np.asarray(values, dtype=str)
+        elif dtype.startswith('datetime64'):
+            encoded[name] = np.asarray(values, dtype=dtype)
+        else:
+            encoded[name] = _cast_checked(name, np.asarray(values), np.dtype(dtype))
+
+        expected_shape = tuple(spec.get('shape', []))
+        if encoded[name].shape[1:] != expected_shape:
+            raise ValueError(f"Колонка '{name}': форма {encoded[name].shape[1:]} вместо {expected_shape}")
+    return encoded
+
+
+def empty_columns(schema: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Колонки без строк с типами и формами хранения схемы (категории - коды)"""
+    return encode_columns({name: np.zeros((0,) + tuple(spec.get('shape', [])), dtype=np.int64)
+                           for name, spec in schema.items()}, schema)
+
+
+def _cast_checked(name: str, values: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Приводит массив к типу, не допуская переполнения целых"""
+    if np.issubdtype(dtype, np.integer) and values.size:
+        info = np.iinfo(dtype)
+        if values.min() < info.min or values.max() > info.max:
+            raise ValueError(f"Колонка '{name}': значения [{values.min()}, {values.max()}] не помещаются в {dtype}")
+    return values.astype(dtype, copy=False)
+
+
+class ChunkedTableWriter:
+    """Пишет таблицу частями (part-00000, part-00001, ...), по одному .npy на колонку.
+
+    Манифест (схема, параметры, список частей) переписывается атомарно после каждой
+    завершённой части, поэтому прерванный запуск оставляет на диске все уже записанные части.
+    Манифест новой таблицы пишется сразу: таблица, в которую не попало ни одной строки, - пустая, а не отсутствующая.
+    """
+
+    def __init__(self, table_dir: Path, schema: Dict[str, Dict[str, Any]],
+                 params: Optional[Dict[str, Any]] = None, resume: bool = False):
+        self.table_dir = Path(table_dir)
+        self.schema = schema
+        self.params = params or {}
+
+        manifest = read_manifest(self.table_dir)
+        if resume and manifest is not None:
+            self.manifest = manifest
+            if self.manifest['params'] != self.params or self.manifest['columns'] != self.schema:
+                raise ValueError(
+                    f"Параметры или схема таблицы {self.table_dir} не совпадают с сохранёнными: "
+                    f"{self.manifest['params']} != {self.params}"
+                )
+        else:
+            if self.table_dir.exists():
+                shutil.rmtree(self.table_dir)
+            self.manifest = {'params': self.params, 'columns': self.schema, 'parts': [], 'num_rows': 0}
+
+        self.table_dir.mkdir(parents=True, exist_ok=True)
+        self._remove_orphan_parts()
+        self._save_manifest()
+
+    @property
+    def num_parts(self) -> int:
+        return len(self.manifest['parts'])
+
+    @property
+    def num_rows(self) -> int:
+        return self.manifest['num_rows']
+
+    def write_chunk(self, data: Mapping[str, Any]):
+        """Дописывает одну часть таблицы"""
+        columns = encode_columns(data, self.schema)
+        num_rows = len(next(iter(columns.values())))
+
+        part_name = f"part-{self.num_parts:05d}"
+        tmp_dir = self.table_dir / f".{part_name}.tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir()
+
+        for name, values in columns.items():
+            np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(values))
+        os.replace(tmp_dir, self.table_dir / part_name)
+
+        self.manifest['parts'].append({'name': part_name, 'rows': num_rows})
+        self.manifest['num_rows'] += num_rows
+        self._save_manifest()
+
+    def truncate(self, num_parts: int):
+        """Отбрасывает части после num_parts (для согласованного продолжения нескольких таблиц)"""
+        for part in self.manifest['parts'][num_parts:]:
+            shutil.rmtree(self.table_dir / part['name'], ignore_errors=True)
+            self.manifest['num_rows'] -= part['rows']
+        self.manifest['parts'] = self.manifest['parts'][:num_parts]
+        self._save_manifest()
+
+    def _save_manifest(self):
+        tmp_path = self.table_dir / f".{MANIFEST_NAME}.tmp"
+        tmp_path.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(tmp_path, self.table_dir / MANIFEST_NAME)
+
+    def _remove_orphan_parts(self):
+        # Части, не попавшие в манифест, остались от прерванной записи
+        known = {part['name'] for part in self.manifest['parts']}
+        for path in self.table_dir.iterdir():
+            if path.is_dir() and path.name not in known:
+                shutil.rmtree(path)
+
+
+def write_table(table_dir: Path, data: Mapping[str, Any], schema: Dict[str, Dict[str, Any]]) -> int:
+    """Записывает таблицу целиком одной частью, возвращает количество строк"""
+    writer = ChunkedTableWriter(table_dir, schema)
+    writer.write_chunk(data)
+    return writer.num_rows
+
+
+def read_manifest(table_dir: Path) -> Optional[Dict[str, Any]]:
+    """Возвращает манифест таблицы или None, если таблица ещё не записана"""
+    manifest_path = Path(table_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    return json.loads(manifest_path.read_text(encoding='utf-8'))
+
+
+def iter_table_chunks(table_dir: Path, columns: Optional[List[str]] = None,
+                      mmap: bool = True) -> Iterator[Dict[str, np.ndarray]]:
+    """Читает таблицу по частям без декодирования (категории - коды), не загружая её целиком"""
+    table_dir = Path(table_dir)
+    manifest = read_manifest(table_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"Таблица не найдена: {table_dir}")
+    columns = columns or list(manifest['columns'])
+    mmap_mode = 'r' if mmap else None
+    for part in manifest['parts']:
+        yield {name: np.load(table_dir / part['name'] / f"{name}.npy", mmap_mode=mmap_mode) for name in columns}
+
+
+def load_columns(table_dir: Path, columns: Optional[List[str]] = None, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """Загружает колонки как массивы NumPy (категории - коды).
+
+    Для таблицы из одной части возвращаются отображённые в память массивы без копирования.
+    """
+    chunks = list(iter_table_chunks(table_dir, columns, mmap))
+    if not chunks:
+        schema = read_manifest(table_dir)['columns']
+        return empty_columns({name: schema[name] for name in columns or schema})
+    if len(chunks) == 1:
+        return chunks[0]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def read_table(table_dir: Path, columns: Optional[List[str]] = None, mmap: bool = True) -> pd.DataFrame:
+    """Читает таблицу в DataFrame.
+
+    Категориальные колонки декодируются в pd.Categorical, многомерные раскладываются в name_0, name_1, ...
+    """
+    schema = read_manifest(table_dir)['columns']
+    frame = {}
+    for name, values in load_columns(table_dir, columns, mmap).items():
+        spec = schema[name]
+        if spec['dtype'] == 'category':
+            frame[name] = pd.Categorical.from_codes(np.asarray(values), categories=spec['categories'])
+        elif values.ndim == 1:
+            frame[name] = values
+        else:
+            for i in range(values.shape[1]):
+                frame[f"{name}_{i}"] = values[:, i]
+    return pd.DataFrame(frame)
+
+
+def export_table(table_dir: Path, formats: List[str], output_stem: Optional[Path] = None) -> List[Path]:
+    """Экспортирует колоночную таблицу в CSV/JSON (опционально, для ручного просмотра и внешних инструментов)"""
+    table_dir = Path(table_dir)
+    output_stem = output_stem or table_dir
+    frame = read_table(table_dir, mmap=False)
+
+    written = []
+    for fmt in formats:
+        path = output_stem.with_suffix(f".{fmt}")
+        if fmt == 'csv':
+            frame.to_csv(path, index=False)
+        elif fmt == 'json':
+            frame.to_json(path, orient='records', date_format='iso')
+        else:
+            raise ValueError(f"Неизвестный формат экспорта: {fmt}. Доступные: {EXPORT_FORMATS}")
+        written.append(path)
+    return written
+
+
+def export_typed_arrays(tables: Mapping[str, Path], output_dir: Path, chunk_rows: int = TYPED_CHUNK_ROWS,
+                        metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Экспортирует колоночные таблицы в типизированные массивы для браузера (src/ml/training-data.ts).
+
+    Каждая таблица делится на части по chunk_rows строк: файл части - колонки подряд (little-endian,
+    смещения выровнены по TYPED_ALIGNMENT), манифест - типы, формы, категории, смещения и SHA-256
+    частей. Клиент загружает части по одной и читает колонки как представления над буфером,
+    не создавая объекты строк. Категории хранятся кодами, строки - кодами словаря таблицы,
+    int64/uint64 - int32/uint32 (с проверкой диапазона), float64 - float32, даты - секунды Unix в float64
+    (единственные колонки Float64Array).
+    """
+    output_dir = Path(output_dir)
+    tmp_dir = output_dir.with_name(f".{output_dir.name}.tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    manifest = {'format': TYPED_FORMAT, 'version': TYPED_FORMAT_VERSION, 'byte_order': 'little',
+                **(metadata or {}), 'tables': {}}
+    for name, table_dir in tables.items():
+        schema = read_manifest(table_dir)['columns']
+        dictionaries = {column: pd.unique(load_columns(table_dir, [column])[column]).tolist()
+                        for column, spec in schema.items() if spec['dtype'] == 'str'}
+        columns = {}
+        for column, spec in schema.items():
+            categories = spec.get('categories', dictionaries.get(column))
+            columns[column] = {'dtype': _typed_dtype(spec, categories), 'shape': spec.get('shape', [])}
+            if categories is not None:
+                columns[column]['categories'] = categories
+            if spec['dtype'].startswith('datetime64'):
+                columns[column]['unit'] = 's'
+
+        (tmp_dir / name).mkdir()
+        chunks = []
+        for index, chunk in enumerate(_fixed_size_chunks(table_dir, chunk_rows)):
+            file_name = f"{name}/chunk-{index:05d}.bin"
+            offsets, buffers, position = {}, [], 0
+            for column, values in chunk.items():
+                if column in dictionaries:
+                    values = pd.Categorical(values, categories=dictionaries[column]).codes
+                elif schema[column]['dtype'].startswith('datetime64'):
+                    values = values.astype('datetime64[s]').astype(np.int64)
+                data = _cast_checked(column, np.asarray(values), np.dtype(columns[column]['dtype']).newbyteorder('<'))
+                padding = -position % TYPED_ALIGNMENT
+                buffers.append(b'\0' * padding)
+                position += padding
+                offsets[column] = position
+                buffers.append(np.ascontiguousarray(data).tobytes())
+                position += data.nbytes
+            payload = b''.join(buffers)
+            (tmp_dir / file_name).write_bytes(payload)
+            chunks.append({'file': file_name, 'rows': len(next(iter(chunk.values()))), 'byte_length': len(payload),
+                           'sha256': hashlib.sha256(payload).hexdigest(), 'offsets': offsets})
+        manifest['tables'][name] = {'num_rows': sum(chunk['rows'] for chunk in chunks), 'chunk_rows': chunk_rows,
+                                    'columns': columns, 'chunks': chunks}
+
+    (tmp_dir / MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    os.replace(tmp_dir, output_dir)
+    return manifest
+
+
+def _typed_dtype(spec: Dict[str, Any], categories: Optional[List[str]]) -> str:
+    """Тип типизированного массива для колонки схемы"""
+    if categories is not None:
+        return category_code_dtype(categories).name
+    if spec['dtype'].startswith('datetime64'):
+        return 'float64'
+    dtype = np.dtype(spec['dtype'])
+    if dtype.name in TYPED_ARRAY_DTYPES:
+        return dtype.name
+    if dtype.kind == 'f':
+        return 'float32'
+    return 'int32' if dtype.kind == 'i' else 'uint32'
+
+
+def _fixed_size_chunks(table_dir: Path, chunk_rows: int) -> Iterator[Dict[str, np.ndarray]]:
+    """Части таблицы по chunk_rows строк (последняя короче) независимо от деления на части на диске"""
+    pending, pending_rows = [], 0
+    for part in iter_table_chunks(table_dir):
+        num_rows = len(next(iter(part.values())))
+        start = 0
+        while start < num_rows:
+            take = min(chunk_rows - pending_rows, num_rows - start)
+            pending.append({name: values[start:start + take] for name, values in part.items()})
+            pending_rows += take
+            start += take
+            if pending_rows == chunk_rows:
+                yield {name: np.concatenate([block[name] for block in pending]) for name in pending[0]}
+                pending, pending_rows = [], 0
+    if pending:
+        yield {name: np.concatenate([block[name] for block in pending]) for name in pending[0]}
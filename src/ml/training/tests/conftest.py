@@ -0,0 +1,6 @@
+"""Модули обучения импортируют друг друга как соседние файлы (запуск из src/ml/training)"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,26 @@
+"""Набор бенчмарков: этапы обучения действительно замеряются, а не падают на подготовке"""
+
+import pytest
+
+from benchmark import _prepare_suite_dataset, suite_stage
+
+
+@pytest.fixture(scope='module')
+def suite_data_dir(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('suite') / 'data'
+    _prepare_suite_dataset(data_dir, 1_000, seed=42)
+    return data_dir
+
+
+@pytest.mark.parametrize('stage', ['train_battle_predictor', 'train_card_recommender', 'train_strategy_classifier'])
+def test_suite_train_stage(suite_data_dir, tmp_path, stage):
+    task = {'stage': stage, 'size': 1_000, 'seed': 42, 'epochs': 1, 'repeats': 1,
+            'data_dir': str(suite_data_dir), 'scratch_dir': str(tmp_path / 'nested' / f"scratch_{stage}")}
+
+    record = suite_stage(task)
+
+    if record['status'] == 'error' and record['error'].startswith('ModuleNotFoundError'):
+        # Без TensorFlow/sklearn обучение не замерить; любая другая ошибка - провал теста
+        pytest.skip(record['error'])
+    assert record['status'] == 'ok', record.get('error')
+    assert record['rows'] > 0 and record['wall_time'] > 0
@@ -0,0 +1,51 @@
+"""Потоковый инференс: колоночная таблица и CSV дают те же предсказания, что bundle_predict"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import INFERENCE_ARCHITECTURES, _synthetic_bundle
+from inference import BundlePredictor, Predictor, predict_stream
+from model_bundle import BUNDLE_FILE, bundle_predict, read_bundle
+from storage import ChunkedTableWriter, column
+
+
+def test_predictor_is_abstract():
+    with pytest.raises(TypeError):
+        Predictor()
+
+
+@pytest.mark.parametrize('name', list(INFERENCE_ARCHITECTURES))
+def test_predict_stream_matches_bundle_predict(tmp_path, name):
+    _synthetic_bundle(tmp_path / BUNDLE_FILE, seed=0)
+    predictor = BundlePredictor(tmp_path)
+    model = read_bundle(tmp_path / BUNDLE_FILE)['models'][name]
+    features = model['input_features']
+    X = np.random.default_rng(1).normal(5, 3, (1_000, len(features))).astype(np.float32)
+    expected = bundle_predict(model, X)
+
+    # Таблица из нескольких частей и CSV, читаемый частями меньше пакета
+    table_dir = tmp_path / 'table'
+    schema = {'row_id': column('int64'), **{feature: column('float32') for feature in features}}
+    writer = ChunkedTableWriter(table_dir, schema)
+    for start in range(0, len(X), 300):
+        writer.write_chunk({'row_id': np.arange(start, min(start + 300, len(X))),
+                            **{feature: X[start:start + 300, i] for i, feature in enumerate(features)}})
+    csv_path = tmp_path / 'input.csv'
+    pd.DataFrame({'row_id': np.arange(len(X)), **{feature: X[:, i] for i, feature in enumerate(features)}}) \
+        .to_csv(csv_path, index=False, float_format='%.9g')
+
+    for source, output in [(str(table_dir), tmp_path / 'table.jsonl'), (str(csv_path), tmp_path / 'csv.csv')]:
+        num_rows = predict_stream(predictor, name, source, str(output), id_column='row_id', batch_size=128,
+                                  chunk_rows=250)
+        result = pd.read_csv(output) if output.suffix == '.csv' else pd.read_json(output, lines=True)
+
+        assert num_rows == len(X)
+        assert result['row_id'].tolist() == list(range(len(X)))
+        classes = predictor.infos[name].get('output_classes')
+        if classes:
+            probabilities = result[[f"p_{label}" for label in classes]].to_numpy()
+            np.testing.assert_allclose(probabilities, expected, atol=1e-6)
+            assert result['prediction'].tolist() == np.asarray(classes)[expected.argmax(axis=1)].tolist()
+        else:
+            np.testing.assert_allclose(result['score'].to_numpy(), expected[:, 0], atol=1e-6)
@@ -0,0 +1,51 @@
+"""Пустые выборки: write_prepared и конвейеры при разбиении, не давшем строк части выборок"""
+
+import numpy as np
+import pytest
+
+from input_pipeline import (SUBSETS, array_column, columns_fn, fit_scaler, hash_subset_codes, prepared_datasets,
+                            subset_sizes, table_parts, write_prepared)
+from storage import read_manifest, read_table
+
+
+def _battles(num_battles: int) -> dict:
+    """Бои с battle_id, попадающими по хэшу только в обучающую выборку"""
+    ids = np.arange(10_000)
+    ids = ids[hash_subset_codes(ids) == SUBSETS.index('train')][:num_battles]
+    return {'battle_id': ids.astype(np.int32), 'a': np.arange(len(ids), dtype=np.int8),
+            'b': np.ones(len(ids), dtype=np.int8), 'winner': np.zeros(len(ids), dtype=np.int8)}
+
+
+def test_write_prepared_empty_subsets(tmp_path):
+    parts = [_battles(5)]
+    assert subset_sizes(parts) == {'train': 5, 'validation': 0, 'test': 0}
+
+    sizes = write_prepared(parts, columns_fn(['a', 'b']), array_column('winner'), tmp_path)
+
+    assert sizes == {'train': 5, 'validation': 0, 'test': 0}
+    for subset in SUBSETS:
+        assert read_manifest(tmp_path / subset) is not None
+    (part,) = table_parts(tmp_path / 'test')
+    assert part['X'].shape == (0, 2) and part['X'].dtype == np.float32
+    assert part['y'].shape == (0,) and part['y'].dtype == np.int8
+    assert len(read_table(tmp_path / 'validation')) == 0
+
+
+def test_prepared_datasets_empty_subsets(tmp_path):
+    pytest.importorskip('tensorflow')
+    write_prepared([_battles(5)], columns_fn(['a', 'b']), array_column('winner'), tmp_path)
+
+    datasets = prepared_datasets(tmp_path, batch_size=2)
+
+    assert sum(len(y) for _, y in datasets['train']) == 5
+    assert list(datasets['test']) == []
+    assert datasets['test'].element_spec[0].shape.as_list() == [None, 2]
+
+
+def test_fit_scaler_without_train_rows():
+    battles = _battles(5)
+    ids = np.arange(10_000)
+    battles['battle_id'] = ids[hash_subset_codes(ids) == SUBSETS.index('test')][:5].astype(np.int32)
+
+    with pytest.raises(ValueError, match="'train'"):
+        fit_scaler([battles], columns_fn(['a', 'b']))
@@ -0,0 +1,51 @@
+"""Таблица исходов пар карт против правил раунда эталонного _simulate_battle"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from dataset import UrbanRivalsDataCollector
+from matchups import PILL_LEVELS, MatchupTable, build_matchup_table
+
+
+@pytest.fixture(scope='module')
+def table_setup(tmp_path_factory):
+    tmp_dir = tmp_path_factory.mktemp('matchups')
+    np.random.seed(42)
+    collector = UrbanRivalsDataCollector(str(tmp_dir), reference_time=datetime(2024, 1, 1))
+    cards_df = collector.create_cards_database()
+    # Маленькие блоки: таблица собирается из нескольких блоков, записанных на свои места
+    build_matchup_table(cards_df, tmp_dir / 'matchups.bin', workers=1, block_rows=7)
+    with MatchupTable(tmp_dir / 'matchups.bin') as table:
+        yield collector, cards_df, table
+
+
+def test_outcomes_match_simulate_battle(table_setup):
+    collector, cards_df, table = table_setup
+    rng = np.random.default_rng(0)
+
+    for _ in range(30):
+        player, opponent = rng.integers(0, len(cards_df), size=2)
+        player_cards, opponent_cards = cards_df.iloc[[player]], cards_df.iloc[[opponent]]
+        for player_pills in range(PILL_LEVELS):
+            for opponent_pills in range(PILL_LEVELS):
+                (round_data,) = collector._simulate_battle(player_cards, opponent_cards,
+                                                           pill_draws=([player_pills], [opponent_pills]))['rounds']
+                expected = {'player': round_data['damage_dealt'], 'opponent': -round_data['damage_dealt'],
+                            'draw': 0}[round_data['winner']]
+                assert table.outcome(player_cards['card_id'].iloc[0], opponent_cards['card_id'].iloc[0],
+                                     player_pills, opponent_pills) == expected
+
+
+def test_expected_is_mean_over_opponent_pills(table_setup):
+    _, cards_df, table = table_setup
+    player, opponent = cards_df['card_id'].iloc[0], cards_df['card_id'].iloc[1]
+
+    for max_opponent_pills in [0, 5, PILL_LEVELS - 1]:
+        outcomes = np.array([table.outcome(player, opponent, 3, pills) for pills in range(max_opponent_pills + 1)])
+        expected = table.expected(player, opponent, 3, max_opponent_pills)
+        assert expected['win'] == pytest.approx((outcomes > 0).mean())
+        assert expected['draw'] == pytest.approx((outcomes == 0).mean())
+        assert expected['net_damage'] == pytest.approx(outcomes.mean())
+    assert set(table.header['tensors']) == {'net_damage', 'profile_power', 'profile_damage', 'card_profiles'}
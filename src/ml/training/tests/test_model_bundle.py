@@ -0,0 +1,74 @@
+"""Бинарный бандл моделей: запись и чтение без TensorFlow, точность квантизаций, контрольная сумма"""
+
+import numpy as np
+import pytest
+
+from model_bundle import BUNDLE_ALIGNMENT, QUANTIZATIONS, build_bundle, bundle_predict, read_bundle
+
+# Допуск относительно прямого прохода по исходным весам float32
+TOLERANCES = {'float32': 1e-5, 'float16': 1e-2, 'int8': 5e-2}
+
+
+def _random_models(seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    models = {}
+    for name, sizes, activations in [('classifier', [5, 16, 8, 3], ['relu', 'relu', 'softmax']),
+                                     ('regressor', [4, 8, 1], ['relu', 'sigmoid'])]:
+        models[name] = {
+            'input_features': [f"x{i}" for i in range(sizes[0])],
+            'layers': [{'kernel': rng.normal(0, np.sqrt(2 / inputs), (inputs, outputs)).astype(np.float32),
+                        'bias': rng.normal(0, 0.1, outputs).astype(np.float32), 'activation': activation}
+                       for inputs, outputs, activation in zip(sizes[:-1], sizes[1:], activations)],
+            'scaler': {'mean': rng.normal(0, 1, sizes[0]), 'scale': rng.uniform(0.5, 2, sizes[0])}
+        }
+    return models
+
+
+def _forward(model: dict, X: np.ndarray) -> np.ndarray:
+    """Эталонный прямой проход по исходным весам"""
+    outputs = (X - model['scaler']['mean']) / model['scaler']['scale']
+    for layer in model['layers']:
+        outputs = outputs @ layer['kernel'] + layer['bias']
+        if layer['activation'] == 'relu':
+            outputs = np.maximum(outputs, 0)
+        elif layer['activation'] == 'sigmoid':
+            outputs = 1 / (1 + np.exp(-outputs))
+        elif layer['activation'] == 'softmax':
+            outputs = np.exp(outputs) / np.exp(outputs).sum(axis=1, keepdims=True)
+    return outputs
+
+
+@pytest.mark.parametrize('quantization', QUANTIZATIONS)
+def test_bundle_round_trip(quantization):
+    models = _random_models()
+    bundle = build_bundle(models, {'clans': ['A', 'B'], 'rarities': []}, quantization, created='2024-01-01')
+
+    header = read_bundle(bundle)
+
+    assert header['quantization'] == quantization
+    assert header['mappings'] == {'clans': ['A', 'B'], 'rarities': []}
+    assert all(spec['offset'] % BUNDLE_ALIGNMENT == 0 for spec in header['tensors'].values())
+    kernel_dtypes = {spec['dtype'] for name, spec in header['tensors'].items() if name.endswith('/kernel')}
+    assert kernel_dtypes == {quantization}
+    X = np.random.default_rng(1).normal(0, 2, (64, 5))
+    for name, model in models.items():
+        X_model = X[:, :len(model['input_features'])]
+        assert header['models'][name]['input_features'] == model['input_features']
+        np.testing.assert_allclose(bundle_predict(header['models'][name], X_model), _forward(model, X_model),
+                                   atol=TOLERANCES[quantization])
+
+
+def test_bundle_rejects_corrupted_byte():
+    bundle = bytearray(build_bundle(_random_models(), {}, 'float16'))
+    bundle[-1] ^= 0xFF
+
+    with pytest.raises(ValueError, match="Контрольная сумма"):
+        read_bundle(bytes(bundle))
+
+
+def test_bundle_rejects_wrong_magic():
+    bundle = bytearray(build_bundle(_random_models(), {}, 'float16'))
+    bundle[0:4] = b'XXXX'
+
+    with pytest.raises(ValueError, match="сигнатура"):
+        read_bundle(bytes(bundle))
@@ -0,0 +1,26 @@
+"""Кэш конвейера: запись на месте в рабочих папках не меняет записи кэша"""
+
+import os
+
+from pipeline import PipelineCache
+
+
+def test_cache_entry_survives_in_place_model_rewrite(tmp_path):
+    cache = PipelineCache(tmp_path / 'cache', max_bytes=2**30)
+    model = tmp_path / 'models' / 'sklearn' / 'scaler.pkl'
+    table = tmp_path / 'data' / 'battles' / 'part-00000' / 'winner.npy'
+    for path, content in [(model, b'old model'), (table, b'old table')]:
+        path.parent.mkdir(parents=True)
+        path.write_bytes(content)
+    outputs = {'models/sklearn/scaler.pkl': model, 'data/battles': table.parent.parent}
+    cache.store('train_battle', 'key', outputs)
+
+    # Как joblib.dump / h5py: файл открывается на запись и перезаписывается на месте
+    with open(model, 'wb') as f:
+        f.write(b'warm-started model')
+    cache.restore('train_battle', 'key', outputs)
+
+    assert model.read_bytes() == b'old model'
+    # Таблицы по-прежнему делятся с кэшем без копирования
+    cached_table = tmp_path / 'cache' / 'train_battle-key' / 'data' / 'battles' / 'part-00000' / 'winner.npy'
+    assert os.path.samefile(cached_table, table)
@@ -0,0 +1,43 @@
+"""Пакетный симулятор против эталонного пошагового _simulate_battle на тех же колодах и пилюлях"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from dataset import UrbanRivalsDataCollector
+from simulator import WINNER_LABELS, battle_rounds_records, card_stats_array, simulate_battles
+
+
+@pytest.fixture(scope='module')
+def collector_cards(tmp_path_factory):
+    np.random.seed(42)
+    collector = UrbanRivalsDataCollector(str(tmp_path_factory.mktemp('cards')), reference_time=datetime(2024, 1, 1))
+    return collector, collector.create_cards_database()
+
+
+def test_simulate_battles_matches_reference(collector_cards):
+    collector, cards_df = collector_cards
+    card_stats = card_stats_array(cards_df)
+    batch = simulate_battles(card_stats, 500, np.random.default_rng(7))
+
+    for i in range(500):
+        reference = collector._simulate_battle(
+            cards_df.iloc[batch['player_deck'][i]],
+            cards_df.iloc[batch['opponent_deck'][i]],
+            pill_draws=(batch['player_pill_draws'][i], batch['opponent_pill_draws'][i])
+        )
+        assert reference['rounds'] == battle_rounds_records(batch, card_stats['card_id'], i)
+        assert reference['winner'] == WINNER_LABELS[batch['winner'][i]]
+        assert reference['final_score'] == {'player': int(batch['player_life'][i]),
+                                            'opponent': int(batch['opponent_life'][i])}
+
+
+def test_generate_battle_data_returns_tables(collector_cards):
+    collector, cards_df = collector_cards
+
+    battles, rounds = collector.generate_battle_data(cards_df, 1_000, np.random.default_rng(7))
+
+    assert len(battles['battle_id']) == 1_000
+    assert np.isin(rounds['battle_id'], battles['battle_id']).all()
+    assert (collector.output_dir / 'battles').exists() and (collector.output_dir / 'rounds').exists()
@@ -0,0 +1,96 @@
+"""Решатель против полного перебора без отсечений на малых состояниях 4x4; граница таблицы транспозиций"""
+
+import functools
+
+import numpy as np
+import pytest
+
+from solver import BattleSolver
+
+
+def _round(my_life, their_life, card, their_card, pills, their_pills_used):
+    attack = card[0] + pills
+    their_attack = their_card[0] + their_pills_used
+    if attack > their_attack:
+        their_life -= card[1]
+    elif their_attack > attack:
+        my_life -= their_card[1]
+    return my_life, their_life
+
+
+@functools.lru_cache(maxsize=None)
+def _exhaustive(my_life, their_life, my_pills, their_pills, my_cards, their_cards):
+    """Итог для стороны, ходящей первой: все карты и все ставки обеих сторон"""
+    return max(_move_value(my_life, their_life, my_pills, their_pills, my_cards, their_cards, index, pills)
+               for index in range(len(my_cards)) for pills in range(my_pills + 1))
+
+
+def _move_value(my_life, their_life, my_pills, their_pills, my_cards, their_cards, index, pills):
+    return min(_reply_value(my_life, their_life, my_pills, their_pills, my_cards, their_cards, index, pills,
+                            their_index, their_pills_used)
+               for their_index in range(len(their_cards)) for their_pills_used in range(their_pills + 1))
+
+
+def _reply_value(my_life, their_life, my_pills, their_pills, my_cards, their_cards, index, pills,
+                 their_index, their_pills_used):
+    my_life, their_life = _round(my_life, their_life, my_cards[index], their_cards[their_index],
+                                 pills, their_pills_used)
+    my_rest = my_cards[:index] + my_cards[index + 1:]
+    their_rest = their_cards[:their_index] + their_cards[their_index + 1:]
+    if my_life <= 0 or their_life <= 0 or not my_rest:
+        return max(my_life, 0) - max(their_life, 0)
+    return -_exhaustive(their_life, my_life, their_pills - their_pills_used, my_pills - pills,
+                        tuple(sorted(their_rest)), tuple(sorted(my_rest)))
+
+
+def _random_states(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        cards = rng.integers([1, 1], [9, 7], size=(2, 4, 2)).tolist()
+        yield ([tuple(card) for card in cards[0]], [tuple(card) for card in cards[1]],
+               int(rng.integers(4, 13)), int(rng.integers(4, 13)), int(rng.integers(0, 6)), int(rng.integers(0, 6)))
+
+
+@pytest.mark.parametrize('state', list(_random_states(40, seed=1)))
+def test_solve_matches_exhaustive_search(state):
+    my_cards, their_cards, my_life, their_life, my_pills, their_pills = state
+
+    result = BattleSolver().solve(my_cards, their_cards, my_life, their_life, my_pills, their_pills)
+
+    args = (my_life, their_life, my_pills, their_pills, tuple(my_cards), tuple(their_cards))
+    assert result['value'] == _exhaustive(my_life, their_life, my_pills, their_pills,
+                                          tuple(sorted(my_cards)), tuple(sorted(their_cards)))
+    assert _move_value(*args, result['card'], result['pills']) == result['value']
+    # Из равноценных ходов - с наименьшим числом пилюль
+    assert all(_move_value(*args, index, pills) < result['value']
+               for index in range(len(my_cards)) for pills in range(result['pills']))
+
+
+@pytest.mark.parametrize('state', list(_random_states(20, seed=2)))
+def test_respond_matches_exhaustive_search(state):
+    my_cards, their_cards, my_life, their_life, my_pills, their_pills = state
+    their_card, their_pills_used = 1, min(2, their_pills)
+
+    result = BattleSolver().respond(my_cards, their_cards, their_card, their_pills_used,
+                                    my_life, their_life, my_pills, their_pills)
+
+    # Итог для отвечающего - итог для ходившего первым со знаком минус
+    args = (their_life, my_life, their_pills, my_pills, tuple(their_cards), tuple(my_cards), their_card,
+            their_pills_used)
+    values = {(index, pills): -_reply_value(*args, index, pills)
+              for index in range(len(my_cards)) for pills in range(my_pills + 1)}
+    assert result['value'] == max(values.values())
+    assert values[(result['card'], result['pills'])] == result['value']
+
+
+def test_transposition_table_stays_within_bound():
+    max_entries = 500
+    solver = BattleSolver(max_entries)
+    reference = BattleSolver()
+
+    for my_cards, their_cards, my_life, their_life, my_pills, their_pills in _random_states(10, seed=3):
+        args = (my_cards, their_cards, my_life, their_life, my_pills + 4, their_pills + 4)
+        assert solver.solve(*args) == reference.solve(*args)
+        assert solver.stats()['entries'] <= max_entries
+
+    assert solver.stats()['evictions'] > 0
@@ -0,0 +1,17 @@
+"""Загрузка данных обучения: таблица боёв не копируется в память"""
+
+import numpy as np
+
+from benchmark import _prepare_suite_dataset
+from train_models import UrbanRivalsMLTrainer
+
+
+def test_battle_features_stay_memory_mapped(tmp_path):
+    _prepare_suite_dataset(tmp_path / 'data', 1_000, seed=42)
+    trainer = UrbanRivalsMLTrainer(str(tmp_path / 'data'), str(tmp_path / 'models'))
+
+    data = trainer.load_training_data(['battle'])
+
+    parts = data['battle_features']
+    assert sum(len(part['battle_id']) for part in parts) == 1_000
+    assert all(isinstance(values, np.memmap) for part in parts for values in part.values())
@@ -4,25 +4,164 @@ Urban Rivals ML Model Training
 Обучение ML моделей для Urban Rivals консультанта
 """
 
-import tensorflow as tf
+import argparse
+import os
+import shutil
+import time
 import numpy as np
 import pandas as pd
 import json
 from pathlib import Path
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingRegressor
-from sklearn.metrics import accuracy_score, mean_squared_error, classification_report
-import joblib
-import tensorflowjs as tfjs
-from typing import Dict, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any
+
+# TensorFlow, TensorFlow.js, sklearn и joblib импортируются внутри этапов, которым они нужны:
+# --help, метаданные и обучение одного Random Forest не ждут несколько секунд инициализации TensorFlow
+
+from features import (SEQUENCE_FEATURES, STRATEGY_FEATURES, STRATEGY_LABELS, category_codes,
+                      deck_strategy_features)
+from input_pipeline import (DEFAULT_BATCH_SIZE, SUBSETS, array_column, array_parts, columns_fn, fit_scaler, last_id,
+                            make_datasets, parts_after, prepared_datasets, subset_codes, subset_sizes, table_parts,
+                            write_prepared)
+from instrumentation import add_instrumentation_args, configure_from_args, instrumentation, instrumented
+from market import RARITIES
+from market_features import (PRICE_FORECAST_HORIZON, forecast_input_names, forecast_inputs, forecast_subset_codes,
+                             forecast_targets)
+from matchups import MATCHUP_FILE, build_matchup_table
+from model_bundle import BUNDLE_FILE, QUANTIZATIONS, bundle_predict, dense_layers, read_bundle, write_bundle
+from sharding import run_shards
+from simulator import WINNER_LABELS
+from storage import read_manifest, read_table
+
+# Варианты модели предсказания боёв: dense - по признакам первого раунда,
+# sequence - рекуррентная сеть по последовательности всех раундов (battle_sequences/)
+BATTLE_MODELS = ['dense', 'sequence']
+
+BATTLE_INPUT_FEATURES = ['player_total_attack', 'opponent_total_attack',
+                         'attack_difference', 'player_pills_used', 'opponent_pills_used']
+
+# Нормализованные выборки float32 для модели боёв (data_dir/prepared/battle_features/<выборка>/)
+PREPARED_DIR = "prepared"
+
+# Независимые задачи обучения (ключ в models_info для модели боёв зависит от battle_model)
+MODEL_JOBS = ['battle', 'card', 'strategy', 'price']
+
+# Задачи только на sklearn (без TensorFlow). По умолчанию не запускаются:
+# Random Forest стратегий обучается и в задаче strategy - для сравнения с нейросетью
+SKLEARN_JOBS = ['strategy_rf']
+
+# Этапы CLI (--stages): задачи обучения, метаданные, бинарный бандл, таблица исходов пар карт
+TRAINING_STAGES = MODEL_JOBS + SKLEARN_JOBS + ['metadata', 'bundle', 'matchups']
+DEFAULT_STAGES = MODEL_JOBS + ['metadata', 'bundle', 'matchups']
+
+# Таблицы датасета для задач обучения (load_training_data читает только нужные)
+JOB_TABLES = {
+    'battle': ['battle_features'],
+    'card': ['card_features', 'card_outcomes'],
+    'strategy': ['card_features'],
+    'strategy_rf': ['card_features'],
+    'price': ['market_features']
+}
+
+# Описания моделей в метаданных, которые обновляет задача; описания моделей,
+# не обучавшихся в этом запуске, переносятся из прежних models_metadata.json
+METADATA_MODELS = {
+    'battle': ['battle_predictor', 'battle_sequence_predictor'],
+    'card': ['card_recommender'],
+    'strategy': ['strategy_classifier', 'strategy_forest'],
+    'strategy_rf': ['strategy_forest'],
+    'price': ['price_forecaster']
+}
+STRATEGY_FOREST_FILES = ['strategy_rf.pkl', 'strategy_scaler.pkl', 'strategy_label_encoder.pkl']
+
+# Небольшие выборки в памяти (карты, синтетические колоды) обучаются прежними маленькими батчами
+SMALL_BATCH_SIZE = 32
+
+CARD_INPUT_FEATURES = ['clan_encoded', 'rarity_encoded', 'max_power', 'max_damage',
+                       'has_ability', 'power_damage_ratio', 'total_stats']
+
+# Гиперпараметры полносвязных моделей: units - размеры скрытых слоёв, dropout - Dropout после первых
+# len(dropout) скрытых слоёв, epochs - наибольшее число эпох. Лучшие найденные tuning.py лежат в
+# LEADERBOARD_FILE и применяются с --tuned. batch_size модели боёв по умолчанию - --batch-size.
+DEFAULT_HYPERPARAMS = {
+    'battle': {'units': [64, 32, 16], 'dropout': [0.2, 0.2], 'learning_rate': 1e-3,
+               'batch_size': DEFAULT_BATCH_SIZE, 'epochs': 50},
+    'card': {'units': [128, 64, 32, 16], 'dropout': [0.3, 0.3], 'learning_rate': 1e-3,
+             'batch_size': SMALL_BATCH_SIZE, 'epochs': 100},
+    'strategy': {'units': [64, 32, 16], 'dropout': [0.3, 0.2], 'learning_rate': 1e-3,
+                 'batch_size': SMALL_BATCH_SIZE, 'epochs': 50},
+    'price': {'units': [64, 32], 'dropout': [0.2], 'learning_rate': 1e-3,
+              'batch_size': DEFAULT_BATCH_SIZE, 'epochs': 50}
+}
+LEADERBOARD_FILE = "tuning_leaderboard.json"
+
+# Модели бинарного бандла для расширения (ключ metadata['models'] -> сохранённые файлы)
+BUNDLE_MODELS = {
+    'battle_predictor': {'model': 'battle_predictor.h5', 'scaler': 'battle_scaler.pkl',
+                         'label_encoder': 'battle_label_encoder.pkl'},
+    'card_recommender': {'model': 'card_recommender.h5', 'scaler': 'card_scaler.pkl'},
+    'strategy_classifier': {'model': 'strategy_classifier.h5', 'scaler': 'strategy_scaler.pkl',
+                            'label_encoder': 'strategy_label_encoder.pkl'},
+    'price_forecaster': {'model': 'price_forecaster.h5', 'scaler': 'price_scaler.pkl'}
+}
+BUNDLE_CHECK_ROWS = 256
+
+# Обучение по val_loss: остановка, когда loss не улучшается EARLY_STOPPING_PATIENCE эпох (веса - с лучшей эпохи),
+# шаг делится на 2 после LR_PLATEAU_PATIENCE эпох без улучшения
+EARLY_STOPPING_PATIENCE = 5
+LR_PLATEAU_PATIENCE = 2
+LR_PLATEAU_FACTOR = 0.5
+MIN_LEARNING_RATE = 1e-5
+
+# Резервные копии обучения (models_dir/checkpoints/<модель>): после сбоя обучение продолжается с последней копии
+CHECKPOINTS_DIR = "checkpoints"
+
+# Дообучение прежней модели только на новых боях - с шагом меньше исходного (adam: 1e-3).
+# Меньше WARM_START_MIN_BATTLES новых боёв (или пустая проверочная/тестовая выборка по хэшу battle_id) -
+# полное переобучение: на такой выборке нечего отслеживать ранней остановке и не на чем оценить модель
+WARM_START_LEARNING_RATE = 1e-4
+WARM_START_MIN_BATTLES = 1000
+
+
+def _model_outputs(model_name: str, *sklearn_files: str):
+    """Файлы модели в models_dir тренера (для замеров bytes_written)"""
+    def outputs(arguments: Dict[str, Any]) -> List[Path]:
+        models_dir = arguments['self'].models_dir
+        return ([models_dir / "tensorflow" / f"{model_name}.h5", models_dir / "tensorflowjs" / model_name] +
+                [models_dir / "sklearn" / name for name in sklearn_files])
+    return outputs
 
 class UrbanRivalsMLTrainer:
     """Класс для обучения ML моделей Urban Rivals"""
     
-    def __init__(self, data_dir: str = "datasets", models_dir: str = "trained_models"):
+    def __init__(self, data_dir: str = "datasets", models_dir: str = "trained_models",
+                 battle_model: str = 'dense', batch_size: int = DEFAULT_BATCH_SIZE,
+                 n_jobs: Optional[int] = None, strategy_samples: int = 5000, epochs: Optional[int] = None,
+                 bundle_quantization: str = 'float16', early_stopping_patience: int = EARLY_STOPPING_PATIENCE,
+                 lr_patience: int = LR_PLATEAU_PATIENCE, checkpoint_steps: Optional[int] = None,
+                 resume: bool = True, warm_start: bool = False,
+                 hyperparams: Optional[Dict[str, Dict[str, Any]]] = None):
+        if battle_model not in BATTLE_MODELS:
+            raise ValueError(f"Неизвестная модель боёв: {battle_model}. Доступные: {BATTLE_MODELS}")
+        if bundle_quantization not in QUANTIZATIONS:
+            raise ValueError(f"Неизвестная квантизация: {bundle_quantization}. Доступные: {QUANTIZATIONS}")
         self.data_dir = Path(data_dir)
         self.models_dir = Path(models_dir)
+        self.battle_model = battle_model
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs or -1  # потоки sklearn; -1 - все ядра
+        self.strategy_samples = strategy_samples
+        self.epochs = epochs  # если задано - вместо количества эпох по умолчанию у каждой модели
+        self.bundle_quantization = bundle_quantization
+        self.early_stopping_patience = early_stopping_patience  # 0 - без ранней остановки
+        self.lr_patience = lr_patience  # 0 - постоянный шаг
+        self.checkpoint_steps = checkpoint_steps  # резервная копия каждые N батчей (None - после каждой эпохи)
+        self.resume = resume  # продолжать с резервной копии прерванного обучения, если она есть
+        self.warm_start = warm_start  # модели боёв: дообучить прежнюю модель на боях после прошлого обучения
+        # Гиперпараметры по задачам: DEFAULT_HYPERPARAMS, поверх - переданные (например, из tuning.py)
+        self.hyperparams = {job: dict(params) for job, params in DEFAULT_HYPERPARAMS.items()}
+        self.hyperparams['battle']['batch_size'] = batch_size
+        for job, params in (hyperparams or {}).items():
+            self.hyperparams[job].update(params)
         self.models_dir.mkdir(exist_ok=True)
         
         # Создаём папки для разных типов моделей
@@ -30,337 +169,600 @@ class UrbanRivalsMLTrainer:
         (self.models_dir / "sklearn").mkdir(exist_ok=True)
         (self.models_dir / "tensorflowjs").mkdir(exist_ok=True)
     
-    def load_training_data(self) -> Dict[str, pd.DataFrame]:
-        """Загружает тренировочные данные"""
+    @instrumented('load_training_data',
+                  rows_out=lambda data: sum(len(part['battle_id']) for part in data.get('battle_features', ())))
+    def load_training_data(self, jobs: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Загружает тренировочные данные - только таблицы, нужные задачам jobs (по умолчанию MODEL_JOBS)"""
         print("📁 Загрузка тренировочных данных...")
+        jobs = jobs or MODEL_JOBS
+        names = {name for job in jobs for name in JOB_TABLES[job]}
+        if self.battle_model == 'sequence':
+            # Последовательной модели боёв признаки первого раунда не нужны
+            names.discard('battle_features')
         
         try:
-            card_features = pd.read_csv(self.data_dir / "card_features.csv")
-            battle_features = pd.read_csv(self.data_dir / "battle_features.csv")
+            data = {name: self._load_table(name) for name in ['card_features', 'card_outcomes'] if name in names}
+            if 'battle_features' in names:
+                # Части таблицы боёв отображаются в память и читаются конвейером, без копии в DataFrame
+                data['battle_features'] = self._table_parts('battle_features')
             
-            print(f"✅ Загружено {len(card_features)} карт и {len(battle_features)} боёв")
+            if 'card_features' in data:
+                print(f"✅ Загружено {len(data['card_features'])} карт")
+            if 'battle_features' in data:
+                num_battles = sum(len(part['battle_id']) for part in data['battle_features'])
+                print(f"✅ Загружено {num_battles} боёв")
             
-            return {
-                'card_features': card_features,
-                'battle_features': battle_features
-            }
+            if 'battle' in jobs and self.battle_model == 'sequence':
+                if read_manifest(self.data_dir / "battle_sequences") is None:
+                    raise FileNotFoundError(self.data_dir / "battle_sequences")
+                # Части с массивом int8 (боёв x раундов x признаков) отображаются в память без копирования
+                data['battle_sequences'] = table_parts(self.data_dir / "battle_sequences")
+                num_sequences = sum(len(part['winner']) for part in data['battle_sequences'])
+                print(f"✅ Загружено {num_sequences} последовательностей раундов")
+            
+            if 'market_features' in names:
+                if read_manifest(self.data_dir / "market_features") is None:
+                    raise FileNotFoundError(self.data_dir / "market_features")
+                data['market_features'] = table_parts(self.data_dir / "market_features")
+                num_rows = sum(len(part['price']) for part in data['market_features'])
+                print(f"✅ Загружено {num_rows} строк признаков рынка")
+            return data
         except FileNotFoundError as e:
             print(f"❌ Ошибка: файлы с данными не найдены. Сначала запустите dataset.py")
             raise e
     
-    def train_battle_predictor(self, battle_features: pd.DataFrame) -> Dict[str, Any]:
-        """Обучает модель предсказания результата боя"""
-        print("⚔️ Обучение модели предсказания боёв...")
+    def _load_table(self, name: str) -> pd.DataFrame:
+        """Читает колоночную таблицу датасета (с отображением в память); CSV - для старых датасетов"""
+        if read_manifest(self.data_dir / name) is not None:
+            return read_table(self.data_dir / name)
+        return pd.read_csv(self.data_dir / f"{name}.csv")
+    
+    def _table_parts(self, name: str) -> List[Any]:
+        """Части таблицы для tf.data: с диска (по частям, в отображении в память); CSV - одной частью"""
+        if read_manifest(self.data_dir / name) is not None:
+            return table_parts(self.data_dir / name)
+        return [pd.read_csv(self.data_dir / f"{name}.csv")]
+    
+    @instrumented('train_battle', rows_in=lambda a: sum(len(part['battle_id']) for part in a['battle_features']),
+                  outputs=_model_outputs('battle_predictor', 'battle_scaler.pkl', 'battle_label_encoder.pkl'))
+    def train_battle_predictor(self, battle_features: List[Any]) -> Dict[str, Any]:
+        """Обучает модель предсказания результата боя по частям таблицы battle_features (load_training_data).
         
-        # Подготовка данных
-        X = battle_features[['player_total_attack', 'opponent_total_attack', 
-                            'attack_difference', 'player_pills_used', 'opponent_pills_used']]
-        y = battle_features['winner']
+        С warm_start дообучает прежнюю модель только на боях, появившихся после её обучения,
+        с прежними скейлером и энкодером (входы модели не меняются). Если новых боёв меньше
+        WARM_START_MIN_BATTLES или какая-то выборка по хэшу пуста - обучает модель заново на всех боях.
+        """
+        import joblib
+        from sklearn.preprocessing import LabelEncoder
         
-        # Кодирование меток
-        label_encoder = LabelEncoder()
-        y_encoded = label_encoder.fit_transform(y)
+        print("⚔️ Обучение модели предсказания боёв...")
         
-        # Разделение на train/test
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y_encoded, test_size=0.2, random_state=42
-        )
+        # Подготовка данных: части таблицы читаются конвейером tf.data
+        parts = battle_features
+        features = columns_fn(BATTLE_INPUT_FEATURES)
+        trained_battle_id = last_id(parts)
         
-        # Нормализация
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+        previous = self._previous_battle_model('battle_predictor')
+        if previous is not None:
+            new_parts = parts_after(parts, previous['trained_battle_id'])
+            if not new_parts:
+                print("✅ Новых боёв нет: модель предсказания боёв не изменилась")
+                return {**previous, 'accuracy': previous['info']['accuracy'], 'new_battles': 0}
+            if self._warm_start_possible('battle_predictor', new_parts):
+                parts = new_parts
+            else:
+                previous = None
+        if previous is not None:
+            scaler = joblib.load(self.models_dir / "sklearn" / "battle_scaler.pkl")
+            label_encoder = joblib.load(self.models_dir / "sklearn" / "battle_label_encoder.pkl")
+        else:
+            # Пустая выборка по хэшу - понятная ошибка до обучения скейлера
+            require_subsets('battle_predictor', subset_sizes(parts))
+            # Кодирование меток и нормализация (статистики - по обучающей выборке, часть за частью)
+            label_encoder = LabelEncoder().fit(WINNER_LABELS)
+            scaler = fit_scaler(parts, features)
         
-        # Создание TensorFlow модели
-        model = tf.keras.Sequential([
-            tf.keras.layers.Dense(64, activation='relu', input_shape=(X_train.shape[1],)),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(32, activation='relu'),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(16, activation='relu'),
-            tf.keras.layers.Dense(3, activation='softmax')  # 3 класса: player, opponent, draw
-        ])
+        labels = battle_labels(label_encoder)
         
-        model.compile(
-            optimizer='adam',
-            loss='sparse_categorical_crossentropy',
-            metrics=['accuracy']
-        )
+        # Выборки по хэшу battle_id нормализуются один раз и пишутся частями float32:
+        # эпохи читают готовые признаки с диска, в памяти - только буфер перемешивания
+        prepared_dir = self.data_dir / PREPARED_DIR / "battle_features"
+        sizes = write_prepared(parts, features, labels, prepared_dir, scaler)
+        print(f"📦 Выборки: {', '.join(f'{subset} {rows}' for subset, rows in sizes.items())}")
+        params = self.hyperparams['battle']
+        datasets = prepared_datasets(prepared_dir, batch_size=params['batch_size'])
+        
+        if previous is not None:
+            model = previous['model']
+        else:
+            # Создание TensorFlow модели: 3 класса - player, opponent, draw
+            model = dense_model(len(BATTLE_INPUT_FEATURES), params, len(WINNER_LABELS), 'softmax')
+            compile_model(model, params, 'sparse_categorical_crossentropy', 'accuracy')
         
         # Обучение
-        history = model.fit(
-            X_train_scaled, y_train,
-            epochs=50,
-            batch_size=32,
-            validation_split=0.2,
-            verbose=1
-        )
+        history = self._fit(model, "battle_predictor", datasets, params['epochs'])
         
         # Оценка
-        y_pred = model.predict(X_test_scaled)
-        y_pred_classes = np.argmax(y_pred, axis=1)
-        accuracy = accuracy_score(y_test, y_pred_classes)
+        accuracy = model.evaluate(datasets['test'], verbose=0)[1]
         
         print(f"✅ Точность модели предсказания боёв: {accuracy:.3f}")
         
-        # Сохранение TensorFlow модели
-        model.save(self.models_dir / "tensorflow" / "battle_predictor.h5")
+        # Сохранение TensorFlow модели и конвертация в TensorFlow.js
+        self._save_keras_model(model, "battle_predictor")
         
         # Сохранение скейлера и энкодера
         joblib.dump(scaler, self.models_dir / "sklearn" / "battle_scaler.pkl")
         joblib.dump(label_encoder, self.models_dir / "sklearn" / "battle_label_encoder.pkl")
         
-        # Конвертация в TensorFlow.js
-        tfjs.converters.save_keras_model(
-            model, 
-            str(self.models_dir / "tensorflowjs" / "battle_predictor")
-        )
-        
         return {
             'model': model,
             'scaler': scaler,
             'label_encoder': label_encoder,
             'accuracy': accuracy,
-            'history': history
+            'history': history,
+            'epochs_trained': _epochs_trained(history),
+            'trained_battle_id': trained_battle_id,
+            'new_battles': sum(len(part['battle_id']) for part in parts)
         }
     
-    def train_card_recommender(self, card_features: pd.DataFrame, battle_features: pd.DataFrame) -> Dict[str, Any]:
-        """Обучает модель рекомендации карт"""
-        print("🃏 Обучение модели рекомендации карт...")
+    @instrumented('train_battle', rows_in=lambda a: sum(len(part['winner']) for part in a['battle_sequences']),
+                  outputs=_model_outputs('battle_sequence_predictor'))
+    def train_battle_sequence_model(self, battle_sequences: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        """Обучает модель предсказания результата боя по последовательности всех раундов"""
+        import tensorflow as tf
         
-        # Создаём целевую переменную на основе успешности карт в боях
-        card_success_rates = {}
-        
-        # Анализируем успешность каждой карты
-        for _, battle in battle_features.iterrows():
-            winner = battle['winner']
-            if winner in ['player', 'opponent']:
-                # Здесь упрощённая логика - в реальности нужны данные о конкретных картах в боях
-                attack_diff = battle['attack_difference']
-                success_score = 1 if attack_diff > 0 else 0
-                
-                # Псевдо-связывание с картами (в реальности нужна более сложная логика)
-                card_id = f"card_{np.random.randint(1, len(card_features) + 1)}"
-                if card_id not in card_success_rates:
-                    card_success_rates[card_id] = []
-                card_success_rates[card_id].append(success_score)
-        
-        # Вычисляем средние показатели успешности
-        for card_id in card_success_rates:
-            card_success_rates[card_id] = np.mean(card_success_rates[card_id])
-        
-        # Подготовка данных для обучения
-        X = card_features[['clan_encoded', 'rarity_encoded', 'max_power', 'max_damage', 
-                          'has_ability', 'power_damage_ratio', 'total_stats']]
-        
-        # Создаём целевую переменную (рейтинг карты)
-        y = []
-        for _, card in card_features.iterrows():
-            card_id = card['card_id']
-            success_rate = card_success_rates.get(card_id, 0.5)  # По умолчанию 0.5
-            # Комбинируем успешность и статистики
-            rating = success_rate * 0.7 + (card['total_stats'] / 20) * 0.3
-            y.append(rating)
-        
-        y = np.array(y)
-        
-        # Разделение на train/test
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
+        print("⚔️ Обучение последовательной модели предсказания боёв...")
         
-        # Нормализация
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+        trained_battle_id = last_id(battle_sequences)
+        previous = self._previous_battle_model('battle_sequence_predictor')
+        if previous is not None:
+            new_sequences = parts_after(battle_sequences, previous['trained_battle_id'])
+            if not new_sequences:
+                print("✅ Новых боёв нет: последовательная модель не изменилась")
+                return {**previous, 'accuracy': previous['info']['accuracy'],
+                        'input_shape': previous['info']['input_shape'], 'new_battles': 0}
+            if self._warm_start_possible('battle_sequence_predictor', new_sequences):
+                battle_sequences = new_sequences
+            else:
+                previous = None
+        require_subsets('battle_sequence_predictor', subset_sizes(battle_sequences))
         
-        # Создание TensorFlow модели
-        model = tf.keras.Sequential([
-            tf.keras.layers.Dense(128, activation='relu', input_shape=(X_train.shape[1],)),
-            tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(64, activation='relu'),
-            tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(32, activation='relu'),
-            tf.keras.layers.Dense(16, activation='relu'),
-            tf.keras.layers.Dense(1, activation='sigmoid')  # Рейтинг от 0 до 1
-        ])
+        # Данные остаются в int8 на диске, в float32 переводятся только блоки в конвейере
+        datasets = make_datasets(battle_sequences, array_column('rounds'), array_column('winner'),
+                                 batch_size=self.batch_size)
         
-        model.compile(
-            optimizer='adam',
-            loss='mse',
-            metrics=['mae']
-        )
+        if previous is not None:
+            # Нормализатор с прежними статистиками - часть загруженной модели
+            model = previous['model']
+        else:
+            # Нормализация внутри модели: статистики считаются по первым батчам обучающей выборки,
+            # отдельный скейлер для TensorFlow.js не нужен
+            normalizer = tf.keras.layers.Normalization(axis=-1)
+            normalizer.adapt(datasets['train'].map(lambda x, y: x).take(max(1, 100_000 // self.batch_size)))
+            
+            # Несыгранные раунды дополнены нулями, признак played позволяет сети их различать
+            model = tf.keras.Sequential([
+                tf.keras.layers.Input(shape=battle_sequences[0]['rounds'].shape[1:]),
+                normalizer,
+                tf.keras.layers.GRU(64),
+                tf.keras.layers.Dropout(0.2),
+                tf.keras.layers.Dense(32, activation='relu'),
+                tf.keras.layers.Dense(len(WINNER_LABELS), activation='softmax')
+            ])
+            
+            model.compile(
+                optimizer='adam',
+                loss='sparse_categorical_crossentropy',
+                metrics=['accuracy']
+            )
         
         # Обучение
-        history = model.fit(
-            X_train_scaled, y_train,
-            epochs=100,
-            batch_size=32,
-            validation_split=0.2,
-            verbose=1
-        )
+        history = self._fit(model, "battle_sequence_predictor", datasets, 20)
         
         # Оценка
-        y_pred = model.predict(X_test_scaled)
-        mse = mean_squared_error(y_test, y_pred)
+        accuracy = model.evaluate(datasets['test'], verbose=0)[1]
+        
+        print(f"✅ Точность последовательной модели предсказания боёв: {accuracy:.3f}")
+        
+        # Сохранение TensorFlow модели и конвертация в TensorFlow.js
+        self._save_keras_model(model, "battle_sequence_predictor")
+        
+        return {
+            'model': model,
+            'accuracy': accuracy,
+            'input_shape': list(model.input_shape[1:]),
+            'history': history,
+            'epochs_trained': _epochs_trained(history),
+            'trained_battle_id': trained_battle_id,
+            'new_battles': sum(len(part['battle_id']) for part in battle_sequences)
+        }
+    
+    @instrumented('train_card', rows_in=lambda a: len(a['card_features']),
+                  outputs=_model_outputs('card_recommender', 'card_scaler.pkl'))
+    def train_card_recommender(self, card_features: pd.DataFrame, card_outcomes: pd.DataFrame) -> Dict[str, Any]:
+        """Обучает модель рекомендации карт"""
+        import joblib
+        
+        print("🃏 Обучение модели рекомендации карт...")
+        
+        # Разделение на train/validation/test и нормализация
+        parts = self._card_parts(card_features, card_outcomes)
+        scaler = fit_scaler(parts, array_column('X'))
+        params = self.hyperparams['card']
+        datasets = make_datasets(parts, array_column('X'), array_column('y'), scaler=scaler,
+                                 batch_size=params['batch_size'])
+        
+        # Создание TensorFlow модели: рейтинг от 0 до 1
+        model = dense_model(len(CARD_INPUT_FEATURES), params, 1, 'sigmoid')
+        compile_model(model, params, 'mse', 'mae')
+        
+        # Обучение
+        history = self._fit(model, "card_recommender", datasets, params['epochs'])
+        
+        # Оценка (loss модели - MSE)
+        mse = model.evaluate(datasets['test'], verbose=0)[0]
         
         print(f"✅ MSE модели рекомендации карт: {mse:.4f}")
         
-        # Сохранение модели
-        model.save(self.models_dir / "tensorflow" / "card_recommender.h5")
+        # Сохранение модели (и конвертация в TensorFlow.js)
+        self._save_keras_model(model, "card_recommender")
         joblib.dump(scaler, self.models_dir / "sklearn" / "card_scaler.pkl")
         
-        # Конвертация в TensorFlow.js
-        tfjs.converters.save_keras_model(
-            model, 
-            str(self.models_dir / "tensorflowjs" / "card_recommender")
-        )
-        
         return {
             'model': model,
             'scaler': scaler,
             'mse': mse,
-            'history': history
+            'history': history,
+            'epochs_trained': _epochs_trained(history)
         }
     
+    @instrumented('train_strategy', rows_in=lambda a: a['self'].strategy_samples,
+                  outputs=_model_outputs('strategy_classifier', 'strategy_rf.pkl', 'strategy_scaler.pkl',
+                                         'strategy_label_encoder.pkl'))
     def train_strategy_classifier(self, card_features: pd.DataFrame) -> Dict[str, Any]:
         """Обучает классификатор стратегий колод"""
-        print("🎯 Обучение классификатора стратегий...")
-        
-        # Создаём стратегии на основе характеристик карт
-        strategies = []
-        strategy_labels = []
+        import joblib
         
-        # Генерируем случайные колоды и определяем их стратегии
-        for _ in range(5000):
-            # Случайная колода из 4 карт
-            deck = card_features.sample(4)
-            
-            avg_power = deck['max_power'].mean()
-            avg_damage = deck['max_damage'].mean()
-            total_stats = deck['total_stats'].sum()
-            clan_diversity = deck['clan_encoded'].nunique()
-            ability_count = deck['has_ability'].sum()
-            
-            # Определяем стратегию
-            if avg_power > 7.5:
-                strategy = 'power_focused'
-            elif avg_damage > 6:
-                strategy = 'damage_focused'
-            elif clan_diversity <= 2:
-                strategy = 'mono_clan'
-            elif ability_count >= 3:
-                strategy = 'ability_focused'
-            else:
-                strategy = 'balanced'
-            
-            strategies.append([avg_power, avg_damage, total_stats, clan_diversity, ability_count])
-            strategy_labels.append(strategy)
-        
-        X = np.array(strategies)
-        y = np.array(strategy_labels)
-        
-        # Кодирование меток
-        label_encoder = LabelEncoder()
-        y_encoded = label_encoder.fit_transform(y)
-        
-        # Разделение на train/test
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y_encoded, test_size=0.2, random_state=42
-        )
+        print("🎯 Обучение классификатора стратегий...")
         
-        # Нормализация
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+        decks = self._strategy_decks(card_features)
+        X, label_encoder, scaler = decks['X'], decks['label_encoder'], decks['scaler']
+        params = self.hyperparams['strategy']
+        datasets = make_datasets(decks['parts'], array_column('X'), array_column('y'), scaler=scaler,
+                                 batch_size=params['batch_size'])
         
         # Random Forest для сравнения
-        rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-        rf_model.fit(X_train_scaled, y_train)
-        rf_accuracy = rf_model.score(X_test_scaled, y_test)
+        rf_model, rf_accuracy = self._fit_strategy_forest(decks)
         
         # Создание TensorFlow модели
-        model = tf.keras.Sequential([
-            tf.keras.layers.Dense(64, activation='relu', input_shape=(X_train.shape[1],)),
-            tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(32, activation='relu'),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(16, activation='relu'),
-            tf.keras.layers.Dense(len(label_encoder.classes_), activation='softmax')
-        ])
-        
-        model.compile(
-            optimizer='adam',
-            loss='sparse_categorical_crossentropy',
-            metrics=['accuracy']
-        )
+        model = dense_model(X.shape[1], params, len(label_encoder.classes_), 'softmax')
+        compile_model(model, params, 'sparse_categorical_crossentropy', 'accuracy')
         
         # Обучение
-        history = model.fit(
-            X_train_scaled, y_train,
-            epochs=50,
-            batch_size=32,
-            validation_split=0.2,
-            verbose=1
-        )
+        history = self._fit(model, "strategy_classifier", datasets, params['epochs'])
         
         # Оценка
-        tf_accuracy = model.evaluate(X_test_scaled, y_test, verbose=0)[1]
+        tf_accuracy = model.evaluate(datasets['test'], verbose=0)[1]
         
         print(f"✅ Точность Random Forest: {rf_accuracy:.3f}")
         print(f"✅ Точность TensorFlow модели: {tf_accuracy:.3f}")
         
-        # Сохранение моделей
-        model.save(self.models_dir / "tensorflow" / "strategy_classifier.h5")
+        # Сохранение моделей (и конвертация в TensorFlow.js)
+        self._save_keras_model(model, "strategy_classifier")
         joblib.dump(rf_model, self.models_dir / "sklearn" / "strategy_rf.pkl")
         joblib.dump(scaler, self.models_dir / "sklearn" / "strategy_scaler.pkl")
         joblib.dump(label_encoder, self.models_dir / "sklearn" / "strategy_label_encoder.pkl")
         
-        # Конвертация в TensorFlow.js
-        tfjs.converters.save_keras_model(
-            model, 
-            str(self.models_dir / "tensorflowjs" / "strategy_classifier")
-        )
-        
         return {
             'tf_model': model,
             'rf_model': rf_model,
             'scaler': scaler,
             'label_encoder': label_encoder,
             'tf_accuracy': tf_accuracy,
+            'rf_accuracy': rf_accuracy,
+            'history': history,
+            'epochs_trained': _epochs_trained(history)
+        }
+    
+    @instrumented('train_strategy_rf', rows_in=lambda a: a['self'].strategy_samples,
+                  outputs=lambda a: [a['self'].models_dir / "sklearn" / name for name in STRATEGY_FOREST_FILES])
+    def train_strategy_forest(self, card_features: pd.DataFrame) -> Dict[str, Any]:
+        """Обучает только Random Forest классификатор стратегий (sklearn, без TensorFlow)"""
+        import joblib
+        
+        print("🌲 Обучение Random Forest классификатора стратегий...")
+        
+        decks = self._strategy_decks(card_features)
+        rf_model, rf_accuracy = self._fit_strategy_forest(decks)
+        
+        print(f"✅ Точность Random Forest: {rf_accuracy:.3f}")
+        
+        # Скейлер и энкодер совпадают с сохраняемыми train_strategy_classifier (те же колоды и сид)
+        for name, value in zip(STRATEGY_FOREST_FILES, [rf_model, decks['scaler'], decks['label_encoder']]):
+            joblib.dump(value, self.models_dir / "sklearn" / name)
+        
+        return {
+            'rf_model': rf_model,
+            'scaler': decks['scaler'],
+            'label_encoder': decks['label_encoder'],
             'rf_accuracy': rf_accuracy
         }
     
+    @instrumented('train_price', rows_in=lambda a: sum(len(part['price']) for part in a['market_features']),
+                  outputs=_model_outputs('price_forecaster', 'price_scaler.pkl'))
+    def train_price_forecaster(self, market_features: List[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+        """Обучает модель прогноза цены карты: лог-доходность за PRICE_FORECAST_HORIZON дней по признакам рынка"""
+        import joblib
+        
+        print("📈 Обучение модели прогноза цен...")
+        
+        prices = self._price_parts(market_features)
+        params = self.hyperparams['price']
+        scaler = fit_scaler(prices['parts'], prices['features'])
+        datasets = make_datasets(prices['parts'], prices['features'], columns_fn(['target']), scaler=scaler,
+                                 batch_size=params['batch_size'])
+        
+        # Создание TensorFlow модели: линейный выход - доходность без ограничения диапазона
+        model = dense_model(len(prices['input_features']), params, 1, 'linear')
+        compile_model(model, params, 'mse', 'mae')
+        
+        # Обучение
+        history = self._fit(model, "price_forecaster", datasets, params['epochs'])
+        
+        # Оценка; для сравнения - прогноз "цена не изменится" (нулевая доходность)
+        mse, mae = model.evaluate(datasets['test'], verbose=0)[:2]
+        test_targets = np.concatenate([np.asarray(part['target'])[part['subset'] == SUBSETS.index('test')]
+                                       for part in prices['parts']])
+        baseline_mae = float(np.abs(test_targets).mean())
+        
+        print(f"✅ MAE модели прогноза цен: {mae:.4f} (без изменения цены: {baseline_mae:.4f})")
+        
+        # Сохранение модели (и конвертация в TensorFlow.js)
+        self._save_keras_model(model, "price_forecaster")
+        joblib.dump(scaler, self.models_dir / "sklearn" / "price_scaler.pkl")
+        
+        return {
+            'model': model,
+            'scaler': scaler,
+            'mse': mse,
+            'mae': mae,
+            'baseline_mae': baseline_mae,
+            'input_features': prices['input_features'],
+            'windows': prices['windows'],
+            'history': history,
+            'epochs_trained': _epochs_trained(history)
+        }
+    
+    def tuning_inputs(self, job: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Данные и описание полносвязной модели задачи для поиска гиперпараметров (tuning.py).
+        
+        Те же признаки, метки, разбиение и скейлер, что при обучении: {'parts', 'features', 'labels',
+        'scaler', 'input_dim', 'outputs', 'activation', 'loss', 'metric'}.
+        """
+        from sklearn.preprocessing import LabelEncoder
+        
+        if job == 'battle':
+            parts = data['battle_features']
+            features = columns_fn(BATTLE_INPUT_FEATURES)
+            return {'parts': parts, 'features': features, 'labels': battle_labels(LabelEncoder().fit(WINNER_LABELS)),
+                    'scaler': fit_scaler(parts, features), 'input_dim': len(BATTLE_INPUT_FEATURES),
+                    'outputs': len(WINNER_LABELS), 'activation': 'softmax',
+                    'loss': 'sparse_categorical_crossentropy', 'metric': 'accuracy'}
+        if job == 'card':
+            parts = self._card_parts(data['card_features'], data['card_outcomes'])
+            return {'parts': parts, 'features': array_column('X'), 'labels': array_column('y'),
+                    'scaler': fit_scaler(parts, array_column('X')), 'input_dim': len(CARD_INPUT_FEATURES),
+                    'outputs': 1, 'activation': 'sigmoid', 'loss': 'mse', 'metric': 'mae'}
+        if job == 'strategy':
+            decks = self._strategy_decks(data['card_features'])
+            return {'parts': decks['parts'], 'features': array_column('X'), 'labels': array_column('y'),
+                    'scaler': decks['scaler'], 'input_dim': decks['X'].shape[1],
+                    'outputs': len(decks['label_encoder'].classes_), 'activation': 'softmax',
+                    'loss': 'sparse_categorical_crossentropy', 'metric': 'accuracy'}
+        if job == 'price':
+            prices = self._price_parts(data['market_features'])
+            return {'parts': prices['parts'], 'features': prices['features'], 'labels': columns_fn(['target']),
+                    'scaler': fit_scaler(prices['parts'], prices['features']),
+                    'input_dim': len(prices['input_features']), 'outputs': 1, 'activation': 'linear',
+                    'loss': 'mse', 'metric': 'mae'}
+        raise ValueError(f"Неизвестная модель: {job}. Доступные: {MODEL_JOBS}")
+    
+    def _card_parts(self, card_features: pd.DataFrame, card_outcomes: pd.DataFrame) -> List[Dict[str, np.ndarray]]:
+        """Признаки карт и целевой рейтинг одной частью таблицы ('X', 'y')"""
+        # Успешность карты - доля выигранных раундов из индекса исходов (card_outcomes/)
+        win_rates = pd.Series(np.asarray(card_outcomes['win_rate'], dtype=np.float64),
+                              index=np.asarray(card_outcomes['card_id']))
+        success_rate = win_rates.reindex(card_features['card_id']).fillna(0.5).to_numpy()  # По умолчанию 0.5
+        
+        # Создаём целевую переменную (рейтинг карты): комбинируем успешность и статистики
+        y = success_rate * 0.7 + (card_features['total_stats'].to_numpy() / 20) * 0.3
+        return array_parts(card_features[CARD_INPUT_FEATURES].to_numpy(dtype=np.float32), y.astype(np.float32))
+    
+    def _price_parts(self, market_features: List[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+        """Части market_features/ с целью ('target') и выборкой по датам ('subset', см. forecast_subset_codes).
+        
+        Цель считается по колонке price, а не хранится в таблице: таблица дописывается по дню,
+        и цель дня становится известна только через PRICE_FORECAST_HORIZON дней.
+        """
+        manifest = read_manifest(self.data_dir / "market_features")
+        num_cards = len(manifest['columns']['card_id']['categories'])
+        windows = manifest['params']['windows']
+        
+        price = np.concatenate([np.asarray(part['price']) for part in market_features])
+        targets = forecast_targets(price, num_cards)
+        codes = np.repeat(forecast_subset_codes(len(price) // num_cards), num_cards)
+        counts = {subset: int((codes == index).sum()) for index, subset in enumerate(SUBSETS)}
+        if not all(counts.values()):
+            raise ValueError(f"Мало дней рынка для обучения прогноза цен: {len(price) // num_cards} "
+                             f"(строк по выборкам: {counts})")
+        
+        parts = []
+        start = 0
+        for part in market_features:
+            end = start + len(part['price'])
+            parts.append({**part, 'target': targets[start:end], 'subset': codes[start:end]})
+            start = end
+        return {'parts': parts, 'features': forecast_inputs(windows), 'input_features': forecast_input_names(windows),
+                'windows': windows}
+    
+    def _strategy_decks(self, card_features: pd.DataFrame) -> Dict[str, Any]:
+        """Случайные колоды для классификатора стратегий: признаки, коды меток, энкодер, скейлер и часть таблицы"""
+        from sklearn.preprocessing import LabelEncoder
+        
+        # Генерируем случайные колоды (матрица индексов) и определяем их стратегии по правилам
+        X, y = deck_strategy_features(card_features, self.strategy_samples, np.random.default_rng(42))
+        
+        # Кодирование меток
+        label_encoder = LabelEncoder()
+        y_encoded = label_encoder.fit_transform(y)
+        
+        # Разделение на train/validation/test и нормализация
+        parts = array_parts(X.astype(np.float32), y_encoded)
+        scaler = fit_scaler(parts, array_column('X'))
+        return {'X': X, 'y': y_encoded, 'label_encoder': label_encoder, 'scaler': scaler, 'parts': parts}
+    
+    def _fit_strategy_forest(self, decks: Dict[str, Any]) -> Tuple[Any, float]:
+        """Random Forest по колодам (обучающая и валидационная выборки - для обучения): (модель, точность на тесте)"""
+        from sklearn.ensemble import RandomForestClassifier
+        
+        is_test = subset_codes(len(decks['y']), 0) == SUBSETS.index('test')
+        X_scaled = decks['scaler'].transform(decks['X'])
+        rf_model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=self.n_jobs)
+        rf_model.fit(X_scaled[~is_test], decks['y'][~is_test])
+        return rf_model, rf_model.score(X_scaled[is_test], decks['y'][is_test])
+    
+    def _fit(self, model: Any, name: str, datasets: Dict[str, Any], epochs: int) -> Any:
+        """model.fit с ранней остановкой и снижением шага по val_loss и резервными копиями для продолжения.
+        
+        Резервная копия (веса, состояние оптимизатора, номер эпохи) удаляется после успешного обучения;
+        если она осталась от прерванного запуска, обучение продолжается с неё (resume=False - заново).
+        """
+        import tensorflow as tf
+        
+        backup_dir = self.models_dir / CHECKPOINTS_DIR / name
+        if backup_dir.exists() and not self.resume:
+            shutil.rmtree(backup_dir)
+        elif backup_dir.exists():
+            print(f"♻️ {name}: продолжение прерванного обучения с резервной копии")
+        
+        callbacks = [tf.keras.callbacks.BackupAndRestore(str(backup_dir), save_freq=self.checkpoint_steps or 'epoch')]
+        if self.early_stopping_patience:
+            callbacks.append(tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=self.early_stopping_patience,
+                                                              restore_best_weights=True, verbose=1))
+        if self.lr_patience:
+            callbacks.append(tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=LR_PLATEAU_FACTOR,
+                                                                  patience=self.lr_patience, min_lr=MIN_LEARNING_RATE,
+                                                                  verbose=1))
+        return model.fit(
+            datasets['train'],
+            epochs=self.epochs or epochs,
+            validation_data=datasets['validation'],
+            callbacks=callbacks,
+            verbose=1
+        )
+    
+    def _previous_battle_model(self, name: str) -> Optional[Dict[str, Any]]:
+        """Прежняя модель боёв для warm_start: {'model', 'info', 'trained_battle_id'} или None - обучение с нуля"""
+        import tensorflow as tf
+        
+        if not self.warm_start:
+            return None
+        info = (self.load_model_metadata() or {}).get('models', {}).get(name)
+        path = self.models_dir / "tensorflow" / f"{name}.h5"
+        if info is None or 'trained_battle_id' not in info or not path.exists():
+            print(f"⚠️ {name}: прежней модели с отметкой обученных боёв нет, обучение с нуля")
+            return None
+        model = tf.keras.models.load_model(path, compile=False)
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(WARM_START_LEARNING_RATE),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        print(f"🔁 {name}: дообучение на боях после battle_id {info['trained_battle_id']}")
+        return {'model': model, 'info': info, 'trained_battle_id': info['trained_battle_id']}
+    
+    def _warm_start_possible(self, name: str, new_parts: List[Dict[str, Any]]) -> bool:
+        """Хватает ли новых боёв для дообучения; иначе сообщает о полном переобучении"""
+        sizes = subset_sizes(new_parts)
+        new_battles = sum(sizes.values())
+        if new_battles >= WARM_START_MIN_BATTLES and all(sizes.values()):
+            return True
+        print(f"⚠️ {name}: для дообучения мало новых боёв ({new_battles}, нужно не меньше {WARM_START_MIN_BATTLES} "
+              f"и строки во всех выборках: {sizes}) - полное переобучение на всех боях")
+        return False
+    
+    def _save_keras_model(self, model: Any, name: str):
+        """Сохраняет модель Keras (.h5) и её конвертацию в TensorFlow.js"""
+        import tensorflowjs as tfjs
+        
+        model.save(self.models_dir / "tensorflow" / f"{name}.h5")
+        tfjs.converters.save_keras_model(model, str(self.models_dir / "tensorflowjs" / name))
+    
+    @instrumented('metadata', outputs=lambda a: [a['self'].models_dir / "models_metadata.json"])
     def create_model_metadata(self, models_info: Dict[str, Any]):
-        """Создаёт метаданные обученных моделей"""
+        """Создаёт метаданные обученных моделей.
+        
+        Описания моделей, которые в этом запуске не обучались (models_info без их задачи),
+        переносятся из прежних models_metadata.json.
+        """
         print("📋 Создание метаданных моделей...")
         
+        rf_accuracy = (models_info.get('strategy') or models_info.get('strategy_rf') or {}).get('rf_accuracy')
         metadata = {
             'version': '1.0.0',
             'created': pd.Timestamp.now().isoformat(),
             'models': {
-                'battle_predictor': {
+                'battle_predictor': None if 'battle' not in models_info else {
                     'type': 'classification',
                     'accuracy': models_info['battle']['accuracy'],
-                    'input_features': ['player_total_attack', 'opponent_total_attack', 
-                                     'attack_difference', 'player_pills_used', 'opponent_pills_used'],
+                    'trained_battle_id': models_info['battle']['trained_battle_id'],
+                    'input_features': BATTLE_INPUT_FEATURES,
                     'output_classes': ['player', 'opponent', 'draw'],
                     'description': 'Предсказывает победителя боя на основе характеристик карт и пилюль'
                 },
-                'card_recommender': {
+                'card_recommender': None if 'card' not in models_info else {
                     'type': 'regression',
                     'mse': models_info['card']['mse'],
-                    'input_features': ['clan_encoded', 'rarity_encoded', 'max_power', 'max_damage', 
-                                     'has_ability', 'power_damage_ratio', 'total_stats'],
+                    'input_features': CARD_INPUT_FEATURES,
                     'output_range': [0, 1],
+                    'target': '0.7 * доля выигранных раундов (card_outcomes) + 0.3 * total_stats / 20',
                     'description': 'Оценивает полезность карты в текущей игровой ситуации'
                 },
-                'strategy_classifier': {
+                'strategy_classifier': None if 'strategy' not in models_info else {
                     'type': 'classification',
                     'accuracy': models_info['strategy']['tf_accuracy'],
-                    'input_features': ['avg_power', 'avg_damage', 'total_stats', 'clan_diversity', 'ability_count'],
-                    'output_classes': ['power_focused', 'damage_focused', 'mono_clan', 'ability_focused', 'balanced'],
+                    'input_features': STRATEGY_FEATURES,
+                    'output_classes': STRATEGY_LABELS,
                     'description': 'Классифицирует стратегию колоды'
+                },
+                'strategy_forest': None if rf_accuracy is None else {
+                    'type': 'classification',
+                    'accuracy': rf_accuracy,
+                    'input_features': STRATEGY_FEATURES,
+                    'output_classes': STRATEGY_LABELS,
+                    'file': 'sklearn/strategy_rf.pkl',
+                    'description': 'Random Forest (sklearn) для стратегии колоды, только для Python - в бандл не входит'
+                },
+                'battle_sequence_predictor': None if 'battle_sequence' not in models_info else {
+                    'type': 'classification',
+                    'accuracy': models_info['battle_sequence']['accuracy'],
+                    'trained_battle_id': models_info['battle_sequence']['trained_battle_id'],
+                    'input_shape': models_info['battle_sequence']['input_shape'],
+                    'input_features': SEQUENCE_FEATURES,
+                    'output_classes': WINNER_LABELS,
+                    'description': 'Предсказывает победителя боя по последовательности всех раундов (int8, нули после последнего раунда)'
+                },
+                'price_forecaster': None if 'price' not in models_info else {
+                    'type': 'regression',
+                    'mse': models_info['price']['mse'],
+                    'mae': models_info['price']['mae'],
+                    'baseline_mae': models_info['price']['baseline_mae'],
+                    'input_features': models_info['price']['input_features'],
+                    'windows': models_info['price']['windows'],
+                    'horizon_days': PRICE_FORECAST_HORIZON,
+                    'target': f'log(price[t + {PRICE_FORECAST_HORIZON}] / price[t])',
+                    'description': 'Прогнозирует изменение цены карты на рынке по скользящим признакам '
+                                   '(market_features/: средние и VWAP - в лог-отношении к цене)'
                 }
             },
             'usage_instructions': {
@@ -370,6 +772,14 @@ class UrbanRivalsMLTrainer:
             }
         }
         
+        trained_jobs = {'battle' if key == 'battle_sequence' else key for key in models_info}
+        previous = (self.load_model_metadata() or {}).get('models', {})
+        for job, names in METADATA_MODELS.items():
+            for name in names:
+                if job not in trained_jobs and metadata['models'][name] is None and name in previous:
+                    metadata['models'][name] = previous[name]
+        metadata['models'] = {name: info for name, info in metadata['models'].items() if info is not None}
+        
         # Сохраняем метаданные
         with open(self.models_dir / "models_metadata.json", 'w', encoding='utf-8') as f:
             json.dump(metadata, f, ensure_ascii=False, indent=2)
@@ -377,50 +787,339 @@ class UrbanRivalsMLTrainer:
         print("✅ Метаданные сохранены в models_metadata.json")
         return metadata
     
-    def train_all_models(self):
-        """Обучает все модели"""
-        print("🚀 Начинаем обучение всех ML моделей...")
+    def load_model_metadata(self) -> Optional[Dict[str, Any]]:
+        """Читает models_metadata.json из models_dir (None, если метаданных ещё нет)"""
+        path = self.models_dir / "models_metadata.json"
+        if not path.exists():
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    @instrumented('bundle', outputs=lambda a: [a['self'].models_dir / BUNDLE_FILE])
+    def create_model_bundle(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Собирает единый бинарный бандл полносвязных моделей для расширения (см. model_bundle.py).
         
-        # Загружаем данные
-        data = self.load_training_data()
+        Модели, скейлеры и энкодеры читаются из сохранённых файлов, поэтому бандл собирается
+        одинаково после последовательного, параллельного и инкрементального обучения.
+        """
+        import joblib
+        import tensorflow as tf
         
-        models_info = {}
+        print(f"📦 Сборка бандла моделей ({self.bundle_quantization})...")
         
-        # 1. Обучаем предиктор боёв
-        battle_model = self.train_battle_predictor(data['battle_features'])
-        models_info['battle'] = battle_model
+        cards_manifest = read_manifest(self.data_dir / "cards")
+        if cards_manifest is None:
+            raise FileNotFoundError(self.data_dir / "cards")
+        # Коды кланов и редкостей - те же, что в признаках card_features
+        mappings = {
+            'clans': cards_manifest['columns']['clan']['categories'],
+            'rarities': RARITIES
+        }
+        
+        models = {}
+        sources = {}
+        for name, files in BUNDLE_MODELS.items():
+            if name not in metadata['models']:
+                continue
+            model = tf.keras.models.load_model(self.models_dir / "tensorflow" / files['model'], compile=False)
+            scaler = joblib.load(self.models_dir / "sklearn" / files['scaler'])
+            spec = dict(metadata['models'][name])
+            if 'label_encoder' in files:
+                # Выходы модели идут в порядке классов энкодера
+                label_encoder = joblib.load(self.models_dir / "sklearn" / files['label_encoder'])
+                spec['output_classes'] = list(label_encoder.classes_)
+            models[name] = {**spec, 'layers': dense_layers(model),
+                            'scaler': {'mean': scaler.mean_, 'scale': scaler.scale_}}
+            sources[name] = (model, scaler)
+        
+        bundle_path = self.models_dir / BUNDLE_FILE
+        size = write_bundle(bundle_path, models, mappings, self.bundle_quantization, metadata['version'],
+                            metadata['created'])
+        
+        # Проверка: предсказания по бандлу совпадают с Keras с точностью до квантизации
+        bundle = read_bundle(bundle_path)
+        rng = np.random.default_rng(42)
+        max_errors = {}
+        for name, (model, scaler) in sources.items():
+            X = scaler.mean_ + scaler.scale_ * rng.standard_normal((BUNDLE_CHECK_ROWS, len(scaler.mean_)))
+            expected = model.predict(scaler.transform(X), verbose=0)
+            max_errors[name] = float(np.abs(bundle_predict(bundle['models'][name], X) - expected).max())
+        
+        tfjs_size = sum(f.stat().st_size for f in (self.models_dir / "tensorflowjs").rglob('*') if f.is_file())
+        print(f"✅ Бандл сохранён в {BUNDLE_FILE}: {size / 1024:.1f} КБ (TensorFlow.js: {tfjs_size / 1024:.1f} КБ), "
+              f"макс. отклонение от Keras: {max(max_errors.values(), default=0):.2e}")
+        return {'path': str(bundle_path), 'size': size, 'quantization': self.bundle_quantization,
+                'max_errors': max_errors}
+    
+    def train_model(self, job: str, data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Обучает одну модель из MODEL_JOBS или SKLEARN_JOBS, возвращает (ключ models_info, результат с временем обучения)"""
+        start = time.perf_counter()
+        if job == 'battle' and self.battle_model == 'sequence':
+            key, result = 'battle_sequence', self.train_battle_sequence_model(data['battle_sequences'])
+        elif job == 'battle':
+            key, result = 'battle', self.train_battle_predictor(data['battle_features'])
+        elif job == 'card':
+            key, result = 'card', self.train_card_recommender(data['card_features'], data['card_outcomes'])
+        elif job == 'strategy':
+            key, result = 'strategy', self.train_strategy_classifier(data['card_features'])
+        elif job == 'strategy_rf':
+            key, result = 'strategy_rf', self.train_strategy_forest(data['card_features'])
+        elif job == 'price':
+            key, result = 'price', self.train_price_forecaster(data['market_features'])
+        else:
+            raise ValueError(f"Неизвестная модель: {job}. Доступные: {MODEL_JOBS + SKLEARN_JOBS}")
+        result['train_time'] = time.perf_counter() - start
+        print(f"⏱️ {key}: {result['train_time']:.1f}с")
+        return key, result
+    
+    def train_all_models(self, parallel: bool = False, workers: Optional[int] = None,
+                         stages: Optional[List[str]] = None):
+        """Выполняет этапы из TRAINING_STAGES (по умолчанию DEFAULT_STAGES - все модели, метаданные и бандл).
+        
+        Задачи обучения идут по очереди или параллельно в отдельных процессах; этап bundle
+        без этапа metadata берёт уже сохранённые метаданные.
+        """
+        stages = stages or DEFAULT_STAGES
+        unknown = [name for name in stages if name not in TRAINING_STAGES]
+        if unknown:
+            raise ValueError(f"Неизвестные этапы: {unknown}. Доступные: {TRAINING_STAGES}")
+        jobs = [name for name in TRAINING_STAGES if name in stages and name in MODEL_JOBS + SKLEARN_JOBS]
         
-        # 2. Обучаем рекомендатель карт
-        card_model = self.train_card_recommender(data['card_features'], data['battle_features'])
-        models_info['card'] = card_model
+        print(f"🚀 Этапы обучения: {', '.join(name for name in TRAINING_STAGES if name in stages)}")
+        start = time.perf_counter()
         
-        # 3. Обучаем классификатор стратегий
-        strategy_model = self.train_strategy_classifier(data['card_features'])
-        models_info['strategy'] = strategy_model
+        models_info = {}
+        if jobs and parallel and (workers is None or workers > 1):
+            models_info = self._train_models_parallel(jobs, workers)
+        elif jobs:
+            # Загружаем данные и обучаем модели по очереди
+            data = self.load_training_data(jobs)
+            models_info = dict(self.train_model(job, data) for job in jobs)
         
-        # 4. Создаём метаданные
-        metadata = self.create_model_metadata(models_info)
+        # Метаданные собираются один раз, когда готовы все модели
+        metadata = None
+        if 'metadata' in stages:
+            metadata = self.create_model_metadata(models_info)
+        if 'bundle' in stages:
+            metadata = metadata or self.load_model_metadata()
+            if metadata is None:
+                print("❌ Метаданные моделей не найдены. Сначала выполните этап metadata")
+                raise FileNotFoundError(self.models_dir / "models_metadata.json")
+            self.create_model_bundle(metadata)
+        if 'matchups' in stages:
+            # Таблица исходов зависит только от характеристик карт, обучение моделей ей не нужно
+            build_matchup_table(self._load_table('cards'), self.models_dir / MATCHUP_FILE, workers)
         
-        print("\n🎉 Все модели успешно обучены!")
+        print("\n🎉 Этапы обучения выполнены!")
         print(f"📁 Модели сохранены в: {self.models_dir}")
-        print("\n📊 Результаты обучения:")
-        print(f"  ⚔️ Предиктор боёв: {battle_model['accuracy']:.3f} точность")
-        print(f"  🃏 Рекомендатель карт: {card_model['mse']:.4f} MSE")
-        print(f"  🎯 Классификатор стратегий: {strategy_model['tf_accuracy']:.3f} точность")
+        if models_info:
+            print("\n📊 Результаты обучения:")
+        battle_model = models_info.get('battle') or models_info.get('battle_sequence')
+        if battle_model:
+            print(f"  ⚔️ Предиктор боёв: {battle_model['accuracy']:.3f} точность ({battle_model['train_time']:.1f}с, "
+                  f"{battle_model['new_battles']} боёв)")
+        if 'card' in models_info:
+            print(f"  🃏 Рекомендатель карт: {models_info['card']['mse']:.4f} MSE "
+                  f"({models_info['card']['train_time']:.1f}с)")
+        if 'strategy' in models_info:
+            print(f"  🎯 Классификатор стратегий: {models_info['strategy']['tf_accuracy']:.3f} точность "
+                  f"({models_info['strategy']['train_time']:.1f}с)")
+        if 'strategy_rf' in models_info:
+            print(f"  🌲 Random Forest стратегий: {models_info['strategy_rf']['rf_accuracy']:.3f} точность "
+                  f"({models_info['strategy_rf']['train_time']:.1f}с)")
+        if 'price' in models_info:
+            print(f"  📈 Прогноз цен: {models_info['price']['mae']:.4f} MAE, без изменения цены "
+                  f"{models_info['price']['baseline_mae']:.4f} ({models_info['price']['train_time']:.1f}с)")
+        print(f"  ⏱️ Общее время: {time.perf_counter() - start:.1f}с")
         
         return models_info, metadata
+    
+    def _train_models_parallel(self, jobs: List[str], workers: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Обучает модели в отдельных процессах, поделив ядра между ними"""
+        workers = min(workers or len(jobs), len(jobs))
+        threads = thread_budget(workers)
+        print(f"🔀 Параллельное обучение: {workers} процессов по {threads} потоков")
+        
+        tasks = [
+            {
+                'job': job,
+                'data_dir': str(self.data_dir),
+                'models_dir': str(self.models_dir),
+                'battle_model': self.battle_model,
+                'batch_size': self.batch_size,
+                'strategy_samples': self.strategy_samples,
+                'epochs': self.epochs,
+                'early_stopping_patience': self.early_stopping_patience,
+                'lr_patience': self.lr_patience,
+                'checkpoint_steps': self.checkpoint_steps,
+                'resume': self.resume,
+                'warm_start': self.warm_start,
+                'hyperparams': self.hyperparams,
+                'threads': threads,
+                'instrumentation': instrumentation.settings() if instrumentation.enabled else None
+            }
+            for job in jobs
+        ]
+        # spawn: TensorFlow в родительском процессе мог быть уже инициализирован, fork для него небезопасен
+        models_info = dict(run_shards(train_model_job, tasks, workers, start_method='spawn'))
+        for result in models_info.values():
+            instrumentation.merge(result.pop('stages', []))
+        return models_info
+
+
+def battle_labels(label_encoder: Any):
+    """Метки модели боёв: коды победителя в порядке классов LabelEncoder (int8)"""
+    label_lookup = label_encoder.transform(WINNER_LABELS).astype(np.int8)
+    return lambda part, rows: label_lookup[category_codes(np.asarray(part['winner'])[rows], WINNER_LABELS)]
+
+
+def require_subsets(name: str, sizes: Dict[str, int]):
+    """Останавливает обучение с понятной ошибкой, если в какой-то выборке нет строк"""
+    empty = [subset for subset in SUBSETS if not sizes.get(subset)]
+    if empty:
+        raise ValueError(f"{name}: нет строк в выборках {empty} ({sizes}) - слишком мало данных для обучения "
+                         f"(ранней остановке нужна проверочная выборка, оценке - тестовая)")
+
+
+def dense_model(input_dim: int, params: Dict[str, Any], outputs: int, activation: str) -> Any:
+    """Полносвязная сеть по гиперпараметрам: скрытые слои relu (units), Dropout после первых len(dropout)"""
+    import tensorflow as tf
+    
+    layers = [tf.keras.layers.Input(shape=(input_dim,))]
+    for index, units in enumerate(params['units']):
+        layers.append(tf.keras.layers.Dense(units, activation='relu'))
+        if index < len(params['dropout']):
+            layers.append(tf.keras.layers.Dropout(params['dropout'][index]))
+    layers.append(tf.keras.layers.Dense(outputs, activation=activation))
+    return tf.keras.Sequential(layers)
+
+
+def compile_model(model: Any, params: Dict[str, Any], loss: str, metric: str):
+    """Компилирует модель с Adam и шагом из гиперпараметров"""
+    import tensorflow as tf
+    
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(params['learning_rate']),
+        loss=loss,
+        metrics=[metric]
+    )
+
+
+def load_tuned_hyperparams(models_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """Лучшие гиперпараметры из таблицы результатов tuning.py ({} - поиска ещё не было)"""
+    path = Path(models_dir) / LEADERBOARD_FILE
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        leaderboard = json.load(f)
+    return {job: result['best']['params'] for job, result in leaderboard['models'].items()}
+
+
+def _epochs_trained(history: Any) -> int:
+    """Эпох обучения с учётом продолжения с резервной копии (history.epoch - номера эпох этого запуска)"""
+    return history.epoch[-1] + 1 if history.epoch else 0
+
+
+def thread_budget(num_processes: int, cpu_count: Optional[int] = None) -> int:
+    """Потоков на процесс, чтобы процессы вместе не занимали больше ядер, чем есть"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // max(1, num_processes))
+
+
+def train_model_job(task: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Обучает одну модель в процессе пула и возвращает её метрики (без объектов моделей)"""
+    from threadpoolctl import threadpool_limits
+    
+    threads = task['threads']
+    if task['instrumentation'] is not None:
+        instrumentation.configure(**task['instrumentation'])
+    # Ограничиваем потоки TensorFlow (до первой операции) и BLAS/OpenMP, sklearn - через n_jobs
+    if task['job'] not in SKLEARN_JOBS:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+    
+    trainer = UrbanRivalsMLTrainer(task['data_dir'], task['models_dir'], battle_model=task['battle_model'],
+                                   batch_size=task['batch_size'], n_jobs=threads,
+                                   strategy_samples=task['strategy_samples'], epochs=task['epochs'],
+                                   early_stopping_patience=task['early_stopping_patience'],
+                                   lr_patience=task['lr_patience'], checkpoint_steps=task['checkpoint_steps'],
+                                   resume=task['resume'], warm_start=task['warm_start'],
+                                   hyperparams=task['hyperparams'])
+    with threadpool_limits(threads):
+        key, result = trainer.train_model(task['job'], trainer.load_training_data([task['job']]))
+    
+    # Модели уже сохранены на диск, в родительский процесс передаются только метрики (и замеры этапов)
+    summary = model_summary(result)
+    if instrumentation.enabled:
+        summary['stages'] = instrumentation.records
+    return key, summary
+
+
+def model_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Метрики результата обучения без объектов моделей, скейлеров и истории"""
+    return {name: value for name, value in result.items() if isinstance(value, (int, float, str, list, np.number))}
 
 def main():
     """Основная функция обучения"""
+    parser = argparse.ArgumentParser(description="Обучение ML моделей Urban Rivals")
+    parser.add_argument('--stages', nargs='+', choices=TRAINING_STAGES, default=DEFAULT_STAGES,
+                        help=f"Этапы для выполнения (по умолчанию: {' '.join(DEFAULT_STAGES)}); "
+                             f"strategy_rf - только Random Forest стратегий, без TensorFlow")
+    parser.add_argument('--data-dir', default="datasets", help="Папка с датасетом (dataset.py)")
+    parser.add_argument('--models-dir', default="trained_models", help="Папка для обученных моделей")
+    parser.add_argument('--battle-model', choices=BATTLE_MODELS, default='dense',
+                        help="Модель боёв: dense - первый раунд, sequence - все раунды (GRU)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Размер батча для моделей боёв (конвейер tf.data по частям таблиц)")
+    parser.add_argument('--strategy-samples', type=int, default=5000,
+                        help="Количество случайных колод для классификатора стратегий")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Обучать модели одновременно в отдельных процессах")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Количество процессов для --parallel (по умолчанию - по одному на модель)")
+    parser.add_argument('--bundle-quantization', choices=QUANTIZATIONS, default='float16',
+                        help="Точность весов в бинарном бандле моделей для расширения")
+    parser.add_argument('--epochs', type=int, default=None,
+                        help="Наибольшее число эпох для всех моделей (по умолчанию - своё у каждой модели)")
+    parser.add_argument('--early-stopping-patience', type=int, default=EARLY_STOPPING_PATIENCE,
+                        help="Эпох без улучшения val_loss до остановки (0 - обучать все эпохи)")
+    parser.add_argument('--lr-patience', type=int, default=LR_PLATEAU_PATIENCE,
+                        help="Эпох без улучшения val_loss до уменьшения шага вдвое (0 - постоянный шаг)")
+    parser.add_argument('--checkpoint-steps', type=int, default=None,
+                        help="Резервная копия обучения каждые N батчей (по умолчанию - после каждой эпохи)")
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        help="Не продолжать прерванное обучение: удалить резервные копии и начать заново")
+    parser.add_argument('--tuned', action='store_true',
+                        help=f"Гиперпараметры - лучшие из {LEADERBOARD_FILE} (tuning.py) вместо значений по умолчанию")
+    parser.add_argument('--warm-start', action='store_true',
+                        help="Модели боёв: дообучить прежнюю модель (и её скейлер/энкодер) только на новых боях")
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    
     print("🤖 Urban Rivals ML Training Pipeline")
     print("=====================================")
     
-    trainer = UrbanRivalsMLTrainer()
-    models_info, metadata = trainer.train_all_models()
+    trainer = UrbanRivalsMLTrainer(args.data_dir, args.models_dir, battle_model=args.battle_model,
+                                   batch_size=args.batch_size, strategy_samples=args.strategy_samples,
+                                   epochs=args.epochs, bundle_quantization=args.bundle_quantization,
+                                   early_stopping_patience=args.early_stopping_patience, lr_patience=args.lr_patience,
+                                   checkpoint_steps=args.checkpoint_steps, resume=args.resume,
+                                   warm_start=args.warm_start,
+                                   hyperparams=load_tuned_hyperparams(args.models_dir) if args.tuned else None)
+    models_info, metadata = trainer.train_all_models(parallel=args.parallel, workers=args.workers,
+                                                     stages=args.stages)
     
     print("\n✅ Обучение завершено!")
-    print("📦 Готовые модели для TensorFlow.js находятся в папке trained_models/tensorflowjs/")
-    print("🔧 Метаданные моделей: trained_models/models_metadata.json")
+    if any(stage in MODEL_JOBS for stage in args.stages):
+        print(f"📦 Готовые модели для TensorFlow.js находятся в папке {args.models_dir}/tensorflowjs/")
+    if 'metadata' in args.stages:
+        print(f"🔧 Метаданные моделей: {args.models_dir}/models_metadata.json")
+    if 'bundle' in args.stages:
+        print(f"📦 Бинарный бандл для расширения: {args.models_dir}/{BUNDLE_FILE}")
+    if 'matchups' in args.stages:
+        print(f"🎲 Таблица исходов пар карт: {args.models_dir}/{MATCHUP_FILE}")
     
     return models_info, metadata
 
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Urban Rivals Hyperparameter Search
+Поиск гиперпараметров полносвязных моделей последовательным отсевом (successive halving) на пуле процессов
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from input_pipeline import prepared_datasets, write_prepared
+from instrumentation import add_instrumentation_args, configure_from_args, instrumented
+from sharding import run_shards
+from train_models import (DEFAULT_HYPERPARAMS, LEADERBOARD_FILE, MODEL_JOBS, UrbanRivalsMLTrainer, compile_model,
+                          dense_model, thread_budget)
+
+# Пространства поиска: все сочетания значений (dropout - после первых len(dropout) скрытых слоёв)
+SEARCH_SPACES = {
+    'battle': {
+        'units': [[32, 16], [64, 32, 16], [128, 64, 32], [256, 128, 64, 32]],
+        'dropout': [[0.1], [0.2, 0.2], [0.3, 0.3]],
+        'learning_rate': [3e-4, 1e-3, 3e-3],
+        'batch_size': [256, 1024, 4096]
+    },
+    'card': {
+        'units': [[64, 32], [128, 64, 32, 16], [256, 128, 64]],
+        'dropout': [[0.2, 0.2], [0.3, 0.3], [0.5]],
+        'learning_rate': [3e-4, 1e-3, 3e-3],
+        'batch_size': [16, 32, 64]
+    },
+    'strategy': {
+        'units': [[32, 16], [64, 32, 16], [128, 64, 32]],
+        'dropout': [[0.2], [0.3, 0.2], [0.4, 0.3]],
+        'learning_rate': [3e-4, 1e-3, 3e-3],
+        'batch_size': [16, 32, 64]
+    },
+    'price': {
+        'units': [[32, 16], [64, 32], [128, 64, 32]],
+        'dropout': [[0.1], [0.2], [0.3, 0.2]],
+        'learning_rate': [3e-4, 1e-3, 3e-3],
+        'batch_size': [256, 1024, 4096]
+    }
+}
+
+# 27 конфигураций по 3 эпохи -> 9 по 9 -> 3 по 27: ~190 эпох вместо 729 при полном обучении каждой
+DEFAULT_TRIALS = 27
+DEFAULT_ETA = 3
+DEFAULT_MIN_EPOCHS = 3
+DEFAULT_MAX_EPOCHS = 27
+
+TUNING_DIR = "tuning"
+
+
+def sample_configs(job: str, num_trials: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Различные конфигурации из SEARCH_SPACES; первая - гиперпараметры по умолчанию (базовая линия)"""
+    space = SEARCH_SPACES[job]
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    default = {name: DEFAULT_HYPERPARAMS[job][name] for name in space}
+    grid = [config for config in grid if config != default]
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(grid), size=min(num_trials - 1, len(grid)), replace=False)
+    return [default] + [grid[index] for index in picked]
+
+
+def rung_epochs(min_epochs: int, max_epochs: int, eta: int) -> List[int]:
+    """Эпохи к концу каждого круга отсева: min_epochs * eta^k, последний круг - max_epochs"""
+    epochs = [min_epochs]
+    while epochs[-1] * eta < max_epochs:
+        epochs.append(epochs[-1] * eta)
+    if epochs[-1] < max_epochs:
+        epochs.append(max_epochs)
+    return epochs
+
+
+def run_trial(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Обучает конфигурацию до task['epochs'] эпох, продолжая модель прошлого круга (с состоянием оптимизатора)"""
+    import tensorflow as tf
+
+    threads = task['threads']
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+
+    spec, params = task['spec'], task['params']
+    datasets = prepared_datasets(spec['data_dir'], batch_size=params['batch_size'])
+    model_path = Path(task['model_path'])
+    if task['initial_epoch']:
+        model = tf.keras.models.load_model(model_path)
+    else:
+        model = dense_model(spec['input_dim'], params, spec['outputs'], spec['activation'])
+        compile_model(model, params, spec['loss'], spec['metric'])
+
+    started = time.perf_counter()
+    history = model.fit(
+        datasets['train'],
+        epochs=task['epochs'],
+        initial_epoch=task['initial_epoch'],
+        validation_data=datasets['validation'],
+        verbose=0
+    )
+    model.save(model_path)
+
+    val_losses = history.history['val_loss']
+    best = int(np.argmin(val_losses))
+    return {
+        'trial': task['trial'],
+        'epochs': task['epochs'],
+        'val_loss': float(val_losses[best]),
+        f"val_{spec['metric']}": float(history.history[f"val_{spec['metric']}"][best]),
+        'time': time.perf_counter() - started
+    }
+
+
+@instrumented('tune', rows_in=lambda a: a['num_trials'])
+def tune_model(trainer: UrbanRivalsMLTrainer, job: str, data: Dict[str, Any], num_trials: int = DEFAULT_TRIALS,
+               eta: int = DEFAULT_ETA, min_epochs: int = DEFAULT_MIN_EPOCHS, max_epochs: int = DEFAULT_MAX_EPOCHS,
+               workers: Optional[int] = None, seed: int = 42) -> Dict[str, Any]:
+    """Последовательный отсев для одной модели.
+
+    Выборки один раз нормализуются и пишутся частями float32 (write_prepared), все испытания
+    читают их в отображении в память. В каждом круге конфигурации обучаются параллельно до
+    следующего числа эпох, дальше проходит лучшая 1/eta по val_loss; модели продолжают обучение
+    с прошлого круга, поэтому большая часть эпох достаётся перспективным конфигурациям.
+    """
+    search_dir = trainer.models_dir / TUNING_DIR / job
+    if search_dir.exists():
+        shutil.rmtree(search_dir)
+    inputs = trainer.tuning_inputs(job, data)
+    sizes = write_prepared(inputs['parts'], inputs['features'], inputs['labels'], search_dir / "data",
+                           inputs['scaler'])
+    # Отсев идёт по val_loss: без проверочной выборки испытания упали бы уже в процессах пула
+    empty = [subset for subset in ['train', 'validation'] if not sizes[subset]]
+    if empty:
+        raise ValueError(f"{job}: нет строк в выборках {empty} ({sizes}) - слишком мало данных для поиска "
+                         f"гиперпараметров")
+    spec = {name: inputs[name] for name in ['input_dim', 'outputs', 'activation', 'loss', 'metric']}
+    spec['data_dir'] = str(search_dir / "data")
+
+    configs = sample_configs(job, num_trials, seed)
+    rungs = rung_epochs(min_epochs, max_epochs, eta)
+    print(f"🔎 {job}: {len(configs)} конфигураций, круги по эпохам {rungs}, eta={eta}, "
+          f"обучающих строк {sizes['train']}")
+
+    trials = [{'trial': index, 'params': params, 'epochs': 0, 'rung': -1, 'time': 0.0}
+              for index, params in enumerate(configs)]
+    alive = list(range(len(trials)))
+    started = time.perf_counter()
+    for rung, epochs in enumerate(rungs):
+        pool_size = min(workers or os.cpu_count() or 1, len(alive))
+        tasks = [{
+            'trial': index,
+            'params': trials[index]['params'],
+            'spec': spec,
+            'epochs': epochs,
+            'initial_epoch': trials[index]['epochs'],
+            'model_path': str(search_dir / f"trial-{index:03d}.h5"),
+            'threads': thread_budget(pool_size)
+        } for index in alive]
+        # spawn: TensorFlow в процессах пула инициализируется заново
+        for result in run_shards(run_trial, tasks, pool_size, start_method='spawn'):
+            trial = trials[result['trial']]
+            trial.update({name: value for name, value in result.items() if name != 'time'}, rung=rung)
+            trial['time'] += result['time']
+
+        alive.sort(key=lambda index: trials[index]['val_loss'])
+        best = trials[alive[0]]
+        print(f"  📊 Круг {rung + 1}/{len(rungs)}: {len(alive)} конфигураций до {epochs} эпох, "
+              f"лучший val_loss {best['val_loss']:.4f} (#{best['trial']})")
+        if rung < len(rungs) - 1:
+            survivors = max(1, len(alive) // eta)
+            for index in alive[survivors:]:
+                (search_dir / f"trial-{index:03d}.h5").unlink(missing_ok=True)
+            alive = alive[:survivors]
+
+    shutil.rmtree(search_dir)
+    total_epochs = sum(trial['epochs'] for trial in trials)
+    best = trials[alive[0]]
+    leaderboard = sorted(trials, key=lambda trial: (-trial['rung'], trial['val_loss']))
+    print(f"✅ {job}: лучший val_loss {best['val_loss']:.4f} за {best['epochs']} эпох, {best['params']}; "
+          f"всего {total_epochs} эпох вместо {len(trials) * rungs[-1]} ({time.perf_counter() - started:.1f}с)")
+    return {
+        'objective': 'val_loss',
+        'metric': spec['metric'],
+        'best': {**best, 'params': {**best['params'], 'epochs': best['epochs']}},
+        'total_epochs': total_epochs,
+        'trials': leaderboard
+    }
+
+
+def search(trainer: UrbanRivalsMLTrainer, jobs: Optional[List[str]] = None, num_trials: int = DEFAULT_TRIALS,
+           eta: int = DEFAULT_ETA, min_epochs: int = DEFAULT_MIN_EPOCHS, max_epochs: int = DEFAULT_MAX_EPOCHS,
+           workers: Optional[int] = None, seed: int = 42) -> Dict[str, Any]:
+    """Поиск для моделей jobs и запись таблицы результатов рядом с models_metadata.json.
+
+    Результаты моделей, которые в этом запуске не искались, сохраняются из прежней таблицы.
+    """
+    jobs = jobs or MODEL_JOBS
+    data = trainer.load_training_data(jobs)
+    path = trainer.models_dir / LEADERBOARD_FILE
+    leaderboard = {'models': {}}
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            leaderboard = json.load(f)
+
+    for job in jobs:
+        leaderboard['models'][job] = {
+            **tune_model(trainer, job, data, num_trials, eta, min_epochs, max_epochs, workers, seed),
+            'created': pd.Timestamp.now().isoformat(),
+            'method': 'successive_halving',
+            'eta': eta,
+            'rungs': rung_epochs(min_epochs, max_epochs, eta)
+        }
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(leaderboard, f, ensure_ascii=False, indent=2)
+    print(f"📋 Таблица результатов: {path} (обучение с лучшими: train_models.py --tuned)")
+    return leaderboard
+
+
+def main():
+    """Поиск гиперпараметров полносвязных моделей"""
+    parser = argparse.ArgumentParser(description="Поиск гиперпараметров моделей Urban Rivals (successive halving)")
+    parser.add_argument('--models', nargs='+', choices=MODEL_JOBS, default=MODEL_JOBS,
+                        help="Модели для поиска (модель боёв - полносвязная, по признакам первого раунда)")
+    parser.add_argument('--data-dir', default="datasets", help="Папка с датасетом (dataset.py)")
+    parser.add_argument('--models-dir', default="trained_models", help="Папка моделей и таблицы результатов")
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help="Конфигураций в первом круге")
+    parser.add_argument('--eta', type=int, default=DEFAULT_ETA, help="В следующий круг проходит 1/eta конфигураций")
+    parser.add_argument('--min-epochs', type=int, default=DEFAULT_MIN_EPOCHS, help="Эпох в первом круге")
+    parser.add_argument('--max-epochs', type=int, default=DEFAULT_MAX_EPOCHS, help="Эпох в последнем круге")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Процессов для испытаний (по умолчанию все ядра; ядра делятся между процессами)")
+    parser.add_argument('--strategy-samples', type=int, default=5000,
+                        help="Количество случайных колод для классификатора стратегий")
+    parser.add_argument('--seed', type=int, default=42)
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    trainer = UrbanRivalsMLTrainer(args.data_dir, args.models_dir, strategy_samples=args.strategy_samples)
+    search(trainer, args.models, args.trials, args.eta, args.min_epochs, args.max_epochs, args.workers, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import type {
   IBattleRecommendation, 
   ICard 
 } from '../../common/types';
+import { MATCHUP_TABLE_PATH, MatchupTable, fetchMatchupTable } from '../matchup-table';
 
 // Initialize worker logger
 const workerLogger = createMLLogger('BATTLE_WORKER');
@@ -25,6 +26,8 @@ interface BattleContext {
 // Advanced Battle Analysis Engine
 class BattleAnalyzer {
   private isLoaded = false;
+  // Precomputed round outcomes for every card pair and pill split (null -> heuristic scoring)
+  private matchups: MatchupTable | null = null;
   private clanBonuses: Record<string, string> = {
     'All Stars': '+2 Life',
     'Bangers': '+2 Power',
@@ -53,9 +56,8 @@ class BattleAnalyzer {
     });
     
     try {
-      // Simulate advanced model loading with card synergies database
-      logger.debug(workerLogger, 'Loading card synergies database');
-      await new Promise(resolve => setTimeout(resolve, 800));
+      logger.debug(workerLogger, 'Loading matchup table');
+      await this.loadMatchupTable();
       
       logger.debug(workerLogger, 'Loading clan bonus calculations');
       await new Promise(resolve => setTimeout(resolve, 400));
@@ -73,6 +75,22 @@ class BattleAnalyzer {
     }
   }
 
+  private async loadMatchupTable(): Promise<void> {
+    const url = typeof chrome !== 'undefined' && chrome.runtime?.getURL
+      ? chrome.runtime.getURL(MATCHUP_TABLE_PATH)
+      : MATCHUP_TABLE_PATH;
+    try {
+      this.matchups = await fetchMatchupTable(url);
+      logger.info(workerLogger, 'Matchup table loaded', { sizeBytes: this.matchups.sizeBytes });
+    } catch (error) {
+      // Without the table the analyzer keeps working on heuristic scores
+      this.matchups = null;
+      logger.warn(workerLogger, 'Matchup table unavailable, using heuristic scoring', {
+        error: error instanceof Error ? error.message : String(error)
+      });
+    }
+  }
+
   analyzeMatchup(battleState: IBattleState): IBattleRecommendation {
     const timer = logger.startTimer(workerLogger, 'Battle Matchup Analysis');
     logger.info(workerLogger, 'Starting battle matchup analysis', {
@@ -253,6 +271,20 @@ class BattleAnalyzer {
   }
 
   private calculateOptimalPills(card: ICard, opponentThreat: any, battleState: IBattleState, context: BattleContext): number {
+    // Fewest pills that reach the best win probability against the opponent's remaining cards
+    if (this.matchupWinProbability(card, 0, battleState) !== null) {
+      let bestPills = 0;
+      let bestProbability = -1;
+      for (let pills = 0; pills <= battleState.playerPills; pills++) {
+        const probability = this.matchupWinProbability(card, pills, battleState) as number;
+        if (probability > bestProbability + 1e-9) {
+          bestProbability = probability;
+          bestPills = pills;
+        }
+      }
+      return bestPills;
+    }
+
     const basePills = Math.min(Math.floor((card.power + card.damage) / 4), battleState.playerPills);
     
     // Adjust based on game phase
@@ -280,6 +312,11 @@ class BattleAnalyzer {
   }
 
   private calculateWinProbability(card: ICard, pills: number, battleState: IBattleState, context: BattleContext): number {
+    const tableProbability = this.matchupWinProbability(card, pills, battleState);
+    if (tableProbability !== null) {
+      return Math.round(tableProbability * 100) / 100;
+    }
+
     const cardStrength = card.power + card.damage + pills;
     const lifeAdvantage = (battleState.playerLife - battleState.opponentLife) / 24;
     const pillsAdvantage = (battleState.playerPills - battleState.opponentPills) / 24;
@@ -346,6 +383,26 @@ class BattleAnalyzer {
     ));
   }
 
+  /**
+   * Round win probability from the matchup table: opponent plays any remaining card
+   * with 0..opponentPills pills, all choices equally likely. Null if the table
+   * is not loaded or a card's stats are not in it.
+   */
+  private matchupWinProbability(card: ICard, pills: number, battleState: IBattleState): number | null {
+    const table = this.matchups;
+    if (!table || battleState.opponentCards.length === 0) return null;
+    const player = table.profile(card.power, card.damage);
+    if (player === null) return null;
+
+    let total = 0;
+    for (const opponentCard of battleState.opponentCards) {
+      const opponent = table.profile(opponentCard.power, opponentCard.damage);
+      if (opponent === null) return null;
+      total += table.expected(player, opponent, pills, battleState.opponentPills).win;
+    }
+    return total / battleState.opponentCards.length;
+  }
+
   // Helper methods
   private getClanBonusValue(clan: string): number {
     const bonusValues: Record<string, number> = {